@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+'''Runs the BANG benchmark suite and compares results.
+
+  benchmark.py run [options]         run benchmarks, append to the history
+  benchmark.py compare REF1 REF2     compare two runs from the history
+  benchmark.py list                  list the available benchmarks
+
+Every run is stored as a single line of JSON in the history file, together
+with the git commit of the source tree, so runs of different commits can
+be compared with the compare command.'''
+
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+srcdir = pathlib.Path(__file__).resolve().parent.parent.parent / 'src'
+sys.path.insert(0, str(srcdir))
+
+import macrobenchmarks
+import syntheticfirmware
+from microbenchmarks import microbenchmarks
+
+
+def time_function(func, repeat):
+    '''Run func repeat times, return lists of wall and CPU times.
+    The CPU time includes the time spent in child processes.'''
+    walltimes = []
+    cputimes = []
+    for i in range(repeat):
+        cpustart = os.times()
+        wallstart = time.perf_counter()
+        func()
+        wallend = time.perf_counter()
+        cpuend = os.times()
+        walltimes.append(wallend - wallstart)
+        cputimes.append(sum(cpuend[:4]) - sum(cpustart[:4]))
+    return walltimes, cputimes
+
+def summarize(walltimes, cputimes):
+    return {'runs': walltimes,
+            'min': min(walltimes),
+            'median': statistics.median(walltimes),
+            'cpu': statistics.median(cputimes),
+           }
+
+def get_commit():
+    '''Return the git commit of the source tree, with a '+' appended
+    if there are uncommitted changes.'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=srcdir,
+                                capture_output=True, check=True,
+                                text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=srcdir, capture_output=True, check=True,
+                               text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    if dirty:
+        commit += '+'
+    return commit
+
+def selected(name, options):
+    if not options.benchmarks:
+        return True
+    return any(name.startswith(b) for b in options.benchmarks)
+
+def run_benchmarks(options):
+    workdir = pathlib.Path(tempfile.mkdtemp(prefix='bang-benchmark-',
+                                            dir=options.temporarydirectory))
+    results = {}
+    try:
+        if not options.macro_only:
+            for name, benchmark in microbenchmarks.items():
+                if not selected(name, options):
+                    continue
+                benchdir = workdir / name
+                benchdir.mkdir()
+                func = benchmark(benchdir, options)
+                if func is None:
+                    print("%-30s skipped" % name, file=sys.stderr)
+                    continue
+                # warm up: caches, lazy imports
+                func()
+                results[name] = summarize(*time_function(func, options.repeat))
+                print("%-30s %10.4f s" % (name, results[name]['median']), file=sys.stderr)
+                shutil.rmtree(benchdir)
+
+        if not options.micro_only:
+            images = macrobenchmarks.get_macrobenchmarks(workdir, options)
+            for name, image in images.items():
+                if not selected(name, options):
+                    continue
+                benchdir = workdir / name
+                benchdir.mkdir()
+                func = macrobenchmarks.scan_image(benchdir, image, options.threads)
+                results[name] = summarize(*time_function(func, options.macrorepeat))
+                print("%-30s %10.4f s" % (name, results[name]['median']), file=sys.stderr)
+                shutil.rmtree(benchdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    run = {
+        'commit': get_commit(),
+        'date': datetime.datetime.utcnow().isoformat(),
+        'node': platform.node(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'benchmarks': results,
+    }
+    with open(options.history, 'a') as historyfile:
+        historyfile.write(json.dumps(run) + '\n')
+
+def read_history(historyfilename):
+    runs = []
+    with open(historyfilename, 'r') as historyfile:
+        for line in historyfile:
+            if line.strip() != '':
+                runs.append(json.loads(line))
+    return runs
+
+def find_run(runs, ref):
+    '''Find the most recent run for a commit (prefix) or, if ref is a
+    negative number, the run at that position counting from the end.'''
+    try:
+        index = int(ref)
+        if index < 0:
+            return runs[index]
+    except (ValueError, IndexError):
+        pass
+    for run in reversed(runs):
+        if run['commit'].startswith(ref):
+            return run
+    return None
+
+def compare_runs(options):
+    runs = read_history(options.history)
+    old = find_run(runs, options.old)
+    new = find_run(runs, options.new)
+    if old is None or new is None:
+        print("Cannot find runs for %s and %s in %s" % (options.old, options.new, options.history), file=sys.stderr)
+        sys.exit(2)
+
+    print("%-30s %12s %12s %9s" % ('benchmark', old['commit'][:12], new['commit'][:12], 'change'))
+    regressions = []
+    for name in sorted(set(old['benchmarks']) & set(new['benchmarks'])):
+        oldtime = old['benchmarks'][name]['median']
+        newtime = new['benchmarks'][name]['median']
+        change = (newtime - oldtime) / oldtime if oldtime > 0 else 0
+        flag = ''
+        if change > options.threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -options.threshold:
+            flag = 'improvement'
+        print("%-30s %12.4f %12.4f %+8.1f%% %s" % (name, oldtime, newtime, change*100, flag))
+
+    if regressions:
+        sys.exit(1)
+
+def list_benchmarks(options):
+    for name in microbenchmarks:
+        print(name)
+    print('scan-synthetic')
+
+def main():
+    parser = argparse.ArgumentParser(description='BANG benchmark suite')
+    parser.add_argument('--history', action='store', dest='history',
+                        default='benchmark-history.jsonl', metavar='FILE',
+                        help='history file with benchmark results (default: benchmark-history.jsonl)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    runparser = subparsers.add_parser('run', help='run benchmarks')
+    runparser.add_argument('benchmarks', nargs='*', metavar='NAME',
+                           help='only run benchmarks starting with NAME')
+    runparser.add_argument('--repeat', type=int, default=5,
+                           help='number of runs per micro-benchmark')
+    runparser.add_argument('--macro-repeat', type=int, default=3, dest='macrorepeat',
+                           help='number of runs per macro-benchmark')
+    runparser.add_argument('--micro-only', action='store_true', dest='micro_only')
+    runparser.add_argument('--macro-only', action='store_true', dest='macro_only')
+    runparser.add_argument('--size', type=int, default=32*1024*1024,
+                           help='size of the generated input data in bytes')
+    runparser.add_argument('--padding-size', type=int, default=1024*1024,
+                           dest='paddingsize', help='size of the padding file in bytes')
+    runparser.add_argument('--read-size', type=int, default=10240, dest='readsize',
+                           help='read size for the content computers')
+    runparser.add_argument('--queue-jobs', type=int, default=1000, dest='queuejobs',
+                           help='number of jobs sent through the queue')
+    runparser.add_argument('--elf', type=pathlib.Path,
+                           default=pathlib.Path(os.path.realpath(sys.executable)),
+                           help='ELF file to parse (default: the Python interpreter)')
+    runparser.add_argument('--dex', type=pathlib.Path, default=None,
+                           help='Dex file to parse')
+    runparser.add_argument('--png', type=pathlib.Path,
+                           default=srcdir / 'test' / 'testdata' / 'unpackers' / 'png' / 'Animated_PNG_example_bouncing_beach_ball.png',
+                           help='PNG file to parse')
+    runparser.add_argument('--synthetic-seed', type=int, default=0, dest='syntheticseed',
+                           help='seed for the generated synthetic firmware')
+    runparser.add_argument('--synthetic-size', type=int, default=16*1024*1024,
+                           dest='syntheticsize',
+                           help='size of the contents of the synthetic firmware in bytes')
+    runparser.add_argument('--synthetic-depth', type=int, default=3, dest='syntheticdepth',
+                           help='nesting depth of the synthetic firmware')
+    runparser.add_argument('--synthetic-layers', default=','.join(syntheticfirmware.default_layers),
+                           dest='syntheticlayers',
+                           help='container types in the synthetic firmware')
+    runparser.add_argument('--image', action='append', dest='images', default=[],
+                           help='firmware image to scan as an extra macro-benchmark')
+    runparser.add_argument('--threads', type=int, default=1,
+                           help='number of bang-scanner threads in macro-benchmarks')
+    runparser.add_argument('-t', '--temporary-directory', dest='temporarydirectory',
+                           default=None, help='directory for temporary data')
+
+    compareparser = subparsers.add_parser('compare', help='compare two runs')
+    compareparser.add_argument('old', help='commit (prefix) or negative index of the reference run')
+    compareparser.add_argument('new', help='commit (prefix) or negative index of the new run')
+    compareparser.add_argument('--threshold', type=float, default=0.10,
+                               help='relative slowdown that is flagged as a regression (default: 0.10)')
+
+    subparsers.add_parser('list', help='list benchmarks')
+
+    options = parser.parse_args()
+    if options.command == 'run':
+        run_benchmarks(options)
+    elif options.command == 'compare':
+        compare_runs(options)
+    elif options.command == 'list':
+        list_benchmarks(options)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+'''Macro-benchmarks: complete runs of bang-scanner on firmware images
+of a known composition, generated with syntheticfirmware.py.'''
+
+import pathlib
+import subprocess
+import sys
+
+import syntheticfirmware
+
+srcdir = pathlib.Path(__file__).resolve().parent.parent.parent / 'src'
+bangscanner = srcdir / 'bang-scanner'
+
+configtemplate = '''[configuration]
+baseunpackdirectory = %(unpackdirectory)s
+temporarydirectory = %(temporarydirectory)s
+threads = %(threads)d
+removescandirectory = yes
+logging = no
+json = no
+report = no
+statistics = no
+'''
+
+
+def scan_image(workdir, image, threads):
+    '''Return a function that runs bang-scanner on image with a
+    configuration that removes the results after the scan.'''
+    unpackdirectory = workdir / 'scans'
+    unpackdirectory.mkdir(exist_ok=True)
+    temporarydirectory = workdir / 'tmp'
+    temporarydirectory.mkdir(exist_ok=True)
+    config = workdir / 'bang.config'
+    config.write_text(configtemplate % {
+        'unpackdirectory': unpackdirectory,
+        'temporarydirectory': temporarydirectory,
+        'threads': threads})
+    def run():
+        subprocess.run([sys.executable, str(bangscanner), '-c', str(config),
+                        '-f', str(image)],
+                       check=True, stdout=subprocess.DEVNULL)
+    return run
+
+
+def get_macrobenchmarks(workdir, options):
+    '''Return a dictionary with names and image paths for all macro
+    benchmarks: a generated synthetic image plus any images given on the
+    command line.'''
+    images = {}
+    synthetic = workdir / 'synthetic.bin'
+    syntheticfirmware.generate_image(synthetic, options.syntheticseed,
+                                     options.syntheticsize,
+                                     options.syntheticdepth,
+                                     layers=options.syntheticlayers.split(','),
+                                     temporarydirectory=workdir)
+    images['scan-synthetic'] = synthetic
+    for image in options.images:
+        image = pathlib.Path(image).resolve()
+        images['scan-%s' % image.name] = image
+    return images
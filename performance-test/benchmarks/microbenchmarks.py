@@ -0,0 +1,373 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+'''Micro-benchmarks for the hot components of bang-scanner.
+
+Every benchmark is a function that gets a working directory and the
+command line options, prepares its input data and returns a function
+that does the actual work. Only the returned function is timed. A
+benchmark can return None if it cannot run (for example because an
+input file is missing), in which case it is skipped.'''
+
+import collections
+import multiprocessing
+import os
+import pathlib
+import random
+import shutil
+import stat
+import subprocess
+import sys
+
+from FileContentsComputer import *
+from FileResult import FileResult
+from ScanEnvironment import ScanEnvironment
+from ScanJob import ScanJob
+from UnpackManager import UnpackManager
+from UnpackParser import UnpackParser
+import bangsignatures
+
+srcdir = pathlib.Path(__file__).resolve().parent.parent.parent / 'src'
+testdatadir = srcdir / 'test' / 'testdata'
+
+# all benchmarks, in the order they were defined
+microbenchmarks = {}
+
+def microbenchmark(name):
+    '''Decorator to register a micro-benchmark under name'''
+    def register(func):
+        microbenchmarks[name] = func
+        return func
+    return register
+
+
+def create_random_file(path, size, seed=0):
+    '''Create a file with deterministic pseudo random data'''
+    rng = random.Random(seed)
+    with open(path, 'wb') as outfile:
+        while size > 0:
+            chunksize = min(size, 1048576)
+            outfile.write(rng.randbytes(chunksize))
+            size -= chunksize
+    return path
+
+def create_text_file(path, size, seed=0):
+    '''Create a file with deterministic printable ASCII data'''
+    rng = random.Random(seed)
+    words = [b'firmware', b'kernel', b'busybox', b'root', b'config',
+             b'0x1000', b'/etc/init.d', b'\n', b'\t']
+    with open(path, 'wb') as outfile:
+        written = 0
+        while written < size:
+            line = b' '.join(rng.choices(words, k=16)) + b'\n'
+            outfile.write(line)
+            written += len(line)
+    return path
+
+def create_scan_environment(workdir, **kwargs):
+    '''Create a scan environment in workdir, without any queues.
+    Keyword arguments are passed to ScanEnvironment.'''
+    for d in ['unpack', 'tmp', 'results']:
+        (workdir / d).mkdir(exist_ok=True)
+    scanenvironment = ScanEnvironment(
+        maxbytes = max(200000, bangsignatures.maxsignaturesoffset+1),
+        readsize = 10240,
+        createbytecounter = False,
+        createjson = False,
+        tlshmaximum = sys.maxsize,
+        synthesizedminimum = 10,
+        logging = False,
+        paddingname = 'PADDING',
+        unpackdirectory = workdir / 'unpack',
+        temporarydirectory = workdir / 'tmp',
+        resultsdirectory = workdir / 'results',
+        scanfilequeue = None,
+        resultqueue = None,
+        processlock = None,
+        checksumdict = {},
+        **kwargs)
+    return scanenvironment
+
+def parse_with_unpackparser(workdir, unpackparser, path):
+    '''Return a function that parses the file path (without unpacking)
+    with unpackparser, or None if the file does not exist.'''
+    if path is None or not path.exists():
+        return None
+    scanenvironment = create_scan_environment(workdir)
+    fileresult = FileResult(None, path.resolve(), set())
+    fileresult.set_filesize(path.stat().st_size)
+    def run():
+        up = unpackparser(fileresult, scanenvironment, pathlib.Path('.'), 0)
+        up.open()
+        try:
+            up.parse_from_offset()
+        finally:
+            up.close()
+    return run
+
+def _content_computer(workdir, options, computer_factory, text=False,
+                      max_read_size=None):
+    if text:
+        path = create_text_file(workdir / 'text', options.size)
+    else:
+        path = create_random_file(workdir / 'random', options.size)
+    def run():
+        fc = FileContentsComputer(options.readsize, max_read_size=max_read_size)
+        fc.subscribe(computer_factory())
+        fc.read(path)
+    return run
+
+
+@microbenchmark('signature-search')
+def bench_signature_search(workdir, options):
+    path = create_random_file(workdir / 'random', options.size)
+    filesize = path.stat().st_size
+    maxbytes = max(200000, bangsignatures.maxsignaturesoffset+1)
+    sigs_and_unpackers = bangsignatures.signature_to_unpackparser.items()
+    def run():
+        # same loop as ScanJob.check_for_signatures, without unpacking
+        unpacker = UnpackManager(workdir)
+        unpacker.open_scanfile_with_memoryview(path, maxbytes)
+        unpacker.seek_to(0)
+        unpacker.read_chunk_from_scanfile()
+        while True:
+            for s, unpackparsers in sigs_and_unpackers:
+                unpacker.find_offsets_for_signature(s, unpackparsers, filesize)
+            if unpacker.get_current_offset_in_file() >= filesize:
+                break
+            unpacker.seek_to_find_next_signature()
+            unpacker.read_chunk_from_scanfile()
+        unpacker.close_scanfile()
+    return run
+
+@microbenchmark('hasher')
+def bench_hasher(workdir, options):
+    return _content_computer(workdir, options, lambda: Hasher(hash_algorithms))
+
+@microbenchmark('hasher-parallel')
+def bench_hasher_parallel(workdir, options):
+    return _content_computer(workdir, options,
+                             lambda: Hasher(hash_algorithms, len(hash_algorithms)),
+                             max_read_size=1048576)
+
+@microbenchmark('tlsh')
+def bench_tlsh(workdir, options):
+    return _content_computer(workdir, options, TLSHComputerMemoryView)
+
+@microbenchmark('is-text')
+def bench_is_text(workdir, options):
+    return _content_computer(workdir, options, IsTextComputer, text=True)
+
+@microbenchmark('byte-counter')
+def bench_byte_counter(workdir, options):
+    return _content_computer(workdir, options, ByteCounter)
+
+@microbenchmark('is-padding')
+def bench_is_padding(workdir, options):
+    path = workdir / 'padding'
+    with open(path, 'wb') as outfile:
+        outfile.write(b'\x00' * options.paddingsize)
+    scanjob = ScanJob(None)
+    def run():
+        assert scanjob.is_padding(path)
+    return run
+
+class CarveUnpackParser(UnpackParser):
+    pretty_name = 'benchmark'
+
+@microbenchmark('carve')
+def bench_carve(workdir, options):
+    path = create_random_file(workdir / 'random', options.size)
+    scanenvironment = create_scan_environment(workdir)
+    fileresult = FileResult(None, path, set())
+    fileresult.set_filesize(path.stat().st_size)
+    offset = options.size // 4
+    def run():
+        up = CarveUnpackParser(fileresult, scanenvironment,
+                               pathlib.Path('carve'), offset)
+        up.open()
+        up.unpacked_size = options.size // 2
+        up.carve()
+        up.close()
+    return run
+
+@microbenchmark('kaitai-elf')
+def bench_kaitai_elf(workdir, options):
+    from parsers.executable.elf.UnpackParser import ElfUnpackParser
+    return parse_with_unpackparser(workdir, ElfUnpackParser, options.elf)
+
+@microbenchmark('kaitai-dex')
+def bench_kaitai_dex(workdir, options):
+    from parsers.executable.dex.UnpackParser import DexUnpackParser
+    return parse_with_unpackparser(workdir, DexUnpackParser, options.dex)
+
+@microbenchmark('kaitai-png')
+def bench_kaitai_png(workdir, options):
+    from parsers.image.png.UnpackParser import PngUnpackParser
+    return parse_with_unpackparser(workdir, PngUnpackParser, options.png)
+
+def create_ext2_firmware(workdir, options):
+    '''Create an ext4 file system with many small files and a few
+    large ones, at offset 4096 in a file in a new scan environment.
+    Returns the scan environment and the FileResult of the file.'''
+    rng = random.Random(0)
+    root = workdir / 'root'
+    for i in range(100):
+        directory = root / ('dir-%d' % i)
+        directory.mkdir(parents=True)
+        for j in range(50):
+            (directory / ('file-%d' % j)).write_bytes(rng.randbytes(rng.randrange(4096)))
+    for i in range(4):
+        create_random_file(root / ('large-%d' % i), options.size // 4, seed=i)
+    image = workdir / 'ext4.img'
+    imagesize = (options.size * 2 + 64*1024*1024) // 1048576
+    subprocess.run(['mke2fs', '-q', '-F', '-t', 'ext4', '-d', str(root),
+                    str(image), '%dM' % imagesize], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    shutil.rmtree(root)
+    scanenvironment = create_scan_environment(workdir)
+    path = scanenvironment.unpackdirectory / 'firmware'
+    with open(path, 'wb') as outfile:
+        outfile.write(b'\xff' * 4096)
+        with open(image, 'rb') as infile:
+            shutil.copyfileobj(infile, outfile)
+    image.unlink()
+    fileresult = FileResult(None, pathlib.Path('firmware'), set())
+    fileresult.set_filesize(path.stat().st_size)
+    return (scanenvironment, fileresult)
+
+@microbenchmark('unpack-ext2')
+def bench_unpack_ext2(workdir, options):
+    # an ext4 file system with many small files and a few large ones,
+    # at an offset in the file
+    if shutil.which('mke2fs') is None:
+        return None
+    from parsers.filesystem.ext2.UnpackParser import Ext2UnpackParser
+    (scanenvironment, fileresult) = create_ext2_firmware(workdir, options)
+    def run():
+        unpackdir = pathlib.Path('unpacked')
+        shutil.rmtree(scanenvironment.unpack_path(unpackdir), ignore_errors=True)
+        up = Ext2UnpackParser(fileresult, scanenvironment, unpackdir, 4096)
+        up.open()
+        up.parse_and_unpack()
+        up.close()
+    return run
+
+@microbenchmark('unpack-ext2-e2tools')
+def bench_unpack_ext2_e2tools(workdir, options):
+    # the same file system as unpack-ext2, unpacked the way bang did
+    # before it read ext2 itself, for comparison: the file system is
+    # carved to a temporary file, then e2ls is run for every directory
+    # and e2cp for every file.
+    if shutil.which('mke2fs') is None or shutil.which('e2ls') is None \
+            or shutil.which('e2cp') is None:
+        return None
+    (scanenvironment, fileresult) = create_ext2_firmware(workdir, options)
+    path = scanenvironment.unpack_path(fileresult.filename)
+    def run():
+        unpackdir = scanenvironment.unpack_path(pathlib.Path('unpacked'))
+        shutil.rmtree(unpackdir, ignore_errors=True)
+        unpackdir.mkdir()
+        image = scanenvironment.temporarydirectory / 'ext4.img'
+        with open(path, 'rb') as infile, open(image, 'wb') as outfile:
+            infile.seek(4096)
+            shutil.copyfileobj(infile, outfile)
+        directories = collections.deque([''])
+        while directories:
+            directory = directories.popleft()
+            listing = subprocess.run(['e2ls', '-lai', '%s:%s' % (image, directory)],
+                                     check=True, stdout=subprocess.PIPE).stdout
+            for line in listing.rstrip().split(b'\n'):
+                fields = line.split(None, 7)
+                # skip deleted files, . and ..
+                if len(fields) != 8 or line.strip().startswith(b'>') \
+                        or fields[7] in [b'.', b'..']:
+                    continue
+                name = os.path.join(directory, fields[7].decode())
+                # the mode is printed in octal or like ls -l
+                mode = fields[1]
+                if mode.isdigit():
+                    mode = b'd' if stat.S_ISDIR(int(mode, 8)) else \
+                           b'-' if stat.S_ISREG(int(mode, 8)) else b'?'
+                if mode.startswith(b'd'):
+                    (unpackdir / name).mkdir()
+                    directories.append(name)
+                elif mode.startswith(b'-'):
+                    subprocess.run(['e2cp', '%s:%s' % (image, name), '-d',
+                                    str((unpackdir / name).parent)], check=True)
+        image.unlink()
+    return run
+
+@microbenchmark('unpack-squashfs')
+def bench_unpack_squashfs(workdir, options):
+    # an xz compressed squashfs file system with many small files and
+    # a few large ones, at an offset in the file, unpacked with all CPUs
+    if shutil.which('mksquashfs') is None:
+        return None
+    from parsers.filesystem.squashfs.UnpackParser import SquashfsUnpackParser
+    rng = random.Random(0)
+    root = workdir / 'root'
+    for i in range(100):
+        directory = root / ('dir-%d' % i)
+        directory.mkdir(parents=True)
+        for j in range(50):
+            (directory / ('file-%d' % j)).write_bytes(rng.randbytes(rng.randrange(4096)))
+    for i in range(4):
+        create_text_file(root / ('large-%d' % i), options.size // 4, seed=i)
+    image = workdir / 'squashfs.img'
+    subprocess.run(['mksquashfs', str(root), str(image), '-comp', 'xz',
+                    '-all-root', '-no-progress'], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    shutil.rmtree(root)
+    scanenvironment = create_scan_environment(workdir,
+            unpackthreads=multiprocessing.cpu_count())
+    path = scanenvironment.unpackdirectory / 'firmware'
+    with open(path, 'wb') as outfile:
+        outfile.write(b'\xff' * 4096)
+        with open(image, 'rb') as infile:
+            shutil.copyfileobj(infile, outfile)
+    image.unlink()
+    fileresult = FileResult(None, pathlib.Path('firmware'), set())
+    fileresult.set_filesize(path.stat().st_size)
+    def run():
+        unpackdir = pathlib.Path('unpacked')
+        shutil.rmtree(scanenvironment.unpack_path(unpackdir), ignore_errors=True)
+        up = SquashfsUnpackParser(fileresult, scanenvironment, unpackdir, 4096)
+        up.open()
+        up.parse_and_unpack()
+        up.close()
+    return run
+
+@microbenchmark('queue-round-trip')
+def bench_queue_round_trip(workdir, options):
+    # the queues in bang-scanner are created by a multiprocessing manager
+    processmanager = multiprocessing.Manager()
+    scanfilequeue = processmanager.JoinableQueue(maxsize=0)
+    parent = FileResult(None, pathlib.Path('firmware.bin'), set(['root']))
+    jobs = [ScanJob(FileResult(parent, pathlib.Path('firmware.bin-gzip-1') / ('file-%d' % i), set()))
+            for i in range(options.queuejobs)]
+    def run():
+        for j in jobs:
+            scanfilequeue.put(j)
+        for j in jobs:
+            scanfilequeue.get()
+            scanfilequeue.task_done()
+    return run
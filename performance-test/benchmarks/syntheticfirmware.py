@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+'''Generates synthetic firmware images for load testing.
+
+An image consists of a number of regions: nested containers (gzip, xz,
+tar, cpio, zip, squashfs, ext2), embedded ELF and PNG files, padding and
+random filler. The same seed and parameters always result in the same
+image. Next to every image a file <image>.expected.json is written that
+describes the composition of the image, with the offset, size and
+SHA256 of every region and of every file inside the containers.
+
+  syntheticfirmware.py generate [options] IMAGE
+  syntheticfirmware.py verify IMAGE.expected.json SCANDIRECTORY
+
+The verify command checks the results of a bang-scanner run against the
+expected composition.'''
+
+import argparse
+import gzip
+import hashlib
+import json
+import lzma
+import os
+import pathlib
+import pickle
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+import uuid
+import zipfile
+import zlib
+
+# layers that only need the Python standard library
+default_layers = ['gzip', 'xz', 'tar', 'cpio', 'zip']
+
+# layers that need external tools
+external_layers = {'squashfs': ['mksquashfs'], 'ext2': ['mke2fs', 'debugfs']}
+
+all_layers = default_layers + list(external_layers.keys())
+
+# compressors wrap exactly one file, the other layers can have several
+compressors = ['gzip', 'xz']
+
+# largest PNG file to generate, as PNG files are created in memory
+maxpngsize = 4*1024*1024
+
+# date used for all files in archives, to get reproducible output
+fixed_date = (1980, 1, 1, 0, 0, 0)
+
+# access time for files that are copied into file systems. This is in the
+# future, so reading the files (with relatime) does not change it.
+fixed_atime = 4102444800
+
+textwords = [b'firmware', b'kernel', b'busybox', b'root', b'config',
+             b'version', b'/etc/init.d', b'0x1000', b'linux', b'=', b'#']
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for data in iter(lambda: infile.read(1048576), b''):
+            h.update(data)
+    return h.hexdigest()
+
+
+def build_elf(code):
+    '''Build a minimal, valid 64 bit little endian x86-64 ELF executable
+    with the bytes code as the contents of the .text section.'''
+    shstrtab = b'\x00.text\x00.shstrtab\x00'
+    text_offset = 128
+    shstrtab_offset = text_offset + len(code)
+    shoff = (shstrtab_offset + len(shstrtab) + 7) & ~7
+    vaddr = 0x400000
+
+    elf_header = b'\x7fELF' + bytes([2, 1, 1, 0]) + b'\x00' * 8
+    elf_header += struct.pack('<HHIQQQIHHHHHH', 2, 62, 1, vaddr + text_offset,
+                              64, shoff, 0, 64, 56, 1, 64, 3, 2)
+    program_header = struct.pack('<IIQQQQQQ', 1, 5, 0, vaddr, vaddr,
+                                 shstrtab_offset, shstrtab_offset, 0x1000)
+    section_headers = b'\x00' * 64
+    section_headers += struct.pack('<IIQQQQIIQQ', 1, 1, 6, vaddr + text_offset,
+                                   text_offset, len(code), 0, 0, 16, 0)
+    section_headers += struct.pack('<IIQQQQIIQQ', 7, 3, 0, 0, shstrtab_offset,
+                                   len(shstrtab), 0, 0, 1, 0)
+
+    data = elf_header + program_header
+    data += b'\x00' * (text_offset - len(data))
+    data += code + shstrtab
+    data += b'\x00' * (shoff - len(data))
+    return data + section_headers
+
+
+def png_chunk(chunktype, data):
+    return struct.pack('>I', len(data)) + chunktype + data + \
+        struct.pack('>I', zlib.crc32(chunktype + data))
+
+def build_png(rng, size):
+    '''Build a valid RGB PNG file of roughly size bytes with random
+    pixel data (which does not compress).'''
+    width = 256
+    height = max(1, size // (width * 3))
+    rows = b''.join(b'\x00' + rng.randbytes(width * 3) for i in range(height))
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', ihdr) + \
+        png_chunk(b'IDAT', zlib.compress(rows, 1)) + png_chunk(b'IEND', b'')
+
+
+def write_cpio(outpath, files):
+    '''Write a cpio archive in "new ASCII" format with (name, path) files'''
+    def header(ino, mode, nlink, filesize, name):
+        name = name.encode() + b'\x00'
+        fields = [ino, mode, 0, 0, nlink, 0, filesize, 0, 0, 0, 0, len(name), 0]
+        h = b'070701' + b''.join(b'%08X' % f for f in fields) + name
+        return h + b'\x00' * (-len(h) % 4)
+    with open(outpath, 'wb') as outfile:
+        for ino, (name, path) in enumerate(files, 1):
+            filesize = path.stat().st_size
+            outfile.write(header(ino, 0o100644, 1, filesize, name))
+            with open(path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile)
+            outfile.write(b'\x00' * (-filesize % 4))
+        outfile.write(header(0, 0, 1, 0, 'TRAILER!!!'))
+
+
+class FirmwareGenerator:
+    '''Generates a synthetic firmware image. All randomness comes from
+    a single seeded random number generator, so images are reproducible.
+
+    size is the total size of the uncompressed contents in bytes,
+    depth the maximum nesting depth of containers, regions the number
+    of top level regions with containers or files.'''
+    def __init__(self, seed, size, depth, regions, layers, workdir):
+        self.seed = seed
+        self.size = size
+        self.depth = depth
+        self.regions = regions
+        self.layers = layers
+        self.workdir = workdir
+        self.rng = random.Random(seed)
+        self.counter = 0
+
+    def _new_path(self, suffix=''):
+        self.counter += 1
+        return self.workdir / ('node-%06d%s' % (self.counter, suffix))
+
+    def _write_random(self, path, size):
+        with open(path, 'wb') as outfile:
+            while size > 0:
+                chunksize = min(size, 1048576)
+                outfile.write(self.rng.randbytes(chunksize))
+                size -= chunksize
+
+    def _write_text(self, path, size):
+        with open(path, 'wb') as outfile:
+            written = 0
+            while written < size:
+                line = b' '.join(self.rng.choices(textwords, k=12))[:size - written - 1] + b'\n'
+                outfile.write(line)
+                written += len(line)
+
+    def _leaf(self, budget):
+        '''Create a file of about budget bytes, return the path and
+        the description of the file.'''
+        kinds = ['random', 'random', 'text', 'text', 'padding', 'elf']
+        if budget <= maxpngsize:
+            kinds.append('png')
+        kind = self.rng.choice(kinds)
+        path = self._new_path()
+        if kind == 'random':
+            self._write_random(path, budget)
+        elif kind == 'text':
+            self._write_text(path, budget)
+        elif kind == 'padding':
+            with open(path, 'wb') as outfile:
+                outfile.truncate(budget)
+        elif kind == 'elf':
+            with open(path, 'wb') as outfile:
+                outfile.write(build_elf(self.rng.randbytes(budget)))
+        elif kind == 'png':
+            path.write_bytes(build_png(self.rng, budget))
+        extension = {'random': '.bin', 'text': '.txt', 'padding': '.bin',
+                     'elf': '', 'png': '.png'}[kind]
+        return path, {'type': kind, 'name': 'file-%06d%s' % (self.counter, extension)}
+
+    def _node(self, budget, depth):
+        '''Create a container or a file of about budget bytes of
+        uncompressed data, return the path and the description.'''
+        if depth == 0 or budget < 4096 or self.layers == []:
+            path, node = self._leaf(budget)
+        else:
+            kind = self.rng.choice(self.layers)
+            if kind in compressors:
+                children = [self._node(budget, depth - 1)]
+            else:
+                nrchildren = self.rng.randint(1, 4)
+                # split the budget in random parts
+                cuts = sorted(self.rng.sample(range(1, budget), nrchildren - 1))
+                parts = [b - a for a, b in zip([0] + cuts, cuts + [budget])]
+                children = [self._node(part, depth - 1) for part in parts]
+            path = self._new_path()
+            node = {'type': kind, 'name': 'file-%06d.%s' % (self.counter, kind),
+                    'children': [c[1] for c in children]}
+            getattr(self, '_write_%s' % kind)(path, children)
+            for childpath, child in children:
+                childpath.unlink()
+        node['size'] = path.stat().st_size
+        node['sha256'] = sha256_file(path)
+        return path, node
+
+    def _write_gzip(self, path, children):
+        childpath, child = children[0]
+        with open(childpath, 'rb') as infile, open(path, 'wb') as rawfile:
+            with gzip.GzipFile(filename=child['name'], mode='wb',
+                               fileobj=rawfile, mtime=0) as outfile:
+                shutil.copyfileobj(infile, outfile, 1048576)
+
+    def _write_xz(self, path, children):
+        childpath, child = children[0]
+        with open(childpath, 'rb') as infile, lzma.open(path, 'wb') as outfile:
+            shutil.copyfileobj(infile, outfile, 1048576)
+
+    def _write_tar(self, path, children):
+        with tarfile.open(path, 'w', format=tarfile.GNU_FORMAT) as tar:
+            for childpath, child in children:
+                tarinfo = tarfile.TarInfo(child['name'])
+                tarinfo.size = childpath.stat().st_size
+                tarinfo.mtime = 0
+                tarinfo.mode = 0o644
+                with open(childpath, 'rb') as infile:
+                    tar.addfile(tarinfo, infile)
+
+    def _write_cpio(self, path, children):
+        write_cpio(path, [(child['name'], childpath) for childpath, child in children])
+
+    def _write_zip(self, path, children):
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for childpath, child in children:
+                zipinfo = zipfile.ZipInfo(child['name'], fixed_date)
+                zipinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(childpath, 'rb') as infile, zf.open(zipinfo, 'w') as outfile:
+                    shutil.copyfileobj(infile, outfile, 1048576)
+
+    def _filesystem_directory(self, children):
+        fsdir = pathlib.Path(tempfile.mkdtemp(dir=self.workdir))
+        for childpath, child in children:
+            shutil.copy(childpath, fsdir / child['name'])
+            os.utime(fsdir / child['name'], (fixed_atime, 0))
+        os.utime(fsdir, (fixed_atime, 0))
+        return fsdir
+
+    def _write_squashfs(self, path, children):
+        fsdir = self._filesystem_directory(children)
+        subprocess.run(['mksquashfs', fsdir, path, '-noappend', '-all-root',
+                        '-mkfs-time', '0', '-all-time', '0', '-quiet',
+                        '-no-progress', '-processors', '1'],
+                       check=True, stdout=subprocess.DEVNULL)
+        shutil.rmtree(fsdir)
+
+    def _write_ext2(self, path, children):
+        fsdir = self._filesystem_directory(children)
+        contentsize = sum(childpath.stat().st_size for childpath, child in children)
+        blocks = contentsize // 1024 * 11 // 10 + 1024
+        fsuuid = uuid.UUID(int=self.rng.getrandbits(128))
+        hashseed = uuid.UUID(int=self.rng.getrandbits(128))
+        env = dict(os.environ, E2FSPROGS_FAKE_TIME='1')
+        subprocess.run(['mke2fs', '-q', '-F', '-t', 'ext2', '-b', '1024',
+                        '-U', str(fsuuid), '-E', 'hash_seed=%s,root_owner=0:0' % hashseed,
+                        '-d', fsdir, path, str(blocks)],
+                       check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, env=env)
+
+        # mke2fs copies the inode change time of the files, which cannot
+        # be set from user space, so reset it in the file system itself.
+        commands = ''.join('set_inode_field "/%s" ctime 0\n' % child['name']
+                           for childpath, child in children)
+        commands += 'set_inode_field / ctime 0\n'
+        subprocess.run(['debugfs', '-w', '-f', '-', path], input=commands.encode(),
+                       check=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, env=env)
+        shutil.rmtree(fsdir)
+
+    def generate(self, imagepath):
+        '''Write the image to imagepath and return its description'''
+        regions = []
+        cuts = sorted(self.rng.sample(range(1, self.size), min(self.regions, self.size) - 1))
+        budgets = [b - a for a, b in zip([0] + cuts, cuts + [self.size])]
+        with open(imagepath, 'wb') as image:
+            for budget in budgets:
+                # random filler or padding in between the regions
+                filler = self.rng.choice(['random', 'padding'])
+                fillersize = self.rng.randint(512, 65536)
+                if filler == 'random':
+                    image.write(self.rng.randbytes(fillersize))
+                else:
+                    image.write(self.rng.choice([b'\x00', b'\xff']) * fillersize)
+                regions.append({'offset': image.tell() - fillersize,
+                                'size': fillersize, 'type': filler})
+
+                path, node = self._node(budget, self.depth)
+                node['offset'] = image.tell()
+                with open(path, 'rb') as infile:
+                    shutil.copyfileobj(infile, image, 1048576)
+                path.unlink()
+                regions.append(node)
+
+        return {
+            'generator': {'seed': self.seed, 'size': self.size,
+                          'depth': self.depth, 'regions': self.regions,
+                          'layers': self.layers},
+            'size': imagepath.stat().st_size,
+            'sha256': sha256_file(imagepath),
+            'regions': regions,
+        }
+
+
+def available_layers(layers):
+    '''Return the layers of which the needed tools are installed'''
+    result = []
+    for layer in layers:
+        missing = [tool for tool in external_layers.get(layer, [])
+                   if shutil.which(tool) is None]
+        if missing:
+            print("%s not found, not generating %s layers" % (missing[0], layer),
+                  file=sys.stderr)
+            continue
+        result.append(layer)
+    return result
+
+
+def generate_image(imagepath, seed=0, size=16*1024*1024, depth=3, regions=4,
+                   layers=default_layers, temporarydirectory=None):
+    '''Generate an image and write the expected composition next to it.
+    Returns the description of the image.'''
+    imagepath = pathlib.Path(imagepath)
+    workdir = pathlib.Path(tempfile.mkdtemp(prefix='bang-synthetic-',
+                                            dir=temporarydirectory))
+    try:
+        generator = FirmwareGenerator(seed, size, depth, regions,
+                                      available_layers(layers), workdir)
+        expected = generator.generate(imagepath)
+    finally:
+        shutil.rmtree(workdir)
+    with open(expected_path(imagepath), 'w') as outfile:
+        json.dump(expected, outfile, indent=4)
+    return expected
+
+
+def expected_path(imagepath):
+    return imagepath.with_name(imagepath.name + '.expected.json')
+
+
+def verify_scan(expected, scanresult):
+    '''Compare the scan result (as stored in bang.pickle) with the
+    expected composition. Return a list of error messages.'''
+    errors = []
+    scantree = scanresult['scantree']
+    hashes = set(r['hash'].get('sha256') for r in scantree.values())
+
+    # every region (except filler) should have been found at its offset
+    root = [r for r in scantree.values() if 'parent' not in r][0]
+    offsets = set(u['offset'] for u in root.get('unpackedfiles', []))
+    for region in expected['regions']:
+        if region['type'] in ['random', 'padding']:
+            continue
+        if region['offset'] not in offsets:
+            errors.append("region %s at offset %d was not found" %
+                          (region['type'], region['offset']))
+        nodes = list(region.get('children', []))
+        # every file in a container should have been unpacked
+        while nodes:
+            node = nodes.pop()
+            if node['sha256'] not in hashes:
+                errors.append("%s (%s) was not unpacked" % (node['name'], node['type']))
+            nodes.extend(node.get('children', []))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic firmware images')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generateparser = subparsers.add_parser('generate', help='generate an image')
+    generateparser.add_argument('image', type=pathlib.Path)
+    generateparser.add_argument('--seed', type=int, default=0)
+    generateparser.add_argument('--size', type=int, default=16*1024*1024,
+                                help='total size of the uncompressed contents in bytes')
+    generateparser.add_argument('--depth', type=int, default=3,
+                                help='maximum nesting depth of containers')
+    generateparser.add_argument('--regions', type=int, default=4,
+                                help='number of top level regions')
+    generateparser.add_argument('--layers', default=','.join(default_layers),
+                                help='comma separated container types, from: %s' % ','.join(all_layers))
+    generateparser.add_argument('-t', '--temporary-directory', dest='temporarydirectory',
+                                default=None, help='directory for temporary data')
+
+    verifyparser = subparsers.add_parser('verify', help='verify a scan of an image')
+    verifyparser.add_argument('expected', type=pathlib.Path)
+    verifyparser.add_argument('scandirectory', type=pathlib.Path)
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        layers = [l for l in args.layers.split(',') if l != '']
+        for layer in layers:
+            if layer not in all_layers:
+                parser.error("unknown layer %s" % layer)
+        if args.regions < 1 or args.size < 1 or args.depth < 0:
+            parser.error("size and regions should be positive, depth not negative")
+        generate_image(args.image, args.seed, args.size, args.depth,
+                       args.regions, layers, args.temporarydirectory)
+    elif args.command == 'verify':
+        expected = json.load(open(args.expected))
+        scanresult = pickle.load(open(args.scandirectory / 'bang.pickle', 'rb'))
+        errors = verify_scan(expected, scanresult)
+        for error in errors:
+            print(error)
+        if errors:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -26,11 +26,22 @@ import string
 import collections
 import tlsh
 
+from bangparallel import get_thread_pool
+
+def adaptive_read_size(filesize, read_size, max_read_size):
+    '''Return the read size to use for a file of filesize bytes: small
+    files are read with read_size, larger files with up to max_read_size
+    bytes at a time, so that a file takes at least 16 reads.'''
+    if max_read_size is None or max_read_size <= read_size:
+        return read_size
+    return max(read_size, min(max_read_size, filesize // 16))
+
 class FileContentsComputer:
     '''Class to process the contents of a file'''
-    def __init__(self, read_size, overlap=0):
+    def __init__(self, read_size, overlap=0, max_read_size=None):
         self.computers = []
         self.read_size = read_size
+        self.max_read_size = max_read_size
         self.overlap = overlap
 
     def subscribe(self, input_computer):
@@ -43,12 +54,14 @@ class FileContentsComputer:
 
     def _read_with_file_read(self, filename):
         filesize = filename.stat().st_size
+        read_size = adaptive_read_size(filesize, self.read_size,
+                                       self.max_read_size)
         bytes_processed = 0
         scanfile = open(filename, 'rb')
         scanfile.seek(0)
         for computer in self.computers:
             computer.initialize()
-        data = scanfile.read(self.read_size)
+        data = scanfile.read(read_size)
         while data != b'':
             bytes_processed += len(data)
             for computer in self.computers:
@@ -56,23 +69,28 @@ class FileContentsComputer:
             if self.overlap > 0 and filesize - bytes_processed > self.overlap:
                 scanfile.seek(-self.overlap, os.SEEK_CUR)
                 bytes_processed -= self.overlap
-            data = scanfile.read(self.read_size)
+            data = scanfile.read(read_size)
         for computer in self.computers:
             computer.finalize()
         scanfile.close()
 
     def _read_with_memory_view(self, filename):
         filesize = filename.stat().st_size
+        read_size = adaptive_read_size(filesize, self.read_size,
+                                       self.max_read_size)
         bytes_processed = 0
         scanfile = open(filename, 'rb')
         scanfile.seek(0)
         for computer in self.computers:
             computer.initialize()
-        scanbytes = bytearray(self.read_size)
+        # the buffer is reused for every read, so computers should not
+        # keep a reference to the data after compute() returns
+        scanbytes = bytearray(read_size)
+        scanview = memoryview(scanbytes)
         bytes_read = scanfile.readinto(scanbytes)
         while bytes_read != 0:
             bytes_processed += bytes_read
-            data = memoryview(scanbytes[:bytes_read])
+            data = scanview[:bytes_read]
             for computer in self.computers:
                 computer.compute(data)
             if self.overlap > 0 and filesize - bytes_processed > self.overlap:
@@ -178,16 +196,31 @@ emptyhashresults = _compute_empty_hash_results()
 
 
 class Hasher:
+    '''Computes the hashes for hash_algorithms. With threads > 1 the
+    hashes of data of at least parallel_minimum bytes are updated
+    concurrently in a thread pool. hashlib releases the GIL for large
+    buffers, so this helps for large reads.'''
     supports_memoryview = True
 
-    def __init__(self, hash_algorithms):
+    parallel_minimum = 65536
+
+    def __init__(self, hash_algorithms, threads=1):
         self.hash_algorithms = hash_algorithms
+        self.threads = min(threads, len(hash_algorithms))
 
     def initialize(self):
         self.hashes = dict([(a, hashlib.new(a))
             for a in self.hash_algorithms])
 
     def compute(self, data):
+        if self.threads > 1 and len(data) >= self.parallel_minimum:
+            pool = get_thread_pool(self.threads)
+            # wait for all updates, as the caller may reuse data
+            futures = [pool.submit(h.update, data)
+                       for h in self.hashes.values()]
+            for f in futures:
+                f.result()
+            return
         for a in self.hashes:
             self.hashes[a].update(data)
 
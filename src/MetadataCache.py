@@ -0,0 +1,182 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+from banglogging import log
+
+
+class MetadataCache:
+    '''An on disk cache (a SQLite database) for metadata that parsers
+    computed for a file, so the same file does not have to be analyzed
+    again in another part of the scan, by another worker process or in
+    another scan.
+
+    Entries are stored per parser with a key (typically a hash of the
+    data, plus anything else the metadata depends on). Each entry
+    records the version of the parser that computed it: entries of
+    other versions are never returned and are removed when the parser
+    stores an entry with a new version. If there are more than
+    maxentries entries, the least recently used entries are removed.
+    This is checked every evictinterval entries that are stored
+    (by default a hundredth of maxentries), and when entries were last
+    used is only written to the database when that is checked, so
+    reading from the cache does not write to the database.
+
+    The database is opened on first use in each process, so the cache
+    can be created before the worker processes are forked. Errors from
+    the database are logged and the cache then behaves as if the entry
+    is not there. If the database cannot be opened at all, the cache is
+    disabled in that process.'''
+    def __init__(self, cachefile, maxentries=100000, timeout=60, evictinterval=None):
+        self.cachefile = cachefile
+        self.maxentries = maxentries
+        self.timeout = timeout
+        if evictinterval is None:
+            evictinterval = max(1, maxentries // 100)
+        self.evictinterval = evictinterval
+        self._connection = None
+        self._connection_pid = None
+        self._disabled_pid = None
+        self._versions = set()
+        self._puts = 0
+        self._used = {}
+
+    def _connect(self):
+        '''Return the connection to the database of this process, or
+        None if the cache is disabled.'''
+        if self._disabled_pid == os.getpid():
+            return None
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = None
+            try:
+                connection = sqlite3.connect(self.cachefile, timeout=self.timeout,
+                                             isolation_level=None)
+                connection.execute('PRAGMA journal_mode=WAL')
+                # the cache does not need to survive a power failure, so
+                # do not wait for the disk for every transaction.
+                connection.execute('PRAGMA synchronous=NORMAL')
+                connection.execute('''CREATE TABLE IF NOT EXISTS metadata (
+                    parser TEXT NOT NULL, key TEXT NOT NULL, version TEXT NOT NULL,
+                    lastused REAL NOT NULL, value BLOB NOT NULL,
+                    PRIMARY KEY (parser, key))''')
+                connection.execute('''CREATE INDEX IF NOT EXISTS metadata_lastused
+                    ON metadata (lastused)''')
+            except sqlite3.Error as e:
+                if connection is not None:
+                    connection.close()
+                log(logging.WARNING, "Metadata cache %s disabled: %s" % (self.cachefile, e))
+                self._disabled_pid = os.getpid()
+                return None
+            self._connection = connection
+            self._connection_pid = os.getpid()
+            self._versions = set()
+            self._puts = 0
+            self._used = {}
+        return self._connection
+
+    def get(self, parser, version, key):
+        '''Return the value stored by version of parser for key,
+        or None if there is no such value.'''
+        connection = self._connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute('''SELECT value FROM metadata
+                WHERE parser = ? AND key = ? AND version = ?''',
+                (parser, key, version)).fetchone()
+        except sqlite3.Error as e:
+            log(logging.WARNING, "Metadata cache %s: %s" % (self.cachefile, e))
+            return None
+        if row is None:
+            return None
+        try:
+            value = pickle.loads(row[0])
+        except Exception as e:
+            # unpickling a corrupted value can raise about any exception
+            log(logging.WARNING, "Metadata cache %s: invalid value: %s" % (self.cachefile, e))
+            return None
+        self._used[(parser, key)] = time.time()
+        return value
+
+    def put(self, parser, version, key, value):
+        '''Store value (which has to be picklable) for key as
+        computed by version of parser.'''
+        connection = self._connect()
+        if connection is None:
+            return
+        try:
+            if (parser, version) not in self._versions:
+                # entries of other versions of the parser are stale
+                connection.execute('''DELETE FROM metadata
+                    WHERE parser = ? AND version != ?''', (parser, version))
+                self._versions.add((parser, version))
+            connection.execute('''INSERT OR REPLACE INTO metadata
+                (parser, key, version, lastused, value)
+                VALUES (?, ?, ?, ?, ?)''',
+                (parser, key, version, time.time(),
+                 pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+            self._puts += 1
+            if self._puts >= self.evictinterval:
+                self.evict()
+        except sqlite3.Error as e:
+            log(logging.WARNING, "Metadata cache %s: %s" % (self.cachefile, e))
+
+    def evict(self):
+        '''Record when entries were last used and remove the least
+        recently used entries if there are more than maxentries
+        entries.'''
+        connection = self._connect()
+        if connection is None:
+            return
+        self._puts = 0
+        if self._used:
+            connection.execute('BEGIN')
+            try:
+                connection.executemany('''UPDATE metadata SET lastused = ?
+                    WHERE parser = ? AND key = ?''',
+                    [(lastused, parser, key) for ((parser, key), lastused) in self._used.items()])
+                connection.execute('COMMIT')
+            except:
+                connection.execute('ROLLBACK')
+                raise
+            self._used = {}
+        entries = connection.execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        if entries <= self.maxentries:
+            return
+        connection.execute('''DELETE FROM metadata WHERE rowid IN
+            (SELECT rowid FROM metadata ORDER BY lastused LIMIT ?)''',
+            (entries - self.maxentries,))
+
+    def __getstate__(self):
+        # connections cannot be pickled or shared between processes
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_connection_pid'] = None
+        state['_disabled_pid'] = None
+        state['_versions'] = set()
+        state['_puts'] = 0
+        state['_used'] = {}
+        return state
@@ -24,6 +24,7 @@ import os
 from ByteCountReporter import *
 from PickleReporter import *
 from JsonReporter import *
+from ScanStatistics import ScanStatistics
 
 class ScanEnvironment:
     tlshlabelsignore = set([
@@ -35,7 +36,10 @@ class ScanEnvironment:
                  tlshmaximum, synthesizedminimum, logging,
                  paddingname, unpackdirectory, temporarydirectory,
                  resultsdirectory, scanfilequeue, resultqueue,
-                 processlock, checksumdict,
+                 processlock, checksumdict, statisticsdict=None,
+                 profiler=None, maxreadsize=None, hashthreads=1,
+                 unpackthreads=1, scanprofile=frozenset(),
+                 metadatacache=None,
                 ):
         """unpackdirectory: a Path object, absolute
            temporarydirectory: a Path object, absolute
@@ -44,10 +48,33 @@ class ScanEnvironment:
            processlock: a Lock object that guards access to shared objects
            checksumdict: a shared dictionary to store hashes of files to
                          prevent scans of duplicate files.
+           statisticsdict: a shared dictionary where each process stores
+                           its scan statistics, or None to not collect
+                           statistics.
+           profiler: a ScanProfiler object, or None to disable profiling.
+           maxreadsize: the maximum size of reads for computing hashes of
+                        large files, or None to always use readsize.
+           hashthreads: the number of threads to compute hashes with.
+           unpackthreads: the number of threads unpackers can use to
+                          decompress data in parallel.
+           scanprofile: a set with the names of optional, detailed
+                        metadata that parsers should extract, for example
+                        'dex_methods'. This metadata is expensive to compute
+                        and store, so it is not extracted by default. It
+                        can also contain 'fast_verify_images', to only
+                        verify the structure of images and not decode them.
+           metadatacache: a MetadataCache object that parsers can use to
+                          store and reuse metadata of files, or None to
+                          disable caching.
         """
         # TODO: init from options object
         self.maxbytes = maxbytes
         self.readsize = readsize
+        self.maxreadsize = maxreadsize
+        self.hashthreads = hashthreads
+        self.unpackthreads = unpackthreads
+        self.scanprofile = scanprofile
+        self.metadatacache = metadatacache
         self.createbytecounter = createbytecounter
         self.createjson = createjson
         self.tlshmaximum = tlshmaximum
@@ -61,6 +88,9 @@ class ScanEnvironment:
         self.resultqueue = resultqueue
         self.processlock = processlock
         self.checksumdict = checksumdict
+        self.statisticsdict = statisticsdict
+        self.statistics = ScanStatistics()
+        self.profiler = profiler
         self.unpackparsers = []
         self.unpackparsers_for_extensions = {}
         self.unpackparsers_for_signatures = {}
@@ -73,6 +103,21 @@ class ScanEnvironment:
     def get_readsize(self):
         return self.readsize
 
+    def get_maxreadsize(self):
+        return self.maxreadsize
+
+    def get_hashthreads(self):
+        return self.hashthreads
+
+    def get_unpackthreads(self):
+        return self.unpackthreads
+
+    def get_scanprofile(self):
+        return self.scanprofile
+
+    def get_metadatacache(self):
+        return self.metadatacache
+
     def get_createbytecounter(self):
         return self.createbytecounter
 
@@ -86,6 +131,12 @@ class ScanEnvironment:
         """check whether tlsh is useful here, based on file size and labels."""
         return (256 <= filesize <= self.tlshmaximum) and self.tlshlabelsignore.isdisjoint(labels)
 
+    def store_statistics(self):
+        """make the statistics of the current process available to
+        the main process."""
+        if self.statisticsdict is not None:
+            self.statisticsdict[os.getpid()] = self.statistics.get()
+
     def get_synthesizedminimum(self):
         return self.synthesizedminimum
 
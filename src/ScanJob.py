@@ -37,6 +37,7 @@ from FileResult import FileResult
 from FileContentsComputer import *
 from UnpackManager import *
 from UnpackParserException import UnpackParserException
+from ScanStatistics import signature_name
 
 class ScanJobError(Exception):
     def __new__(cls, *args, **kwargs):
@@ -184,16 +185,20 @@ class ScanJob:
     def check_for_valid_extension(self, unpacker):
         # TODO: this method will try to unpack multiple extensions
         # if they match. Is this the intention?
+        statistics = self.scanenvironment.statistics
         for extension, unpackparsers in \
                 self.scanenvironment.get_unpackparsers_for_extensions().items():
             for unpackparser in unpackparsers:
                 if bangsignatures.matches_file_pattern(self.fileresult.filename, extension):
                     log(logging.INFO, "TRYING extension match %s %s" % (self.fileresult.filename, extension))
+                    statistics_start = statistics.start_parser()
                     try:
                         unpackresult = unpacker.try_unpack_file_for_extension(
                             self.fileresult, self.scanenvironment,
                             extension, unpackparser)
                     except UnpackParserException as e:
+                        statistics.end_parser(unpackparser.pretty_name,
+                                              statistics_start, False)
                         # No data could be unpacked for some reason
                         log(logging.DEBUG, "FAIL %s known extension %s: %s" %
                             (self.fileresult.filename, extension,
@@ -205,6 +210,10 @@ class ScanJob:
                         unpacker.remove_data_unpack_directory_tree()
                         continue
 
+                    statistics.end_parser(unpackparser.pretty_name,
+                                          statistics_start, True)
+                    statistics.add('bytes_unpacked', unpackresult.get_length())
+
                     # the file could be unpacked successfully,
                     # so log it as such.
                     log(logging.INFO, "SUCCESS %s %s at offset: 0, length: %d" %
@@ -249,11 +258,13 @@ class ScanJob:
             # instead of:
             # while unpacker.get_current_offset_in_file() != self.fileresult.filesize:
             sigs_and_unpackers = self.scanenvironment.get_unpackparsers_for_signatures().items()
+            statistics = self.scanenvironment.statistics
             while True:
                 candidateoffsetsfound = set()
                 for s, unpackparsers in sigs_and_unpackers:
                     offsets = unpacker.find_offsets_for_signature(s,
                             unpackparsers, self.fileresult.filesize)
+                    statistics.add_candidates(signature_name(s), len(offsets))
                     candidateoffsetsfound.update(offsets)
 
                 # For each of the found candidates see if any
@@ -287,11 +298,15 @@ class ScanJob:
                     log(logging.DEBUG, "TRYING %s %s at offset: %d" %
                         (self.fileresult.filename, unpackparser.pretty_name, offset))
 
+                    statistics_start = statistics.start_parser()
                     try:
                         unpackresult = unpacker.try_unpack_file_for_signatures(
                             self.fileresult, self.scanenvironment,
                             unpackparser, offset)
                     except UnpackParserException as e:
+                        statistics.end_parser(unpackparser.pretty_name,
+                                              statistics_start, False)
+
                         # No data could be unpacked for some reason,
                         # so log the status and error message
                         log(logging.DEBUG, "FAIL %s %s at offset: %d: %s" %
@@ -315,6 +330,10 @@ class ScanJob:
                         # scanning. TODO: find an elegant solution for this.
                         continue
 
+                    statistics.end_parser(unpackparser.pretty_name,
+                                          statistics_start, True)
+                    statistics.add('bytes_unpacked', unpackresult.get_length())
+
                     # first rewrite the offset, if needed
                     # (example: coreboot file system)
                     offset = unpackresult.get_offset(default=offset)
@@ -505,9 +524,15 @@ class ScanJob:
         scanfile.close()
 
     def do_content_computations(self):
-        fc = FileContentsComputer(self.scanenvironment.get_readsize())
-        hasher = Hasher(hash_algorithms)
-        fc.subscribe(hasher)
+        fc = FileContentsComputer(self.scanenvironment.get_readsize(),
+                max_read_size=self.scanenvironment.get_maxreadsize())
+        # unpackers can compute the hashes while writing the file, in
+        # which case there is no need to compute them again.
+        known_hashes = self.fileresult.get_hashresult()
+        hashes_known = all(a in known_hashes for a in hash_algorithms)
+        if not hashes_known:
+            hasher = Hasher(hash_algorithms, self.scanenvironment.get_hashthreads())
+            fc.subscribe(hasher)
 
         if self.scanenvironment.get_createbytecounter() and 'padding' not in self.fileresult.labels:
             byte_counter = ByteCounter()
@@ -523,7 +548,10 @@ class ScanJob:
         filename_full = self.scanenvironment.unpack_path(self.fileresult.filename)
         fc.read(filename_full)
 
-        hashresults = dict(hasher.get())
+        if hashes_known:
+            hashresults = {}
+        else:
+            hashresults = dict(hasher.get())
         if self.scanenvironment.use_tlsh(self.fileresult.filesize, self.fileresult.labels):
             # there might not be a valid hex digest for files
             # with little or no entropy, for example files with
@@ -550,6 +578,7 @@ class ScanJob:
         # TODO: this is assuming that only one featureless file can be extracted
         # and not more
         if 'text' in self.fileresult.labels and unpacker.unpacked_range() == []:
+            statistics = self.scanenvironment.statistics
             for unpack_parser in \
                     self.scanenvironment.get_unpackparsers_for_featureless_files():
                 namecounter = unpacker.make_data_unpack_directory(
@@ -558,16 +587,23 @@ class ScanJob:
 
                 log(logging.DEBUG, "TRYING %s %s at offset: 0" %
                         (self.fileresult.filename, unpack_parser.pretty_name))
+                statistics_start = statistics.start_parser()
                 try:
                     unpackresult = unpacker.try_unpack_without_features(
                         self.fileresult, self.scanenvironment, unpack_parser, 0)
                 except UnpackParserException as e:
+                    statistics.end_parser(unpack_parser.pretty_name,
+                                          statistics_start, False)
                     log(logging.DEBUG, "FAIL %s %s at offset: %d: %s" %
                         (self.fileresult.filename, unpack_parser.pretty_name, 0,
                             e.args))
                     unpacker.remove_data_unpack_directory_tree()
                     continue
 
+                statistics.end_parser(unpack_parser.pretty_name,
+                                      statistics_start, True)
+                statistics.add('bytes_unpacked', unpackresult.get_length())
+
                 log(logging.INFO, "SUCCESS %s %s at offset: %d, length: %d" %
                     (self.fileresult.filename, unpack_parser.pretty_name, 0,
                     unpackresult.get_length()))
@@ -620,30 +656,55 @@ class ScanJob:
 # running.
 def processfile(scanenvironment):
 
+    os.chdir(scanenvironment.unpackdirectory)
+
+    try:
+        process_scan_jobs(scanenvironment)
+    finally:
+        # the statistics and profile are only made available to the main
+        # process once, when the worker process exits, also if a scan
+        # job failed.
+        scanenvironment.store_statistics()
+        if scanenvironment.profiler is not None:
+            scanenvironment.profiler.dump()
+
+def process_scan_jobs(scanenvironment):
+    '''Process scan jobs from the scan queue, until a None job
+    is received.'''
     scanfilequeue = scanenvironment.scanfilequeue
     resultqueue = scanenvironment.resultqueue
     processlock = scanenvironment.processlock
     checksumdict = scanenvironment.checksumdict
 
-    carveunpacked = True
+    profiler = scanenvironment.profiler
 
-    os.chdir(scanenvironment.unpackdirectory)
+    carveunpacked = True
 
     while True:
         try:
             scanjob = scanfilequeue.get(timeout=86400)
-            if not scanjob: continue
+            if scanjob is None:
+                # the scan is done
+                scanfilequeue.task_done()
+                break
+            if profiler is not None:
+                profiletoken = profiler.start_job()
             scanjob.set_scanenvironment(scanenvironment)
             scanjob.initialize()
             fileresult = scanjob.fileresult
 
+            scanenvironment.statistics.add('files')
+
             unscannable = scanjob.check_unscannable_file()
             if unscannable:
                 resultqueue.put(scanjob.fileresult)
+                if profiler is not None:
+                    profiler.stop(profiletoken)
                 scanfilequeue.task_done()
                 continue
 
-            unpacker = UnpackManager(scanenvironment.unpackdirectory)
+            unpacker = UnpackManager(scanenvironment.unpackdirectory,
+                                     scanenvironment.statistics)
             scanjob.prepare_for_unpacking()
             scanjob.check_for_padding_file(unpacker)
             scanjob.check_for_unpacked_file(unpacker)
@@ -681,6 +742,9 @@ def processfile(scanenvironment):
             # scanjob.fileresult.set_filesize(scanjob.filesize)
 
             resultqueue.put(scanjob.fileresult)
+
+            if profiler is not None:
+                profiler.stop(profiletoken)
             scanfilequeue.task_done()
         except Exception as e:
             tb = sys.exc_info()[2]
@@ -0,0 +1,96 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import cProfile
+import os
+import pstats
+import time
+
+
+class ScanProfiler:
+    '''Profiles the work done in a worker process with cProfile.
+    If no parsers are given, then every scan job is profiled, otherwise
+    only the unpack attempts of the given parsers (by pretty name) are
+    profiled. Profiles of jobs or parsers that took less than
+    minimumduration seconds are discarded.
+
+    Each worker process writes its own profile to profiledirectory when
+    it exits, which can be combined with merge_profiles() afterwards.'''
+    def __init__(self, profiledirectory, parsers=[], minimumduration=0):
+        self.profiledirectory = profiledirectory
+        self.parsers = set(parsers)
+        self.minimumduration = minimumduration
+        self.stats = None
+
+    def start_job(self):
+        '''Start profiling a scan job, if needed. Returns a token that
+        has to be passed to stop().'''
+        if self.parsers:
+            return None
+        return self._start()
+
+    def start_parser(self, pretty_name):
+        '''Start profiling an unpack attempt of the parser pretty_name,
+        if needed. Returns a token that has to be passed to stop().'''
+        if pretty_name not in self.parsers:
+            return None
+        return self._start()
+
+    def _start(self):
+        profile = cProfile.Profile()
+        starttime = time.perf_counter()
+        profile.enable()
+        return (profile, starttime)
+
+    def stop(self, token):
+        '''Stop profiling and record the profile if it took long enough'''
+        if token is None:
+            return
+        profile, starttime = token
+        profile.disable()
+        if time.perf_counter() - starttime < self.minimumduration:
+            return
+        if self.stats is None:
+            self.stats = pstats.Stats(profile)
+        else:
+            self.stats.add(profile)
+
+    def dump(self):
+        '''Write the profile of this worker process, if anything was
+        profiled. Called once, when the worker process exits.'''
+        if self.stats is None:
+            return
+        self.stats.dump_stats(self.profiledirectory /
+                              ("worker-%d.prof" % os.getpid()))
+
+
+def merge_profiles(profiledirectory, profilefilename, reportfile, limit=100):
+    '''Merge all worker profiles in profiledirectory into a single profile
+    written to profilefilename and write a report with the top limit
+    functions (by cumulative time) to the (text mode) file reportfile.
+    Returns False if there were no profiles to merge.'''
+    profiles = sorted(profiledirectory.glob('worker-*.prof'))
+    if profiles == []:
+        return False
+    stats = pstats.Stats(*map(str, profiles), stream=reportfile)
+    stats.dump_stats(profilefilename)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return True
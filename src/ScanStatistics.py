@@ -0,0 +1,128 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+import collections
+import csv
+import json
+import time
+
+# names of the global counters, in the order they are reported
+counter_names = ['files', 'bytes_scanned', 'bytes_unpacked',
+                 'directories_created', 'directories_removed',
+                 'temporary_bytes_written']
+
+# names of the per parser statistics, in the order they are reported
+parser_fields = ['attempts', 'successes', 'failures', 'wall', 'cpu']
+
+
+class ScanStatistics:
+    '''Collects counters about a scan. Every worker process keeps its own
+    ScanStatistics object, so updating the counters does not need any
+    locking. The results of all workers are merged when the scan is done.'''
+    def __init__(self):
+        self.counters = collections.Counter()
+        self.parsers = {}
+        self.candidates = collections.Counter()
+
+    def add(self, name, value=1):
+        '''Increase the global counter name with value'''
+        self.counters[name] += value
+
+    def add_candidates(self, signature, count):
+        '''Record the amount of candidate offsets found for a signature'''
+        if count != 0:
+            self.candidates[signature] += count
+
+    def start_parser(self):
+        '''Return a token with the current wall and CPU time, to be passed
+        to end_parser when the parser has finished.'''
+        return (time.perf_counter(), time.process_time())
+
+    def end_parser(self, pretty_name, start, success):
+        '''Record an attempt of the parser pretty_name, which was
+        started at start (as returned by start_parser).'''
+        wall = time.perf_counter() - start[0]
+        cpu = time.process_time() - start[1]
+        stats = self.parsers.get(pretty_name)
+        if stats is None:
+            stats = dict.fromkeys(parser_fields, 0)
+            self.parsers[pretty_name] = stats
+        stats['attempts'] += 1
+        if success:
+            stats['successes'] += 1
+        else:
+            stats['failures'] += 1
+        stats['wall'] += wall
+        stats['cpu'] += cpu
+
+    def get(self):
+        '''Return the statistics as a dictionary with only standard
+        types, so it can be sent to other processes and serialized.'''
+        return {
+            'counters': dict(self.counters),
+            'parsers': dict((k, dict(v)) for k, v in self.parsers.items()),
+            'candidates': dict(self.candidates),
+        }
+
+
+def signature_name(signature):
+    '''Return a printable name for a (offset, bytes) signature'''
+    s_offset, s_text = signature
+    return "%d:%s" % (s_offset, s_text.hex())
+
+
+def merge_statistics(statistics):
+    '''Merge an iterable of dictionaries as returned by
+    ScanStatistics.get() into a single dictionary.'''
+    counters = collections.Counter(dict.fromkeys(counter_names, 0))
+    parsers = {}
+    candidates = collections.Counter()
+    workers = 0
+    for s in statistics:
+        workers += 1
+        counters.update(s['counters'])
+        candidates.update(s['candidates'])
+        for pretty_name, stats in s['parsers'].items():
+            merged = parsers.setdefault(pretty_name,
+                                        dict.fromkeys(parser_fields, 0))
+            for field in parser_fields:
+                merged[field] += stats[field]
+    return {
+        'workers': workers,
+        'counters': dict(counters),
+        'parsers': parsers,
+        'candidates': dict(candidates.most_common()),
+    }
+
+
+def write_statistics_json(statistics, outfile):
+    '''Write merged statistics to the (text mode) file outfile'''
+    json.dump(statistics, outfile, indent=4)
+
+
+def write_statistics_csv(statistics, outfile):
+    '''Write the per parser statistics of merged statistics to the
+    (text mode) file outfile, sorted by wall time, slowest first.'''
+    csv_writer = csv.writer(outfile)
+    csv_writer.writerow(['parser'] + parser_fields)
+    for pretty_name, stats in sorted(statistics['parsers'].items(),
+                                     key=lambda x: x[1]['wall'], reverse=True):
+        csv_writer.writerow([pretty_name] + [stats[f] for f in parser_fields])
@@ -30,13 +30,15 @@ import bangsignatures
 from bangsignatures import maxsignaturesoffset
 
 from UnpackParserException import UnpackParserException
+from ScanStatistics import ScanStatistics
 
 class UnpackManager:
     """The UnpackManager manages the unpacking (analysis and extraction) of a
     file."""
-    def __init__(self, unpackroot):
+    def __init__(self, unpackroot, statistics=None):
         """Create UnpackManager object, relative to unpackroot.
         unpackroot is an absolute path object.
+        statistics is a ScanStatistics object to record counters in.
         """
         # Invariant: lastunpackedoffset ==
         # last known position in file with successfully unpacked data
@@ -48,6 +50,9 @@ class UnpackManager:
         self.signaturesfound = []
         self.counterspersignature = {}
         self.unpackroot = unpackroot
+        if statistics is None:
+            statistics = ScanStatistics()
+        self.statistics = statistics
 
     def needs_unpacking(self):
         ''' Return whether or not a file needs further unpacking'''
@@ -90,6 +95,7 @@ class UnpackManager:
             try:
                 os.makedirs(self.unpackroot / dirpath, exist_ok=True)
                 self.dataunpackdirectory = dirpath
+                self.statistics.add('directories_created')
                 break
             except FileExistsError:
                 seqnr += 1
@@ -100,6 +106,7 @@ class UnpackManager:
         if not (self.unpackroot / self.dataunpackdirectory).exists():
             return
         os.rmdir(os.path.join(self.unpackroot, self.dataunpackdirectory))
+        self.statistics.add('directories_removed')
 
     def remove_data_unpack_directory_tree(self):
         '''Remove the unpacking directory, including any
@@ -124,6 +131,7 @@ class UnpackManager:
                     os.chmod(fullfilename,
                              stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR)
         shutil.rmtree(os.path.join(self.unpackroot, self.dataunpackdirectory))
+        self.statistics.add('directories_removed')
 
     def get_data_unpack_directory(self):
         '''Return the location of the data unpack directory'''
@@ -137,6 +145,16 @@ class UnpackManager:
         self.make_data_unpack_directory(fileresult.get_unpack_directory_parent(), unpackparser.pretty_name, 0)
         up = unpackparser(fileresult, scanenvironment, self.dataunpackdirectory,
                 0)
+        return self._run_unpackparser(up, fileresult, scanenvironment)
+
+    def _run_unpackparser(self, up, fileresult, scanenvironment):
+        """parses and unpacks with the unpackparser object up, and carves
+        the data if it does not cover the entire file. If profiling is
+        enabled for this unpackparser, this is done under the profiler.
+        """
+        profiler = scanenvironment.profiler
+        if profiler is not None:
+            profiletoken = profiler.start_parser(up.pretty_name)
         up.open()
         try:
             unpackresult = up.parse_and_unpack()
@@ -146,6 +164,8 @@ class UnpackManager:
             raise e
         finally:
             up.close()
+            if profiler is not None:
+                profiler.stop(profiletoken)
 
         return unpackresult
 
@@ -179,6 +199,7 @@ class UnpackManager:
     def read_chunk_from_scanfile(self):
         self.offsetinfile = self.get_current_offset_in_file()
         self.bytesread = self.scanfile.readinto(self.scanbytesarray)
+        self.statistics.add('bytes_scanned', self.bytesread)
 
     def close_scanfile(self):
         '''Close the file'''
@@ -221,31 +242,13 @@ class UnpackManager:
             unpackparser, offset):
         up = unpackparser(fileresult, scanenvironment, self.dataunpackdirectory,
                 offset)
-        up.open()
-        try:
-            unpackresult = up.parse_and_unpack()
-            if unpackresult.get_length() != fileresult.filesize:
-                up.carve()
-        except UnpackParserException as e:
-            raise e
-        finally:
-            up.close()
-        return unpackresult
+        return self._run_unpackparser(up, fileresult, scanenvironment)
 
     def try_unpack_without_features(self, fileresult, scanenvironment, unpackparser,  offset):
+        # TODO: let up generate name when carving
         up = unpackparser(fileresult, scanenvironment, self.dataunpackdirectory,
                 0)
-        up.open()
-        try:
-            unpackresult = up.parse_and_unpack()
-            if unpackresult.get_length() != fileresult.filesize:
-                # TODO: let up generate name
-                up.carve()
-        except UnpackParserException as e:
-            raise e
-        finally:
-            up.close()
-        return unpackresult
+        return self._run_unpackparser(up, fileresult, scanenvironment)
 
     def file_unpacked(self, unpackresult, filesize):
         # store the location of where the successfully
@@ -4,25 +4,78 @@ from UnpackParserException import UnpackParserException
 from UnpackResults import UnpackResults
 from FileResult import FileResult
 
+import mmap
 import os
 import pathlib
 
 class OffsetInputFile:
+    """A read-only file object for the data in infile starting at offset.
+    The data is read from a memory map of infile, so reading a field does
+    not need a system call or any buffering, which makes Kaitai Struct
+    parsers, which read every field separately, a lot faster. Positions
+    are relative to offset, so a KaitaiStream over an OffsetInputFile
+    starts at offset as well.
+
+    Although this is a file object for the data at offset, fileno() gives
+    the file descriptor of infile, so offset should be added when the file
+    descriptor is used directly, for example with os.sendfile().
+    """
     def __init__(self, infile, offset):
         self.infile = infile
         self.offset = offset
+        try:
+            self.data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            self.data = b''
+        self.size = len(self.data)
+        # the position is an absolute position in infile
+        self.position = offset
 
     def __getattr__(self, name):
         return self.infile.__getattribute__(name)
 
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self.data[self.position:]
+        else:
+            data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
     def seek(self, offset, whence=os.SEEK_SET):
         if whence == os.SEEK_SET:
-            return self.infile.seek(offset + self.offset, whence)
-        return self.infile.seek(offset, whence)
+            position = self.offset + offset
+        elif whence == os.SEEK_CUR:
+            position = self.position + offset
+        else:
+            position = self.size + offset
+        if position < self.offset:
+            raise ValueError("negative seek position %d" % (position - self.offset))
+        self.position = position
+        return position - self.offset
 
     def tell(self):
-        return self.infile.tell() - self.offset
+        return self.position - self.offset
+
+    def seekable(self):
+        return True
 
+    def readable(self):
+        return True
+
+    def fileno(self):
+        return self.infile.fileno()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.infile.close()
 
 
 class UnpackParser:
@@ -197,6 +250,12 @@ class WrappedUnpackParser(UnpackParser):
         unpack_results.set_length(r['length'])
         frs = [ FileResult(self.fileresult, pathlib.Path(x[0]), set(x[1]))
                 for x in r['filesandlabels'] ]
+        # unpack functions that compute the hashes of unpacked files
+        # while writing them can pass these in 'hashes', so the files
+        # do not have to be read again for hashing.
+        for fr, x in zip(frs, r['filesandlabels']):
+            for hash_algorithm, hash_value in r.get('hashes', {}).get(x[0], {}).items():
+                fr.set_hashresult(hash_algorithm, hash_value)
         unpack_results.set_unpacked_files(frs)
         unpack_results.set_offset(r.get('offset'))
         unpack_results.set_labels(r.get('labels', []))
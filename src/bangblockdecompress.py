@@ -0,0 +1,311 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+# Parallel decompression of bzip2 and XZ streams that consist of
+# multiple independent blocks.
+#
+# bzip2 compresses data in blocks of at most 900k that start with a
+# (not byte aligned) 48 bit magic. XZ files that were created with
+# multiple threads (xz -T) contain multiple blocks that record their
+# compressed size, and an index with the sizes of all blocks.
+#
+# Every block is turned into a stream with a single block, so the
+# standard Python modules can decompress (and verify) it, and the
+# blocks are decompressed in a thread pool: bz2 and lzma release the
+# GIL while decompressing. If anything about the blocks is not as
+# expected None is returned, so the caller can fall back to
+# decompressing the stream serially.
+
+import bz2
+import lzma
+import mmap
+import os
+import struct
+import zlib
+
+from bangparallel import ordered_map
+
+# https://en.wikipedia.org/wiki/Bzip2#File_format
+bzip2_block_magic = 0x314159265359
+bzip2_end_of_stream_magic = 0x177245385090
+
+# the amount of bzip2 data in which block boundaries are searched in
+# one go. Searching stops after the end of the stream has been found.
+bzip2_search_size = 16777216
+
+# https://tukaani.org/xz/xz-file-format.txt
+xz_header_magic = b'\xfd\x37\x7a\x58\x5a\x00'
+xz_footer_magic = b'YZ'
+
+
+def find_bit_pattern(data, pattern, patternbits, start, end):
+    '''Find all (not necessarily byte aligned) occurences of a pattern
+    of patternbits bits (at most 48) in data[start:end]. Returns a
+    sorted list of bit positions.'''
+    positions = []
+    for shift in range(8):
+        # the pattern in a window of 7 bytes, starting at bit 'shift'
+        windowshift = 56 - patternbits - shift
+        window = (pattern << windowshift).to_bytes(7, byteorder='big')
+        mask = (((1 << patternbits) - 1) << windowshift).to_bytes(7, byteorder='big')
+        # bytes 1 to 5 of the window are always part of the pattern
+        core = window[1:6]
+        pos = data.find(core, start + 1, end)
+        while pos != -1:
+            windowstart = pos - 1
+            if data[windowstart] & mask[0] == window[0] and \
+                    (mask[6] == 0 or (pos + 5 < len(data) and
+                                      data[pos + 5] & mask[6] == window[6])):
+                positions.append(windowstart * 8 + shift)
+            pos = data.find(core, pos + 1, end)
+    positions.sort()
+    return positions
+
+
+def read_bits(data, startbit, endbit):
+    '''Return the bits from startbit to endbit in data as an integer.'''
+    chunk = data[startbit // 8:(endbit + 7) // 8]
+    value = int.from_bytes(chunk, byteorder='big')
+    value >>= len(chunk) * 8 - (startbit % 8) - (endbit - startbit)
+    return value & ((1 << (endbit - startbit)) - 1)
+
+
+def find_bzip2_blocks(data, offset):
+    '''Find the blocks of the bzip2 stream at offset in data. Returns
+    a list of (start bit, end bit) of the blocks and the end of the
+    stream (in bytes), or None if no valid list of blocks was found.'''
+    if data[offset:offset+3] != b'BZh':
+        return None
+    blockstarts = []
+    endofstream = None
+    searchstart = offset + 4
+    while endofstream is None and searchstart < len(data):
+        # have a small overlap the size of the magic
+        searchend = min(len(data), searchstart + bzip2_search_size + 6)
+        for position in find_bit_pattern(data, bzip2_block_magic, 48,
+                                         searchstart - 1, searchend):
+            if position >= searchstart * 8 and position not in blockstarts:
+                blockstarts.append(position)
+        for position in find_bit_pattern(data, bzip2_end_of_stream_magic, 48,
+                                         searchstart - 1, searchend):
+            if position >= searchstart * 8 and blockstarts and position > blockstarts[0]:
+                endofstream = position
+                break
+        searchstart += bzip2_search_size
+    if endofstream is None or blockstarts == [] or blockstarts[0] != (offset + 4) * 8:
+        return None
+
+    # a block starts with the magic and a CRC32
+    blockstarts = [b for b in blockstarts if b < endofstream]
+    blockends = blockstarts[1:] + [endofstream]
+    blocks = list(zip(blockstarts, blockends))
+    if any(end - start <= 80 for (start, end) in blocks):
+        return None
+
+    # the end of stream marker is followed by the combined CRC, which
+    # is computed from the CRCs of the blocks.
+    if (endofstream + 80 + 7) // 8 > len(data):
+        return None
+    combinedcrc = 0
+    for (start, end) in blocks:
+        blockcrc = read_bits(data, start + 48, start + 80)
+        combinedcrc = ((combinedcrc << 1) | (combinedcrc >> 31)) & 0xffffffff
+        combinedcrc ^= blockcrc
+    if combinedcrc != read_bits(data, endofstream + 48, endofstream + 80):
+        return None
+    return (blocks, (endofstream + 80 + 7) // 8)
+
+
+def decompress_bzip2_block(data, level, startbit, endbit):
+    '''Decompress the bzip2 block from startbit to endbit in data.'''
+    blockbits = endbit - startbit
+    block = read_bits(data, startbit, endbit)
+    blockcrc = (block >> (blockbits - 80)) & 0xffffffff
+
+    # create a stream with just this block, for which the combined
+    # CRC is the CRC of the block.
+    stream = (block << 80) | (bzip2_end_of_stream_magic << 32) | blockcrc
+    streambits = blockbits + 80
+    padding = (-streambits) % 8
+    stream = (stream << padding).to_bytes((streambits + padding) // 8, byteorder='big')
+    return bz2.decompress(b'BZh' + level + stream)
+
+
+def read_xz_number(data, position):
+    '''Read a variable length integer from XZ data. Returns the number
+    and the position after the number.'''
+    number = 0
+    for i in range(9):
+        byte = data[position + i]
+        number |= (byte & 0x7f) << (i * 7)
+        if byte & 0x80 == 0:
+            return (number, position + i + 1)
+    raise ValueError('invalid number')
+
+
+def encode_xz_number(number):
+    '''Encode a number as a variable length integer for XZ.'''
+    encoded = bytearray()
+    while number >= 0x80:
+        encoded.append((number & 0x7f) | 0x80)
+        number >>= 7
+    encoded.append(number)
+    return bytes(encoded)
+
+
+def xz_check_size(streamflags):
+    '''Return the size of the check of the blocks in a stream.'''
+    checktype = streamflags[1] & 0x0f
+    if checktype == 0:
+        return 0
+    return 4 << ((checktype - 1) // 3)
+
+
+def find_xz_blocks(data, offset):
+    '''Find the blocks of the XZ stream at offset in data. Returns the
+    stream header, a list of (start, end, unpadded size, uncompressed
+    size) of the blocks and the end of the stream, or None if the
+    sizes of the blocks are not recorded in the block headers or do
+    not match with the index.'''
+    try:
+        if data[offset:offset+6] != xz_header_magic:
+            return None
+        streamheader = data[offset:offset+12]
+        checksize = xz_check_size(streamheader[6:8])
+        blocks = []
+        position = offset + 12
+        while data[position] != 0:
+            headersize = (data[position] + 1) * 4
+            blockflags = data[position + 1]
+            # the compressed size is needed to find the next block
+            if blockflags & 0x40 == 0:
+                return None
+            (compressedsize, fieldposition) = read_xz_number(data, position + 2)
+            unpaddedsize = headersize + compressedsize + checksize
+            end = position + headersize + compressedsize
+            end += (-(end - offset)) % 4 + checksize
+            blocks.append((position, end, unpaddedsize))
+            position = end
+            if position >= len(data):
+                return None
+
+        # the index records the unpadded size and uncompressed size
+        # of every block.
+        indexstart = position
+        (records, position) = read_xz_number(data, position + 1)
+        if records != len(blocks):
+            return None
+        xzblocks = []
+        for (start, end, unpaddedsize) in blocks:
+            (indexunpaddedsize, position) = read_xz_number(data, position)
+            (uncompressedsize, position) = read_xz_number(data, position)
+            if indexunpaddedsize != unpaddedsize:
+                return None
+            xzblocks.append((start, end, unpaddedsize, uncompressedsize))
+        position += (-(position - indexstart)) % 4
+        if struct.unpack('<I', data[position:position+4])[0] != \
+                zlib.crc32(data[indexstart:position]):
+            return None
+        position += 4
+
+        # the footer has the same stream flags as the header
+        footer = data[position:position+12]
+        if len(footer) != 12 or footer[10:12] != xz_footer_magic or \
+                footer[8:10] != streamheader[6:8]:
+            return None
+        return (streamheader, xzblocks, position + 12)
+    except (IndexError, ValueError, struct.error):
+        return None
+
+
+def decompress_xz_block(data, streamheader, block):
+    '''Decompress a block from find_xz_blocks().'''
+    (start, end, unpaddedsize, uncompressedsize) = block
+
+    # create a stream with just this block
+    index = b'\x00' + encode_xz_number(1) + encode_xz_number(unpaddedsize) + \
+            encode_xz_number(uncompressedsize)
+    index += b'\x00' * ((-len(index)) % 4)
+    index += struct.pack('<I', zlib.crc32(index))
+    footer = struct.pack('<I', len(index) // 4 - 1) + streamheader[6:8]
+    footer = struct.pack('<I', zlib.crc32(footer)) + footer + xz_footer_magic
+    unpackeddata = lzma.decompress(streamheader + data[start:end] + index + footer,
+                                   format=lzma.FORMAT_XZ)
+    if len(unpackeddata) != uncompressedsize:
+        raise lzma.LZMAError('wrong uncompressed size')
+    return unpackeddata
+
+
+def _decompress_blocks_to_file(decompress, blocks, outfile_full, threads):
+    '''Decompress blocks in threads and write the data, in order, to
+    outfile_full. Returns False if a block could not be decompressed.'''
+    outfile = open(outfile_full, 'wb')
+    try:
+        for unpackeddata in ordered_map(decompress, blocks, threads):
+            outfile.write(unpackeddata)
+    except (OSError, EOFError, ValueError, lzma.LZMAError):
+        return False
+    finally:
+        outfile.close()
+    return True
+
+
+def unpack_bzip2_parallel(filename, offset, outfile_full, threads):
+    '''Decompress the bzip2 stream at offset in filename to outfile_full,
+    with the blocks decompressed in threads. Returns the length of the
+    stream, or None if the stream could not be unpacked this way.'''
+    with open(filename, 'rb') as checkfile:
+        data = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        bzip2blocks = find_bzip2_blocks(data, offset)
+        if bzip2blocks is None:
+            return None
+        (blocks, endofstream) = bzip2blocks
+        level = data[offset+3:offset+4]
+        if not _decompress_blocks_to_file(
+                lambda block: decompress_bzip2_block(data, level, block[0], block[1]),
+                blocks, outfile_full, threads):
+            return None
+        return endofstream - offset
+    finally:
+        data.close()
+
+
+def unpack_xz_parallel(filename, offset, outfile_full, threads):
+    '''Decompress the XZ stream at offset in filename to outfile_full,
+    with the blocks decompressed in threads. Returns the length of the
+    stream, or None if the stream could not be unpacked this way.'''
+    with open(filename, 'rb') as checkfile:
+        data = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        xzblocks = find_xz_blocks(data, offset)
+        if xzblocks is None:
+            return None
+        (streamheader, blocks, endofstream) = xzblocks
+        if len(blocks) < 2:
+            return None
+        if not _decompress_blocks_to_file(
+                lambda block: decompress_xz_block(data, streamheader, block),
+                blocks, outfile_full, threads):
+            return None
+        return endofstream - offset
+    finally:
+        data.close()
@@ -0,0 +1,219 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+# Helpers to hand a range of bytes of a file (for example data at an
+# offset in a firmware image) to an external tool, preferably without
+# copying the data to a temporary file first. In order of preference:
+#
+# 1. use an option of the tool to skip to the offset
+#    (see tool_help_contains())
+# 2. stream the range to the standard input of the tool
+#    (see run_with_range_as_stdin())
+# 3. copy exactly the range to a temporary file
+#    (see copy_range_to_temporary_file())
+#
+# Python modules that want a file object (for example zipfile) can
+# read the range through a FileRange.
+#
+# Bytes written to temporary files are counted in the scan statistics
+# as 'temporary_bytes_written'.
+
+import errno
+import functools
+import io
+import os
+import subprocess
+import tempfile
+import threading
+
+# os.sendfile() won't write more data than 2147479552 at once
+# Reference:
+# https://bugzilla.redhat.com/show_bug.cgi?id=612839
+maxsendfilesize = 2147479552
+
+
+def sendfile_range(outfd, infd, offset, size):
+    '''Copy size bytes at offset in infd to outfd using os.sendfile().
+    Returns the amount of bytes written, which is less than size if
+    infd ends before offset + size.'''
+    byteswritten = 0
+    while byteswritten < size:
+        written = os.sendfile(outfd, infd, offset + byteswritten,
+                              min(size - byteswritten, maxsendfilesize))
+        if written == 0:
+            break
+        byteswritten += written
+    return byteswritten
+
+
+def data_ranges(fd, offset, size):
+    '''Return a list of (offset, size) for the parts of the range of
+    size bytes at offset in fd that contain data, so holes in sparse
+    files (for example unpacked Android sparse images) can be skipped.
+    The whole range is returned if the file system cannot report holes.
+    The file position of fd is not changed.'''
+    ranges = []
+    end = offset + size
+    oldposition = os.lseek(fd, 0, os.SEEK_CUR)
+    try:
+        while offset < end:
+            try:
+                datastart = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                # ENXIO: only a hole until the end of the file
+                if e.errno != errno.ENXIO:
+                    ranges.append((offset, end - offset))
+                break
+            if datastart >= end:
+                break
+            holestart = min(os.lseek(fd, datastart, os.SEEK_HOLE), end)
+            ranges.append((datastart, holestart - datastart))
+            offset = holestart
+    finally:
+        os.lseek(fd, oldposition, os.SEEK_SET)
+    return ranges
+
+
+class FileRange(io.RawIOBase):
+    '''A read only file object for size bytes at offset in filename,
+    so modules that expect a file object can read data at an offset
+    without copying it first. Every FileRange has its own file
+    descriptor and reads with os.preadv(), so different FileRange
+    objects for the same file can be used in different threads.
+    Note that fileno() returns the descriptor of the whole file, so
+    for os.sendfile() the offset has to be added to positions.'''
+    def __init__(self, filename, offset, size):
+        self.fd = os.open(filename, os.O_RDONLY)
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self.fd
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self.position
+        elif whence == os.SEEK_END:
+            position += self.size
+        if position < 0:
+            raise ValueError('negative seek position %d' % position)
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, b):
+        size = max(0, min(len(b), self.size - self.position))
+        if size == 0:
+            return 0
+        bytesread = os.preadv(self.fd, [memoryview(b)[:size]],
+                              self.offset + self.position)
+        self.position += bytesread
+        return bytesread
+
+    def close(self):
+        if not self.closed:
+            os.close(self.fd)
+        super().close()
+
+
+def copy_range_to_temporary_file(scanenvironment, filename, offset, size,
+                                 suffix=None):
+    '''Copy size bytes at offset in filename to a new file in the
+    temporary directory and return the name of the temporary file.
+    The caller has to remove the file.'''
+    (temporaryfd, temporaryfilename) = tempfile.mkstemp(
+            dir=scanenvironment.temporarydirectory, suffix=suffix)
+    with open(filename, 'rb') as infile:
+        byteswritten = sendfile_range(temporaryfd, infile.fileno(), offset, size)
+    os.close(temporaryfd)
+    scanenvironment.statistics.add('temporary_bytes_written', byteswritten)
+    return temporaryfilename
+
+
+def run_with_range_as_stdin(args, filename, offset, size=None,
+                            stdout=subprocess.PIPE, **kwargs):
+    '''Run a program with size bytes at offset in filename as its
+    standard input, or all data from offset to the end of the file
+    if size is None. No temporary files are used. Returns the return
+    code, standard output and standard error of the program.'''
+    infile = open(filename, 'rb')
+    if size is None:
+        # the program reads the file directly, from offset
+        infile.seek(offset)
+        try:
+            p = subprocess.Popen(args, stdin=infile, stdout=stdout,
+                                 stderr=subprocess.PIPE, **kwargs)
+            (outputmsg, errormsg) = p.communicate()
+        finally:
+            infile.close()
+        return (p.returncode, outputmsg, errormsg)
+
+    # otherwise send exactly the range through a pipe from a separate
+    # thread, while the output of the program is read.
+    (readfd, writefd) = os.pipe()
+
+    def feed():
+        try:
+            sendfile_range(writefd, infile.fileno(), offset, size)
+        except OSError:
+            # the program exited before reading all data
+            pass
+        finally:
+            os.close(writefd)
+
+    try:
+        p = subprocess.Popen(args, stdin=readfd, stdout=stdout,
+                             stderr=subprocess.PIPE, **kwargs)
+    except:
+        os.close(writefd)
+        infile.close()
+        raise
+    finally:
+        os.close(readfd)
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    (outputmsg, errormsg) = p.communicate()
+    feeder.join()
+    infile.close()
+    return (p.returncode, outputmsg, errormsg)
+
+
+@functools.lru_cache(maxsize=None)
+def tool_help_contains(args, text):
+    '''Check if the help output of a program (started with the tuple
+    args, for example ('unsquashfs', '-help')) contains text. This is
+    used to find out if an installed version of a program supports an
+    option. The result is cached.'''
+    try:
+        p = subprocess.run(args, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError:
+        return False
+    return text in p.stdout.decode(errors='replace')
@@ -0,0 +1,271 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+# In-process decompression of data at an offset in a file for formats
+# that were unpacked with external tools: zstd frames, LZ4 legacy
+# frames and UNIX compress (LZW). The decompressors work directly on
+# the (memory mapped) input file, find the length of the compressed
+# data in the same pass and write the output through a HashingWriter,
+# that computes the hashes of the output while it is written.
+
+import array
+import sys
+
+import lz4.block
+import zstd
+
+from FileContentsComputer import Hasher, hash_algorithms
+
+
+class DecompressionError(Exception):
+    pass
+
+
+class HashingWriter:
+    '''Write data to a file and compute the hashes of the data on the
+    way, so the file does not have to be read again for hashing.'''
+    def __init__(self, filename, hashthreads=1):
+        self.outfile = open(filename, 'wb')
+        self.hasher = Hasher(hash_algorithms, hashthreads)
+        self.hasher.initialize()
+        self.size = 0
+
+    def write(self, data):
+        self.outfile.write(data)
+        self.hasher.compute(data)
+        self.size += len(data)
+
+    def close(self):
+        '''Close the file and return the hashes of the data.'''
+        self.outfile.close()
+        self.hasher.finalize()
+        return self.hasher.get()
+
+
+# frames with a larger content size are not decompressed in memory
+zstd_maximum_in_process_size = 268435456
+
+
+def decompress_zstd_frame(data, offset, size, contentsize, writer):
+    '''Decompress the zstd frame of size bytes at offset in data. The
+    Python zstd bindings can only decompress frames at once, and need
+    the content size to be recorded in the frame header.'''
+    try:
+        unpackeddata = zstd.decompress(data[offset:offset+size])
+    except zstd.Error as e:
+        raise DecompressionError(e.args)
+    if len(unpackeddata) != contentsize:
+        raise DecompressionError('wrong content size')
+    writer.write(unpackeddata)
+
+
+# https://github.com/lz4/lz4/blob/master/doc/lz4_Frame_format.md#legacy-frame
+lz4_legacy_magic = b'\x02\x21\x4c\x18'
+lz4_legacy_block_size = 8388608
+
+# LZ4_compressBound() for a block of 8 MiB
+lz4_legacy_max_compressed_size = lz4_legacy_block_size + lz4_legacy_block_size // 255 + 16
+
+
+def decompress_lz4_legacy(data, offset, writer):
+    '''Decompress the LZ4 legacy frame at offset in data. Every block
+    except the last decompresses to 8 MiB. The frame ends after the
+    last block, at the end of the data, or at a new frame. Returns the
+    length of the frame.'''
+    position = offset + 4
+    blocksdecompressed = 0
+    while position + 4 <= len(data):
+        if data[position:position+4] == lz4_legacy_magic:
+            break
+        blocksize = int.from_bytes(data[position:position+4], byteorder='little')
+        if blocksize == 0 or blocksize > lz4_legacy_max_compressed_size or \
+                position + 4 + blocksize > len(data):
+            break
+        try:
+            unpackeddata = lz4.block.decompress(data[position+4:position+4+blocksize],
+                                                uncompressed_size=lz4_legacy_block_size)
+        except lz4.block.LZ4BlockError:
+            # the data after the frame is not necessarily
+            # another frame
+            if blocksdecompressed == 0:
+                raise DecompressionError('invalid LZ4 block')
+            break
+        writer.write(unpackeddata)
+        blocksdecompressed += 1
+        position += 4 + blocksize
+        if len(unpackeddata) != lz4_legacy_block_size:
+            break
+    if blocksdecompressed == 0:
+        raise DecompressionError('no LZ4 blocks')
+    return position - offset
+
+
+# the maximum length of the suffix of an LZW table entry
+lzw_suffix_size = 64
+
+# the maximum number of groups of LZW codes that are read at once
+lzw_max_groups = 4096
+
+
+def lzw_codes(groups, bits):
+    '''Return the codes of bits bits in the bytes of groups. The
+    codes are little endian and the last group can be incomplete.'''
+    numcodes = len(groups) * 8 // bits
+    if bits == 16:
+        codes = array.array('H', groups[:numcodes*2])
+        if sys.byteorder == 'big':
+            codes.byteswap()
+        return codes
+    mask = (1 << bits) - 1
+    shifts = range(0, 8 * bits, bits)
+    codes = [(group >> shift) & mask
+             for group in (int.from_bytes(groups[i:i+bits], byteorder='little')
+                           for i in range(0, len(groups), bits))
+             for shift in shifts]
+    del codes[numcodes:]
+    return codes
+
+
+def decompress_lzw(data, offset, writer, flushsize=1048576):
+    '''Decompress UNIX compress'd (LZW) data at offset in data, until
+    the end of the data. Codes are stored in groups of eight codes,
+    so a group of codes of n bits is n bytes. When the code size
+    changes (or the table is cleared) the rest of the group is
+    skipped, as is done by ncompress. This follows the description
+    and checks of unlzw() in pigz by Mark Adler.
+
+    Like in unlzw() the table stores a prefix code and a suffix for
+    every code, and codes are expanded by following the prefix codes
+    on a stack, so the size of the table does not depend on the size
+    of the output. To follow fewer prefix codes in Python the suffix
+    is up to lzw_suffix_size bytes instead of a single byte.'''
+    if data[offset:offset+2] != b'\x1f\x9d' or len(data) < offset + 3:
+        raise DecompressionError('invalid header')
+    flags = data[offset+2]
+    if flags & 0x60:
+        raise DecompressionError('reserved bits set')
+    maxbits = flags & 0x1f
+    if maxbits < 9 or maxbits > 16:
+        raise DecompressionError('invalid bits per code')
+    # 9 doesn't really mean 9
+    if maxbits == 9:
+        maxbits = 10
+    blockmode = flags & 0x80 == 0x80
+
+    bits = 9
+    mask = 0x1ff
+    end = 256 if blockmode else 255
+    # -1 is used for codes without a prefix
+    prefix = [-1] * (1 << maxbits)
+    suffix = [bytes([i]) for i in range(256)] + [b''] * ((1 << maxbits) - 256)
+    prev = -1
+    preventry = b''
+    output = bytearray()
+    position = offset + 3
+    while True:
+        # if the table will be full after this, increase the code size
+        if end >= mask and bits < maxbits:
+            bits += 1
+            mask = (mask << 1) | 1
+
+        # read the groups of codes that can be read before the code
+        # size changes. The rest of a group is skipped if the code
+        # size changes, which happens when the table is full.
+        if bits < maxbits:
+            numgroups = max((mask - end) // 8, 1)
+            numcodes = mask - end
+        else:
+            numgroups = lzw_max_groups
+            numcodes = numgroups * 8
+        groups = data[position:position+numgroups*bits]
+        if groups == b'':
+            break
+        codes = lzw_codes(groups, bits)
+        if numcodes < len(codes):
+            del codes[numcodes:]
+        nextposition = position + len(groups)
+
+        first = 0
+        if prev == -1 and codes:
+            # the first code is a literal
+            if codes[0] > 255:
+                raise DecompressionError('invalid first code')
+            prev = codes[0]
+            preventry = suffix[prev]
+            output += preventry
+            first = 1
+
+        for i in range(first, len(codes)):
+            code = codes[i]
+            # clear the table and skip the rest of the group
+            if code == 256 and blockmode:
+                nextposition = position + (i // 8 + 1) * bits
+                bits = 9
+                mask = 0x1ff
+                end = 255
+                break
+
+            if code > end:
+                # special case: the code that is about to be added
+                if code != end + 1 or prev > end:
+                    raise DecompressionError('invalid code')
+                entry = preventry + preventry[:1]
+                if len(output) >= flushsize:
+                    writer.write(output)
+                    output = bytearray()
+            elif prefix[code] == -1:
+                entry = suffix[code]
+            else:
+                # expand the code by following the prefix codes
+                stack = [suffix[code]]
+                stackcode = prefix[code]
+                while stackcode != -1:
+                    stack.append(suffix[stackcode])
+                    stackcode = prefix[stackcode]
+                stack.reverse()
+                entry = b''.join(stack)
+                # long entries can make the output large before
+                # all codes that were read are expanded
+                if len(output) >= flushsize:
+                    writer.write(output)
+                    output = bytearray()
+
+            # add a new entry to the table
+            if end < mask:
+                end += 1
+                prevsuffix = suffix[prev]
+                if len(prevsuffix) < lzw_suffix_size:
+                    prefix[end] = prefix[prev]
+                    suffix[end] = prevsuffix + entry[:1]
+                else:
+                    prefix[end] = prev
+                    suffix[end] = entry[:1]
+            prev = code
+            preventry = entry
+            output += entry
+        position = nextposition
+        if len(output) >= flushsize:
+            writer.write(output)
+            output = bytearray()
+    if prev == -1:
+        raise DecompressionError('no compressed data')
+    writer.write(output)
+    return position - offset
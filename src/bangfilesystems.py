@@ -34,18 +34,26 @@ import sys
 import os
 import shutil
 import binascii
+import struct
 import tempfile
 import collections
 import math
+import mmap
+import array
 import lzma
 import zlib
 import gzip
 import stat
 import subprocess
-import json
 import re
 import pathlib
 import lzo
+import lz4.block
+import zstd
+
+from bangparallel import ordered_map
+from bangdatarange import copy_range_to_temporary_file, data_ranges, sendfile_range, tool_help_contains
+from bangvirtualdisk import VirtualDiskError, Qcow2Disk, VdiDisk, VmdkSparseDisk
 
 encodingstotranslate = ['utf-8', 'ascii', 'latin-1', 'euc_jp', 'euc_jis_2004',
                         'jisx0213', 'iso2022_jp', 'iso2022_jp_1',
@@ -69,16 +77,6 @@ def unpack_squashfs(fileresult, scanenvironment, offset, unpackdir):
     unpackingerror = {}
 
     unpackedsize = 0
-    usesasquatch = True
-
-    if shutil.which('unsquashfs') is None:
-        unpackingerror = {'offset': offset+unpackedsize,
-                          'fatal': False,
-                          'reason': 'unsquashfs program not found'}
-        return {'status': False, 'error': unpackingerror}
-
-    if shutil.which('sasquatch') is None:
-        usesasquatch = False
 
     # need at least a header, plus version
     # see /usr/share/magic
@@ -169,29 +167,98 @@ def unpack_squashfs(fileresult, scanenvironment, offset, unpackdir):
                           'reason': 'file system cannot extend past file'}
         return {'status': False, 'error': unpackingerror}
 
-    # then create a temporary file and copy the data into the
-    # temporary file but only if offset != 0
-    if offset != 0:
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        # depending on the variant of squashfs a file size can be
-        # determined meaning less data needs to be copied.
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, filesize - offset)
-        os.fdopen(temporaryfile[0]).close()
     checkfile.close()
 
+    # squashfs 4.0 file systems are read in-process. Other versions
+    # and vendor variants that the reader does not support are unpacked
+    # with unsquashfs, or sasquatch.
+    unpacked = False
+    if majorversion == 4:
+        checkfile = open(filename_full, 'rb')
+        try:
+            squashfsreader = SquashfsReader(checkfile, offset,
+                                            scanenvironment.get_unpackthreads())
+            unpackedfilesandlabels = squashfsreader.unpack(scanenvironment, unpackdir)
+            unpacked = True
+        except SquashfsError as e:
+            # remove any partially unpacked data
+            if os.path.exists(unpackdir_full):
+                shutil.rmtree(unpackdir_full)
+        finally:
+            checkfile.close()
+
+    if not unpacked:
+        result = unpack_squashfs_with_tools(scanenvironment, filename_full,
+                                            offset, squashfssize, unpackdir_full)
+        if not result['status']:
+            return result
+        unpackedfilesandlabels = result['filesandlabels']
+
+    unpackedsize = squashfssize
+
+    if offset + unpackedsize != filesize:
+        # by default mksquashfs pads to 4K blocks with NUL bytes.
+        # The padding is not counted in squashfssize
+        checkfile = open(filename_full, 'rb')
+        checkfile.seek(offset + unpackedsize)
+        padoffset = checkfile.tell()
+        if unpackedsize % 4096 != 0:
+            paddingbytes = 4096 - unpackedsize % 4096
+            checkbytes = checkfile.read(paddingbytes)
+            if len(checkbytes) == paddingbytes:
+                if checkbytes == paddingbytes * b'\x00':
+                    unpackedsize += paddingbytes
+                    havepadding = True
+        checkfile.close()
+
+    if offset == 0 and unpackedsize == filesize:
+        labels.append('squashfs')
+        labels.append('filesystem')
+
+    return {'status': True, 'length': unpackedsize, 'labels': labels,
+            'filesandlabels': unpackedfilesandlabels}
+
+
+# Unpack a squashfs file system with unsquashfs, or sasquatch, which
+# supports several vendor variants of squashfs.
+def unpack_squashfs_with_tools(scanenvironment, filename_full, offset,
+                               squashfssize, unpackdir_full):
+    '''Unpack squashfs file system data with external tools.'''
+    unpackedfilesandlabels = []
+    unpackedsize = 0
+    usesasquatch = True
+
+    if shutil.which('unsquashfs') is None:
+        unpackingerror = {'offset': offset+unpackedsize,
+                          'fatal': False,
+                          'reason': 'unsquashfs program not found'}
+        return {'status': False, 'error': unpackingerror}
+
+    if shutil.which('sasquatch') is None:
+        usesasquatch = False
+
+    # unsquashfs (squashfs-tools 4.4 and later) can read a file system
+    # at an offset, otherwise copy exactly the file system into a
+    # temporary file, but only if offset != 0
+    squashfsfile = filename_full
+    unsquashfsoptions = []
+    temporaryfilename = None
+    if offset != 0:
+        if tool_help_contains(('unsquashfs', '-help'), '-o[ffset]'):
+            unsquashfsoptions = ['-o', str(offset)]
+        else:
+            temporaryfilename = copy_range_to_temporary_file(
+                    scanenvironment, filename_full, offset, squashfssize)
+            squashfsfile = temporaryfilename
+
     # unpack in a temporary directory, as unsquashfs expects
     # to create the directory itself, but the unpacking directory
     # already exists.
     squashfsunpackdirectory = tempfile.mkdtemp(dir=scanenvironment.temporarydirectory)
 
-    if offset != 0:
-        p = subprocess.Popen(['unsquashfs', temporaryfile[1]],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                             cwd=squashfsunpackdirectory)
-    else:
-        p = subprocess.Popen(['unsquashfs', filename_full],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                             cwd=squashfsunpackdirectory)
+    p = subprocess.Popen(['unsquashfs'] + unsquashfsoptions + [squashfsfile],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         cwd=squashfsunpackdirectory)
     (outputmsg, errormsg) = p.communicate()
 
     # check if there was an error and retry with another tool
@@ -203,39 +270,39 @@ def unpack_squashfs(fileresult, scanenvironment, offset, unpackdir):
     if p.returncode != 0 and not b'because you\'re not superuser!' in errormsg:
         shutil.rmtree(squashfsunpackdirectory)
         if usesasquatch:
+            # sasquatch cannot read at an offset
+            if offset != 0 and temporaryfilename is None:
+                temporaryfilename = copy_range_to_temporary_file(
+                        scanenvironment, filename_full, offset, squashfssize)
+                squashfsfile = temporaryfilename
+
             # retry with sasquatch, using 1 thread
             squashfsunpackdirectory = tempfile.mkdtemp(dir=scanenvironment.temporarydirectory)
-            if offset != 0:
-                p = subprocess.Popen(['sasquatch', '-p', '1', temporaryfile[1]],
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                     cwd=squashfsunpackdirectory)
-            else:
-                p = subprocess.Popen(['sasquatch', '-p', '1', filename_full],
-                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                     cwd=squashfsunpackdirectory)
+            p = subprocess.Popen(['sasquatch', '-p', '1', squashfsfile],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 cwd=squashfsunpackdirectory)
             (outputmsg, errormsg) = p.communicate()
 
             if p.returncode != 0 and not b'because you\'re not superuser!' in errormsg:
                 # remove old data
-                if offset != 0:
-                    os.unlink(temporaryfile[1])
+                if temporaryfilename is not None:
+                    os.unlink(temporaryfilename)
+                shutil.rmtree(squashfsunpackdirectory)
                 unpackingerror = {'offset': offset+unpackedsize,
                                   'fatal': False,
                                   'reason': 'Not a valid squashfs file'}
                 return {'status': False, 'error': unpackingerror}
         else:
-            if offset != 0:
-                os.unlink(temporaryfile[1])
+            if temporaryfilename is not None:
+                os.unlink(temporaryfilename)
             unpackingerror = {'offset': offset+unpackedsize,
                               'fatal': False,
                               'reason': 'Not a valid squashfs file'}
             return {'status': False, 'error': unpackingerror}
 
     # remove old data
-    if offset != 0:
-        os.unlink(temporaryfile[1])
-
-    unpackedsize = squashfssize
+    if temporaryfilename is not None:
+        os.unlink(temporaryfilename)
 
     # create the unpacking directory
     os.makedirs(unpackdir_full, exist_ok=True)
@@ -278,27 +345,7 @@ def unpack_squashfs(fileresult, scanenvironment, offset, unpackdir):
             relfilename = scanenvironment.rel_unpack_path(fullfilename)
             unpackedfilesandlabels.append((relfilename, []))
 
-    if offset + unpackedsize != filesize:
-        # by default mksquashfs pads to 4K blocks with NUL bytes.
-        # The padding is not counted in squashfssize
-        checkfile = open(filename_full, 'rb')
-        checkfile.seek(offset + unpackedsize)
-        padoffset = checkfile.tell()
-        if unpackedsize % 4096 != 0:
-            paddingbytes = 4096 - unpackedsize % 4096
-            checkbytes = checkfile.read(paddingbytes)
-            if len(checkbytes) == paddingbytes:
-                if checkbytes == paddingbytes * b'\x00':
-                    unpackedsize += paddingbytes
-                    havepadding = True
-        checkfile.close()
-
-    if offset == 0 and unpackedsize == filesize:
-        labels.append('squashfs')
-        labels.append('filesystem')
-
-    return {'status': True, 'length': unpackedsize, 'labels': labels,
-            'filesandlabels': unpackedfilesandlabels}
+    return {'status': True, 'filesandlabels': unpackedfilesandlabels}
 
 
 # a wrapper around shutil.copy2 to copy symbolic links instead of
@@ -309,6 +356,374 @@ def local_copy2(src, dest):
     return shutil.copy2(src, dest, follow_symlinks=False)
 
 
+class SquashfsError(Exception):
+    pass
+
+
+# An in-process reader for squashfs 4.0 file systems (little endian,
+# as created by mksquashfs 4.x), used by unpack_squashfs. Inodes and
+# directories are read from the metadata tables and files are written
+# directly into the unpacking directory. Data blocks of a file are
+# decompressed in a thread pool, as all supported decompressors release
+# the GIL. Extended attributes, device files, FIFOs and sockets are
+# skipped. Vendor variants (other versions, big endian, modified
+# compressors) are not supported and raise a SquashfsError.
+#
+# References:
+# https://dr-emann.github.io/squashfs/
+# squashfs_fs.h in squashfs-tools
+class SquashfsReader:
+    # compression ids
+    COMPRESSION_GZIP = 1
+    COMPRESSION_LZMA = 2
+    COMPRESSION_LZO = 3
+    COMPRESSION_XZ = 4
+    COMPRESSION_LZ4 = 5
+    COMPRESSION_ZSTD = 6
+
+    # inode types
+    DIR = 1
+    FILE = 2
+    SYMLINK = 3
+    LDIR = 8
+    LFILE = 9
+    LSYMLINK = 10
+
+    METADATA_SIZE = 8192
+    METADATA_UNCOMPRESSED = 0x8000
+    DATA_UNCOMPRESSED = 0x1000000
+    NO_FRAGMENT = 0xffffffff
+
+    # decompressed data blocks that are processed ahead per thread
+    blocks_per_thread = 4
+
+    # the number of decompressed metadata blocks that are kept
+    metadata_cache_size = 1024
+
+    def __init__(self, infile, offset, threads=1):
+        self.fd = infile.fileno()
+        self.offset = offset
+        self.threads = threads
+        # least recently used metadata blocks are removed first
+        self.metadatablocks = collections.OrderedDict()
+        self.fragmentcache = (None, None)
+
+        superblock = os.pread(self.fd, 96, offset)
+        if len(superblock) != 96:
+            raise SquashfsError('not enough data for superblock')
+        if superblock[:4] != b'hsqs':
+            raise SquashfsError('unsupported squashfs variant')
+        (self.inodecount, self.blocksize, self.fragmentcount,
+         self.compression, blocklog, flags, idcount, majorversion,
+         minorversion) = struct.unpack_from('<I4xIIHHHHHH', superblock, 4)
+        (rootinode, self.bytesused, idtable, xattrtable, self.inodetable,
+         self.directorytable, fragmenttable,
+         exporttable) = struct.unpack_from('<8Q', superblock, 32)
+
+        if (majorversion, minorversion) != (4, 0):
+            raise SquashfsError('unsupported squashfs version')
+        if self.blocksize != 1 << blocklog or not 4096 <= self.blocksize <= 1048576:
+            raise SquashfsError('invalid block size')
+        if not self.COMPRESSION_GZIP <= self.compression <= self.COMPRESSION_ZSTD:
+            raise SquashfsError('unsupported compression')
+        if not 96 <= self.inodetable < self.directorytable < self.bytesused:
+            raise SquashfsError('invalid table positions')
+        self.rootinode = rootinode
+
+        # read the fragment table: a list of metadata blocks with
+        # 16 byte entries (start, size), found via a table of pointers
+        self.fragments = []
+        if self.fragmentcount != 0:
+            if fragmenttable + math.ceil(self.fragmentcount / 512) * 8 > self.bytesused:
+                raise SquashfsError('invalid fragment table')
+            pointers = self.read(fragmenttable, math.ceil(self.fragmentcount / 512) * 8)
+            fragmentdata = b''
+            for (pointer,) in struct.iter_unpack('<Q', pointers):
+                fragmentdata += self._metadata_block(pointer)[0]
+            if len(fragmentdata) < self.fragmentcount * 16:
+                raise SquashfsError('invalid fragment table')
+            self.fragments = [struct.unpack_from('<QI', fragmentdata, i*16)
+                              for i in range(self.fragmentcount)]
+
+    def read(self, position, size):
+        '''Read size bytes at position relative to the start of the
+        file system.'''
+        if position + size > self.bytesused:
+            raise SquashfsError('data outside of file system')
+        data = os.pread(self.fd, size, self.offset + position)
+        if len(data) != size:
+            raise SquashfsError('not enough data')
+        return data
+
+    def _decompress(self, data, maxsize):
+        try:
+            if self.compression == self.COMPRESSION_GZIP:
+                result = zlib.decompressobj().decompress(data, maxsize + 1)
+            elif self.compression == self.COMPRESSION_LZMA:
+                decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_ALONE)
+                result = decompressor.decompress(data, maxsize + 1)
+            elif self.compression == self.COMPRESSION_LZO:
+                result = lzo.decompress(data, False, maxsize)
+            elif self.compression == self.COMPRESSION_XZ:
+                decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+                result = decompressor.decompress(data, maxsize + 1)
+            elif self.compression == self.COMPRESSION_LZ4:
+                result = lz4.block.decompress(data, uncompressed_size=maxsize)
+            elif self.compression == self.COMPRESSION_ZSTD:
+                result = zstd.decompress(data)
+        except (zlib.error, lzma.LZMAError, lzo.error, zstd.Error,
+                lz4.block.LZ4BlockError):
+            raise SquashfsError('decompression error')
+        if len(result) > maxsize:
+            raise SquashfsError('decompressed data too large')
+        return result
+
+    def _metadata_block(self, position):
+        '''Return the decompressed metadata block at position and the
+        position of the next metadata block.'''
+        if position in self.metadatablocks:
+            self.metadatablocks.move_to_end(position)
+            return self.metadatablocks[position]
+        header = struct.unpack('<H', self.read(position, 2))[0]
+        size = header & 0x7fff
+        if size == 0 or size > self.METADATA_SIZE:
+            raise SquashfsError('invalid metadata block')
+        data = self.read(position + 2, size)
+        if not header & self.METADATA_UNCOMPRESSED:
+            data = self._decompress(data, self.METADATA_SIZE)
+        self.metadatablocks[position] = (data, position + 2 + size)
+        if len(self.metadatablocks) > self.metadata_cache_size:
+            self.metadatablocks.popitem(last=False)
+        return (data, position + 2 + size)
+
+    def read_metadata(self, position, offset, size):
+        '''Read size bytes from the metadata blocks starting at offset
+        in the decompressed metadata block at position.'''
+        result = b''
+        while len(result) < offset + size:
+            (data, position) = self._metadata_block(position)
+            result += data
+        return result[offset:offset+size]
+
+    def read_inode(self, reference):
+        '''Return the inode type, inode number and a dictionary with
+        the fields of the inode that are needed for unpacking.'''
+        block = self.inodetable + (reference >> 16)
+        offset = reference & 0xffff
+        if block >= self.directorytable:
+            raise SquashfsError('invalid inode reference')
+        (inodetype, mode, uid, gid, mtime,
+         inodenumber) = struct.unpack('<HHHHII', self.read_metadata(block, offset, 16))
+        offset += 16
+        inode = {}
+        if inodetype == self.DIR:
+            (dirblock, links, size, diroffset,
+             parent) = struct.unpack('<IIHHI', self.read_metadata(block, offset, 16))
+            inode = {'block': dirblock, 'offset': diroffset, 'size': size}
+        elif inodetype == self.LDIR:
+            (links, size, dirblock, parent, indexcount, diroffset,
+             xattr) = struct.unpack('<IIIIHHI', self.read_metadata(block, offset, 24))
+            inode = {'block': dirblock, 'offset': diroffset, 'size': size}
+        elif inodetype in [self.FILE, self.LFILE]:
+            if inodetype == self.FILE:
+                (start, fragment, fragmentoffset,
+                 size) = struct.unpack('<IIII', self.read_metadata(block, offset, 16))
+                offset += 16
+            else:
+                (start, size, sparse, links, fragment, fragmentoffset,
+                 xattr) = struct.unpack('<QQQIIII', self.read_metadata(block, offset, 40))
+                offset += 40
+            if fragment == self.NO_FRAGMENT:
+                blockcount = math.ceil(size / self.blocksize)
+            else:
+                blockcount = size // self.blocksize
+                if fragment >= self.fragmentcount:
+                    raise SquashfsError('invalid fragment index')
+            if blockcount > self.bytesused:
+                raise SquashfsError('invalid file size')
+            blocksizes = struct.unpack('<%dI' % blockcount,
+                                       self.read_metadata(block, offset, blockcount * 4))
+            inode = {'start': start, 'size': size, 'blocksizes': blocksizes,
+                     'fragment': fragment, 'fragmentoffset': fragmentoffset}
+        elif inodetype in [self.SYMLINK, self.LSYMLINK]:
+            (links, targetsize) = struct.unpack('<II', self.read_metadata(block, offset, 8))
+            if targetsize > 4096:
+                raise SquashfsError('invalid symbolic link')
+            inode = {'target': self.read_metadata(block, offset + 8, targetsize)}
+        return (inodetype, inodenumber, inode)
+
+    def read_directory(self, inode):
+        '''Return a list of (inode reference, name) for a directory.'''
+        # the size includes the (not stored) entries for . and ..
+        size = inode['size'] - 3
+        if size <= 0:
+            return []
+        block = self.directorytable + inode['block']
+        data = self.read_metadata(block, inode['offset'], size)
+        entries = []
+        pos = 0
+        while pos < size:
+            if pos + 12 > size:
+                raise SquashfsError('invalid directory header')
+            (count, start, inodenumber) = struct.unpack_from('<III', data, pos)
+            pos += 12
+            if count >= 256:
+                raise SquashfsError('invalid directory header')
+            for i in range(count + 1):
+                if pos + 8 > size:
+                    raise SquashfsError('invalid directory entry')
+                (inodeoffset, inodedelta, entrytype,
+                 namesize) = struct.unpack_from('<HhHH', data, pos)
+                pos += 8
+                name = data[pos:pos+namesize+1]
+                pos += namesize + 1
+                if len(name) != namesize + 1:
+                    raise SquashfsError('invalid directory entry')
+                entries.append(((start << 16) | inodeoffset, name))
+        return entries
+
+    def _read_block(self, block):
+        (position, blocksize) = block
+        compressedsize = blocksize & ~self.DATA_UNCOMPRESSED
+        data = self.read(position, compressedsize)
+        if blocksize & self.DATA_UNCOMPRESSED:
+            return data
+        return self._decompress(data, self.blocksize)
+
+    def _read_fragment(self, fragment):
+        if self.fragmentcache[0] != fragment:
+            (start, blocksize) = self.fragments[fragment]
+            if blocksize & ~self.DATA_UNCOMPRESSED > self.blocksize:
+                raise SquashfsError('invalid fragment')
+            self.fragmentcache = (fragment, self._read_block((start, blocksize)))
+        return self.fragmentcache[1]
+
+    def copy_file(self, inode, outfile):
+        size = inode['size']
+        outfd = outfile.fileno()
+
+        # compute the positions of the data blocks. Sparse blocks
+        # (size 0) are not stored and become holes in the output file.
+        blocks = []
+        position = inode['start']
+        for (i, blocksize) in enumerate(inode['blocksizes']):
+            compressedsize = blocksize & ~self.DATA_UNCOMPRESSED
+            if compressedsize > self.blocksize:
+                raise SquashfsError('invalid block size')
+            if compressedsize != 0:
+                blocks.append((i, (position, blocksize)))
+            position += compressedsize
+        if position > self.bytesused:
+            raise SquashfsError('data outside of file system')
+
+        # decompress the blocks in parallel, but write them in order
+        window = self.threads * self.blocks_per_thread
+        decompressed = ordered_map(self._read_block,
+                [block for (i, block) in blocks], self.threads, window)
+        for ((i, block), data) in zip(blocks, decompressed):
+            expectedsize = min(self.blocksize, size - i * self.blocksize)
+            if len(data) != expectedsize:
+                raise SquashfsError('invalid data block')
+            os.lseek(outfd, i * self.blocksize, os.SEEK_SET)
+            os.write(outfd, data)
+
+        # the tail end of a file can be stored in a fragment
+        if inode['fragment'] != self.NO_FRAGMENT:
+            tailsize = size % self.blocksize
+            fragmentdata = self._read_fragment(inode['fragment'])
+            fragmentoffset = inode['fragmentoffset']
+            if fragmentoffset + tailsize > len(fragmentdata):
+                raise SquashfsError('invalid fragment offset')
+            os.lseek(outfd, size - tailsize, os.SEEK_SET)
+            os.write(outfd, fragmentdata[fragmentoffset:fragmentoffset+tailsize])
+
+        # set the size of files that end with a hole
+        try:
+            os.ftruncate(outfd, size)
+        except OSError:
+            raise SquashfsError('invalid file size')
+
+    def unpack(self, scanenvironment, unpackdir):
+        '''Recreate the directory tree in unpackdir and return a list
+        of unpacked files and labels.'''
+        unpackedfilesandlabels = []
+        unpackdir_full = scanenvironment.unpack_path(unpackdir)
+        os.makedirs(unpackdir_full, exist_ok=True)
+
+        (inodetype, inodenumber, rootinode) = self.read_inode(self.rootinode)
+        if inodetype not in [self.DIR, self.LDIR]:
+            raise SquashfsError('root inode is not a directory')
+
+        # store a mapping for inode numbers and files. This is needed
+        # to detect hard links, where files have the same inode.
+        inodetofile = {}
+
+        squashfsdirstoscan = collections.deque([(rootinode, '')])
+        seendirs = set([inodenumber])
+        while squashfsdirstoscan:
+            (dirinode, squashfsdir) = squashfsdirstoscan.popleft()
+            for (reference, squashfsname) in self.read_directory(dirinode):
+                # try to make sense of the filename by decoding it first.
+                # This might fail.
+                namedecoded = False
+                for c in encodingstotranslate:
+                    try:
+                        squashfsname = squashfsname.decode(c)
+                        namedecoded = True
+                        break
+                    except Exception as e:
+                        pass
+                if not namedecoded or '/' in squashfsname or '\x00' in squashfsname or \
+                        squashfsname in ['', '.', '..']:
+                    raise SquashfsError('could not decode file name')
+
+                fullsquashfsname = os.path.join(squashfsdir, squashfsname)
+                outfile_rel = os.path.join(unpackdir, fullsquashfsname)
+                outfile_full = scanenvironment.unpack_path(outfile_rel)
+                if os.path.lexists(outfile_full):
+                    raise SquashfsError('duplicate file name')
+                (inodetype, inodenumber, inode) = self.read_inode(reference)
+
+                # Check the different file types
+                if inodetype in [self.DIR, self.LDIR]:
+                    if inodenumber in seendirs:
+                        raise SquashfsError('directory loop')
+                    seendirs.add(inodenumber)
+                    os.mkdir(outfile_full)
+                    unpackedfilesandlabels.append((outfile_rel, []))
+                    squashfsdirstoscan.append((inode, fullsquashfsname))
+                elif inodetype in [self.SYMLINK, self.LSYMLINK]:
+                    try:
+                        symlinktarget = inode['target'].decode()
+                    except UnicodeDecodeError:
+                        continue
+                    if '\x00' in symlinktarget:
+                        continue
+                    os.symlink(symlinktarget, outfile_full)
+                    unpackedfilesandlabels.append((outfile_rel, ['symbolic link']))
+                elif inodetype in [self.FILE, self.LFILE]:
+                    if inodenumber in inodetofile:
+                        # hardlink the file to an existing
+                        # file and record it as such.
+                        os.link(scanenvironment.unpack_path(inodetofile[inodenumber]),
+                                outfile_full)
+                    else:
+                        inodetofile[inodenumber] = outfile_rel
+                        outfile = open(outfile_full, 'wb')
+                        try:
+                            self.copy_file(inode, outfile)
+                        finally:
+                            outfile.close()
+                    unpackedfilesandlabels.append((outfile_rel, []))
+                # block devices, character devices, FIFOs and sockets
+                # are ignored
+        return unpackedfilesandlabels
+
+
+class Iso9660Error(Exception):
+    pass
+
+
 # Derived from public ISO9660 specifications
 # https://en.wikipedia.org/wiki/ISO_9660
 # http://wiki.osdev.org/ISO_9660
@@ -331,920 +746,1047 @@ def local_copy2(src, dest):
 #
 # The zisofs specific bits can be found at:
 # http://libburnia-project.org/wiki/zisofs
+#
+# Joliet:
+# https://en.wikipedia.org/wiki/Joliet_(file_system)
+#
+# El Torito:
+# https://pdos.csail.mit.edu/6.828/2017/readings/boot-cdrom.pdf
+#
+# The reader takes all directories from the path table (ECMA 119, 6.9),
+# which lists every directory with its parent, so the directory tree is
+# known after reading the path table and every directory extent once,
+# without recursion. Names come from Rock Ridge if the primary volume
+# uses it, otherwise from the Joliet volume if there is one, otherwise
+# from the primary volume. Each extent of a file is copied with a single
+# sendfile().
+class Iso9660Reader:
+    # volume descriptor types (ECMA 119, section 8.1.1)
+    BOOT_RECORD = 0
+    PRIMARY = 1
+    SUPPLEMENTARY = 2
+    PARTITION = 3
+    TERMINATOR = 255
+
+    # file flags (ECMA 119, 9.1.6)
+    FLAG_DIRECTORY = 0x02
+    FLAG_ASSOCIATED = 0x04
+    FLAG_MULTI_EXTENT = 0x80
+
+    # escape sequences for the UCS-2 levels of Joliet
+    joliet_escapes = [b'%/@', b'%/C', b'%/E']
+
+    zisofs_magic = b'\x37\xe4\x53\x96\xc9\xdb\xd6\x07'
+
+    # El Torito media types and the size of the emulated floppies
+    eltorito_media = {0: ('NoEmul', None), 1: ('1.2M', 1200 * 1024),
+                      2: ('1.44M', 1440 * 1024), 3: ('2.88M', 2880 * 1024),
+                      4: ('HardDisk', None)}
+
+    # a directory record (ECMA 119, 9.1) and a path table record
+    # (ECMA 119, 9.4), both little endian
+    directory_record = struct.Struct('<BBI4xI4x7xBBBH2xB')
+    path_table_record = struct.Struct('<BBIH')
+
+    def __init__(self, infile, data, offset):
+        self.infile = infile
+        self.data = data
+        self.offset = offset
+        self.filesize = len(data)
+        self.primary = None
+        self.joliet = None
+        self.bootcatalog = None
+
+        # each sector is 2048 bytes long (ECMA 119, 6.1.2). The first 16
+        # sectors are reserved for the "system area" (in total 32768 bytes:
+        # ECMA 119, 6.2.1). What follows is the volume descriptor set
+        # (ECMA 119, 6.7.1), which should have a primary volume
+        # descriptor and end with a terminator.
+        position = offset + 32768
+        while True:
+            if position + 2048 > self.filesize:
+                raise Iso9660Error('not enough bytes for sector')
+
+            # each volume descriptor has a type and an identifier
+            # (ECMA 119, section 8.1)
+            if data[position+1:position+6] != b'CD001':
+                raise Iso9660Error('wrong identifier')
+            descriptortype = data[position]
+            if descriptortype == self.BOOT_RECORD:
+                # El Torito boot records point to the boot catalog
+                if data[position+7:position+30] == b'EL TORITO SPECIFICATION':
+                    self.bootcatalog = int.from_bytes(data[position+0x47:position+0x4b], byteorder='little')
+            elif descriptortype == self.PRIMARY:
+                if self.primary is None:
+                    self.primary = self._read_volume_descriptor(position)
+                    (self.volume_space_size, self.logical_size) = self.primary[:2]
+            elif descriptortype == self.SUPPLEMENTARY:
+                # Joliet is a supplementary volume descriptor with
+                # UCS-2 escape sequences (ECMA 119, 8.5.6)
+                if self.joliet is None and data[position+88:position+91] in self.joliet_escapes:
+                    self.joliet = self._read_volume_descriptor(position)
+            elif descriptortype == self.TERMINATOR:
+                # ECMA 119, 8.3.1
+                if self.primary is None:
+                    raise Iso9660Error('no primary volume descriptor')
+                break
+            elif descriptortype != self.PARTITION:
+                # reserved types have never been used
+                raise Iso9660Error('invalid volume descriptor type')
+            position += 2048
+
+        # a supplementary volume descriptor describes the same volume
+        if self.joliet is not None and self.joliet[:2] != self.primary[:2]:
+            self.joliet = None
+
+        self.size = self.volume_space_size * self.logical_size
+        self.hybrid = None
+
+    def _read_volume_descriptor(self, position):
+        '''Return the volume space size, the logical block size and
+        the location and size of the path table and the root directory
+        from a primary or supplementary volume descriptor (ECMA 119, 8.4
+        and 8.5).'''
+        descriptor = self.data[position:position+2048]
+
+        # most fields are stored in both little endian and big
+        # endian format and should have the same values.
+        for (start, length) in [(80, 4), (128, 2), (132, 4)]:
+            if int.from_bytes(descriptor[start:start+length], byteorder='little') != \
+               int.from_bytes(descriptor[start+length:start+2*length], byteorder='big'):
+                raise Iso9660Error('endian mismatch')
+
+        # ECMA 119, 8.4.8 and 8.4.12
+        volume_space_size = int.from_bytes(descriptor[80:84], byteorder='little')
+        logical_size = int.from_bytes(descriptor[128:130], byteorder='little')
+        if logical_size == 0 or logical_size & (logical_size - 1) != 0:
+            raise Iso9660Error('invalid logical block size')
+
+        # sanity check: the ISO image cannot be outside of the file
+        if self.offset + volume_space_size * logical_size > self.filesize:
+            raise Iso9660Error('image cannot be outside of file')
+
+        # ECMA 119, 8.4.14 and 8.4.15: the path table in little endian
+        path_table_size = int.from_bytes(descriptor[132:136], byteorder='little')
+        path_table_location = int.from_bytes(descriptor[140:144], byteorder='little')
+        if path_table_location * logical_size + path_table_size > volume_space_size * logical_size:
+            raise Iso9660Error('path table outside of declared size')
+
+        # The volume descriptor contains the directory root entry
+        # (ECMA 119, 8.4.18), formatted as described in ECMA 119, 9.1
+        (root_location, root_size, flags, name) = self._parse_directory_record(descriptor[156:190],
+                                                                             volume_space_size * logical_size,
+                                                                             logical_size)[:4]
+        if not flags & self.FLAG_DIRECTORY:
+            raise Iso9660Error('file flags for directory wrong')
+
+        # ECMA 119, 7.6: file name for root directory is 0x00
+        # Some ISO file systems instead said it to 0x01, which
+        # according to 6.8.2.2 should not be for the first root
+        # entry.
+        # Seen in an ISO file included in an ASUS firmware file
+        # Modem_FW_4G_AC55U_30043808102_M14.zip
+        if name not in [b'\x00', b'\x01']:
+            raise Iso9660Error('root file name wrong')
+        return (volume_space_size, logical_size, path_table_location,
+                path_table_size, root_location)
+
+    def _parse_directory_record(self, record, volumesize, logical_size):
+        '''Return the extent location, extent size, file flags, name and
+        system use area of a directory record (ECMA 119, 9.1).'''
+        if len(record) < 34 or record[0] > len(record):
+            raise Iso9660Error('not enough data for directory record')
+        (length, extattrlength, extent_location, extent_size, flags,
+         unitsize, gap, volumesequence, namelength) = self.directory_record.unpack_from(record)
+        if 33 + namelength > length:
+            raise Iso9660Error('invalid file name length')
+
+        # sanity check: the extent cannot be outside of the image
+        if extent_location * logical_size + extent_size > volumesize:
+            raise Iso9660Error('extent outside of declared size')
+
+        # the system use area (ECMA 119, 9.1.13) follows the file name
+        # and a padding byte if the length of the name is even
+        # (ECMA 119, 9.1.12)
+        system_use_start = 33 + namelength + (1 - namelength % 2)
+        return (extent_location, extent_size, flags, bytes(record[33:33+namelength]),
+                record[system_use_start:length])
+
+    def read_path_table(self, path_table_location, path_table_size):
+        '''Return a list of (extent location, parent directory index,
+        name) for all directories in the path table (ECMA 119, 9.4).
+        Directories are numbered in the order of the table and parents
+        come before their children.'''
+        position = self.offset + path_table_location * self.logical_size
+        path_table = self.data[position:position+path_table_size]
+        directories = []
+        pos = 0
+        while pos + 8 <= len(path_table):
+            (namelength, extattrlength, extent_location, parent) = self.path_table_record.unpack_from(path_table, pos)
+            if namelength == 0:
+                break
+            if pos + 8 + namelength > len(path_table):
+                raise Iso9660Error('not enough data for path table record')
+            if parent == 0 or parent > len(directories) + 1:
+                raise Iso9660Error('invalid parent in path table')
+            if extent_location >= self.volume_space_size:
+                raise Iso9660Error('extent location cannot be outside file')
+            directories.append((extent_location, parent - 1,
+                                path_table[pos+8:pos+8+namelength]))
+            pos += 8 + namelength + namelength % 2
+        if directories == []:
+            raise Iso9660Error('empty path table')
+        return directories
+
+    def read_directory(self, extent_location):
+        '''Return the records of the directory in an extent as a list of
+        (extent location, extent size, flags, name, system use area),
+        starting with the record for the directory itself.'''
+        volumesize = self.size
+        position = self.offset + extent_location * self.logical_size
+
+        # the first record points to the directory itself and has the
+        # size of the directory.
+        first = self._parse_directory_record(self.data[position:position+self.data[position]],
+                                             volumesize, self.logical_size)
+        if first[0] != extent_location or first[3] != b'\x00':
+            raise Iso9660Error('wrong back reference for . directory')
+        directory = self.data[position:position+first[1]]
+
+        records = []
+        pos = 0
+        while pos < len(directory):
+            length = directory[pos]
+
+            # ECMA 119, 6.8.1.1: "each Directory Record shall
+            # end in the Logical Sector in which it begins"
+            # This means that there could be padding bytes (NUL)
+            if length == 0:
+                pos = (pos // self.logical_size + 1) * self.logical_size
+                continue
+            records.append(self._parse_directory_record(directory[pos:pos+length],
+                                                        volumesize, self.logical_size))
+            pos += length
+        return records
+
+    def system_use_entries(self, system_use, skip):
+        '''Yield the signature and data of all System Use entries
+        (IEEE P1281, section 4) in a system use area, including the
+        continuation areas it points to.'''
+        system_use = system_use[skip:]
+        continuations = 0
+        while True:
+            continuation = None
+            pos = 0
+            while pos + 4 <= len(system_use):
+                signature = bytes(system_use[pos:pos+2])
+                length = system_use[pos+2]
+                # padding at the end of the area
+                if length < 4:
+                    break
+                if pos + length > len(system_use):
+                    raise Iso9660Error('invalid length in system use field')
+                if signature == b'ST':
+                    # terminator (IEEE P1281, 5.4)
+                    break
+                if signature == b'CE':
+                    # the continuation area (IEEE P1281, 5.1)
+                    if length < 28:
+                        raise Iso9660Error('invalid continuation area entry')
+                    (block, ceoffset, celength) = struct.unpack_from('<I4xI4xI', system_use, pos+4)
+                    continuation = (block * self.logical_size + ceoffset, celength)
+                else:
+                    yield (signature, system_use[pos+4:pos+length])
+                pos += length
+            if continuation is None:
+                return
+            (position, length) = continuation
+            continuations += 1
+            if continuations > 256 or position + length > self.size:
+                raise Iso9660Error('invalid continuation area location or size')
+            position += self.offset
+            system_use = self.data[position:position+length]
+
+    def rock_ridge(self, system_use, skip):
+        '''Return the alternate name, symbolic link target, relocation
+        information and zisofs parameters from the Rock Ridge entries
+        in a system use area (IEEE P1282, section 4).'''
+        alternatename = b''
+        namecontinue = True
+        linkcomponents = []
+        linkcomponent = None
+        linkcontinue = True
+        childlink = None
+        relocated = False
+        zisofs = None
+        for (signature, entrydata) in self.system_use_entries(system_use, skip):
+            if signature == b'NM' and namecontinue and len(entrydata) >= 1:
+                # The alternate name field is described in
+                # IEEE P1282, 4.1.4. Names for . and .. are ignored.
+                if entrydata[0] & 0x06 == 0:
+                    alternatename += entrydata[1:]
+                namecontinue = entrydata[0] & 1 == 1
+            elif signature == b'SL' and linkcontinue and len(entrydata) >= 1:
+                # symbolic links, IEEE P1282, 4.1.3. The target is a
+                # list of components, which can span several entries.
+                pos = 1
+                while pos + 2 <= len(entrydata):
+                    (componentflags, componentlength) = entrydata[pos:pos+2]
+                    if pos + 2 + componentlength > len(entrydata):
+                        raise Iso9660Error('declared component area size larger than SUSP')
+                    if componentflags & 0x02:
+                        component = b'.'
+                    elif componentflags & 0x04:
+                        component = b'..'
+                    elif componentflags & 0x08:
+                        component = b'/'
+                    else:
+                        component = bytes(entrydata[pos+2:pos+2+componentlength])
+                    if linkcomponent is None:
+                        linkcomponent = component
+                    else:
+                        linkcomponent += component
+                    if not componentflags & 1:
+                        linkcomponents.append(linkcomponent)
+                        linkcomponent = None
+                    pos += 2 + componentlength
+                linkcontinue = entrydata[0] & 1 == 1
+            elif signature == b'CL' and len(entrydata) >= 4:
+                # IEEE P1282, 4.1.5.1: the entry is a placeholder for a
+                # directory that has been relocated.
+                childlink = int.from_bytes(entrydata[:4], byteorder='little')
+                if childlink >= self.volume_space_size:
+                    raise Iso9660Error('invalid directory relocation')
+            elif signature == b'RE':
+                # IEEE P1282, 4.1.5.3: the directory has been relocated
+                relocated = True
+            elif signature == b'ZF' and len(entrydata) >= 8:
+                # zisofs extension
+                if entrydata[:2] != b'pz':
+                    raise Iso9660Error('unsupported zisofs compression')
+                # Log2 of Block Size must be 15, 16 or 17
+                if entrydata[3] not in [15, 16, 17]:
+                    raise Iso9660Error('unsupported zisofs block size log')
+                zisofs = (entrydata[2], entrydata[3],
+                          int.from_bytes(entrydata[4:8], byteorder='little'))
+
+        symlinktarget = None
+        if linkcomponents != []:
+            if linkcomponents[0] == b'/':
+                symlinktarget = b'/' + b'/'.join(linkcomponents[1:])
+            else:
+                symlinktarget = b'/'.join(linkcomponents)
+        return (alternatename, symlinktarget, childlink, relocated, zisofs)
+
+    def decode_name(self, name, joliet):
+        if joliet:
+            try:
+                return name.decode('utf-16-be')
+            except UnicodeDecodeError:
+                raise Iso9660Error('could not decode file name')
+        for c in encodingstotranslate:
+            try:
+                return name.decode(c)
+            except UnicodeDecodeError:
+                pass
+        raise Iso9660Error('could not decode file name')
+
+    def read_tree(self):
+        '''Return a dictionary with the relative path of every directory
+        extent and a list of files as (parent directory extent, name,
+        list of extents, symbolic link target, zisofs parameters).'''
+        # Rock Ridge is used if the first record of the root directory
+        # starts with the 'SP' entry (IEEE P1281, section 5.3), which
+        # also specifies how many bytes need to be skipped in each
+        # system use area.
+        (path_table_location, path_table_size, root_location) = self.primary[2:]
+        rootsystemuse = self.read_directory(root_location)[0][4]
+        skip = 0
+        if rootsystemuse[:2] == b'SP' and len(rootsystemuse) >= 7 and \
+           rootsystemuse[4:6] == b'\xbe\xef':
+            self.rockridge = True
+            skip = rootsystemuse[6]
+        else:
+            self.rockridge = False
+            if self.joliet is not None:
+                (path_table_location, path_table_size, root_location) = self.joliet[2:]
+        usejoliet = not self.rockridge and self.joliet is not None
+
+        directories = self.read_path_table(path_table_location, path_table_size)
+        if directories[0][0] != root_location:
+            raise Iso9660Error('path table does not start with root directory')
+
+        # Names of directories from the directory records of their
+        # parents, which can differ from the path table when Rock Ridge
+        # is used. Relocated directories get their name and parent from
+        # the placeholder (the 'CL' entry) in the real parent.
+        dirnames = {}
+        files = []
+        for (extent_location, parent, ptname) in directories:
+            previousmultiextent = False
+            for (location, size, flags, name, system_use) in self.read_directory(extent_location)[1:]:
+                if name in [b'\x00', b'\x01'] or flags & self.FLAG_ASSOCIATED:
+                    continue
+                symlinktarget = None
+                childlink = None
+                relocated = False
+                zisofs = None
+                if self.rockridge:
+                    (alternatename, symlinktarget, childlink,
+                     relocated, zisofs) = self.rock_ridge(system_use, skip)
+                    if alternatename != b'':
+                        name = alternatename
+                name = self.decode_name(name, usejoliet)
+                if not self.rockridge or alternatename == b'':
+                    # strip the version number and a trailing dot
+                    # for files without an extension (ECMA 119, 7.5)
+                    if not flags & self.FLAG_DIRECTORY:
+                        name = name.rsplit(';', 1)[0]
+                        if name.endswith('.') and name not in ['.', '..']:
+                            name = name[:-1]
+                if name in ['', '.', '..'] or '/' in name or '\x00' in name:
+                    raise Iso9660Error('invalid file name')
+
+                if flags & self.FLAG_DIRECTORY:
+                    if not relocated:
+                        dirnames.setdefault(location, (extent_location, name))
+                elif childlink is not None:
+                    dirnames[childlink] = (extent_location, name)
+                elif previousmultiextent and files[-1][:2] == (extent_location, name):
+                    # files larger than 4 GiB are stored in several
+                    # extents in consecutive records (ECMA 119, 6.5.1)
+                    files[-1][2].append((location, size))
+                else:
+                    files.append((extent_location, name, [(location, size)],
+                                  symlinktarget, zisofs))
+                previousmultiextent = flags & self.FLAG_MULTI_EXTENT != 0
+
+        # then compute the path of every directory
+        for (extent_location, parent, ptname) in directories[1:]:
+            if extent_location not in dirnames:
+                name = self.decode_name(ptname, usejoliet)
+                if name in ['', '.', '..'] or '/' in name or '\x00' in name:
+                    raise Iso9660Error('invalid file name')
+                dirnames[extent_location] = (directories[parent][0], name)
+        dirpaths = {root_location: ''}
+        for extent_location in dirnames:
+            seen = set()
+            pending = []
+            location = extent_location
+            while location not in dirpaths:
+                if location in seen or location not in dirnames:
+                    raise Iso9660Error('directory loop')
+                seen.add(location)
+                pending.append(location)
+                location = dirnames[location][0]
+            for location in reversed(pending):
+                (parentlocation, name) = dirnames[location]
+                dirpaths[location] = os.path.join(dirpaths[parentlocation], name)
+        return (dirpaths, files)
+
+    def read_boot_catalog(self):
+        '''Return the media type, load location and number of sectors of
+        all El Torito boot images.'''
+        bootimages = []
+        if self.bootcatalog is None or (self.bootcatalog + 1) * 2048 > self.size:
+            return bootimages
+        position = self.offset + self.bootcatalog * 2048
+        catalog = self.data[position:position+2048]
+
+        # the validation entry, with a checksum that makes the sum of
+        # all words 0, followed by the initial/default entry.
+        if catalog[0] != 1 or catalog[30:32] != b'\x55\xaa':
+            return bootimages
+        if sum(struct.unpack_from('<16H', catalog)) & 0xffff != 0:
+            return bootimages
+        entries = [catalog[32:64]]
+
+        # section headers, each followed by section entries
+        pos = 64
+        while pos + 32 <= len(catalog) and catalog[pos] in [0x90, 0x91]:
+            finalheader = catalog[pos] == 0x91
+            sectionentries = int.from_bytes(catalog[pos+2:pos+4], byteorder='little')
+            pos += 32
+            for i in range(sectionentries):
+                if pos + 32 > len(catalog):
+                    break
+                entries.append(catalog[pos:pos+32])
+                pos += 32
+            if finalheader:
+                break
+
+        for entry in entries:
+            if entry[0] not in [0x00, 0x88]:
+                continue
+            (mediatype, sectorcount, loadrba) = struct.unpack_from('<B4xHI', entry, 1)
+            mediatype &= 0x0f
+            if mediatype not in self.eltorito_media:
+                continue
+            bootimages.append((mediatype, loadrba, sectorcount))
+        return bootimages
+
+    def read_hybrid(self):
+        '''Check whether or not the system area contains a partition
+        table that makes the image bootable from a disk ("hybrid" images,
+        as made by isohybrid or xorriso). Returns the size of the disk
+        described by the partition table.'''
+        mbr = self.data[self.offset:self.offset+512]
+        if mbr[510:512] != b'\x55\xaa':
+            return 0
+        disksize = 0
+        for i in range(4):
+            (status, partitiontype, lba, sectors) = struct.unpack_from('<B3xB3xII', mbr, 446 + i*16)
+            if status not in [0x00, 0x80]:
+                return 0
+            if partitiontype == 0 or sectors == 0:
+                continue
+            disksize = max(disksize, (lba + sectors) * 512)
+        if disksize == 0:
+            return 0
+        self.hybrid = 'mbr'
+
+        # a GPT header in the second sector, which records the location
+        # of the backup header in the last sector of the disk.
+        if self.data[self.offset+512:self.offset+520] == b'EFI PART':
+            self.hybrid = 'gpt'
+            backuplba = int.from_bytes(self.data[self.offset+544:self.offset+552], byteorder='little')
+            disksize = max(disksize, (backuplba + 1) * 512)
+        return disksize
+
+    def copy_zisofs(self, outfile, extent_location, extent_size, zisofs):
+        (header_div_4, block_size_log, uncompressed_size) = zisofs
+        position = self.offset + extent_location * self.logical_size
+        header = self.data[position:position+min(16, extent_size)]
+
+        # the zisofs header should match the SUSP entry
+        if len(header) < 16:
+            raise Iso9660Error('not enough bytes for zisofs header')
+        if header[:8] != self.zisofs_magic:
+            raise Iso9660Error('wrong magic for zisofs data')
+        if int.from_bytes(header[8:12], byteorder='little') != uncompressed_size:
+            raise Iso9660Error('mismatch for uncompressed size in zisofs header and SUSP')
+        if header[12] != header_div_4 or header[13] != block_size_log:
+            raise Iso9660Error('mismatch between zisofs header and SUSP')
+        if header[14:16] != b'\x00\x00':
+            raise Iso9660Error('wrong value for reserved bytes')
+
+        # then the pointer array
+        block_size = 1 << block_size_log
+        blockpointers = math.ceil(uncompressed_size/block_size) + 1
+        pointerstart = header_div_4 * 4
+        if pointerstart + blockpointers * 4 > extent_size:
+            raise Iso9660Error('not enough data for block pointer')
+        pointers = struct.unpack_from('<%dI' % blockpointers, self.data, position + pointerstart)
+        if max(pointers) > extent_size:
+            raise Iso9660Error('block pointer cannot be outside extent')
+
+        # in case two pointers are the same a block of NULs should be
+        # written, which is left as a hole in the output file.
+        for b in range(blockpointers - 1):
+            if pointers[b] == pointers[b+1]:
+                outfile.seek(block_size, os.SEEK_CUR)
+                continue
+            try:
+                outfile.write(zlib.decompress(self.data[position+pointers[b]:position+pointers[b+1]]))
+            except zlib.error:
+                raise Iso9660Error('invalid zisofs data')
+        outfile.truncate(uncompressed_size)
+
+    def unpack(self, scanenvironment, unpackdir):
+        '''Recreate the directory tree in unpackdir and return a list
+        of unpacked files and labels.'''
+        unpackedfilesandlabels = []
+        (dirpaths, files) = self.read_tree()
+
+        for dirpath in sorted(dirpaths.values()):
+            os.makedirs(scanenvironment.unpack_path(os.path.join(unpackdir, dirpath)), exist_ok=True)
+
+        # the size of the file at every extent, used for boot images
+        extentsizes = {}
+        for (parentlocation, name, extents, symlinktarget, zisofs) in files:
+            outfile_rel = os.path.join(unpackdir, dirpaths[parentlocation], name)
+            outfile_full = scanenvironment.unpack_path(outfile_rel)
+
+            # names without the version number are not necessarily
+            # unique, so only the first (the newest version,
+            # ECMA 119, 9.3) is unpacked.
+            if os.path.lexists(outfile_full):
+                continue
+            if symlinktarget is not None:
+                try:
+                    target = self.decode_name(symlinktarget, False)
+                except Iso9660Error:
+                    continue
+                if '\x00' in target:
+                    continue
+                os.symlink(target, outfile_full)
+                unpackedfilesandlabels.append((outfile_rel, ['symbolic link']))
+                continue
+
+            outfile = open(outfile_full, 'wb')
+            try:
+                if zisofs is not None:
+                    self.copy_zisofs(outfile, extents[0][0], extents[0][1], zisofs)
+                else:
+                    for (extent_location, extent_size) in extents:
+                        outfile.flush()
+                        if sendfile_range(outfile.fileno(), self.infile.fileno(),
+                                          self.offset + extent_location * self.logical_size,
+                                          extent_size) != extent_size:
+                            raise Iso9660Error('extent cannot be outside file')
+                        outfile.seek(0, os.SEEK_END)
+            finally:
+                outfile.close()
+            extentsizes.setdefault(extents[0][0], sum(size for (location, size) in extents))
+            unpackedfilesandlabels.append((outfile_rel, []))
+
+        # El Torito boot images are written to a separate directory
+        bootdir_rel = os.path.join(unpackdir, '[BOOT]')
+        bootimages = self.read_boot_catalog()
+        if bootimages != [] and not os.path.lexists(scanenvironment.unpack_path(bootdir_rel)):
+            os.mkdir(scanenvironment.unpack_path(bootdir_rel))
+            for (counter, (mediatype, loadrba, sectorcount)) in enumerate(bootimages, 1):
+                (medianame, imagesize) = self.eltorito_media[mediatype]
+                if imagesize is None:
+                    # the sector count is in virtual sectors of 512
+                    # bytes, and is often not the size of the whole
+                    # image, so use the size of the file in the ISO
+                    # image if there is one.
+                    imagesize = extentsizes.get(loadrba, sectorcount * 512)
+                imagesize = min(imagesize, self.size - loadrba * 2048)
+                if imagesize <= 0:
+                    continue
+                outfile_rel = os.path.join(bootdir_rel, '%d-Boot-%s.img' % (counter, medianame))
+                outfile = open(scanenvironment.unpack_path(outfile_rel), 'wb')
+                sendfile_range(outfile.fileno(), self.infile.fileno(),
+                               self.offset + loadrba * 2048, imagesize)
+                outfile.close()
+                unpackedfilesandlabels.append((outfile_rel, []))
+        return unpackedfilesandlabels
+
+
 def unpack_iso9660(fileresult, scanenvironment, offset, unpackdir):
     '''Unpack an ISO9660 file system.'''
     filesize = fileresult.filesize
     filename_full = scanenvironment.unpack_path(fileresult.filename)
     unpackdir_full = scanenvironment.unpack_path(unpackdir)
-    unpackedfilesandlabels = []
     labels = []
-    unpackingerror = {}
     if filesize - offset < 32769:
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'File too small (less than 32769 bytes'}
         return {'status': False, 'error': unpackingerror}
 
-    unpackedsize = 0
-
-    # each sector is 2048 bytes long (ECMA 119, 6.1.2). The first 16
-    # sectors are reserved for the "system area" (in total 32768 bytes:
-    # ECMA 119, 6.2.1)
     checkfile = open(filename_full, 'rb')
-    checkfile.seek(offset+32768)
-    unpackedsize += 32768
-
-    # What follows is the data area: ECMA 119, 6.3
-    # This consists of a sequence of volume descriptors
-    # called volume desciptor set (ECMA 119, 6.7.1)
-    # Inside the sequence there should be at least one
-    # primary volume descriptor (ECMA 119, 6.7.1.1) and
-    # at least one terminator (ECMA 119, 6.7.1.6)
-    haveprimary = False
-    haveterminator = False
-    isbootable = False
-
-    # store whether or not Rock Ridge and zisofs extensions are used
-    havesusp = False
-    haverockridge = False
-    havezisofs = False
-
-    isobuffer = bytearray(2048)
+    checkdata = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        isoreader = Iso9660Reader(checkfile, checkdata, offset)
+        os.makedirs(unpackdir_full, exist_ok=True)
+        unpackedfilesandlabels = isoreader.unpack(scanenvironment, unpackdir)
+        disksize = isoreader.read_hybrid()
+    except Iso9660Error as e:
+        unpackingerror = {'offset': offset, 'fatal': False,
+                          'reason': e.args[0]}
+        return {'status': False, 'error': unpackingerror}
+    finally:
+        checkdata.close()
+        checkfile.close()
 
-    # create the unpacking directory
-    os.makedirs(unpackdir_full, exist_ok=True)
+    unpackedsize = isoreader.size
 
-    # read all sectors, until there are none left, or
-    # a volume set descriptor terminator is found
-    while True:
-        bytesread = checkfile.readinto(isobuffer)
-        if bytesread != 2048:
-            checkfile.close()
-            unpackingerror = {'offset': offset, 'fatal': False,
-                              'reason': 'not enough bytes for sector'}
-            return {'status': False, 'error': unpackingerror}
+    # Hybrid images are padded so they can be written to a disk, and
+    # with GPT have a backup GPT header at the end, which all belong
+    # to the image.
+    if offset + disksize <= filesize:
+        unpackedsize = max(unpackedsize, disksize)
 
-        checkbytes = memoryview(isobuffer)
+    metadata = {'rockridge': isoreader.rockridge,
+                'joliet': isoreader.joliet is not None,
+                'bootable': isoreader.bootcatalog is not None,
+                'hybrid': isoreader.hybrid}
 
-        # each volume descriptor has a type and an identifier
-        # (ECMA 119, section 8.1)
-        if checkbytes[1:6] != b'CD001':
-            checkfile.close()
-            unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                              'reason': 'wrong identifier'}
-            return {'status': False, 'error': unpackingerror}
+    if offset == 0 and unpackedsize == filesize:
+        labels += ['iso9660', 'filesystem']
+    return {'status': True, 'length': unpackedsize, 'labels': labels,
+            'filesandlabels': unpackedfilesandlabels, 'metadata': metadata}
 
-        volumedescriptoroffset = checkfile.tell()
-
-        # volume descriptor type (ECMA 119, section 8.1.1)
-        # 0: boot record
-        # 1: primary volume descriptor
-        # 2: supplementary volume descriptor or an enhanced volume
-        #    descriptor
-        # 3: volume partition descriptor
-        # 255: volume descriptor set terminator
-        if checkbytes[0] == 0:
-            # boot record. There is no additional data here, except
-            # that there could be a bootloader located here, which
-            # could be important for license compliance (isolinux and
-            # friends), so mark this as a bootable CD.
-            isbootable = True
-        elif checkbytes[0] == 1:
-            # primary volume descriptor (PVD)
-            # ECMA 119, 8.4
-            haveprimary = True
-
-            # most fields are stored in both little endian and big
-            # endian format and should have the same values.
-            if int.from_bytes(checkbytes[80:84], byteorder='little') != int.from_bytes(checkbytes[84:88], byteorder='big'):
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'endian mismatch'}
-                return {'status': False, 'error': unpackingerror}
-            # ECMA 119, 8.4.8
-            volume_space_size = int.from_bytes(checkbytes[80:84], byteorder='little')
 
-            # extra sanity check to see if little endian and big endian
-            # values match.
-            if int.from_bytes(checkbytes[128:130], byteorder='little') != int.from_bytes(checkbytes[130:132], byteorder='big'):
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'endian mismatch'}
-                return {'status': False, 'error': unpackingerror}
+def decompress_rtime(data, decompressedsize):
+    '''Decompress JFFS2 rtime data. The data is a list of (byte, repeat)
+    pairs: after every byte the data that followed the previous
+    occurence of the same byte is repeated. Repeats that overlap with
+    the data that is being written are done as a repeated pattern
+    instead of byte by byte.'''
+    positions = [0] * 256
+    result = bytearray()
+    for (value, repeat) in zip(data[0::2], data[1::2]):
+        result.append(value)
+        outpos = len(result)
+        backoffs = positions[value]
+        positions[value] = outpos
+        if repeat:
+            distance = outpos - backoffs
+            if distance >= repeat:
+                result += result[backoffs:backoffs+repeat]
+            else:
+                pattern = result[backoffs:outpos]
+                result += (pattern * (repeat // distance + 1))[:repeat]
+        if len(result) >= decompressedsize:
+            break
+    return bytes(result[:decompressedsize])
 
-            # ECMA 119, 8.4.12
-            logical_size = int.from_bytes(checkbytes[128:130], byteorder='little')
 
-            # sanity check: the ISO image cannot be outside of the file
-            if offset + volume_space_size * logical_size > filesize:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'image cannot be outside of file'}
-                return {'status': False, 'error': unpackingerror}
+# An in-process reader for JFFS2 file systems, used by unpack_jffs2.
+#
+# Unpacking is done in two phases. First the (memory mapped) file
+# system is scanned once and an index of the nodes is made: directory
+# entries and the headers of data nodes (inode, version, position,
+# compressor, sizes). The scan stops at the first data that is not
+# valid JFFS2, which determines the size of the file system.
+#
+# Then the index is resolved: for every name the directory entry with
+# the highest version is used (deleted entries have inode 0), and the
+# data nodes of a file are applied in order of their version, so newer
+# data overwrites older data, as JFFS2 is a log structured file system.
+# Files are written in a thread pool, one file per task, as the zlib
+# and LZMA decompressors release the GIL.
+#
+# References:
+# jffs2.h in the Linux kernel
+# https://github.com/sviehb/jefferson/
+class Jffs2Reader:
+    # node types
+    DIRENT = 0xe001
+    INODE = 0xe002
+    CLEANMARKER = 0x2003
+    PADDING = 0x2004
+    SUMMARY = 0x2006
+    XATTR = 0xe008
+    XREF = 0xe009
 
-            # according to https://wiki.osdev.org/ISO_9660 Linux does
-            # not use the L-path and M-path but the directory entries
-            # instead.
-            # The PVD contains the directory root entry (ECMA 119, 8.4.8)
-            root_directory_entry = checkbytes[156:190]
+    validnodetypes = set([DIRENT, INODE, CLEANMARKER, PADDING, SUMMARY,
+                          XATTR, XREF])
 
-            # the entry is formatted as described in ECMA 119, 9.1
-            len_dr = root_directory_entry[0]
+    # different kinds of compression
+    # The mtd-utils code defines more types of "compression"
+    # than supported by mkfs.jffs2
+    # LZMA compression is available as a patch from OpenWrt.
+    COMPR_NONE = 0x00
+    COMPR_ZERO = 0x01
+    COMPR_RTIME = 0x02
+    COMPR_RUBINMIPS = 0x03
+    COMPR_COPY = 0x04
+    COMPR_DYNRUBIN = 0x05
+    COMPR_ZLIB = 0x06
+    COMPR_LZO = 0x07
+    COMPR_LZMA = 0x08
 
-            # extent location (ECMA 119, 9.1.3)
-            extent_location = int.from_bytes(root_directory_entry[2:6], byteorder='little')
-            # sanity check: the ISO image cannot be outside of the file
-            if offset + extent_location * logical_size > filesize:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'extent location cannot be outside file'}
-                return {'status': False, 'error': unpackingerror}
+    # LZMA settings from OpenWrt's patch
+    lzma_filters = [{'id': lzma.FILTER_LZMA1, 'dict_size': 0x2000,
+                     'lc': 0, 'lp': 0, 'pb': 0}]
+
+    # the size of the chunks in which empty (erased) flash is skipped
+    erasedchunksize = 65536
+
+    def __init__(self, data, offset, threads=1):
+        self.data = data
+        self.offset = offset
+        self.threads = threads
+        if data[offset:offset+2] == b'\x19\x85':
+            byteorder = '>'
+            self.magic = b'\x19\x85'
+        else:
+            byteorder = '<'
+            self.magic = b'\x85\x19'
+        self.nodeheader = struct.Struct(byteorder + 'HII')
+        self.direntheader = struct.Struct(byteorder + 'IIIIBBHII')
+        self.inodeheader = struct.Struct(byteorder + 'IIIHHIIIIIIIBBHII')
+
+        # The index: directory entries as (parent inode, name) ->
+        # (version, inode) and the data nodes of every inode as a list
+        # of (version, mode, size, write offset, compressed size,
+        # decompressed size, compressor, position of the data).
+        self.dirents = {}
+        self.datanodes = collections.defaultdict(list)
+        self.parentinodes = set()
+        self.length = self._scan()
+
+    def _crc(self, position, size):
+        # The checksum varies slightly from the one in the zlib/binascii
+        # modules as explained here:
+        #
+        # http://www.infradead.org/pipermail/linux-mtd/2003-February/006910.html
+        return (binascii.crc32(self.data[position:position+size], -1) ^ -1) & 0xffffffff
+
+    def _end_of_erased(self, position):
+        '''Return the position of the first byte at or after position
+        that is not 0xff.'''
+        while position < len(self.data):
+            chunk = self.data[position:position+self.erasedchunksize]
+            remaining = chunk.lstrip(b'\xff')
+            if remaining != b'':
+                return position + len(chunk) - len(remaining)
+            position += len(chunk)
+        return len(self.data)
+
+    def _scan(self):
+        '''Scan the file system and index the nodes. Returns the size
+        of the file system.'''
+        data = self.data
+        datasize = len(data)
+        position = self.offset
+        length = 0
+        seenversions = set()
+        prev_is_padding = False
+        while position + 4 <= datasize:
+            magic = data[position:position+2]
+            if magic == b'\xff\xff':
+                # empty space, in words of four bytes
+                erasedwords = (self._end_of_erased(position) - position) // 4
+                if erasedwords == 0:
+                    break
+                position += erasedwords * 4
+                length = position - self.offset
+                continue
+            if magic not in [self.magic, b'\x00\x00']:
+                break
 
-            # sanity check: the ISO image cannot be outside of the
-            # declared size of the file
-            if extent_location * logical_size > volume_space_size * logical_size:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'extent location cannot be larger than declared size'}
-                return {'status': False, 'error': unpackingerror}
+            if position + 12 <= datasize:
+                (nodetype, totlen, headercrc) = self.nodeheader.unpack_from(data, position + 2)
+            else:
+                (nodetype, totlen, headercrc) = (None, 0, 0)
 
-            # extent size (ECMA 119, 9.1.4)
-            root_directory_extent_length = int.from_bytes(root_directory_entry[10:14], byteorder='little')
-            # sanity check: the ISO image cannot be outside of the file
-            if offset + extent_location * logical_size + root_directory_extent_length > filesize:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'extent cannot be outside fle'}
-                return {'status': False, 'error': unpackingerror}
+            if nodetype not in self.validnodetypes:
+                if data[position+2:position+4] != b'\x00\x00' or prev_is_padding:
+                    break
+                # due to page alignments there might
+                # be extra NULL bytes
+                paddingend = position + 4
+                if paddingend % 4096 != 0:
+                    paddingend += 4096 - paddingend % 4096
+                    if data[position+4:paddingend].count(0) != paddingend - position - 4:
+                        break
+                prev_is_padding = True
+                position = paddingend
+                length = position - self.offset
+                continue
+            prev_is_padding = False
 
-            # sanity check: the ISO image cannot be outside of the
-            # declared size of the file
-            if extent_location * logical_size + root_directory_extent_length > volume_space_size * logical_size:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'extent cannot be outside of declared size'}
-                return {'status': False, 'error': unpackingerror}
+            # the node should be inside the file
+            if totlen < 12 or position + totlen > datasize:
+                break
 
-            # file flags (ECMA 119, 9.1.6)
-            if root_directory_entry[25] >> 1 & 1 != 1:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'file flags for directory wrong'}
-                return {'status': False, 'error': unpackingerror}
+            # dirty nodes (magic 0) are skipped. The header CRC of
+            # all other nodes is checked.
+            if magic == self.magic:
+                if self._crc(position, 8) != headercrc:
+                    break
+                if nodetype == self.DIRENT:
+                    if not self._index_dirent(position, totlen, seenversions):
+                        break
+                elif nodetype == self.INODE:
+                    if not self._index_inode(position, totlen, seenversions):
+                        break
 
-            # file name length (ECMA 119, 9.1.10)
-            file_name_length = root_directory_entry[32]
-            extent_filename = root_directory_entry[33:33+file_name_length]
-
-            # ECMA 119, 7.6: file name for root directory is 0x00
-            # Some ISO file systems instead said it to 0x01, which
-            # according to 6.8.2.2 should not be for the first root
-            # entry.
-            # Seen in an ISO file included in an ASUS firmware file
-            # Modem_FW_4G_AC55U_30043808102_M14.zip
-            if extent_filename != b'\x00' and extent_filename != b'\x01':
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'root file name wrong'}
-                return {'status': False, 'error': unpackingerror}
+            # nodes are 4 byte aligned
+            position += totlen
+            position += (-(position - self.offset)) % 4
+            length = min(position, datasize) - self.offset
+        return length
+
+    def _index_dirent(self, position, totlen, seenversions):
+        '''Add a directory entry to the index. Returns False if the node
+        is not valid.'''
+        if totlen < 40:
+            return False
+        (parentinode, version, inode, mctime, namelength, direnttype,
+         unused, nodecrc, namecrc) = self.direntheader.unpack_from(self.data, position + 12)
+        self.parentinodes.add(parentinode)
+        if namelength == 0 or 40 + namelength > totlen:
+            return False
+        if self._crc(position + 40, namelength) != namecrc:
+            return False
+        try:
+            name = self.data[position+40:position+40+namelength].decode()
+        except UnicodeDecodeError:
+            return False
+
+        # Inodes cannot have the same version twice, which happens
+        # for example when file systems are concatenated. Entries
+        # for deleted files (inode 0) are recorded as well, to
+        # hide older entries with the same name.
+        if inode != 0:
+            if (self.DIRENT, inode, version) in seenversions:
+                return False
+            seenversions.add((self.DIRENT, inode, version))
+        key = (parentinode, name)
+        if key not in self.dirents or self.dirents[key][0] < version:
+            self.dirents[key] = (version, inode)
+        return True
+
+    def _index_inode(self, position, totlen, seenversions):
+        '''Add the header of a data node to the index. Returns False if
+        the node is not valid.'''
+        if totlen < 68:
+            return False
+        (inode, version, mode, uid, gid, size, atime, mtime, ctime,
+         writeoffset, compressedsize, decompressedsize, compressor,
+         usercompressor, flags, datacrc,
+         nodecrc) = self.inodeheader.unpack_from(self.data, position + 12)
+        if inode == 0:
+            return True
+        if 68 + compressedsize > totlen:
+            return False
+        if (self.INODE, inode, version) in seenversions:
+            return False
+        seenversions.add((self.INODE, inode, version))
+
+        # a node with a wrong CRC is where the file system ends
+        if self._crc(position, 60) != nodecrc or \
+                self._crc(position + 68, compressedsize) != datacrc:
+            return False
+        self.datanodes[inode].append((version, mode, size, writeoffset,
+                                      compressedsize, decompressedsize,
+                                      compressor, position + 68))
+        return True
+
+    def _decompress(self, node):
+        '''Return the data of a data node, or None if the data could not
+        be decompressed.'''
+        (version, mode, size, writeoffset, compressedsize,
+         decompressedsize, compressor, dataposition) = node
+        data = self.data[dataposition:dataposition+compressedsize]
+        try:
+            if compressor == self.COMPR_NONE:
+                unpackeddata = data
+            elif compressor == self.COMPR_ZERO:
+                unpackeddata = bytes(decompressedsize)
+            elif compressor == self.COMPR_ZLIB:
+                unpackeddata = zlib.decompress(data)
+            elif compressor == self.COMPR_LZMA:
+                # The data is LZMA compressed, without any headers.
+                decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW,
+                                                     filters=self.lzma_filters)
+                unpackeddata = decompressor.decompress(data, decompressedsize)
+            elif compressor == self.COMPR_RTIME:
+                unpackeddata = decompress_rtime(data, decompressedsize)
+            elif compressor == self.COMPR_LZO:
+                unpackeddata = lzo.decompress(data, False, decompressedsize)
+            else:
+                return None
+        except (zlib.error, lzma.LZMAError, lzo.error):
+            return None
+        if len(unpackeddata) != decompressedsize:
+            return None
+        return unpackeddata
+
+    def _latest_node(self, inode):
+        '''Return the data node with the highest version of an inode.'''
+        if self.datanodes[inode] == []:
+            return None
+        return max(self.datanodes[inode])
+
+    def write_file(self, task):
+        '''Write the data of a regular file by applying its data nodes
+        in order of their version. Returns True if data was written.'''
+        (inode, outfile_full) = task
+        nodes = sorted(self.datanodes[inode])
+        datawritten = False
+        outfile = open(outfile_full, 'wb')
+        try:
+            for node in nodes:
+                # holes only have to be written over older data
+                if node[6] == self.COMPR_ZERO and not datawritten:
+                    continue
+                unpackeddata = self._decompress(node)
+                if unpackeddata is None:
+                    continue
+                os.pwrite(outfile.fileno(), unpackeddata, node[3])
+                datawritten = True
+            # the newest node has the size of the file
+            if nodes != []:
+                outfile.truncate(nodes[-1][2])
+        finally:
+            outfile.close()
+        return datawritten
+
+    def unpack(self, scanenvironment, unpackdir):
+        '''Recreate the files and directories in unpackdir. Returns a
+        list of unpacked files and labels, and whether or not any data
+        was unpacked.'''
+        unpackedfilesandlabels = []
+        unpackdir_full = scanenvironment.unpack_path(unpackdir)
+        os.makedirs(unpackdir_full, exist_ok=True)
 
-            # record which extents correspond to which names. This is
-            # important for RockRidge relocations.
-            extenttoname = {}
-            extenttoparent = {}
-
-            # recursively walk all entries/extents in the directory
-            # structure.
-            # Keep these in a deque data structure for quick access
-            # For each extent to unpack add:
-            # location of the extent, the size of the extent, location
-            # where to unpack, and the name
-            extents = collections.deque()
-            extents.append((extent_location, root_directory_extent_length, unpackdir, ''))
-
-            # keep track of which extents need to be moved.
-            extenttomove = {}
-            relocatedextents = set()
-            plparent = {}
-
-            firstextentprocessed = False
-
-            # in case rock ridge or zisofs are used the first
-            # directory entry in the first extent will contain
-            # the SP System Use entry, which specifies how many
-            # bytes need to be skipped by default
-            # (IEEE P1281, section 5.3)
-            suspskip = 0
-
-            # then process all the extents with directory records. The
-            # structure is described in ECMA 119, 6.8
-            # In the extent pointed to by a directory entry all the
-            # entries are concatenated (ECMA 119, 6.8.1).
-            while len(extents) != 0:
-                (this_extent_location, this_extent_length, this_extent_unpackdir_rel, this_extent_name) = extents.popleft()
-
-                # first seek to the right location in the file
-                checkfile.seek(offset + this_extent_location * logical_size)
-
-                # store the starting offset of the current extent
-                orig_extent_offset = checkfile.tell()
-
-                # a counter of all data that has been read in this
-                # extent so far
-                all_extent_offset = 0
-
-                while checkfile.tell() - orig_extent_offset < this_extent_length:
-                    # the entry is formatted as described in ECMA 119, 9.1
-                    extent_directory_length = ord(checkfile.read(1))
-
-                    # then reset the file pointer
-                    checkfile.seek(-1, os.SEEK_CUR)
-
-                    # and store how much data will have been read
-                    # after processing this directory.
-                    all_extent_offset += extent_directory_length
-
-                    # ECMA 119, 6.8.1.1: "each Directory Record shall
-                    # end in the Logical Sector in which it begins"
-                    # This means that there could be padding bytes (NUL)
-                    if extent_directory_length == 0:
-                        # if there is still a logical size block then
-                        # jump to the start of that next block
-                        all_extent_offset = ((all_extent_offset//logical_size) + 1) * logical_size
-                        checkfile.seek(orig_extent_offset + all_extent_offset)
+        # the current names in every directory
+        children = collections.defaultdict(list)
+        for ((parentinode, name), (version, inode)) in sorted(self.dirents.items()):
+            # names that cannot be used as a file name are ignored
+            if inode == 0 or '/' in name or '\x00' in name or name in ['', '.', '..']:
+                continue
+            children[parentinode].append((name, inode))
+
+        # walk the tree, starting at the root inode (1)
+        inodetofilename = {}
+        filestowrite = []
+        hardlinks = []
+        symlinks = []
+        dirstoscan = collections.deque([(1, '')])
+        seendirs = set([1])
+        while dirstoscan:
+            (dirinode, dirname) = dirstoscan.popleft()
+            for (name, inode) in children[dirinode]:
+                filename = os.path.join(dirname, name)
+                latestnode = self._latest_node(inode)
+                if latestnode is not None:
+                    mode = latestnode[1]
+                elif inode in children:
+                    mode = stat.S_IFDIR
+                else:
+                    continue
+                if stat.S_ISDIR(mode):
+                    if inode in seendirs:
                         continue
-
-                    # read the directory entry and process according
-                    # to ECMA 119, 9.1
-                    directory_entry = bytearray(extent_directory_length)
-                    bytesread = checkfile.readinto(directory_entry)
-                    if bytesread != extent_directory_length:
-                        checkfile.close()
-                        unpackingerror = {'offset': offset+unpackedsize,
-                                          'fatal': False,
-                                          'reason': 'not enough data for extent directory'}
-                        return {'status': False, 'error': unpackingerror}
-
-                    # extent location (ECMA 119, 9.1.3)
-                    extent_location = int.from_bytes(directory_entry[2:6], byteorder='little')
-                    # sanity check: the ISO image cannot be outside
-                    # of the file
-                    if offset + extent_location * logical_size > filesize:
-                        checkfile.close()
-                        unpackingerror = {'offset': offset+unpackedsize,
-                                          'fatal': False,
-                                          'reason': 'extent location cannot be outside file'}
-                        return {'status': False, 'error': unpackingerror}
-
-                    # sanity check: the ISO image cannot be outside of
-                    # the declared size of the file
-                    if extent_location * logical_size > volume_space_size * logical_size:
-                        checkfile.close()
-                        unpackingerror = {'offset': offset+unpackedsize,
-                                          'fatal': False,
-                                          'reason': 'extent location cannot be bigger than declared size'}
-                        return {'status': False, 'error': unpackingerror}
-
-                    # extent size (ECMA 119, 9.1.4)
-                    directory_extent_length = int.from_bytes(directory_entry[10:14], byteorder='little')
-                    # sanity check: the ISO image cannot
-                    # be outside of the file
-                    if offset + extent_location * logical_size + directory_extent_length > filesize:
-                        checkfile.close()
-                        unpackingerror = {'offset': offset+unpackedsize,
-                                          'fatal': False,
-                                          'reason': 'extent cannot be outside file'}
-                        return {'status': False, 'error': unpackingerror}
-
-                    # sanity check: the ISO image cannot be outside of
-                    # the declared size of the file
-                    if extent_location * logical_size + directory_extent_length > volume_space_size * logical_size:
-                        checkfile.close()
-                        unpackingerror = {'offset': offset+unpackedsize,
-                                          'fatal': False,
-                                          'reason': 'extent outside of declared size'}
-                        return {'status': False, 'error': unpackingerror}
-
-                    # file name length (ECMA 119, 9.1.10)
-                    file_name_length = directory_entry[32]
-
-                    # file name (ECMA 119, 9.1.11)
-                    extent_filename = directory_entry[33:33+file_name_length].decode()
-
-                    # Grab the system use field (ECMA 119, 9.1.13) as
-                    # this is where Rock Ridge and zisofs information
-                    # lives (IEEE P1282, section 3).
-                    # First check if there is a padding byte
-                    # (ECMA 119, 9.1.12)
-                    if file_name_length % 2 == 0:
-                        # extra check: there should be a padding byte
-                        # if the file name length is even
-                        # (ECMA 119, 9.1.12)
-                        if directory_entry[33+file_name_length] != 0:
-                            checkfile.close()
-                            unpackingerror = {'offset': offset+unpackedsize,
-                                              'fatal': False,
-                                              'reason': 'no mandatory padding byte found'}
-                            return {'status': False, 'error': unpackingerror}
-                        system_use = directory_entry[33+file_name_length+1:]
-                    else:
-                        system_use = directory_entry[33+file_name_length:]
-
-                    # if RockRidge extensions are used place holder
-                    # files are written when a directory has been
-                    # moved. These files should not be created, so
-                    # indicate whether or not a file needs to be
-                    # created or not.
-                    createfile = True
-
-                    if len(system_use) != 0:
-                        # set the offset to the number of bytes that
-                        # should be skipped for each system use area
-                        # according to IEEE P1281, section 5.3
-                        suoffset = suspskip
-
-                        # add a stub for an alternate name as the
-                        # could span multiple entries and need to be
-                        # concatenated.
-                        alternatename = b''
-                        alternatenamecontinue = True
-                        renamecurrentdirectory = False
-                        renameparentdirectory = False
-
-                        # add a stub for a symbolic name as the could
-                        # span multiple entries and need to be
-                        # concatenated.
-                        symlinktarget = b''
-                        symlinkcontinue = True
-                        symlinknamecontinue = True
-
-                        # store if PL was already seen
-                        # (IEEE P1282, 4.1.5.2)
-                        havepl = False
-
-                        # process according to IEEE P1281, section 4
-                        while True:
-                            if suoffset >= len(system_use) - 2:
-                                break
-
-                            signatureword = system_use[suoffset:suoffset+2]
-                            sulength = system_use[suoffset+2]
-                            if sulength > len(system_use):
-                                checkfile.close()
-                                unpackingerror = {'offset': offset+unpackedsize,
-                                                  'fatal': False,
-                                                  'reason': 'invalid length in system use field'}
-                                return {'status': False, 'error': unpackingerror}
-                            suversion = system_use[suoffset+3]
-                            sudata = system_use[suoffset+4:suoffset+4+sulength]
-
-                            # the 'SP' entry can only appear once per
-                            # directory hierarchy and has to be the
-                            # very first entry of the first directory
-                            # entry of the first extent
-                            # (IEEE P1281, section 5.3)
-                            if signatureword == b'SP':
-                                if firstextentprocessed:
-                                    checkfile.close()
-                                    unpackingerror = {'offset': offset+unpackedsize,
-                                                      'fatal': False,
-                                                      'reason': 'SP used twice in System Use area'}
-                                    return {'status': False, 'error': unpackingerror}
-                                havesusp = True
-                                suspskip = system_use[suoffset+6]
-                            else:
-                                if not havesusp:
-                                    checkfile.close()
-                                    unpackingerror = {'offset': offset+unpackedsize,
-                                                      'fatal': False,
-                                                      'reason': 'SP not first in System Use area'}
-                                    return {'status': False, 'error': unpackingerror}
-                                # depending on the SUSP word that
-                                # follows the contents should be
-                                # interpreted differently
-                                if signatureword == b'ST':
-                                    # terminator (IEEE P1281, 5.4)
-                                    break
-                                if signatureword == b'RR':
-                                    # this signature word is obsolete
-                                    # but still frequently used to
-                                    # indicate that RockRidge is used
-                                    haverockridge = True
-                                elif signatureword == b'CE':
-                                    # the continuation area
-                                    continuation_block = int.from_bytes(system_use[suoffset+4:suoffset+8], byteorder='little')
-                                    continuation_offset = int.from_bytes(system_use[suoffset+12:suoffset+16], byteorder='little')
-                                    continuation_length = int.from_bytes(system_use[suoffset+20:suoffset+24], byteorder='little')
-
-                                    # first check whether or not the
-                                    # continuation data is inside the
-                                    # ISO image.
-                                    if volume_space_size * logical_size < continuation_block * logical_size + continuation_offset + continuation_length:
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'invalid continuation area location or size'}
-                                        return {'status': False, 'error': unpackingerror}
-
-                                    # store the current position in the file
-                                    oldoffset = checkfile.tell()
-                                    checkfile.seek(continuation_block * logical_size + continuation_offset)
-                                    # continuation_bytes = checkfile.read(continuation_length)
-                                    # TODO
-
-                                    # return to the original position
-                                    # in the file
-                                    checkfile.seek(oldoffset)
-                                elif signatureword == b'NM' and alternatenamecontinue:
-                                    # The alternate name field is
-                                    # described in IEEE P1282, 4.1.4
-                                    nmflags = system_use[suoffset+4]
-
-                                    # sanity check: only one of the
-                                    # lower bits can be set
-                                    nmflagtotal = (nmflags & 1) + (nmflags >> 1 & 1) + (nmflags >> 2 & 1)
-                                    if nmflagtotal > 1:
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'invalid flag combination in alternate name field'}
-                                        return {'status': False, 'error': unpackingerror}
-
-                                    if sulength - 5 != 0:
-                                        alternatename += system_use[suoffset+5:suoffset+sulength]
-
-                                    if nmflags & 1 != 1:
-                                        alternatenamecontinue = False
-                                    if nmflags >> 1 & 1 == 1:
-                                        renamecurrentdirectory = True
-                                    if nmflags >> 2 & 1 == 1:
-                                        renameparentdirectory = True
-                                elif signatureword == b'PD':
-                                    # no need to process padding areas
-                                    pass
-                                elif signatureword == b'PN':
-                                    # no need to process POSIX device numbers
-                                    pass
-                                elif signatureword == b'PX':
-                                    # This entry is mandatory, so a
-                                    # good indicator that RockRidge is
-                                    # used in case there is no RR entry.
-                                    haverockridge = True
-                                    # don't process POSIX flags
-                                    pass
-                                elif signatureword == b'SL' and symlinkcontinue:
-                                    # symbolic links, IEEE P1282, 4.1.3
-                                    symflags = system_use[suoffset+4]
-
-                                    # sanity check: only one of the
-                                    # lower bits can be set
-                                    nmflagtotal = (symflags & 1) + (symflags >> 1 & 1) + (symflags >> 2 & 1)
-                                    if nmflagtotal > 1:
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'invalid flag combination in alternate name field'}
-                                        return {'status': False, 'error': unpackingerror}
-
-                                    if sulength - 5 != 0:
-                                        # the rest of the data is the
-                                        # component area the first byte
-                                        # is a bit field
-                                        if system_use[suoffset+5] & 1 == 1:
-                                            symlinknamecontinue = True
-                                        else:
-                                            symlinknamecontinue = False
-
-                                        if system_use[suoffset+5] & 2 == 2:
-                                            if symlinknamecontinue:
-                                                checkfile.close()
-                                                unpackingerror = {'offset': offset+unpackedsize,
-                                                                  'fatal': False,
-                                                                  'reason': 'invalid flag combination in symbolic name field'}
-                                                return {'status': False, 'error': unpackingerror}
-                                            symlinktarget = b'.'
-                                        elif system_use[suoffset+5] & 4 == 4:
-                                            if symlinknamecontinue:
-                                                checkfile.close()
-                                                unpackingerror = {'offset': offset+unpackedsize,
-                                                                  'fatal': False,
-                                                                  'reason': 'invalid flag combination in symbolic name field'}
-                                                return {'status': False, 'error': unpackingerror}
-                                            symlinktarget = b'..'
-                                        elif system_use[suoffset+5] & 8 == 8:
-                                            if symlinknamecontinue:
-                                                checkfile.close()
-                                                unpackingerror = {'offset': offset+unpackedsize,
-                                                                  'fatal': False,
-                                                                  'reason': 'invalid flag combination in symbolic name field'}
-                                                return {'status': False, 'error': unpackingerror}
-                                            symlinktarget = b'/'
-                                        elif system_use[suoffset+5] & 16 == 16:
-                                            pass
-                                        elif system_use[suoffset+5] & 32 == 32:
-                                            pass
-                                        else:
-                                            # the next byte is the length
-                                            componentlength = system_use[suoffset+6]
-                                            if sulength-7 > componentlength:
-                                                checkfile.close()
-                                                unpackingerror = {'offset': offset+unpackedsize,
-                                                                  'fatal': False,
-                                                                  'reason': 'declared component area size larger than SUSP'}
-                                                return {'status': False, 'error': unpackingerror}
-                                            symlinktarget += system_use[suoffset+7:suoffset+7+componentlength]
-
-                                    if symflags & 1 != 1:
-                                        symlinkcontinue = False
-                                elif signatureword == b'SF':
-                                    # no need to process sparse file as
-                                    # it doesn't seem to be supported
-                                    # well in the real world
-                                    pass
-                                elif signatureword == b'TF':
-                                    # don't process time field
-                                    pass
-
-                                # the following three signature words
-                                # are involved in directory relocations
-                                elif signatureword == b'CL':
-                                    # IEEE P1282, 4.1.5.1 says:
-                                    # If an entry is tagged with CL it
-                                    # means that this entry is a
-                                    # placeholder file with the same
-                                    # name as the directory and that the
-                                    # directory should be moved to
-                                    # this location.
-                                    location_child = int.from_bytes(system_use[suoffset+4:suoffset+8], byteorder='little')
-                                    if volume_space_size < location_child:
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'invalid directory relocation'}
-                                        return {'status': False, 'error': unpackingerror}
-
-                                    # don't create, simply store
-                                    createfile = False
-
-                                    # store the directory here
-                                    extenttomove[location_child] = this_extent_location
-                                elif signatureword == b'PL':
-                                    # IEEE P1282, 4.1.5.2: PL entry is
-                                    # recorded in SUSP field for the
-                                    # parent field.
-                                    # This value points to the original
-                                    # parent of the file.
-                                    if extent_filename != '\x01':
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'PL in wrong directory entry'}
-                                        return {'status': False, 'error': unpackingerror}
-
-                                    # IEEE P1282, 4.1.5.2: only one
-                                    # PL entry is allowed per directory
-                                    # entry.
-                                    if havepl:
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'duplicate PL entry'}
-                                        return {'status': False, 'error': unpackingerror}
-                                    havepl = True
-
-                                    # location cannot be outside of file
-                                    location_parent = int.from_bytes(system_use[suoffset+4:suoffset+8], byteorder='little')
-                                    if volume_space_size < location_parent:
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'relocated directory parent outside of file'}
-                                        return {'status': False, 'error': unpackingerror}
-
-                                    # record the original parent for
-                                    # this extent
-                                    plparent[this_extent_location] = location_parent
-                                elif signatureword == b'RE':
-                                    # IEEE P1282, 4.1.5.3 describes
-                                    # that the directory entry that is
-                                    # described is labeled as
-                                    # relocated, so record it as such.
-                                    relocatedextents.add(extent_location)
-
-                                # zisofs extension
-                                elif signatureword == b'ZF':
-                                    havezisofs = True
-                                    # some sanity checks
-                                    pz = system_use[suoffset+4:suoffset+6]
-                                    if pz != b'pz':
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'unsupported zisofs compression'}
-                                        return {'status': False, 'error': unpackingerror}
-                                    zisofs_header_div_4 = system_use[suoffset+6]
-
-                                    # Log2 of Block Size
-                                    # must be 15, 16 or 17
-                                    zisofs_header_log = system_use[suoffset+7]
-                                    if zisofs_header_log not in [15, 16, 17]:
-                                        checkfile.close()
-                                        unpackingerror = {'offset': offset+unpackedsize,
-                                                          'fatal': False,
-                                                          'reason': 'unsupported zisofs block size log'}
-                                        return {'status': False, 'error': unpackingerror}
-                                    zisofs_uncompressed = int.from_bytes(system_use[suoffset+8:suoffset+12], byteorder='little')
-                            # skip all the other signature words
-                            suoffset += sulength
-
-                    # file flags (ECMA 119, 9.1.6)
-
-                    if directory_entry[25] >> 1 & 1 == 1:
-                        # directory entry
-                        if extent_filename == '\x00':
-                            # Look at the file name. If it is '.. then
-                            # it is safe to skip, but do a sanity check
-                            # to see if the location matches with the
-                            # current one.
-                            if not this_extent_location == extent_location:
-                                checkfile.close()
-                                unpackingerror = {'offset': offset+unpackedsize,
-                                                  'fatal': False,
-                                                  'reason': 'wrong back reference for . directory'}
-                                return {'status': False, 'error': unpackingerror}
-                        elif extent_filename == '\x01':
-                            # TODO: extra sanity checks to see if parent matches
-                            pass
-                        else:
-                            # store the name of the parent,
-                            # for extra sanity checks
-                            extenttoparent[extent_location] = this_extent_location
-
-                            extent_unpackdir_rel = os.path.join(this_extent_unpackdir_rel, extent_filename)
-                            if haverockridge:
-                                if not renamecurrentdirectory or renameoarentdirectory:
-                                    if alternatename != b'':
-                                        try:
-                                            alternatename = alternatename.decode()
-                                            extent_unpackdir_rel = os.path.join(this_extent_unpackdir_rel, alternatename)
-                                        except UnicodeDecodeError:
-                                            pass
-                            extenttoname[extent_location] = extent_unpackdir_rel
-                            extent_unpackdir_full = scanenvironment.unpack_path(extent_unpackdir_rel)
-                            os.mkdir(extent_unpackdir_rel)
-                            extents.append((extent_location, directory_extent_length, extent_unpackdir_rel, ''))
-                    else:
-                        # file entry
-                        # store the name of the parent,
-                        # for extra sanity checks
-                        extenttoparent[extent_location] = this_extent_location
-                        outfile_rel = os.path.join(this_extent_unpackdir_rel, extent_filename.rsplit(';', 1)[0])
-                        outfile_full = scanenvironment.unpack_path(outfile_rel)
-                        if haverockridge:
-                            if alternatename != b'':
-                                if not renamecurrentdirectory or renameoarentdirectory:
-                                    try:
-                                        alternatename = alternatename.decode()
-                                        outfile_rel = os.path.join(this_extent_unpackdir_rel, alternatename)
-                                        outfile_full = scanenvironment.unpack_path(outfile_rel)
-                                    except UnicodeDecodeError:
-                                        pass
-
-                            if len(symlinktarget) != 0:
-                                try:
-                                    symlinktarget = symlinktarget.decode()
-                                except UnicodeDecodeError:
-                                    pass
-
-                                # absolute symlinks can always be created,
-                                # as can links to . and ..
-                                if os.path.isabs(symlinktarget):
-                                    os.symlink(symlinktarget, outfile_full)
-                                elif symlinktarget == '.' or symlinktarget == '..':
-                                    os.symlink(symlinktarget, outfile_full)
-                                else:
-                                    # first chdir to the directory, then
-                                    # create the link and go back
-                                    olddir = os.getcwd()
-                                    os.chdir(os.path.dirname(outfile_full))
-                                    os.symlink(symlinktarget, outfile_full)
-                                    os.chdir(olddir)
-                                unpackedfilesandlabels.append((outfile_rel, ['symbolic link']))
-                                createfile = False
-
-                        if createfile:
-                            outfile = open(outfile_full, 'wb')
-                            if not havezisofs:
-                                os.sendfile(outfile.fileno(), checkfile.fileno(), offset + extent_location * logical_size, directory_extent_length)
-                            else:
-                                # first some sanity checks
-                                zisofs_oldoffset = checkfile.tell()
-                                checkfile.seek(offset + extent_location * logical_size)
-                                if filesize - checkfile.tell() < 16:
-                                    unpackingerror = {'offset': checkfile.tell() - offset,
-                                                      'fatal': False,
-                                                      'reason': 'not enough bytes for zisofs header'}
-                                    checkfile.close()
-                                    return {'status': False, 'error': unpackingerror}
-
-                                # first 8 bytes are the zisofs magic
-                                zcheckbytes = checkfile.read(8)
-                                if zcheckbytes != b'\x37\xe4\x53\x96\xc9\xdB\xd6\x07':
-                                    unpackingerror = {'offset': checkfile.tell() - offset,
-                                                      'fatal': False,
-                                                      'reason': 'wrong magic for zisofs data'}
-                                    checkfile.close()
-                                    return {'status': False, 'error': unpackingerror}
-
-                                # then the uncompressed size. Should be
-                                # the same as in the SUSP entry
-                                zcheckbytes = checkfile.read(4)
-                                if int.from_bytes(zcheckbytes, byteorder='little') != zisofs_uncompressed:
-                                    unpackingerror = {'offset': checkfile.tell() - offset,
-                                                      'fatal': False,
-                                                      'reason': 'mismatch for uncompressed size in zisofs header and SUSP'}
-                                    checkfile.close()
-                                    return {'status': False, 'error': unpackingerror}
-
-                                # then the zisofs header size
-                                zcheckbytes = checkfile.read(1)
-                                if not ord(zcheckbytes) == zisofs_header_div_4:
-                                    unpackingerror = {'offset': checkfile.tell() - offset,
-                                                      'fatal': False,
-                                                      'reason': 'mismatch between zisofs header and SUSP'}
-                                    checkfile.close()
-                                    return {'status': False, 'error': unpackingerror}
-
-                                # then the zisofs log2(block size)
-                                zcheckbytes = checkfile.read(1)
-                                if not ord(zcheckbytes) == zisofs_header_log:
-                                    unpackingerror = {'offset': checkfile.tell() - offset,
-                                                      'fatal': False,
-                                                      'reason': 'mismatch between zisofs header and SUSP'}
-                                    checkfile.close()
-                                    return {'status': False, 'error': unpackingerror}
-
-                                block_size = pow(2, zisofs_header_log)
-
-                                # then two reserved bytes
-                                zcheckbytes = checkfile.read(2)
-                                if not int.from_bytes(zcheckbytes, byteorder='little') == 0:
-                                    unpackingerror = {'offset': checkfile.tell() - offset,
-                                                      'fatal': False,
-                                                      'reason': 'wrong value for reserved bytes'}
-                                    checkfile.close()
-                                    return {'status': False, 'error': unpackingerror}
-
-                                # then the pointer array
-                                blockpointers = math.ceil(zisofs_uncompressed/block_size)+1
-                                blockpointerarray = []
-                                for b in range(0, blockpointers):
-                                    zcheckbytes = checkfile.read(4)
-                                    if not len(zcheckbytes) == 4:
-                                        unpackingerror = {'offset': checkfile.tell() - offset,
-                                                          'fatal': False,
-                                                          'reason': 'not enough data for block pointer'}
-                                        checkfile.close()
-                                        return {'status': False, 'error': unpackingerror}
-                                    blockpointer = int.from_bytes(zcheckbytes, byteorder='little')
-                                    if blockpointer > directory_extent_length:
-                                        unpackingerror = {'offset': checkfile.tell() - offset,
-                                                          'fatal': False,
-                                                          'reason': 'block pointer cannot be outside extent'}
-                                        checkfile.close()
-                                        return {'status': False, 'error': unpackingerror}
-                                    blockpointerarray.append(blockpointer)
-
-                                totalwritten = 0
-                                for b in range(0, len(blockpointerarray) - 1):
-                                    blockpointer = blockpointerarray[b]
-                                    nextblockpointer = blockpointerarray[b+1]
-                                    # in case the two pointers are the
-                                    # same a block of NULs should be
-                                    # written. Normally this is blocksize
-                                    # bytes unless there are fewer bytes
-                                    # to be left to write. The
-                                    # specification does not mention this.
-                                    if blockpointer == nextblockpointer:
-                                        if zisofs_uncompressed - totalwritten > block_size:
-                                            outfile.seek(block_size, os.SEEK_CUR)
-                                            totalwritten += block_size
-                                        else:
-                                            outfile.seek(zisofs_uncompressed - totalwritten, os.SEEK_CUR)
-                                            totalwritten += (zisofs_uncompressed - totalwritten)
-                                    else:
-                                        totalwritten += outfile.write(zlib.decompress(checkfile.read(nextblockpointer-blockpointer)))
-
-                                # extra sanity check, unsure if this is correct, but seems so
-                                if blockpointerarray[-1] < directory_extent_length:
-                                    unpackingerror = {'offset': checkfile.tell() - offset,
-                                                      'fatal': False,
-                                                      'reason': 'block pointer ends before directory extent'}
-                                    checkfile.close()
-                                    return {'status': False, 'error': unpackingerror}
-
-                                checkfile.seek(zisofs_oldoffset)
-                            outfile.close()
-                            unpackedfilesandlabels.append((outfile_rel, []))
-
-                    # then skip to the (possible) start of
-                    # the next directory entry.
-                    checkfile.seek(orig_extent_offset + all_extent_offset)
-
-                firstextentprocessed = True
-
-            for e in extenttomove:
-                # First check if all the PL and CL references are
-                # correct, before moving extent e to extenttomove[e]
-                # 1. extentmove[e] should be the parent
-                #    e will be moved to.
-                targetparent = extenttomove[e]
-
-                # 2. see if the targetparent is the same
-                #    as the recorded value in plparent[e]
-                if not targetparent == plparent[e]:
-                    checkfile.close()
-                    unpackingerror = {'offset': offset+unpackedsize,
-                                      'fatal': False,
-                                      'reason': 'CL/PL entries do not match'}
-                    return {'status': False, 'error': unpackingerror}
-
-                # now move the directory and all its contents
-                # to the right location
-                shutil.move(extenttoname[e], extenttoname[extenttomove[e]])
-
-                # fix references for unpacked files if necessary
-                newunpackedfilesandlabels = []
-                for u in unpackedfilesandlabels:
-                    if u[0].startswith(extenttoname[e]):
-                        newunpackedfilesandlabels.append((u[0].replace(os.path.dirname(extenttoname[e]), extenttoname[extenttomove[e]], 1), u[1]))
+                    seendirs.add(inode)
+                    os.makedirs(os.path.join(unpackdir_full, filename), exist_ok=True)
+                    dirstoscan.append((inode, filename))
+                elif stat.S_ISREG(mode):
+                    if inode in inodetofilename:
+                        hardlinks.append((inodetofilename[inode], filename))
                     else:
-                        newunpackedfilesandlabels.append(u)
-                unpackedfilesandlabels = newunpackedfilesandlabels
-
-                # fix references for extent names
-                for n in extenttoname:
-                    if n != e:
-                        if extenttoname[n].startswith(extenttoname[e]):
-                            extenttoname[n] = extenttoname[n].replace(os.path.dirname(extenttoname[e]), extenttoname[extenttomove[e]], 1)
-
-                # finally rewrite the name of the extent moved itself
-                extenttoname[e] = extenttoname[e].replace(os.path.dirname(extenttoname[e]), extenttoname[extenttomove[e]], 1)
-
-            # finally return to the old offset to read more
-            # volume descriptors
-            checkfile.seek(volumedescriptoroffset)
-        elif checkbytes[0] == 2:
-            # supplementary or enhanced volume descriptor
-            # used for for example Joliet (ECMA 119, appendix B.2)
-            pass
-        elif checkbytes[0] == 3:
-            pass
-        elif checkbytes[0] == 255:
-            # ECMA 119, 8.3.1
-            haveterminator = True
-            if not haveprimary:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'no primary volume descriptor'}
-                return {'status': False, 'error': unpackingerror}
-        elif checkbytes[0] > 3 and checkbytes[0] < 255:
-            # reserved blocks, for future use, have never been
-            # implemented for ISO9660.
-            checkfile.close()
-            unpackingerror = {'offset': offset+unpackedsize,
-                              'fatal': False,
-                              'reason': 'no primary volume descriptor'}
-            return {'status': False, 'error': unpackingerror}
-        unpackedsize += 2048
-
-        if haveterminator:
-            break
-
-    checkfile.close()
-
-    # there should always be at least one terminator. If not,
-    # then it is not a valid ISO file
-    if not haveterminator:
-        unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                          'reason': 'no volume terminator descriptor'}
-        return {'status': False, 'error': unpackingerror}
+                        inodetofilename[inode] = filename
+                        filestowrite.append((inode, filename))
+                elif stat.S_ISLNK(mode):
+                    symlinks.append((latestnode, filename))
+                # block devices, character devices, FIFOs and sockets
+                # are ignored
+
+        dataunpacked = False
+        tasks = [(inode, os.path.join(unpackdir_full, filename))
+                 for (inode, filename) in filestowrite]
+        results = ordered_map(self.write_file, tasks, self.threads)
+        for ((inode, filename), datawritten) in zip(filestowrite, results):
+            unpackedfilesandlabels.append((os.path.join(unpackdir, filename), []))
+            if datawritten:
+                dataunpacked = True
 
-    unpackedsize = volume_space_size * logical_size
+        for (target, filename) in hardlinks:
+            os.link(os.path.join(unpackdir_full, target),
+                    os.path.join(unpackdir_full, filename))
 
-    if offset == 0 and unpackedsize == filesize:
-        labels += ['iso9660', 'filesystem']
-    return {'status': True, 'length': unpackedsize, 'labels': labels,
-            'filesandlabels': unpackedfilesandlabels}
+        for (node, filename) in symlinks:
+            symlinkdata = self._decompress(node)
+            if symlinkdata is None:
+                continue
+            try:
+                target = symlinkdata.decode()
+            except UnicodeDecodeError:
+                continue
+            if '\x00' in target:
+                continue
+            os.symlink(target, os.path.join(unpackdir_full, filename))
+            unpackedfilesandlabels.append((os.path.join(unpackdir, filename), ['symbolic link']))
+            dataunpacked = True
+        return (unpackedfilesandlabels, dataunpacked)
 
 
 # JFFS2 https://en.wikipedia.org/wiki/JFFS2
@@ -1256,561 +1798,470 @@ def unpack_jffs2(fileresult, scanenvironment, offset, unpackdir):
     filesize = fileresult.filesize
     filename_full = scanenvironment.unpack_path(fileresult.filename)
     unpackdir_full = scanenvironment.unpack_path(unpackdir)
-    unpackedfilesandlabels = []
     labels = []
-    unpackingerror = {}
     if filesize - offset < 12:
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'File too small (less than 12 bytes'}
         return {'status': False, 'error': unpackingerror}
 
-    unpackedsize = 0
     checkfile = open(filename_full, 'rb')
-    checkfile.seek(offset)
-
-    # read the magic of the first inode to see if it is a little endian
-    # or big endian file system
-    checkbytes = checkfile.read(2)
-    if checkbytes == b'\x19\x85':
-        bigendian = True
-        byteorder = 'big'
-    else:
-        bigendian = False
-        byteorder = 'little'
-
-    dataunpacked = False
-
-    # keep track of which nodes have already been seen. This is to
-    # detect if multiple JFFS2 file systems have been concatenated.
-    # Also store the version, as inodes could have been reused in the
-    # case of hardlinks.
-    inodesseenversion = set()
-    parentinodesseen = set()
-
-    # the various node types are:
-    #
-    # * directory entry
-    # * inode (containing actual data)
-    # * clean marker
-    # * padding
-    # * summary
-    # * xattr
-    # * xref
-    #
-    # For unpacking data only the directory entry and regular inode
-    # will be considered.
-
-    DIRENT = 0xe001
-    INODE = 0xe002
-    CLEANMARKER = 0x2003
-    PADDING = 0x2004
-    SUMMARY = 0x2006
-    XATTR = 0xe008
-    XREF = 0xe009
-
-    validinodes = set([DIRENT, INODE, CLEANMARKER,
-                       PADDING, SUMMARY, XATTR, XREF])
-
-    inodetoparent = {}
+    checkdata = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
+    checkfile.close()
+    try:
+        # first index all the nodes
+        jffs2reader = Jffs2Reader(checkdata, offset,
+                                  scanenvironment.get_unpackthreads())
 
-    # keep a list of inodes to file names
-    # the root inode (1) always has ''
-    inodetofilename = {}
-    inodetofilename[1] = ''
+        # check if a valid root node was found.
+        if 1 not in jffs2reader.parentinodes:
+            unpackingerror = {'offset': offset, 'fatal': False,
+                              'reason': 'no valid root file node'}
+            return {'status': False, 'error': unpackingerror}
 
-    # different kinds of compression
-    # The mtd-utils code defines more types of "compression"
-    # than supported by mkfs.jffs2
-    # LZMA compression is available as a patch from OpenWrt.
-    COMPR_NONE = 0x00
-    COMPR_ZERO = 0x01
-    COMPR_RTIME = 0x02
-    COMPR_RUBINMIPS = 0x03
-    COMPR_COPY = 0x04
-    COMPR_DYNRUBIN = 0x05
-    COMPR_ZLIB = 0x06
-    COMPR_LZO = 0x07
-    COMPR_LZMA = 0x08
+        # then write the newest version of every file
+        (unpackedfilesandlabels, dataunpacked) = jffs2reader.unpack(scanenvironment, unpackdir)
+    finally:
+        checkdata.close()
 
-    # LZMA settings from OpenWrt's patch
-    lzma_dict_size = 0x2000
-    lzma_pb = 0
-    lzma_lp = 0
-    lzma_lc = 0
+    if not dataunpacked:
+        if os.path.exists(unpackdir_full):
+            shutil.rmtree(unpackdir_full)
+        unpackingerror = {'offset': offset, 'fatal': False,
+                          'reason': 'no data unpacked'}
+        return {'status': False, 'error': unpackingerror}
 
-    # keep a mapping of inodes to last written position in
-    # the file.
-    inodetowriteoffset = {}
+    unpackedsize = jffs2reader.length
+    if offset == 0 and unpackedsize == filesize:
+        labels.append('jffs2')
+        labels.append('filesystem')
 
-    # a mapping of inodes to open files
-    inodetoopenfiles = {}
-    currentinode = None
+    return {'status': True, 'length': unpackedsize, 'labels': labels,
+            'filesandlabels': unpackedfilesandlabels}
 
-    rootseen = False
 
-    # create the unpacking directory
-    os.makedirs(unpackdir_full, exist_ok=True)
+class Ext2Error(Exception):
+    pass
 
-    # reset the file pointer and read all the inodes
-    checkfile.seek(offset)
-    prev_is_padding = False
-    while True:
-        oldoffset = checkfile.tell()
-        if checkfile.tell() == filesize:
-            break
-        checkbytes = checkfile.read(2)
-        if len(checkbytes) != 2:
-            break
 
-        # first check if the inode magic is valid
-        if bigendian:
-            if checkbytes not in [b'\x19\x85', b'\x00\x00', b'\xff\xff']:
-                break
+# An in-process reader for ext2/3/4 file systems, used by unpack_ext2.
+# It reads the superblock, group descriptors and inodes directly from
+# the file at an offset and supports block maps (direct and indirect
+# blocks) as well as ext4 extent trees. Data of regular files is
+# copied with sendfile() per contiguous run of blocks. Holes and
+# uninitialized extents are skipped, as well as holes in the input file
+# itself, so the output files are sparse.
+#
+# References:
+# https://www.kernel.org/doc/html/latest/filesystems/ext4/index.html
+# http://www.nongnu.org/ext2-doc/ext2.html
+class Ext2Reader:
+    # compatible features (s_feature_compat)
+    COMPAT_SPARSE_SUPER2 = 0x200
+
+    # read only compatible features (s_feature_ro_compat)
+    RO_COMPAT_SPARSE_SUPER = 0x1
+
+    # incompatible features (s_feature_incompat)
+    INCOMPAT_COMPRESSION = 0x1
+    INCOMPAT_FILETYPE = 0x2
+    INCOMPAT_META_BG = 0x10
+    INCOMPAT_EXTENTS = 0x40
+    INCOMPAT_64BIT = 0x80
+    INCOMPAT_INLINE_DATA = 0x8000
+    INCOMPAT_ENCRYPT = 0x10000
+
+    # inode flags (i_flags)
+    EXTENTS_FL = 0x80000
+    INLINE_DATA_FL = 0x10000000
+
+    EXTENT_MAGIC = 0xf30a
+
+    def __init__(self, infile, offset):
+        self.infile = infile
+        self.offset = offset
+
+        infile.seek(offset + 1024)
+        superblock = infile.read(1024)
+        if len(superblock) != 1024:
+            raise Ext2Error('not enough data for superblock')
+        (self.inodecount, blockcount_lo) = struct.unpack_from('<II', superblock, 0)
+        self.firstdatablock = struct.unpack_from('<I', superblock, 20)[0]
+        self.blocksize = 1024 << struct.unpack_from('<I', superblock, 24)[0]
+        self.blocks_per_group = struct.unpack_from('<I', superblock, 32)[0]
+        self.inodes_per_group = struct.unpack_from('<I', superblock, 40)[0]
+        revision = struct.unpack_from('<I', superblock, 76)[0]
+        if revision == 0:
+            self.inodesize = 128
+            self.compat = 0
+            self.incompat = 0
+            self.rocompat = 0
         else:
-            if checkbytes not in [b'\x85\x19', b'\x00\x00', b'\xff\xff']:
-                break
-        if checkbytes == b'\x00\x00':
-            # dirty nodes
-            nodemagictype = 'dirty'
-        elif checkbytes == b'\xff\xff':
-            # empty space
-            # read the next two bytes to see if they are empty as well
-            checkbytes = checkfile.read(2)
-            if checkbytes == b'\xff\xff':
-                unpackedsize += 4
-            else:
-                break
-            continue
+            self.inodesize = struct.unpack_from('<H', superblock, 88)[0]
+            (self.compat, self.incompat, self.rocompat) = struct.unpack_from('<III', superblock, 92)
+
+        if self.blocks_per_group == 0 or self.inodes_per_group == 0:
+            raise Ext2Error('invalid block group geometry')
+        if self.inodesize < 128 or self.inodesize > self.blocksize:
+            raise Ext2Error('invalid inode size')
+        for feature, name in [(self.INCOMPAT_COMPRESSION, 'compression'),
+                              (self.INCOMPAT_ENCRYPT, 'encryption')]:
+            if self.incompat & feature:
+                raise Ext2Error('unsupported feature: %s' % name)
+
+        self.blockcount = blockcount_lo
+        descsize = 32
+        if self.incompat & self.INCOMPAT_64BIT:
+            descsize = struct.unpack_from('<H', superblock, 0xfe)[0]
+            self.blockcount |= struct.unpack_from('<I', superblock, 0x150)[0] << 32
+            if descsize < 64:
+                raise Ext2Error('invalid group descriptor size')
+
+        # read the group descriptors, which start in the block after
+        # the superblock, and store the location of the inode tables.
+        # With meta_bg only the descriptors of the first s_first_meta_bg
+        # descriptor blocks are stored there. The descriptors of the
+        # other groups are stored per meta block group (the groups that
+        # fit in one descriptor block) in the first group of the meta
+        # block group.
+        groupcount = math.ceil((self.blockcount - self.firstdatablock) / self.blocks_per_group)
+        descriptorblocks = math.ceil(groupcount * descsize / self.blocksize)
+        if self.incompat & self.INCOMPAT_META_BG:
+            firstmetabg = struct.unpack_from('<I', superblock, 0x104)[0]
+            self.backupgroups = struct.unpack_from('<II', superblock, 0x24c)
+            descriptors = b''.join([self.read_blocks(self._descriptor_block(i, firstmetabg, descsize))
+                                    for i in range(descriptorblocks)])
         else:
-            nodemagictype = 'normal'
-
-        # then read the node type
-        checkbytes = checkfile.read(2)
-        if len(checkbytes) != 2:
-            break
-        inodetype = int.from_bytes(checkbytes, byteorder=byteorder)
-
-        # check if the inode type is actually valid
-        if inodetype not in validinodes:
-            if inodetype == 0:
-                if prev_is_padding:
-                    break
-                # due to page alignments there might
-                # be extra NULL bytes
-                if (oldoffset + 4)%4096 != 0:
-                    ofs = checkfile.tell()
-                    bytes_to_read = 4096 - ((oldoffset + 4)%4096)
-                    checkbytes = checkfile.read(bytes_to_read)
-                    if checkbytes != b'\x00' * bytes_to_read:
-                        checkfile.seek(ofs)
-                        break
-            else:
-                break
-            prev_is_padding = True
-            unpackedsize = checkfile.tell() - offset
-            continue
-
-        prev_is_padding = False
-        # then read the size
-        checkbytes = checkfile.read(4)
-        if len(checkbytes) != 4:
-            break
-        inodesize = int.from_bytes(checkbytes, byteorder=byteorder)
-
-        # check if the inode extends past the file
-        if checkfile.tell() - 12 + inodesize > filesize:
-            break
-
-        # skip dirty nodes
-        if nodemagictype == 'dirty':
-            checkfile.seek(oldoffset + inodesize)
-            unpackedsize = checkfile.tell() - offset
-            if unpackedsize % 4 != 0:
-                paddingbytes = 4 - (unpackedsize % 4)
-                checkfile.seek(paddingbytes, os.SEEK_CUR)
-                unpackedsize = checkfile.tell() - offset
-            continue
-
-        # then the header CRC of the first 8 bytes in the node
-        # The checksum is not the same as the CRC32 algorithm from
-        # zlib/binascii, and it is explained here:
-        #
-        # http://www.infradead.org/pipermail/linux-mtd/2003-February/006910.html
-        checkbytes = checkfile.read(4)
-        if len(checkbytes) != 4:
-            break
-        headercrc = int.from_bytes(checkbytes, byteorder=byteorder)
-
-        # The checksum varies slightly from the one in the zlib/binascii modules
-        # as explained here:
-        #
-        # http://www.infradead.org/pipermail/linux-mtd/2003-February/006910.html
-        #
-        # specific implementation for computing checksum grabbed from
-        # MIT licensed script found at:
-        #
-        # https://github.com/sviehb/jefferson/blob/master/src/scripts/jefferson
-        checkfile.seek(-12, os.SEEK_CUR)
-        checkbytes = checkfile.read(8)
-
-        computedcrc = (binascii.crc32(checkbytes, -1) ^ -1) & 0xffffffff
-        if not computedcrc == headercrc:
-            break
-
-        # skip past the CRC and start processing the data
-        checkfile.seek(4, os.SEEK_CUR)
-
-        # process directory entries
-        if inodetype == DIRENT:
-            # parent inode is first
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-            parentinode = int.from_bytes(checkbytes, byteorder=byteorder)
-
-            parentinodesseen.add(parentinode)
-
-            # inode version is next
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-            inodeversion = int.from_bytes(checkbytes, byteorder=byteorder)
-
-            # inode number is next
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-            inodenumber = int.from_bytes(checkbytes, byteorder=byteorder)
-
-            # skip unlinked inodes
-            if inodenumber == 0:
-                # first go back to the old offset, then skip
-                # the entire inode
-                checkfile.seek(oldoffset + inodesize)
-                unpackedsize = checkfile.tell() - offset
-                if unpackedsize % 4 != 0:
-                    paddingbytes = 4 - (unpackedsize % 4)
-                    checkfile.seek(paddingbytes, os.SEEK_CUR)
-                    unpackedsize = checkfile.tell() - offset
-                continue
-
-            # cannot have duplicate inodes
-            if (inodenumber, inodeversion) in inodesseenversion:
-                break
-
-            inodesseenversion.add((inodenumber, inodeversion))
-
-            # mctime is next, not interesting so no need to process
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-
-            # name length is next
-            checkbytes = checkfile.read(1)
-            if len(checkbytes) != 1:
-                break
-            inodenamelength = ord(checkbytes)
-            if inodenamelength == 0:
-                break
-
-            # the dirent type is next. Not sure what to do with this
-            # value at the moment
-            checkbytes = checkfile.read(1)
-            if len(checkbytes) != 1:
-                break
-
-            # skip two unused bytes
-            checkbytes = checkfile.read(2)
-            if len(checkbytes) != 2:
-                break
-
-            # the node CRC. skip for now
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-
-            # the name CRC
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-            namecrc = int.from_bytes(checkbytes, byteorder=byteorder)
-
-            # finally the name of the node
-            checkbytes = checkfile.read(inodenamelength)
-            if len(checkbytes) != inodenamelength:
-                break
-
-            try:
-                inodename = checkbytes.decode()
-            except UnicodeDecodeError:
-                break
-
-            # compute the CRC of the name
-            computedcrc = (binascii.crc32(checkbytes, -1) ^ -1) & 0xffffffff
-            if namecrc != computedcrc:
-                break
-
-            # process any possible hard links
-            if inodenumber in inodetofilename:
-                # the inode number is already known, meaning
-                # that this should be a hard link
-                os.link(os.path.join(unpackdir_full, inodetofilename[inodenumber]), os.path.join(unpackdir_full, inodename))
-
-                # TODO: determine whether or not to add
-                # the hard link to the result set
-                # unpackedfilesandlabels.append((os.path.join(unpackdir, inodename),['hardlink']))
-
-            # now add the name to the inode to filename mapping
-            if parentinode in inodetofilename:
-                inodetofilename[inodenumber] = os.path.join(inodetofilename[parentinode], inodename)
-
-        elif inodetype == INODE:
-            # inode number
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-            inodenumber = int.from_bytes(checkbytes, byteorder=byteorder)
-
-            # first check if a file name for this inode is known
-            if inodenumber not in inodetofilename:
-                break
-
-            # skip unlinked inodes
-            if inodenumber == 0:
-                # first go back to the old offset, then skip
-                # the entire inode
-                checkfile.seek(oldoffset + inodesize)
-                unpackedsize = checkfile.tell() - offset
-                if unpackedsize % 4 != 0:
-                    paddingbytes = 4 - (unpackedsize % 4)
-                    checkfile.seek(paddingbytes, os.SEEK_CUR)
-                    unpackedsize = checkfile.tell() - offset
-                continue
-
-            # version number, should not be a duplicate
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
-                break
-            inodeversion = int.from_bytes(checkbytes, byteorder=byteorder)
-
-            # file mode
-            checkbytes = checkfile.read(4)
-            if len(checkbytes) != 4:
+            descriptors = self.read_blocks(self.firstdatablock + 1, descriptorblocks)
+        if len(descriptors) < groupcount * descsize:
+            raise Ext2Error('not enough data for group descriptors')
+        self.inodetables = []
+        for i in range(groupcount):
+            inodetable = struct.unpack_from('<I', descriptors, i*descsize + 8)[0]
+            if descsize >= 64:
+                inodetable |= struct.unpack_from('<I', descriptors, i*descsize + 0x28)[0] << 32
+            if inodetable >= self.blockcount:
+                raise Ext2Error('inode table outside of file system')
+            self.inodetables.append(inodetable)
+
+    def _has_superblock(self, group):
+        '''Return whether a group has a copy of the superblock (and of
+        the group descriptors that are not stored with meta_bg)'''
+        if group == 0:
+            return True
+        if self.compat & self.COMPAT_SPARSE_SUPER2:
+            return group in self.backupgroups
+        if group == 1 or not self.rocompat & self.RO_COMPAT_SPARSE_SUPER:
+            return True
+        # with sparse_super only powers of 3, 5 and 7 have a copy
+        for base in [3, 5, 7]:
+            power = base
+            while power < group:
+                power *= base
+            if power == group:
+                return True
+        return False
+
+    def _descriptor_block(self, number, firstmetabg, descsize):
+        '''Return the location of group descriptor block number
+        of a file system with meta_bg'''
+        if number < firstmetabg:
+            return self.firstdatablock + 1 + number
+        group = number * (self.blocksize // descsize)
+        block = self.firstdatablock + group * self.blocks_per_group
+        if self._has_superblock(group):
+            block += 1
+        # with 1024 byte blocks and first data block 0 the descriptors
+        # of group 0 are after the superblock, in block 2.
+        if self.blocksize == 1024 and number == 0 and self.firstdatablock == 0:
+            block += 1
+        return block
+
+    def read_blocks(self, block, count=1):
+        if block + count > self.blockcount:
+            raise Ext2Error('block outside of file system')
+        self.infile.seek(self.offset + block * self.blocksize)
+        return self.infile.read(count * self.blocksize)
+
+    def read_raw_inode(self, inode):
+        if not 0 < inode <= self.inodecount:
+            raise Ext2Error('invalid inode number')
+        group, index = divmod(inode - 1, self.inodes_per_group)
+        if group >= len(self.inodetables):
+            raise Ext2Error('invalid inode number')
+        self.infile.seek(self.offset + self.inodetables[group] * self.blocksize +
+                         index * self.inodesize)
+        inodebytes = self.infile.read(self.inodesize)
+        if len(inodebytes) != self.inodesize:
+            raise Ext2Error('not enough data for inode')
+        return inodebytes
+
+    def read_inode(self, inode):
+        '''Return mode, size, flags and the raw i_block field of an inode'''
+        inodebytes = self.read_raw_inode(inode)
+        mode = struct.unpack_from('<H', inodebytes, 0)[0]
+        size = struct.unpack_from('<I', inodebytes, 4)[0] | \
+               struct.unpack_from('<I', inodebytes, 108)[0] << 32
+        flags = struct.unpack_from('<I', inodebytes, 32)[0]
+        return (mode, size, flags, inodebytes[40:100])
+
+    def extents(self, size, flags, iblock):
+        '''Return the runs of data blocks of an inode as a sorted list
+        of (logical block, physical block, number of blocks).'''
+        maxblocks = math.ceil(size / self.blocksize)
+        if flags & self.EXTENTS_FL:
+            runs = []
+            self._extent_tree(iblock, runs, 0)
+        else:
+            runs = self._block_map(iblock, maxblocks)
+        result = []
+        for (logical, physical, length) in sorted(runs):
+            if logical >= maxblocks:
                 break
-            filemode = int.from_bytes(checkbytes, byteorder=byteorder)
-
-            if stat.S_ISSOCK(filemode):
-                # keep track of whatever is in the file and report
-                pass
-            elif stat.S_ISDIR(filemode):
-                # create directories, but skip them otherwise
-                os.makedirs(os.path.join(unpackdir_full, inodetofilename[inodenumber]), exist_ok=True)
-                checkfile.seek(oldoffset + inodesize)
-                continue
-            elif stat.S_ISLNK(filemode):
-                # skip ahead 24 bytes to the size of the data
-                checkfile.seek(24, os.SEEK_CUR)
-
-                checkbytes = checkfile.read(4)
-                if len(checkbytes) != 4:
-                    break
-                linknamelength = int.from_bytes(checkbytes, byteorder=byteorder)
-
-                # skip ahead 16 bytes to the data containing the link name
-                checkfile.seek(16, os.SEEK_CUR)
-                checkbytes = checkfile.read(linknamelength)
-                if len(checkbytes) != linknamelength:
-                    break
-                try:
-                    fn_rel = os.path.join(unpackdir, inodetofilename[inodenumber])
-                    fn_full = scanenvironment.unpack_path(fn_rel)
-                    os.symlink(checkbytes.decode(), fn_full)
-                    unpackedfilesandlabels.append((fn_rel, ['symbolic link']))
-                    dataunpacked = True
-                except UnicodeDecodeError:
-                    break
-            elif stat.S_ISREG(filemode):
-                # skip ahead 20 bytes to the offset of where to write data
-                checkfile.seek(20, os.SEEK_CUR)
-
-                # the write offset is useful as a sanity check: either
-                # it is 0, or it is the previous offset, plus the
-                # previous uncompressed length.
-                checkbytes = checkfile.read(4)
-                if len(checkbytes) != 4:
-                    break
-                writeoffset = int.from_bytes(checkbytes, byteorder=byteorder)
-
-                if writeoffset == 0:
-                    if inodenumber in inodetowriteoffset:
-                        break
-                    if inodenumber in inodetoopenfiles:
-                        break
-                    if currentinode != None:
-                        if currentinode in inodetoopenfiles:
-                            try:
-                                inodetoopenfiles[currentinode].close()
-                            except:
-                                pass
-
-                    # open a file and store it as a reference
-                    fn_rel = os.path.join(unpackdir, inodetofilename[inodenumber])
-                    fn_full = scanenvironment.unpack_path(fn_rel)
-                    outfile = open(fn_full, 'wb')
-                    inodetoopenfiles[inodenumber] = outfile
-                    currentinode = inodenumber
+            length = min(length, maxblocks - logical)
+            if physical + length > self.blockcount:
+                raise Ext2Error('data block outside of file system')
+            result.append((logical, physical, length))
+        return result
+
+    def _extent_tree(self, node, runs, level):
+        (magic, entries, maxentries, depth) = struct.unpack_from('<HHHH', node, 0)
+        if magic != self.EXTENT_MAGIC or level > 5 or 12 + entries*12 > len(node):
+            raise Ext2Error('invalid extent tree')
+        for i in range(entries):
+            entry = 12 + i*12
+            if depth == 0:
+                (logical, length, start_hi, start_lo) = struct.unpack_from('<IHHI', node, entry)
+                # extents longer than 32768 blocks are uninitialized
+                # and read as zeroes, so they are left as holes.
+                if length > 32768:
+                    continue
+                runs.append((logical, start_hi << 32 | start_lo, length))
+            else:
+                (logical, leaf_lo, leaf_hi) = struct.unpack_from('<IIH', node, entry)
+                self._extent_tree(self.read_blocks(leaf_hi << 32 | leaf_lo),
+                                  runs, level + 1)
+
+    def _block_map(self, iblock, maxblocks):
+        blocks = struct.unpack_from('<15I', iblock, 0)
+        perblock = self.blocksize // 4
+        runs = []
+        logical = 0
+
+        def add(physical):
+            nonlocal logical
+            if physical != 0:
+                # merge with the previous run if the blocks are contiguous
+                if runs and runs[-1][0] + runs[-1][2] == logical and \
+                        runs[-1][1] + runs[-1][2] == physical:
+                    runs[-1] = (runs[-1][0], runs[-1][1], runs[-1][2] + 1)
                 else:
-                    if writeoffset != inodetowriteoffset[inodenumber]:
-                        break
-                    if inodenumber not in inodetoopenfiles:
-                        break
-                    outfile = inodetoopenfiles[inodenumber]
-
-                # the offset to the compressed data length
-                checkbytes = checkfile.read(4)
-                if len(checkbytes) != 4:
-                    outfile.close()
-                    break
-                compressedsize = int.from_bytes(checkbytes, byteorder=byteorder)
-
-                # read the decompressed size
-                checkbytes = checkfile.read(4)
-                if len(checkbytes) != 4:
-                    outfile.close()
-                    break
-                decompressedsize = int.from_bytes(checkbytes, byteorder=byteorder)
-
-                # find out which compression algorithm has been used
-                checkbytes = checkfile.read(1)
-                if len(checkbytes) != 1:
-                    outfile.close()
-                    break
-                compression_used = ord(checkbytes)
-
-                # skip ahead 11 bytes to the actual data
-                checkfile.seek(11, os.SEEK_CUR)
-                checkbytes = checkfile.read(compressedsize)
-                if len(checkbytes) != compressedsize:
-                    outfile.close()
-                    break
-
-                # Check the compression that's used as it could be that
-                # for a file compressed and uncompressed nodes are mixed
-                # in case the node cannot be compressed efficiently
-                # and the compressed data would be larger than the
-                # original data.
-                if compression_used == COMPR_NONE:
-                    # the data is not compressed, so can be written
-                    # to the output file immediately
-                    outfile.write(checkbytes)
-                    dataunpacked = True
-                elif compression_used == COMPR_ZLIB:
-                    # the data is zlib compressed, so first decompress
-                    # before writing
-                    try:
-                        outfile.write(zlib.decompress(checkbytes))
-                        dataunpacked = True
-                    except Exception as e:
-                        outfile.close()
-                        break
-                elif compression_used == COMPR_LZMA:
-                    # The data is LZMA compressed, so create a
-                    # LZMA decompressor with custom filter, as the data
-                    # is stored without LZMA headers.
-                    jffs_filters = [{'id': lzma.FILTER_LZMA1,
-                                     'dict_size': lzma_dict_size,
-                                     'lc': lzma_lc, 'lp': lzma_lp,
-                                     'pb': lzma_pb}]
-
-                    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=jffs_filters)
-
-                    try:
-                        outfile.write(decompressor.decompress(checkbytes))
-                        dataunpacked = True
-                    except Exception as e:
-                        outfile.close()
-                        break
-                elif compression_used == COMPR_RTIME:
-                    # From: https://github.com/sviehb/jefferson/blob/master/src/jefferson/rtime.py
-                    # First initialize the positions, set to 0
-                    positions = [0] * 256
-
-                    # create a bytearray, set everything to 0
-                    data_out = bytearray([0] * decompressedsize)
-
-                    # create counters
-                    outpos = 0
-                    pos = 0
-
-                    # process all the bytes
-                    while outpos < decompressedsize:
-                        value = checkbytes[pos]
-                        pos += 1
-                        data_out[outpos] = value
-                        outpos += 1
-                        repeat = checkbytes[pos]
-                        pos += 1
-
-                        backoffs = positions[value]
-                        positions[value] = outpos
-                        if repeat:
-                            if backoffs + repeat >= outpos:
-                                while repeat:
-                                    data_out[outpos] = data_out[backoffs]
-                                    outpos += 1
-                                    backoffs += 1
-                                    repeat -= 1
-                            else:
-                                data_out[outpos : outpos + repeat] = data_out[
-                                    backoffs : backoffs + repeat
-                                ]
-                                outpos += repeat
-                    outfile.write(data_out)
-                elif compression_used == COMPR_LZO:
-                    outfile.write(lzo.decompress(checkbytes, False, decompressedsize))
+                    runs.append((logical, physical, 1))
+            logical += 1
+
+        def indirect(block, level):
+            nonlocal logical
+            if block == 0:
+                # a hole that covers all blocks below this one
+                logical += perblock ** level
+                return
+            pointers = struct.unpack('<%dI' % perblock, self.read_blocks(block))
+            for pointer in pointers:
+                if logical >= maxblocks:
+                    return
+                if level == 1:
+                    add(pointer)
                 else:
-                    outfile.close()
-                    break
-
-                # flush any remaining data
-                outfile.flush()
-                inodetowriteoffset[inodenumber] = writeoffset + decompressedsize
-            else:
-                # unsure what to do here now
-                pass
-
-        checkfile.seek(oldoffset + inodesize)
-        unpackedsize = checkfile.tell() - offset
-        if unpackedsize % 4 != 0:
-            paddingbytes = 4 - (unpackedsize % 4)
-            checkfile.seek(paddingbytes, os.SEEK_CUR)
-            unpackedsize = checkfile.tell() - offset
-
-    checkfile.close()
-
-    if not dataunpacked:
-        unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'no data unpacked'}
-        return {'status': False, 'error': unpackingerror}
-
-    # add the files to the unpack result
-    for i in inodetoopenfiles:
-        fn_rel = scanenvironment.rel_unpack_path(inodetoopenfiles[i].name)
-        unpackedfilesandlabels.append((fn_rel, []))
+                    indirect(pointer, level - 1)
+
+        for physical in blocks[:12]:
+            if logical >= maxblocks:
+                return runs
+            add(physical)
+        for level, block in enumerate(blocks[12:], start=1):
+            if logical >= maxblocks:
+                break
+            indirect(block, level)
+        return runs
+
+    def _inline_data(self, inode, size, iblock):
+        '''Return the data of an inode with inline data: the first 60
+        bytes are stored in i_block, the rest in the extended attribute
+        "system.data" in the inode itself.'''
+        if size <= len(iblock):
+            return iblock[:size]
+        inodebytes = self.read_raw_inode(inode)
+        if len(inodebytes) <= 128:
+            raise Ext2Error('invalid inline data')
+        xattrstart = 128 + struct.unpack_from('<H', inodebytes, 128)[0]
+        if xattrstart + 4 > len(inodebytes) or \
+                struct.unpack_from('<I', inodebytes, xattrstart)[0] != 0xea020000:
+            raise Ext2Error('invalid inline data')
+        entrystart = xattrstart + 4
+        pos = entrystart
+        while pos + 16 <= len(inodebytes):
+            (namelen, nameindex, valueoffset, valueinode, valuesize) = \
+                struct.unpack_from('<BBHII', inodebytes, pos)
+            if namelen == 0 and nameindex == 0:
+                break
+            name = inodebytes[pos+16:pos+16+namelen]
+            # name index 7 is the "system." prefix
+            if nameindex == 7 and name == b'data' and valueinode == 0:
+                value = inodebytes[entrystart+valueoffset:entrystart+valueoffset+valuesize]
+                data = iblock + value
+                if len(data) < size:
+                    raise Ext2Error('invalid inline data')
+                return data[:size]
+            pos += (16 + namelen + 3) & ~3
+        raise Ext2Error('invalid inline data')
+
+    def read_data(self, inode):
+        '''Return the contents of a small file, such as a directory or
+        a symbolic link.'''
+        (mode, size, flags, iblock) = self.read_inode(inode)
+        if flags & self.INLINE_DATA_FL:
+            return self._inline_data(inode, size, iblock)
+        data = bytearray(size)
+        for (logical, physical, length) in self.extents(size, flags, iblock):
+            blockdata = self.read_blocks(physical, length)
+            start = logical * self.blocksize
+            data[start:start+len(blockdata)] = blockdata[:size-start]
+        return bytes(data)
+
+    def read_symlink(self, inode):
+        (mode, size, flags, iblock) = self.read_inode(inode)
+        # fast symbolic links store the target in i_block
+        if size < 60 and not flags & (self.EXTENTS_FL | self.INLINE_DATA_FL):
+            return iblock[:size]
+        return self.read_data(inode)
+
+    def read_directory(self, inode):
+        '''Return a list of (inode, name) for a directory. Hashed
+        (dir_index) directories can be read like linear directories, as
+        the index blocks look like empty directory entries.'''
+        (mode, size, flags, iblock) = self.read_inode(inode)
+        data = self.read_data(inode)
+        pos = 0
+        if flags & self.INLINE_DATA_FL:
+            # inline directories start with the inode of the parent
+            # directory instead of the entries for . and ..
+            pos = 4
+        entries = []
+        while pos + 8 <= len(data):
+            (entryinode, reclen, namelen) = struct.unpack_from('<IHB', data, pos)
+            if not self.incompat & self.INCOMPAT_FILETYPE:
+                namelen |= data[pos+7] << 8
+            if reclen < 8 or pos + 8 + namelen > len(data):
+                raise Ext2Error('invalid directory entry')
+            if entryinode != 0 and namelen != 0:
+                entries.append((entryinode, data[pos+8:pos+8+namelen]))
+            pos += reclen
+        return entries
+
+    def copy_file(self, inode, outfile):
+        (mode, size, flags, iblock) = self.read_inode(inode)
+        if flags & self.INLINE_DATA_FL:
+            outfile.write(self._inline_data(inode, size, iblock))
+            return
+        infilesize = os.fstat(self.infile.fileno()).st_size
+        for (logical, physical, length) in self.extents(size, flags, iblock):
+            readoffset = self.offset + physical * self.blocksize
+            bytestowrite = min(length * self.blocksize, size - logical * self.blocksize)
+            if readoffset + bytestowrite > infilesize:
+                raise Ext2Error('not enough data')
+            # the file system itself can be a sparse file (for example
+            # an unpacked Android sparse image), so only copy the parts
+            # of the run that contain data.
+            for (dataoffset, datasize) in data_ranges(self.infile.fileno(),
+                                                      readoffset, bytestowrite):
+                os.lseek(outfile.fileno(),
+                         logical * self.blocksize + dataoffset - readoffset, os.SEEK_SET)
+                if sendfile_range(outfile.fileno(), self.infile.fileno(),
+                                  dataoffset, datasize) != datasize:
+                    raise Ext2Error('not enough data')
+        # set the size of files that end with a hole
+        if size > (1 << 32) * self.blocksize:
+            raise Ext2Error('invalid file size')
+        try:
+            os.ftruncate(outfile.fileno(), size)
+        except OSError:
+            raise Ext2Error('invalid file size')
+
+    def unpack(self, scanenvironment, unpackdir):
+        '''Recreate the directory tree in unpackdir and return a list
+        of unpacked files and labels.'''
+        unpackedfilesandlabels = []
+        unpackdir_full = scanenvironment.unpack_path(unpackdir)
+        os.makedirs(unpackdir_full, exist_ok=True)
 
-    # check if a valid root node was found.
-    if 1 not in parentinodesseen:
-        for i in inodetoopenfiles:
-            os.unlink(inodetoopenfiles[i])
-        unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'no valid root file node'}
-        return {'status': False, 'error': unpackingerror}
+        # store a mapping for inodes and files. This is needed to detect
+        # hard links, where files have the same inode.
+        inodetofile = {}
+
+        # the root directory is inode 2
+        ext2dirstoscan = collections.deque([(2, '')])
+        seendirs = set([2])
+        while ext2dirstoscan:
+            (dirinode, ext2dir) = ext2dirstoscan.popleft()
+            for (inode, ext2name) in self.read_directory(dirinode):
+                if ext2name == b'.' or ext2name == b'..':
+                    continue
 
-    if offset == 0 and filesize == unpackedsize:
-        labels.append('jffs2')
-        labels.append('filesystem')
-    return {'status': True, 'length': unpackedsize, 'labels': labels,
-            'filesandlabels': unpackedfilesandlabels}
+                # try to make sense of the filename by decoding it first.
+                # This might fail.
+                namedecoded = False
+                for c in encodingstotranslate:
+                    try:
+                        ext2name = ext2name.decode(c)
+                        namedecoded = True
+                        break
+                    except Exception as e:
+                        pass
+                if not namedecoded:
+                    raise Ext2Error('could not decode file name')
+                if ext2name in ['', '.', '..'] or '/' in ext2name or '\x00' in ext2name:
+                    raise Ext2Error('invalid file name')
+
+                fullext2name = os.path.join(ext2dir, ext2name)
+                outfile_rel = os.path.join(unpackdir, fullext2name)
+                outfile_full = scanenvironment.unpack_path(outfile_rel)
+                if os.path.lexists(outfile_full):
+                    raise Ext2Error('duplicate file name')
+                filemode = self.read_inode(inode)[0]
+
+                # Check the different file types
+                if stat.S_ISDIR(filemode):
+                    if inode in seendirs:
+                        raise Ext2Error('directory loop')
+                    seendirs.add(inode)
+                    os.mkdir(outfile_full)
+                    unpackedfilesandlabels.append((outfile_rel, []))
+                    ext2dirstoscan.append((inode, fullext2name))
+                elif stat.S_ISLNK(filemode):
+                    try:
+                        symlinktarget = self.read_symlink(inode).decode()
+                    except UnicodeDecodeError:
+                        continue
+                    if '\x00' in symlinktarget:
+                        continue
+                    os.symlink(symlinktarget, outfile_full)
+                    unpackedfilesandlabels.append((outfile_rel, ['symbolic link']))
+                elif stat.S_ISREG(filemode):
+                    if inode in inodetofile:
+                        # hardlink the file to an existing
+                        # file and record it as such.
+                        os.link(scanenvironment.unpack_path(inodetofile[inode]),
+                                outfile_full)
+                    else:
+                        inodetofile[inode] = outfile_rel
+                        outfile = open(outfile_full, 'wb')
+                        try:
+                            self.copy_file(inode, outfile)
+                        finally:
+                            outfile.close()
+                    unpackedfilesandlabels.append((outfile_rel, []))
+                # block devices, character devices, FIFOs and sockets
+                # are ignored
+        return unpackedfilesandlabels
 
 
 # Unpacker for the ext2, ext3, ext4 file systems
@@ -1820,9 +2271,7 @@ def unpack_jffs2(fileresult, scanenvironment, offset, unpackdir):
 #
 # The format is described in Chapter 3 and is used to implement
 # several sanity checks. References to the specification point
-# to this document. The heavy lifting is done using e2tools
-# because it already takes care of deleted files, etc. through
-# e2fsprogs-libs.
+# to this document. The files are extracted with Ext2Reader.
 def unpack_ext2(fileresult, scanenvironment, offset, unpackdir):
     '''Unpack an ext2/ext3/ext4 file system.'''
     filesize = fileresult.filesize
@@ -1839,16 +2288,6 @@ def unpack_ext2(fileresult, scanenvironment, offset, unpackdir):
                           'reason': 'not enough data for superblock'}
         return {'status': False, 'error': unpackingerror}
 
-    if shutil.which('e2ls') is None:
-        unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                          'reason': 'e2ls program not found'}
-        return {'status': False, 'error': unpackingerror}
-
-    if shutil.which('e2cp') is None:
-        unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                          'reason': 'e2cp program not found'}
-        return {'status': False, 'error': unpackingerror}
-
     # open the file and skip directly to the superblock
     checkfile = open(filename_full, 'rb')
     checkfile.seek(offset+1024)
@@ -2057,188 +2496,23 @@ def unpack_ext2(fileresult, scanenvironment, offset, unpackdir):
     except UnicodeDecodeError:
         pass
 
-    # e2tools can work with trailing data, but if there is any data
-    # preceding the file system then some carving has to be done first.
-    havetmpfile = False
-    if not offset == 0:
-        # if files are larger than a certain limit, then os.sendfile()
-        # won't write more data than 2147479552 so write bytes
-        # out in chunks. Reference:
-        # https://bugzilla.redhat.com/show_bug.cgi?id=612839
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        if unpackedsize > 2147479552:
-            bytesleft = unpackedsize
-            bytestowrite = min(bytesleft, 2147479552)
-            readoffset = offset
-            while bytesleft > 0:
-                os.sendfile(temporaryfile[0], checkfile.fileno(), readoffset, bytestowrite)
-                bytesleft -= bytestowrite
-                readoffset += bytestowrite
-                bytestowrite = min(bytesleft, 2147479552)
-        else:
-            os.sendfile(temporaryfile[0], checkfile.fileno(), offset, unpackedsize)
-        os.fdopen(temporaryfile[0]).close()
-        havetmpfile = True
+    # Read the file system directly from the file at the offset and
+    # recreate the directory tree.
+    try:
+        ext2reader = Ext2Reader(checkfile, offset)
+        unpackedfilesandlabels = ext2reader.unpack(scanenvironment, unpackdir)
+    except Ext2Error as e:
+        checkfile.close()
+        unpackingerror = {'offset': offset, 'fatal': False,
+                          'reason': e.args[0]}
+        return {'status': False, 'error': unpackingerror}
     checkfile.close()
 
-    # Now read the contents of the file system with e2ls and
-    # copy the files with e2cp.
-    # Unfortunately e2cp does not allow recursive copying, so the entire
-    # directory structure has to be walked recursively and recreated.
-    # Individual files have then to be copied with e2cp.
-    ext2dirstoscan = collections.deque([''])
-
-    # store a mapping for inodes and files. This is needed to detect
-    # hard links, where files have the same inode.
-    inodetofile = {}
-    filetoinode = {}
-
     # keep track of if any data was unpacked. Since file systems that
     # have been created always have the "lost+found" directory it means
     # that if no data could be unpacked it was not a valid file system,
     # or at least it was not a useful file system.
-    dataunpacked = False
-
-    while True:
-        try:
-            ext2dir = ext2dirstoscan.popleft()
-        except IndexError:
-            # there are no more entries to process
-            break
-        if havetmpfile:
-            p = subprocess.Popen(['e2ls', '-lai', temporaryfile[1] + ":" + ext2dir], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        else:
-            p = subprocess.Popen(['e2ls', '-lai', str(filename_full) + ":" + ext2dir], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (outputmsg, errormsg) = p.communicate()
-        if p.returncode != 0:
-            if havetmpfile:
-                os.unlink(temporaryfile[1])
-            unpackingerror = {'offset': offset, 'fatal': False,
-                              'reason': 'e2ls error'}
-            return {'status': False, 'error': unpackingerror}
-        dirlisting = outputmsg.rstrip().split(b'\n')
-
-        # socket, symbolic link, regular, block device, directory
-        # charactter device, FIFO/pipe
-        octals = [('s', 0o140000), ('l', 0o120000), ('-', 0o100000),
-                  ('b', 0o60000), ('d', 0o40000), ('c', 0o10000),
-                  ('p', 0o20000)]
-
-        # create the unpacking directory
-        os.makedirs(unpackdir_full, exist_ok=True)
-        for d in dirlisting:
-            # ignore deleted files
-            if d.strip().startswith(b'>'):
-                continue
-            dirsplit = re.split(b'\s+', d.strip(), 7)
-            if len(dirsplit) != 8:
-                unpackingerror = {'offset': offset, 'fatal': False,
-                                  'reason': 'not enough data in directory entry'}
-                return {'status': False, 'error': unpackingerror}
-            (inode, filemode, userid, groupid, size, filedate, filetime, ext2name) = re.split(b'\s+', d.strip(), 7)
-            try:
-                filemode = int(filemode, base=8)
-            except ValueError:
-                # newer versions of e2tools (starting 0.1.0) pretty print
-                # the file mode instead of printing a number so recreate it
-                if len(filemode) != 10:
-                     unpackingerror = {'offset': offset, 'fatal': False,
-                                       'reason': 'e2ls error'}
-                     return {'status': False, 'error': unpackingerror}
-
-                # instantiate the file mode and look at the first character
-                # as that is the only one used during checks.
-                filemode = filemode.decode()
-                new_filemode = 0
-                for fm in octals:
-                    if filemode[0] == fm[0]:
-                        new_filemode = fm[1]
-                        break
-
-                filemode = new_filemode
-
-            dataunpacked = True
-
-            # try to make sense of the filename by decoding it first.
-            # This might fail.
-            namedecoded = False
-            for c in encodingstotranslate:
-                try:
-                    ext2name = ext2name.decode(c)
-                    namedecoded = True
-                    break
-                except Exception as e:
-                    pass
-            if not namedecoded:
-                if havetmpfile:
-                    os.unlink(temporaryfile[1])
-                unpackingerror = {'offset': offset, 'fatal': False,
-                                  'reason': 'could not decode file name'}
-                return {'status': False, 'error': unpackingerror}
-
-            # Check the different file types
-            if stat.S_ISDIR(filemode):
-                # It is a directory, so create it and then add
-                # it to the scanning queue, unless it is . or ..
-                if ext2name == '.' or ext2name == '..':
-                    continue
-                newext2dir = os.path.join(ext2dir, ext2name)
-                ext2dirstoscan.append(newext2dir)
-                ext2dir_rel = os.path.join(unpackdir, newext2dir)
-                ext2dir_full = scanenvironment.unpack_path(ext2dir_rel)
-                os.mkdir(ext2dir_full)
-                unpackedfilesandlabels.append((ext2dir_rel, []))
-            elif stat.S_ISBLK(filemode):
-                # ignore block devices
-                continue
-            elif stat.S_ISCHR(filemode):
-                # ignore character devices
-                continue
-            elif stat.S_ISFIFO(filemode):
-                # ignore FIFO
-                continue
-            elif stat.S_ISSOCK(filemode):
-                # ignore sockets
-                continue
-
-            fullext2name = os.path.join(ext2dir, ext2name)
-            filetoinode[fullext2name] = inode
-            if stat.S_ISLNK(filemode):
-                # e2cp cannot copy symbolic links
-                # so just record it as a symbolic link
-                # TODO: process symbolic links
-                pass
-            elif stat.S_ISREG(filemode):
-                fileunpacked = False
-                if inode not in inodetofile:
-                    inodetofile[inode] = fullext2name
-                    # use e2cp to copy the file
-                    ext2dir_rel = os.path.join(unpackdir, ext2dir)
-                    ext2dir_full = scanenvironment.unpack_path(ext2dir_rel)
-                    if havetmpfile:
-                        p = subprocess.Popen(['e2cp', temporaryfile[1] + ":" + fullext2name, "-d", ext2dir_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    else:
-                        p = subprocess.Popen(['e2cp', str(filename_full) + ":" + fullext2name, "-d", ext2dir_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    (outputmsg, errormsg) = p.communicate()
-                    if p.returncode != 0:
-                        if havetmpfile:
-                            os.unlink(temporaryfile[1])
-                        unpackingerror = {'offset': offset, 'fatal': False,
-                                          'reason': 'e2cp error'}
-                        return {'status': False, 'error': unpackingerror}
-                    fileunpacked = True
-                else:
-                    # hardlink the file to an existing
-                    # file and record it as such.
-                    if inodetofile[inode] != fullext2name:
-                        os.link(os.path.join(unpackdir_full, inodetofile[inode]), os.path.join(unpackdir_full, fullext2name))
-                        fileunpacked = True
-                if fileunpacked:
-                    unpackedfilesandlabels.append((os.path.join(unpackdir, fullext2name), []))
-
-    # cleanup
-    if havetmpfile:
-        os.unlink(temporaryfile[1])
+    dataunpacked = unpackedfilesandlabels != []
 
     # only report if any data was unpacked
     if not dataunpacked:
@@ -2254,6 +2528,47 @@ def unpack_ext2(fileresult, scanenvironment, offset, unpackdir):
             'filesandlabels': unpackedfilesandlabels}
 
 
+def unpack_virtual_disk(diskclass, fileresult, scanenvironment, offset,
+                        unpackdir, extension, labels):
+    '''Write the guest disk of a virtual disk image as a sparse raw
+    disk image, using one of the readers from bangvirtualdisk.'''
+    filesize = fileresult.filesize
+    filename_full = scanenvironment.unpack_path(fileresult.filename)
+    unpackedfilesandlabels = []
+
+    try:
+        disk = diskclass(filename_full, offset)
+    except VirtualDiskError:
+        unpackingerror = {'offset': offset, 'fatal': False,
+                          'reason': 'invalid %s image' % extension}
+        return {'status': False, 'error': unpackingerror}
+
+    unpackedsize = disk.length
+    unpackdir_full = scanenvironment.unpack_path(unpackdir)
+    os.makedirs(unpackdir_full, exist_ok=True)
+    if offset == 0 and unpackedsize == filesize and filename_full.suffix.lower() == '.' + extension:
+        outputfile_rel = os.path.join(unpackdir, filename_full.stem)
+    else:
+        outputfile_rel = os.path.join(unpackdir, 'unpacked-from-%s' % extension)
+    outputfile_full = scanenvironment.unpack_path(outputfile_rel)
+
+    try:
+        disk.write_sparse(outputfile_full)
+    except VirtualDiskError:
+        os.unlink(outputfile_full)
+        unpackingerror = {'offset': offset, 'fatal': False,
+                          'reason': 'cannot convert file'}
+        return {'status': False, 'error': unpackingerror}
+    finally:
+        disk.close()
+
+    if offset != 0 or unpackedsize != filesize:
+        labels = []
+    unpackedfilesandlabels.append((outputfile_rel, []))
+    return {'status': True, 'length': unpackedsize, 'labels': labels,
+            'filesandlabels': unpackedfilesandlabels}
+
+
 # VMware VMDK files
 #
 # The website:
@@ -2269,68 +2584,13 @@ def unpack_ext2(fileresult, scanenvironment, offset, unpackdir):
 # https://github.com/libyal/libvmdk/blob/master/documentation/VMWare%20Virtual%20Disk%20Format%20(VMDK).asciidoc
 # in section 4
 #
-# For now just focus on files where the entire file is VMDK
+# Only hosted sparse extents (monolithic sparse and stream optimized
+# images) are supported.
 def unpack_vmdk(fileresult, scanenvironment, offset, unpackdir):
     '''Convert a VMware VMDK file.'''
-    filesize = fileresult.filesize
-    filename_full = scanenvironment.unpack_path(fileresult.filename)
-    unpackedfilesandlabels = []
-    labels = []
-    unpackedsize = 0
-    unpackingerror = {}
-    if filesize - offset < 512:
-        unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'File too small (less than 512 bytes'}
-        return {'status': False, 'error': unpackingerror}
-
-    if shutil.which('qemu-img') is None:
-        unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                          'reason': 'qemu-img program not found'}
-        return {'status': False, 'error': unpackingerror}
-
-    # first run qemu-img in case the whole file is the VMDK file
-    if offset == 0:
-        p = subprocess.Popen(['qemu-img', 'info', '--output=json', filename_full],
-                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        (standardout, standarderror) = p.communicate()
-        if p.returncode == 0:
-            # extra sanity check to see if it is valid JSON
-            try:
-                vmdkjson = json.loads(standardout)
-            except:
-                unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                                  'reason': 'no valid JSON output from qemu-img'}
-                return {'status': False, 'error': unpackingerror}
-            if filename_full.suffix.lower() == '.vmdk':
-                outputfile_rel = os.path.join(unpackdir, filename_full.stem)
-            else:
-                outputfile_rel = os.path.join(unpackdir, 'unpacked-from-vmdk')
-
-            outputfile_full = scanenvironment.unpack_path(outputfile_rel)
-            # now convert it to a raw file
-            p = subprocess.Popen(['qemu-img', 'convert', '-O', 'raw', filename_full, outputfile_full],
-                                 stdin=subprocess.PIPE,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            (standardout, standarderror) = p.communicate()
-            if p.returncode != 0:
-                if os.path.exists(outputfile_full):
-                    os.unlink(outputfile_full)
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'cannot convert file'}
-                return {'status': False, 'error': unpackingerror}
-
-            labels.append('vmdk')
-            labels.append('filesystem')
-            unpackedfilesandlabels.append((outputfile_rel, []))
-            return {'status': True, 'length': unpackedsize, 'labels': labels,
-                    'filesandlabels': unpackedfilesandlabels}
-
-    unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                      'reason': 'Not a valid VMDK file or cannot unpack'}
-    return {'status': False, 'error': unpackingerror}
+    return unpack_virtual_disk(VmdkSparseDisk, fileresult, scanenvironment,
+                               offset, unpackdir, 'vmdk',
+                               ['vmdk', 'filesystem'])
 
 
 # QEMU qcow2 files
@@ -2340,67 +2600,9 @@ def unpack_vmdk(fileresult, scanenvironment, offset, unpackdir):
 # https://git.qemu.org/?p=qemu.git;a=blob;f=docs/interop/qcow2.txt;hb=HEAD
 def unpack_qcow2(fileresult, scanenvironment, offset, unpackdir):
     '''Convert a QEMU qcow2 file.'''
-    filesize = fileresult.filesize
-    filename_full = scanenvironment.unpack_path(fileresult.filename)
-    unpackedfilesandlabels = []
-    labels = []
-    unpackedsize = 0
-    unpackingerror = {}
-
-    if filesize - offset < 72:
-        unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'File too small (less than 72 bytes'}
-        return {'status': False, 'error': unpackingerror}
-
-    if shutil.which('qemu-img') is None:
-        unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                          'reason': 'qemu-img program not found'}
-        return {'status': False, 'error': unpackingerror}
-
-    # first run qemu-img in case the whole file is the qcow2 file
-    if offset == 0:
-        p = subprocess.Popen(['qemu-img', 'info', '--output=json', filename_full],
-                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        (standardout, standarderror) = p.communicate()
-        if p.returncode == 0:
-            # extra sanity check to see if it is valid JSON
-            try:
-                vmdkjson = json.loads(standardout)
-            except:
-                unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                                  'reason': 'no valid JSON output from qemu-img'}
-                return {'status': False, 'error': unpackingerror}
-            if filename_full.suffix.lower() == '.qcow2':
-                outputfile_rel = os.path.join(unpackdir, filename_full.stem)
-            else:
-                outputfile_rel = os.path.join(unpackdir, 'unpacked-from-qcow2')
-
-            outputfile_full = scanenvironment.unpack_path(outputfile_rel)
-            # now convert it to a raw file
-            p = subprocess.Popen(['qemu-img', 'convert', '-O', 'raw', filename_full, outputfile_full],
-                                 stdin=subprocess.PIPE,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-            (standardout, standarderror) = p.communicate()
-            if p.returncode != 0:
-                if os.path.exists(outputfile_full):
-                    os.unlink(outputfile_full)
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'cannot convert file'}
-                return {'status': False, 'error': unpackingerror}
-
-            labels.append('qemu')
-            labels.append('qcow2')
-            labels.append('filesystem')
-            unpackedfilesandlabels.append((outputfile_rel, []))
-            return {'status': True, 'length': unpackedsize, 'labels': labels,
-                    'filesandlabels': unpackedfilesandlabels}
-
-    unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                      'reason': 'Not a valid qcow2 file or cannot unpack'}
-    return {'status': False, 'error': unpackingerror}
+    return unpack_virtual_disk(Qcow2Disk, fileresult, scanenvironment,
+                               offset, unpackdir, 'qcow2',
+                               ['qemu', 'qcow2', 'filesystem'])
 
 
 # VirtualBox VDI
@@ -2408,214 +2610,9 @@ def unpack_qcow2(fileresult, scanenvironment, offset, unpackdir):
 # https://forums.virtualbox.org/viewtopic.php?t=8046
 def unpack_vdi(fileresult, scanenvironment, offset, unpackdir):
     '''Convert a VirtualBox VDI file.'''
-    filesize = fileresult.filesize
-    filename_full = scanenvironment.unpack_path(fileresult.filename)
-    unpackedfilesandlabels = []
-    labels = []
-    unpackedsize = 0
-    unpackingerror = {}
-
-    if filesize - offset < 512:
-        unpackingerror = {'offset': offset,
-                          'fatal': False,
-                          'reason': 'File too small (less than 512 bytes'}
-        return {'status': False, 'error': unpackingerror}
-
-    if shutil.which('qemu-img') is None:
-        unpackingerror = {'offset': offset+unpackedsize,
-                          'fatal': False,
-                          'reason': 'qemu-img program not found'}
-        return {'status': False, 'error': unpackingerror}
-
-    # open the file skip over the magic header bytes
-    checkfile = open(filename_full, 'rb')
-
-    # This assumes the Oracle flavour of VDI. There have been
-    # others in the past.
-    checkfile.seek(offset+40)
-    unpackedsize = 40
-
-    # 24 NUL bytes
-    checkbytes = checkfile.read(24)
-    if checkbytes != b'\x00' * 24:
-        checkfile.close()
-        unpackingerror = {'offset': offset+unpackedsize,
-                          'fatal': False,
-                          'reason': 'wrong value for padding bytes'}
-        return {'status': False, 'error': unpackingerror}
-    unpackedsize += 24
-
-    # then the image signature
-    checkbytes = checkfile.read(4)
-    if checkbytes != b'\x7f\x10\xda\xbe':
-        checkfile.close()
-        unpackingerror = {'offset': offset+unpackedsize,
-                          'fatal': False,
-                          'reason': 'wrong value for image signature'}
-        return {'status': False, 'error': unpackingerror}
-    unpackedsize += 4
-
-    # major version
-    checkbytes = checkfile.read(2)
-    majorversion = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 2
-
-    # minor version
-    checkbytes = checkfile.read(2)
-    minorversion = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 2
-
-    # size of header, should be 0x190
-    checkbytes = checkfile.read(4)
-    headersize = int.from_bytes(checkbytes, byteorder='little')
-    if headersize != 0x190:
-        checkfile.close()
-        unpackingerror = {'offset': offset+unpackedsize,
-                          'fatal': False,
-                          'reason': 'wrong value for header size'}
-        return {'status': False, 'error': unpackingerror}
-    unpackedsize += 4
-
-    # image type
-    checkbytes = checkfile.read(4)
-    imagetype = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # image flags
-    checkbytes = checkfile.read(4)
-    imageflags = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # image description, unclear how big it is
-    #checkbytes = checkfile.read(32)
-    #unpackedsize += 32
-
-    # skip to 0x154
-    checkfile.seek(offset + 0x154)
-    unpackedsize = 0x154
-
-    # offset blocks
-    checkbytes = checkfile.read(4)
-    offsetblocks = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # offset data
-    checkbytes = checkfile.read(4)
-    offsetdata = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # cylinders
-    checkbytes = checkfile.read(4)
-    cylinders = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # heads
-    checkbytes = checkfile.read(4)
-    heads = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # sectors
-    checkbytes = checkfile.read(4)
-    sectors = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # sector size (should be 512)
-    checkbytes = checkfile.read(4)
-    sectorsize = int.from_bytes(checkbytes, byteorder='little')
-    if sectorsize != 512:
-        checkfile.close()
-        unpackingerror = {'offset': offset+unpackedsize,
-                          'fatal': False,
-                          'reason': 'wrong value for sector size'}
-        return {'status': False, 'error': unpackingerror}
-    unpackedsize += 4
-
-    # skip unused bytes
-    checkfile.seek(4, os.SEEK_CUR)
-
-    # disk size (uncompressed)
-    checkbytes = checkfile.read(8)
-    disksize = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 8
-
-    # block size
-    checkbytes = checkfile.read(4)
-    blocksize = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # block extra data
-    checkbytes = checkfile.read(4)
-    blockextradata = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # blocks in hdd
-    checkbytes = checkfile.read(4)
-    blocksinhdd = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # blocks allocated
-    checkbytes = checkfile.read(4)
-    blocksallocated = int.from_bytes(checkbytes, byteorder='little')
-    unpackedsize += 4
-
-    # now there is enough information to do some sanity checks
-    # First see if the file is large enough
-    if offset + (2+blocksallocated) * blocksize > filesize:
-        checkfile.close()
-        unpackingerror = {'offset': offset+unpackedsize,
-                          'fatal': False,
-                          'reason': 'data cannot be outside of file'}
-        return {'status': False, 'error': unpackingerror}
-
-    # check to see if the VDI is the entire file. If so unpack it.
-    if offset == 0 and (2+blocksallocated) * blocksize == filesize:
-        p = subprocess.Popen(['qemu-img', 'info', '--output=json', filename_full],
-                             stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-
-        (standardout, standarderror) = p.communicate()
-        if p.returncode == 0:
-            # extra sanity check to see if it is valid JSON
-            try:
-                vmdkjson = json.loads(standardout)
-            except:
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'no valid JSON output from qemu-img'}
-                return {'status': False, 'error': unpackingerror}
-            if filename_full.suffix.lower() == '.vdi':
-                outputfile_rel = os.path.join(unpackdir, filename_full.stem)
-            else:
-                outputfile_rel = os.path.join(unpackdir, 'unpacked-from-vdi')
-
-            outputfile_full = scanenvironment.unpack_path(outputfile_rel)
-            # now convert it to a raw file
-            p = subprocess.Popen(['qemu-img', 'convert', '-O', 'raw', filename_full, outputfile_full],
-                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE)
-
-            (standardout, standarderror) = p.communicate()
-            if p.returncode != 0:
-                if os.path.exists(outputfile_full):
-                    os.unlink(outputfile_full)
-                unpackingerror = {'offset': offset+unpackedsize,
-                                  'fatal': False,
-                                  'reason': 'cannot convert file'}
-                return {'status': False, 'error': unpackingerror}
-
-            labels.append('virtualbox')
-            labels.append('vdi')
-            labels.append('filesystem')
-            unpackedfilesandlabels.append((outputfile_rel, []))
-            return {'status': True, 'length': unpackedsize, 'labels': labels,
-                    'filesandlabels': unpackedfilesandlabels}
-
-    # TODO: snapshots and carving
-
-    checkfile.close()
-    unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                      'reason': 'Not a valid VDI file or cannot unpack'}
-    return {'status': False, 'error': unpackingerror}
+    return unpack_virtual_disk(VdiDisk, fileresult, scanenvironment,
+                               offset, unpackdir, 'vdi',
+                               ['virtualbox', 'vdi', 'filesystem'])
 
 
 # FAT file system
@@ -4363,25 +4360,23 @@ def unpack_cramfs(fileresult, scanenvironment, offset, unpackdir):
     # remove the directory. Possible race condition?
     shutil.rmtree(cramfsunpackdirectory)
 
+    # fsck.cramfs cannot read at an offset and needs a seekable
+    # file, so copy exactly the file system if needed.
+    checkfile.close()
     if offset == 0 and cramfssize == filesize:
-        checkfile.close()
-        p = subprocess.Popen(['fsck.cramfs', '--extract=%s' % cramfsunpackdirectory, filename_full],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        cramfsfile = filename_full
     else:
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, cramfssize)
-        os.fdopen(temporaryfile[0]).close()
-        checkfile.close()
+        cramfsfile = copy_range_to_temporary_file(scanenvironment,
+                filename_full, offset, cramfssize)
         havetmpfile = True
 
-        p = subprocess.Popen(['fsck.cramfs', '--extract=%s' % cramfsunpackdirectory, temporaryfile[1]],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
+    p = subprocess.Popen(['fsck.cramfs', '--extract=%s' % cramfsunpackdirectory, cramfsfile],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     (outputmsg, errormsg) = p.communicate()
 
     # clean up
     if havetmpfile:
-        os.unlink(temporaryfile[1])
+        os.unlink(cramfsfile)
 
     if p.returncode != 0:
         # clean up the temporary directory. It could be that
@@ -4819,11 +4814,30 @@ def unpack_plf(fileresult, scanenvironment, offset, unpackdir):
 # Extra inspiration from:
 #
 # https://github.com/nlitsme/ubidump
+#
+# The image is scanned once and for every physical erase block (PEB)
+# only the position and size of its data are recorded. For every
+# volume there is an array that maps logical erase blocks (LEBs) to
+# PEBs. If a LEB is found in more than one PEB (for example in NAND
+# dumps, where wear levelling moved data around) the PEB with the
+# highest sequence number is used.
+UBI_LAYOUT_VOLUME_ID = 0x7fffefff
+
+ubi_ec_header = struct.Struct('>4sB3sQIII32sI')
+ubi_vid_header = struct.Struct('>4sBBBBII4sIIII4sQ12sI')
+ubi_vtbl_record = struct.Struct('>IIIBBH128sB23sI')
+
+
+def ubi_crc(data):
+    '''Return the CRC32 of data like UBI computes it: without
+    inverting the result.'''
+    return binascii.crc32(data) ^ 0xffffffff
+
+
 def unpack_ubi(fileresult, scanenvironment, offset, unpackdir):
     '''Unpack a UBI image'''
     filesize = fileresult.filesize
     filename_full = scanenvironment.unpack_path(fileresult.filename)
-    unpackdir_full = scanenvironment.unpack_path(unpackdir)
     unpackedfilesandlabels = []
     labels = []
     unpackingerror = {}
@@ -4834,415 +4848,203 @@ def unpack_ubi(fileresult, scanenvironment, offset, unpackdir):
                           'reason': 'not enough data for header'}
         return {'status': False, 'error': unpackingerror}
 
-    # open the file
     checkfile = open(filename_full, 'rb')
-    checkfile.seek(offset)
-
-    curoffset = offset
-
-    # the block size is not known in advance, so just read some
-    # data (1 MiB) to see where the next UBI block can be found.
-    blocksize = 0
-    readsize = 1048576
-    ubifound = False
-
-    isfirstblock = True
-
-    # store the volume tables from the layout volume per image
-    volume_tables = {}
+    checkdata = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
 
-    # store the number of layout volumes per image
-    layout_volumes_per_image = {}
+    # The block size is not known in advance, but it is the distance
+    # to the next UBI block, which has to be a power of 2.
+    blocksize = checkdata.find(b'UBI#', offset + 1) - offset
+    if blocksize <= 64 or blocksize & (blocksize - 1) != 0:
+        checkdata.close()
+        checkfile.close()
+        unpackingerror = {'offset': offset, 'fatal': False,
+                          'reason': 'no valid block size found'}
+        return {'status': False, 'error': unpackingerror}
 
-    # store some info about each block
-    blocks = {}
+    # for every PEB: the offset of its data in the PEB and the amount
+    # of data (for static volumes). PEBs that are not used by any
+    # volume have offset 0.
+    peb_data_offsets = array.array('L')
+    peb_data_sizes = array.array('L')
 
-    # store which blocks belong to an image
-    image_to_erase_blocks = {}
+    # per image sequence number: per volume id an array mapping
+    # LEBs to PEBs (-1 if not mapped) and an array with the
+    # sequence numbers of the mapped PEBs.
+    images = {}
 
     # Now keep processing UBI blocks until no more valid UBI blocks can
-    # be found. It could be that multiple images are concatenated. Typically
-    # each image should have two layout volumes first, but there are UBI
-    # volumes where the layout volumes appear later in the file. These
-    # are not yet supported.
-    ubiseen = 0
-    blockid = 0
-    while True:
-        if not isfirstblock:
-            if curoffset + blocksize > filesize:
-                break
-        checkfile.seek(curoffset)
-        # magic
-        checkbytes = checkfile.read(4)
-        if checkbytes != b'UBI#':
+    # be found. It could be that multiple images are concatenated, which
+    # have a different image sequence number.
+    unpackedsize = 0
+    curoffset = offset
+    ubiversion = None
+    while curoffset + blocksize <= filesize:
+        (magic, version, padding1, erasecount, vid_hdr_offset, data_offset,
+         image_sequence, padding2, header_crc) = ubi_ec_header.unpack_from(checkdata, curoffset)
+        if magic != b'UBI#' or padding1 != b'\x00' * 3 or padding2 != b'\x00' * 32:
             break
-        unpackedsize = 4
-
-        # UBI version
-        checkbytes = checkfile.read(1)
-        ubiversion = ord(checkbytes)
-        unpackedsize += 1
-
-        # three padding bytes
-        checkbytes = checkfile.read(3)
-        if checkbytes != b'\x00\x00\x00':
+        if ubiversion is None:
+            ubiversion = version
+        elif version != ubiversion:
             break
-        unpackedsize += 3
-
-        # number of erasures for the block
-        checkbytes = checkfile.read(8)
-        erasecount = int.from_bytes(checkbytes, byteorder='big')
-        unpackedsize += 8
-
-        # offset of the volume identifier header, relative
-        # to the start of the erase block
-        checkbytes = checkfile.read(4)
-        vid_hdr_offset = int.from_bytes(checkbytes, byteorder='big')
-        unpackedsize += 4
 
-        # volume identifier cannot start inside the
-        # current erase block header
-        if vid_hdr_offset < 64:
+        # the volume identifier header and the data cannot start
+        # inside the erase counter header, nor outside the block
+        if vid_hdr_offset < 64 or data_offset < 64:
             break
-
-        # offset to data in the erase block, relative
-        # to the start of the erase block
-        checkbytes = checkfile.read(4)
-        data_offset = int.from_bytes(checkbytes, byteorder='big')
-        unpackedsize += 4
-
-        # data offset cannot start inside the current erase block header
-        if data_offset < 64:
+        if vid_hdr_offset + 64 > blocksize or data_offset > blocksize:
             break
 
         # check if the data offset doesn't start in the volume header
-        # TODO: extra checks
-        if data_offset > vid_hdr_offset:
-            if data_offset - vid_hdr_offset < 64:
-                break
-
-        # image sequence
-        checkbytes = checkfile.read(4)
-        image_sequence = int.from_bytes(checkbytes, byteorder='big')
-
-        # if the image sequence is not known, then this block
-        # is the first block of the image. Potentially blocks
-        # of different images could be interleaved, but that
-        # is just asking for trouble, so assume that doesn't
-        # happen.
-        if image_sequence not in volume_tables:
-            isfirstblock = True
-        unpackedsize += 4
-
-        # 32 padding bytes
-        checkbytes = checkfile.read(32)
-        if checkbytes != b'\x00' * 32:
-            break
-        unpackedsize += 32
-
-        # and finally a header CRC
-        checkbytes = checkfile.read(4)
-        header_crc = int.from_bytes(checkbytes, byteorder='big')
-        unpackedsize += 4
-
-        # Determine the block size if this is the first block.
-        # This is done here to prevent the whole file from
-        # being read in its entirety, so do this after quite a few
-        # sanity checks.
-        if isfirstblock:
-            blocksize = 0
-            checkfile.seek(curoffset)
-            while True:
-                checkbytes = checkfile.read(readsize)
-                if checkbytes == b'':
-                    # end of the file reached, this cannot be an UBI image
-                    break
-                nextubi = checkbytes.find(b'UBI#', 1)
-                if nextubi != -1:
-                    blocksize += nextubi
-                    ubifound = True
-                    break
-                blocksize += readsize
-
-            if not ubifound:
-                break
-
-            # sanity check: block size has to be a power of 2
-            if blocksize != pow(2, int(math.log(blocksize, 2))):
-                break
-            isfirstblock = False
-
-        # extra sanity checks for volume identifier header
-        # and data offset. volume identifier header is
-        # 64 bytes.
-        if curoffset + blocksize > filesize:
+        if data_offset > vid_hdr_offset and data_offset - vid_hdr_offset < 64:
             break
 
-        if vid_hdr_offset > blocksize or data_offset > blocksize:
-            break
+        pebnumber = len(peb_data_offsets)
+        vid_header = checkdata[curoffset+vid_hdr_offset:curoffset+vid_hdr_offset+64]
 
-        # jump to the volume identifier and process the data
-        checkfile.seek(curoffset + vid_hdr_offset)
-        unpackedsize = vid_hdr_offset
+        # a PEB without a volume identifier header is not in use, and
+        # a PEB with a corrupted header cannot be used, like in Linux.
+        if vid_header == b'\xff' * 64 or \
+                ubi_crc(vid_header[:60]) != int.from_bytes(vid_header[60:], byteorder='big'):
+            peb_data_offsets.append(0)
+            peb_data_sizes.append(0)
+            curoffset += blocksize
+            unpackedsize = curoffset - offset
+            continue
 
-        # first the magic
-        checkbytes = checkfile.read(4)
-        if checkbytes != b'UBI!':
-            break
-        unpackedsize += 4
+        (magic, version, volume_type, copy_flag, compat, volume_id,
+         logical_erase_block, padding1, data_size, used_ebs, data_pad,
+         data_crc, padding2, sequence_number, padding3,
+         vid_crc) = ubi_vid_header.unpack_from(vid_header)
 
-        # then the ubi version, should be the same as the previouis one
-        checkbytes = checkfile.read(1)
-        if ord(checkbytes) != ubiversion:
+        if magic != b'UBI!' or version != ubiversion:
             break
-        unpackedsize += 1
 
         # volume type, can be 1 (dynamic) or 2 (static)
-        checkbytes = checkfile.read(1)
-        volumetype = ord(checkbytes)
-        if volumetype not in [1, 2]:
-            break
-        unpackedsize += 1
-
-        # copy flag, skip for now
-        checkbytes = checkfile.read(1)
-        copyflag = ord(checkbytes)
-        unpackedsize += 1
-
-        # compatibility flags
-        checkbytes = checkfile.read(1)
-        compat = ord(checkbytes)
-        unpackedsize += 1
-
-        # volume id
-        checkbytes = checkfile.read(4)
-        volume_id = int.from_bytes(checkbytes, byteorder='big')
-        ubiseen += 1
-
-        if volume_id > 0x7fffefff:
+        if volume_type not in [1, 2]:
             break
-
-        if image_sequence not in volume_tables:
-            volume_tables[image_sequence] = {}
-            layout_volumes_per_image[image_sequence] = 0
-
-        # need layout volume first
-        if volume_id != 0x7fffefff and layout_volumes_per_image[image_sequence] == 0:
+        if volume_id > UBI_LAYOUT_VOLUME_ID:
             break
-
-        # cannot have more than two layout volumes
-        if volume_id == 0x7fffefff and layout_volumes_per_image[image_sequence] > 2:
+        if volume_id == UBI_LAYOUT_VOLUME_ID and volume_type != 1:
             break
-        unpackedsize += 4
-
-        if volume_id == 0x7fffefff:
-            # has to be dynamic
-            if volumetype != 1:
-                break
-            layout_volumes_per_image[image_sequence] += 1
-
-        # logical erase block number. This is basically the number
-        # this block has in a volume.
-        checkbytes = checkfile.read(4)
-        logical_erase_block = int.from_bytes(checkbytes, byteorder='big')
-        unpackedsize += 4
-
-        # 4 bytes of padding
-        checkbytes = checkfile.read(4)
-        if checkbytes != b'\x00\x00\x00\x00':
-            del layout_volumes_per_image[image_sequence]
+        if padding1 != b'\x00' * 4 or padding2 != b'\x00' * 4 or padding3 != b'\x00' * 12:
             break
-        unpackedsize += 4
-
-        # data size
-        checkbytes = checkfile.read(4)
-        data_size = int.from_bytes(checkbytes, byteorder='big')
-        unpackedsize += 4
 
-        # used erase blocks, only used for static volumes, should
-        # be 0 for dynamic volumes
-        checkbytes = checkfile.read(4)
-        used_ebs = int.from_bytes(checkbytes, byteorder='big')
-        if volumetype == 1:
+        # used erase blocks are only used for static volumes
+        if volume_type == 1:
             if used_ebs != 0:
-                del layout_volumes_per_image[image_sequence]
                 break
-        unpackedsize += 4
-
-        # data pad, skip for now
-        checkfile.seek(4, os.SEEK_CUR)
-        unpackedsize += 4
-
-        # data crc, skip for now
-        checkfile.seek(4, os.SEEK_CUR)
-        unpackedsize += 4
-
-        # 4 bytes of padding
-        checkbytes = checkfile.read(4)
-        if checkbytes != b'\x00\x00\x00\x00':
-            del layout_volumes_per_image[image_sequence]
+            if data_pad > blocksize - data_offset:
+                break
+            data_size = blocksize - data_offset - data_pad
+        elif data_size > blocksize - data_offset:
             break
-        unpackedsize += 4
 
-        # sequence number
-        checkbytes = checkfile.read(8)
-        sequence_number = int.from_bytes(checkbytes, byteorder='big')
-        unpackedsize += 8
-
-        # 12 bytes of padding
-        checkbytes = checkfile.read(12)
-        if checkbytes != b'\x00' * 12:
-            del layout_volumes_per_image[image_sequence]
+        # a volume cannot have more LEBs than there are PEBs
+        if logical_erase_block >= (filesize - offset) // blocksize:
             break
-        unpackedsize += 12
-
-        # header crc, skip for now
-        checkfile.seek(4, os.SEEK_CUR)
-        unpackedsize += 4
 
-        # jump to the data offset and process the data. Maximum
-        # is 128, but it depends on how much data is actually available.
-        checkfile.seek(curoffset + data_offset)
-        unpackedsize = data_offset
-
-        # read the volume tables from the first layout volume
-        if volume_id == 0x7fffefff:
-            if layout_volumes_per_image[image_sequence] == 2:
-                # skip the layout volume copy
-                curoffset += blocksize
-                blockid += 1
-                continue
-            # each volume table entry is 172 bytes, and
-            # the amount read depends on the size of the
-            # erase block.
-            max_volume_tables = (blocksize - unpackedsize)//172
-            volume_table_count = min(128, max_volume_tables)
-            broken_volume_table = False
-            for volume_table in range(0, volume_table_count):
-                # reserved physical erase blocks
-                checkbytes = checkfile.read(4)
-                phys_erase_blocks = int.from_bytes(checkbytes, byteorder='big')
-                unpackedsize += 4
-
-                # alignment
-                checkbytes = checkfile.read(4)
-                alignment = int.from_bytes(checkbytes, byteorder='big')
-                unpackedsize += 4
-
-                # data padding
-                checkbytes = checkfile.read(4)
-                data_padding = int.from_bytes(checkbytes, byteorder='big')
-                unpackedsize += 4
-
-                # volume type
-                checkbytes = checkfile.read(1)
-                volume_type = ord(checkbytes)
-                unpackedsize += 1
-
-                # update marker
-                checkbytes = checkfile.read(1)
-                update_marker = ord(checkbytes)
-                unpackedsize += 1
-
-                # name length
-                checkbytes = checkfile.read(2)
-                name_length = int.from_bytes(checkbytes, byteorder='big')
-                unpackedsize += 2
+        peb_data_offsets.append(data_offset)
+        peb_data_sizes.append(data_size)
+
+        if image_sequence not in images:
+            images[image_sequence] = {}
+        if volume_id not in images[image_sequence]:
+            images[image_sequence][volume_id] = (array.array('l'), array.array('Q'))
+        (lebs, sequence_numbers) = images[image_sequence][volume_id]
+        if logical_erase_block >= len(lebs):
+            extra = logical_erase_block + 1 - len(lebs)
+            lebs.extend([-1] * extra)
+            sequence_numbers.extend([0] * extra)
+        if lebs[logical_erase_block] == -1 or sequence_numbers[logical_erase_block] < sequence_number:
+            lebs[logical_erase_block] = pebnumber
+            sequence_numbers[logical_erase_block] = sequence_number
+
+        curoffset += blocksize
+        unpackedsize = curoffset - offset
+
+    def peb_data(pebnumber):
+        '''Return the offset and size of the data in a PEB'''
+        return (offset + pebnumber * blocksize + peb_data_offsets[pebnumber],
+                peb_data_sizes[pebnumber])
 
-                # name
-                checkbytes = checkfile.read(128)
-                try:
-                    volume_name = checkbytes.split(b'\x00', 1)[0].decode()
-                    if os.path.isabs(volume_name):
-                        volume_name = os.path.relpath(volume_name, '/')
-                except UnicodeDecodeError:
-                    broken_volume_table = True
-                    break
-                if name_length != len(volume_name):
-                    broken_volume_table = True
-                    break
-                unpackedsize += 128
+    data_unpacked = False
 
-                # flags
-                checkbytes = checkfile.read(1)
-                volume_flags = ord(checkbytes)
-                unpackedsize += 1
+    # write the data for each image
+    for image_sequence in sorted(images):
+        volumes = images[image_sequence]
 
-                # padding
-                checkbytes = checkfile.read(23)
-                if checkbytes != b'\x00' * 23:
-                    broken_volume_table = True
-                    break
-                unpackedsize += 23
-
-                # crc, skip
-                checkfile.seek(4, os.SEEK_CUR)
-                unpackedsize += 4
-
-                if phys_erase_blocks != 0:
-                    volume_tables[image_sequence][volume_table] = {'name': volume_name,
-                                                   'blocks': phys_erase_blocks,
-                                                   'flags': volume_flags,
-                                                   'alignment': alignment,
-                                                   'padding': data_padding,
-                                                   'marker': update_marker,
-                                                  }
-            if broken_volume_table:
-                del layout_volumes_per_image[image_sequence]
+        # the volume table is stored in the layout volume, which
+        # has two copies of the table.
+        if UBI_LAYOUT_VOLUME_ID not in volumes:
+            continue
+        layout_lebs = [peb for peb in volumes[UBI_LAYOUT_VOLUME_ID][0] if peb != -1]
+        (vtbl_offset, vtbl_size) = peb_data(layout_lebs[0])
+
+        # each volume table entry is 172 bytes, and the amount of entries
+        # depends on the size of the erase block.
+        volume_table_count = min(128, vtbl_size // ubi_vtbl_record.size)
+        volume_table = {}
+        volume_names = set()
+        broken_volume_table = False
+        for volume_id in range(volume_table_count):
+            (phys_erase_blocks, alignment, data_padding, volume_type,
+             update_marker, name_length, volume_name, volume_flags,
+             padding, crc) = ubi_vtbl_record.unpack_from(checkdata,
+                     vtbl_offset + volume_id * ubi_vtbl_record.size)
+            try:
+                volume_name = volume_name.split(b'\x00', 1)[0].decode()
+            except UnicodeDecodeError:
+                broken_volume_table = True
                 break
-            curoffset += blocksize
-        else:
-            # store the blocks per image, the first two are always
-            # layout volume blocks
-            if image_sequence not in image_to_erase_blocks:
-                image_to_erase_blocks[image_sequence] = [0, 1]
-            image_to_erase_blocks[image_sequence].append(blockid)
-            curoffset += blocksize
-        if curoffset > filesize:
-            break
-        blocks[blockid] = {'offset': data_offset, 'logical': logical_erase_block}
-        blockid += 1
+            if name_length != len(volume_name) or padding != b'\x00' * 23:
+                broken_volume_table = True
+                break
+            if phys_erase_blocks == 0:
+                continue
+            if os.path.isabs(volume_name):
+                volume_name = os.path.relpath(volume_name, '/')
+
+            # names that are unusable as a file name or that are
+            # not unique are replaced by the volume id
+            if volume_name in ['', '.', '..'] or '/' in volume_name or \
+                    volume_name in volume_names:
+                volume_name = 'volume-%d' % volume_id
+            volume_names.add(volume_name)
+            volume_table[volume_id] = (volume_name, volume_type)
+
+        if broken_volume_table:
+            continue
 
-    data_unpacked = False
+        for volume_id in sorted(volume_table):
+            if volume_id not in volumes:
+                continue
+            (volume_name, volume_type) = volume_table[volume_id]
+            lebs = volumes[volume_id][0]
 
-    # write the data for each image
-    for image_sequence in volume_tables:
-        image_block_counter = 2
-        for vt in sorted(volume_tables[image_sequence].keys()):
-            if image_sequence not in image_to_erase_blocks:
+            # static volumes cannot have unmapped LEBs
+            if volume_type == 2 and -1 in lebs:
                 continue
-            volume_table = volume_tables[image_sequence][vt]
 
-            # open the output file
-            # TODO: check if there are any duplicate names inside an image
-            outfile_rel = os.path.join(unpackdir, "image-%d" % image_sequence, volume_table['name'])
+            outfile_rel = os.path.join(unpackdir, "image-%d" % image_sequence, volume_name)
             outfile_full = scanenvironment.unpack_path(outfile_rel)
             os.makedirs(os.path.dirname(outfile_full), exist_ok=True)
-            outfile = open(outfile_full, 'wb')
+            outfile = open(outfile_full, 'wb', buffering=0)
 
-            seen_logical = 0
-            broken_image = False
-            for block in range(image_block_counter, len(image_to_erase_blocks[image_sequence])):
-                erase_block = image_to_erase_blocks[image_sequence][block]
-                if erase_block not in blocks:
-                    broken_image = True
-                    break
-                if blocks[erase_block]['logical'] < seen_logical:
-                    image_block_counter = erase_block
-                    break
-                seen_logical = blocks[erase_block]['logical']
-                readoffset = erase_block * blocksize + blocks[block]['offset']
-                blockreadsize = blocksize - blocks[erase_block]['offset']
-                unpackedsize = max(unpackedsize, readoffset + blockreadsize)
-                os.sendfile(outfile.fileno(), checkfile.fileno(), offset + readoffset, blockreadsize)
+            # unmapped LEBs in dynamic volumes read as erased flash
+            leb_size = max(peb_data(pebnumber)[1] for pebnumber in lebs if pebnumber != -1)
+            for pebnumber in lebs:
+                if pebnumber == -1:
+                    outfile.write(b'\xff' * leb_size)
+                    continue
+                (readoffset, readsize) = peb_data(pebnumber)
+                sendfile_range(outfile.fileno(), checkfile.fileno(), readoffset, readsize)
             outfile.close()
 
-            if broken_image:
-                os.unlink(outfile_full)
-            else:
-                data_unpacked = True
-                unpackedfilesandlabels.append((outfile_rel, []))
+            data_unpacked = True
+            unpackedfilesandlabels.append((outfile_rel, []))
 
+    checkdata.close()
     checkfile.close()
 
     if data_unpacked:
@@ -5422,6 +5224,80 @@ def unpack_pfs(fileresult, scanenvironment, offset, unpackdir):
 # A YAFFS2 file system is basically a concatenation of chunks, with associated
 # metadata which is either stored separately from the data ("out of band")
 # or with the data ("in band").
+
+# the different yaffs2 chunk types
+YAFFS_OBJECT_TYPE_UNKNOWN = 0
+YAFFS_OBJECT_TYPE_FILE = 1
+YAFFS_OBJECT_TYPE_SYMLINK = 2
+YAFFS_OBJECT_TYPE_DIRECTORY = 3
+YAFFS_OBJECT_TYPE_HARDLINK = 4
+YAFFS_OBJECT_TYPE_SPECIAL = 5
+
+# flags for inband tags (from yaffs_packedtags2.c )
+YAFFS_EXTRA_HEADER_INFO_FLAG = 0x80000000
+YAFFS_ALL_EXTRA_FLAG = 0xf0000000
+YAFFS_EXTRA_OBJECT_TYPE_MASK = 0x0f << 28
+
+# the range of valid sequence numbers (from yaffs_guts.h)
+YAFFS_LOWEST_SEQUENCE_NUMBER = 0x00001000
+YAFFS_HIGHEST_SEQUENCE_NUMBER = 0xefffff00
+
+# common values for chunk/spare combinations, sorted by occurance.
+# The default in mkyaffs2image is (2048, 64) and Android
+# primarily uses (1024, 32).
+#
+# Most devices use "out of band" (OOB) tags, but
+# some devices use "in band" tags to save flash space.
+# (4080, 16) is an example of a common size for inline tags
+yaffs2_chunks_and_spares = [(2048, 64), (1024, 32), (4096, 128), (8192, 256),
+                            (8192, 448), (512, 16), (4096, 16), (4080, 16),
+                            (4096, 64), (4096, 32)]
+
+# the amount of chunks that is looked at to find the chunk/spare
+# combination of an image
+yaffs2_sample_chunks = 64
+
+# The object header, with the object type, parent object id, name,
+# mode, uid, gid, atime, mtime, ctime, size, equivalent object id (for
+# hard links), alias (for symbolic links), rdev and the high 32 bits
+# of the size. The name is followed by 2 bytes that are initialized to
+# 0xff, and the rdev by Windows and in band specific fields.
+#
+# The maximum name length (255) and alias length (159) are hardcoded
+# in the YAFFS2 code and only these values have been observed, but it
+# could be that other values exist.
+yaffs2_object_header = '%sII2x258sIIIIIIII160sI32xI'
+
+
+def yaffs2_sample_score(data, offset, chunk_size, spare_size, tagorder, byteorder):
+    '''Return how plausible a chunk/spare combination and byte order of
+    the tags is for the image at offset: the amount of chunks with valid
+    tags in a sample of the chunks, until the first chunk with invalid
+    tags. Chunks that are empty (erased flash) are skipped.'''
+    tags = struct.Struct(tagorder + 'IIII')
+    stride = chunk_size + spare_size
+    maxchunks = (len(data) - offset) // stride
+    score = 0
+    for chunk in range(min(yaffs2_sample_chunks, maxchunks)):
+        position = offset + chunk * stride
+        (sequence_number, objectid, chunkid, byte_count) = tags.unpack_from(data, position + chunk_size)
+        if sequence_number == 0xffffffff:
+            continue
+        if not YAFFS_LOWEST_SEQUENCE_NUMBER <= sequence_number < YAFFS_HIGHEST_SEQUENCE_NUMBER:
+            break
+        if objectid & ~YAFFS_EXTRA_OBJECT_TYPE_MASK == 0:
+            break
+        if chunkid == 0 or chunkid & YAFFS_EXTRA_HEADER_INFO_FLAG:
+            # an object header
+            object_type = int.from_bytes(data[position:position+4], byteorder=byteorder)
+            if not YAFFS_OBJECT_TYPE_FILE <= object_type <= YAFFS_OBJECT_TYPE_SPECIAL:
+                break
+        elif byte_count > chunk_size or chunkid > maxchunks:
+            break
+        score += 1
+    return score
+
+
 def unpack_yaffs2(fileresult, scanenvironment, offset, unpackdir):
     '''Unpack a YAFFS2 image'''
     filesize = fileresult.filesize
@@ -5433,145 +5309,97 @@ def unpack_yaffs2(fileresult, scanenvironment, offset, unpackdir):
     unpackedsize = 0
     metadata = {}
 
-    # the different yaffs2 chunk types
-    YAFFS_OBJECT_TYPE_UNKNOWN = 0
-    YAFFS_OBJECT_TYPE_FILE = 1
-    YAFFS_OBJECT_TYPE_SYMLINK = 2
-    YAFFS_OBJECT_TYPE_DIRECTORY = 3
-    YAFFS_OBJECT_TYPE_HARDLINK = 4
-    YAFFS_OBJECT_TYPE_SPECIAL = 5
-
-    # the maximum name length and alias length. These are hardcoded in
-    # the YAFFS2 code and only this value has been observed, but it
-    # could be that other values exist.
-    YAFFS_MAX_NAME_LENGTH = 255
-    YAFFS_MAX_ALIAS_LENGTH = 159
-
-    # flags for inband tags (from yaffs_packedtags2.c )
-    EXTRA_HEADER_INFO_FLAG = 0x80000000
-    EXTRA_SHRINK_FLAG = 0x40000000
-    EXTRA_SHADOWS_FLAG = 0x20000000
-    EXTRA_SPARE_FLAGS = 0x10000000
-    ALL_EXTRA_FLAG = 0xf0000000
-
-    EXTRA_OBJECT_TYPE_SHIFT = 28
-    EXTRA_OBJECT_TYPE_MASK = 0x0f << EXTRA_OBJECT_TYPE_SHIFT
-
-    # common signatures from little endian file systems.
+    # common signatures of the first object header
     little_endian_signatures = [b'\x03\x00\x00\x00\x01\x00\x00\x00\xff\xff',
                                 b'\x01\x00\x00\x00\x01\x00\x00\x00\xff\xff']
+    big_endian_signatures = [b'\x00\x00\x00\x03\x00\x00\x00\x01\xff\xff',
+                             b'\x00\x00\x00\x01\x00\x00\x00\x01\xff\xff']
 
-    # common values for chunk/spare combinations, sorted by
-    # occurance.
-    # The default in mkyaffs2image is (2048, 64) and Android
-    # primarily uses (1024, 32).
-    #
-    # Most devices use "out of band" (OOB) tags, but
-    # some devices use "in band" tags to save flash space.
-    # (4080, 16) is an example of a common size for inline tags
-    chunks_and_spares = [(2048, 64), (1024, 32), (4096, 128), (8192, 256),
-                         (8192, 448), (512, 16), (4096, 16), (4080, 16)]
-
-    # open the file and seek to the offset
     checkfile = open(filename_full, 'rb')
-    checkfile.seek(offset)
+    checkdata = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
 
     # YAFFS2 come in little endian and big endian flavour.
-    # In practice little endian will be used the most.
-    little_endian_patterns = []
-
-    # First read 10 bytes to see if it is possibly
-    # little or big endian
-    checkbytes = checkfile.read(10)
-    if checkbytes in little_endian_signatures:
-        byteorder = 'little'
-    else:
+    # In practice little endian will be used the most. The
+    # tags in the spare data can have a different byte order
+    # than the object headers.
+    if checkdata[offset:offset+10] in big_endian_signatures:
         byteorder = 'big'
-
-    if byteorder == 'big':
-        unpackingerror = {'offset': offset,
-                          'fatal': False,
-                          'reason': 'big endian images not supported'}
-        return {'status': False, 'error': unpackingerror}
+        object_header = struct.Struct(yaffs2_object_header % '>')
+    else:
+        byteorder = 'little'
+        object_header = struct.Struct(yaffs2_object_header % '<')
+
+    # Determine the most likely chunk/spare combinations and byte
+    # order of the tags from a sample of the image, so the whole image
+    # only has to be parsed for combinations that look valid.
+    geometries = []
+    for (chunk_size, spare_size) in yaffs2_chunks_and_spares:
+        if offset + chunk_size + spare_size > filesize:
+            continue
+        for tagorder in ['<', '>']:
+            score = yaffs2_sample_score(checkdata, offset, chunk_size,
+                                        spare_size, tagorder, byteorder)
+            if score > 0:
+                # images created by mkyaffs2image consist of whole
+                # chunk/spare combinations
+                fits = (filesize - offset) % (chunk_size + spare_size) == 0
+                geometries.append((score, fits, chunk_size, spare_size, tagorder))
+
+    # a stable sort, so for equal scores the most common
+    # combination is tried first
+    geometries.sort(key=lambda x: (x[0], x[1]), reverse=True)
 
     dataunpacked = False
-
-    # then try to read the file system for various chunk/spare
-    # combinations. In band tags are not supported yet.
-    for (chunk_size, spare_size) in chunks_and_spares:
-        # seek to the original offset
-        checkfile.seek(offset)
-
-        # keep a mapping of object ids to latest chunk id
-        objectid_to_latest_chunk = {}
-
-        # keep a mapping of object ids to type
+    for (score, fits, chunk_size, spare_size, tagorder) in geometries:
+        stride = chunk_size + spare_size
+        maxchunks = (filesize - offset) // stride
+        # The tags of all chunks are decoded in bulk: each record is a
+        # chunk followed by the sequence number, object id, chunk id
+        # and byte count in the spare data.
+        tags = struct.Struct('%s%dxIIII%dx' % (tagorder, chunk_size, spare_size - 16))
+
+        # the objects in the order in which they were found, as
+        # (object id, object type, name, size, alias, equivalent id)
+        objects = []
+
+        # keep a mapping of object ids to type and to name
         objectid_to_type = {}
-
-        # keep a mapping of object ids to name
         objectid_to_name = {}
 
-        # keep a mapping of object ids to file size
-        # for sanity checks
-        objectid_to_size = {}
-
-        # store the last open file for an object
-        last_open = None
-        last_open_name = None
-        last_open_size = 0
-        previous_objectid = 0
+        # keep a mapping of object ids to latest chunk id
+        objectid_to_latest_chunk = {}
 
-        # store how many bytes need to be read for an open file
-        open_bytes_left = 0
+        # the (position, byte count) of the data chunks of every file
+        objectid_to_chunks = collections.defaultdict(list)
 
-        # store if element with object id 1 has been seen. Most, but not all,
-        # YAFFS2 images have this as a separate chunk.
-        seen_root_element = False
-        is_first_element = True
+        # store the last seen file object and its size
+        previous_file = None
 
         # store if this is an inband image
         inband = False
+        is_first_element = True
 
-        if unpackedfilesandlabels != []:
-            # remove leftover data TODO
-            unpackedfilesandlabels = []
-
-        while True:
-            unpackedsize = checkfile.tell() - offset
-            if checkfile.tell() + chunk_size + spare_size > filesize:
-                break
-            oldoffset = checkfile.tell()
-
-            # skip the chunk data and read the spare data
-            checkfile.seek(chunk_size, os.SEEK_CUR)
-
-            # read the sequence number
-            checkbytes = checkfile.read(4)
-            sequence_number = int.from_bytes(checkbytes, byteorder=byteorder)
+        chunk = 0
+        for (sequence_number, objectid, chunkid, byte_count) in tags.iter_unpack(
+                memoryview(checkdata)[offset:offset+maxchunks*stride]):
+            chunkoffset = offset + chunk * stride
+            unpackedsize = chunkoffset - offset
 
             # mkyaffs2image uses 0xff for padding. Skip these bytes
             # and continue reading to determine the real size of the
             # yaffs2 image.
             if sequence_number == 0xffffffff:
-                checkfile.seek(oldoffset + chunk_size + spare_size)
+                chunk += 1
                 continue
 
-            # read the object id
-            checkbytes = checkfile.read(4)
-            objectid = int.from_bytes(checkbytes, byteorder=byteorder)
-
             # object id 0 is invalid so likely this is a false positive.
             if objectid == 0:
                 break
 
-            # read the chunk id
-            checkbytes = checkfile.read(4)
-            chunkid = int.from_bytes(checkbytes, byteorder=byteorder)
-
             # first check if the relevant info is stored in an inband tag
             # or in a normal tag. This needs some juggling. These tags
             # are described in the YAFFS2 code in the file yaffs_packedtags2.c
-            if chunkid & EXTRA_HEADER_INFO_FLAG == EXTRA_HEADER_INFO_FLAG:
+            if chunkid & YAFFS_EXTRA_HEADER_INFO_FLAG == YAFFS_EXTRA_HEADER_INFO_FLAG:
                 if not is_first_element and not inband:
                     # can't mix inband and out of band
                     break
@@ -5580,7 +5408,7 @@ def unpack_yaffs2(fileresult, scanenvironment, offset, unpackdir):
                 orig_chunkid = chunkid
 
                 # extract the objectid
-                objectid = objectid & ~EXTRA_OBJECT_TYPE_MASK
+                objectid = objectid & ~YAFFS_EXTRA_OBJECT_TYPE_MASK
 
                 # the chunkid will only have been changed for
                 # the chunk with id 0, but not for any chunks
@@ -5589,10 +5417,6 @@ def unpack_yaffs2(fileresult, scanenvironment, offset, unpackdir):
                 chunkid = 0
                 inband = True
 
-            # read the chunk byte count
-            checkbytes = checkfile.read(4)
-            byte_count = int.from_bytes(checkbytes, byteorder=byteorder)
-
             # depending on the objectid, chunkid and object type the
             # chunk is either a continuation, or a new object.
 
@@ -5607,212 +5431,160 @@ def unpack_yaffs2(fileresult, scanenvironment, offset, unpackdir):
                 # only files can be spread over multiple chunks
                 if objectid_to_type[objectid] != YAFFS_OBJECT_TYPE_FILE:
                     break
-                objectid_to_latest_chunk[objectid] = chunkid
-
-                # it is a continuation, so there should be an open file
-                # and the following check should never be true, but
-                # just include it anyway.
-                if last_open is None:
-                    break
-                # jump to the offset of the chunk and write data
-                os.sendfile(last_open.fileno(), checkfile.fileno(), oldoffset, byte_count)
-            else:
-                # object id should not have been seen yet
-                if objectid in objectid_to_latest_chunk:
+                if byte_count > chunk_size:
                     break
-
-                # close open file, if any
-                if last_open is not None:
-                    # file size sanity check (TODO)
-                    last_open.close()
-                    if objectid_to_latest_chunk[previous_objectid] == 0:
-                        if last_open_size != 0:
-                            os.unlink(last_open.name)
-                            last_open = None
-                            break
-                    unpackedfilesandlabels.append((last_open_name, []))
-                last_open = None
-
                 objectid_to_latest_chunk[objectid] = chunkid
+                objectid_to_chunks[objectid].append((chunkoffset, byte_count))
+                chunk += 1
+                continue
 
-                # jump to the offset of the chunk and analyze
-                checkfile.seek(oldoffset)
-
-                # object type
-                checkbytes = checkfile.read(4)
-                chunk_object_type = int.from_bytes(checkbytes, byteorder=byteorder)
-
-                # check the object type
-                if chunk_object_type == YAFFS_OBJECT_TYPE_UNKNOWN:
-                    break
-
-                # read the parent object id
-                checkbytes = checkfile.read(4)
-                parent_object_id = int.from_bytes(checkbytes, byteorder=byteorder)
-
-                if inband:
-                    parent_object_id = orig_chunkid & ~ALL_EXTRA_FLAG
-
-                # skip the name checksum (2 bytes)
-                checkfile.seek(2, os.SEEK_CUR)
-
-                # object name
-                # For some reason 2 extra bytes need to be read that have
-                # been initialized to 0xff
-                checkbytes = checkfile.read(YAFFS_MAX_NAME_LENGTH + 1 + 2)
-                try:
-                    object_name = os.path.normpath(checkbytes.split(b'\x00', 1)[0].decode())
+            # object id should not have been seen yet
+            if objectid in objectid_to_latest_chunk:
+                break
 
-                    # sanity check, needs more TODO
-                    if os.path.isabs(object_name):
-                        object_name = os.path.relpath(object_name, '/')
-                except:
+            # a file without any data has to be empty
+            if previous_file is not None:
+                (previous_objectid, previous_size) = previous_file
+                if objectid_to_chunks[previous_objectid] == [] and previous_size != 0:
+                    objects.pop()
                     break
+            previous_file = None
 
-                # yst_mode
-                checkbytes = checkfile.read(4)
-                yst_mode = int.from_bytes(checkbytes, byteorder=byteorder)
-
-                # stat information: uid, gid, atime, mtime, ctime
-                checkbytes = checkfile.read(4)
-                yst_uid = int.from_bytes(checkbytes, byteorder=byteorder)
+            objectid_to_latest_chunk[objectid] = chunkid
 
-                checkbytes = checkfile.read(4)
-                yst_gid = int.from_bytes(checkbytes, byteorder=byteorder)
+            (chunk_object_type, parent_object_id, object_name, yst_mode,
+             yst_uid, yst_gid, yst_atime, yst_mtime, yst_ctime,
+             object_size_low, equiv_id, alias, yst_rdev,
+             object_size_high) = object_header.unpack_from(checkdata, chunkoffset)
 
-                checkbytes = checkfile.read(4)
-                yst_atime = int.from_bytes(checkbytes, byteorder=byteorder)
+            # check the object type
+            if chunk_object_type == YAFFS_OBJECT_TYPE_UNKNOWN:
+                break
 
-                checkbytes = checkfile.read(4)
-                yst_mtime = int.from_bytes(checkbytes, byteorder=byteorder)
+            if inband:
+                parent_object_id = orig_chunkid & ~YAFFS_ALL_EXTRA_FLAG
 
-                checkbytes = checkfile.read(4)
-                yst_ctime = int.from_bytes(checkbytes, byteorder=byteorder)
+            # object name
+            try:
+                object_name = os.path.normpath(object_name.split(b'\x00', 1)[0].decode())
 
-                # the object size. This only makes sense for files. The real
-                # size depends on the "high" value as well.
-                checkbytes = checkfile.read(4)
-                object_size_low = int.from_bytes(checkbytes, byteorder=byteorder)
+                # sanity check, needs more TODO
+                if os.path.isabs(object_name):
+                    object_name = os.path.relpath(object_name, '/')
+            except UnicodeDecodeError:
+                break
 
-                # equiv_id, only makes sense for hard links
-                checkbytes = checkfile.read(4)
-                equiv_id = int.from_bytes(checkbytes, byteorder=byteorder)
+            # element 1 is special, but not every yaffs2 file system
+            # seems to have element 1, so sometimes it needs to be added.
+            if objectid != 1:
+                if is_first_element:
+                    # artificially add object 1
+                    objectid_to_type[1] = YAFFS_OBJECT_TYPE_DIRECTORY
+                    objectid_to_name[1] = ''
+            else:
+                # sanity checks for the root element
+                if not is_first_element:
+                    break
+                if chunk_object_type != YAFFS_OBJECT_TYPE_DIRECTORY:
+                    break
 
-                # alias, only makes sense for symlinks
-                alias = checkfile.read(YAFFS_MAX_ALIAS_LENGTH + 1)
+                # add the root element and skip to the next chunk
+                objectid_to_type[1] = YAFFS_OBJECT_TYPE_DIRECTORY
+                objectid_to_name[1] = ''
+                chunk += 1
+                continue
 
-                # rdev, only for special files (block/char)
-                checkbytes = checkfile.read(4)
-                yst_rdev = int.from_bytes(checkbytes, byteorder=byteorder)
+            if parent_object_id not in objectid_to_type:
+                break
 
-                # skip some Windows specific structures
-                checkfile.seek(24, os.SEEK_CUR)
+            # parent objects always have to be a directory
+            if objectid_to_type[parent_object_id] != YAFFS_OBJECT_TYPE_DIRECTORY:
+                break
 
-                # skip some inband related structures
-                checkfile.seek(8, os.SEEK_CUR)
+            # names have to stay inside the parent directory
+            if object_name == '..' or object_name.startswith('../'):
+                break
 
-                # object size high
-                checkbytes = checkfile.read(4)
-                object_size_high = int.from_bytes(checkbytes, byteorder=byteorder)
+            full_object_name = os.path.join(objectid_to_name[parent_object_id], object_name)
 
-                # element 1 is special, but not every yaffs2 file system
-                # seems to have element 1, so sometimes it needs to be added.
-                if objectid != 1:
-                    if is_first_element:
-                        # artificially add object 1
-                        objectid_to_type[1] = YAFFS_OBJECT_TYPE_DIRECTORY
-                        objectid_to_name[1] = ''
+            object_size = 0
+            if chunk_object_type == YAFFS_OBJECT_TYPE_FILE:
+                # extra sanity check: in case the chunk/spare
+                # combination is not known false positives can happen
+                # where a regular file with name '.' can seem to
+                # exist, when it actually doesn't.
+                if object_name == '.':
+                    break
+                # first reconstruct the file size.
+                if object_size_high != 0xffffffff:
+                    object_size = (object_size_high << 32) + object_size_low
                 else:
-                    # sanity checks for the root element
-                    if not is_first_element:
-                        break
-                    if chunk_object_type != YAFFS_OBJECT_TYPE_DIRECTORY:
-                        break
-
-                    # add the root element and skip to the next chunk
-                    objectid_to_type[1] = YAFFS_OBJECT_TYPE_DIRECTORY
-                    objectid_to_name[1] = ''
-                    checkfile.seek(oldoffset + chunk_size + spare_size)
-                    continue
-
-                if parent_object_id not in objectid_to_type:
+                    object_size = object_size_low
+                previous_file = (objectid, object_size)
+            elif chunk_object_type == YAFFS_OBJECT_TYPE_SYMLINK:
+                try:
+                    alias = alias.split(b'\x00', 1)[0].decode()
+                except UnicodeDecodeError:
                     break
-
-                # parent objects always have to be a directory
-                if objectid_to_type[parent_object_id] != YAFFS_OBJECT_TYPE_DIRECTORY:
+            elif chunk_object_type == YAFFS_OBJECT_TYPE_HARDLINK:
+                if equiv_id not in objectid_to_name:
                     break
+            elif chunk_object_type not in [YAFFS_OBJECT_TYPE_DIRECTORY,
+                                           YAFFS_OBJECT_TYPE_SPECIAL]:
+                break
 
-                full_object_name = os.path.join(objectid_to_name[parent_object_id], object_name)
-                outfile_rel = os.path.join(unpackdir, full_object_name)
-                outfile_full = os.path.join(unpackdir_full, full_object_name)
-                objectid_to_name[objectid] = full_object_name
-
-                if chunk_object_type == YAFFS_OBJECT_TYPE_FILE:
-                    # extra sanity check: in case the chunk/spare
-                    # combination is not known false positives can happen
-                    # where a regular file with name '.' can seem to
-                    # exist, when it actually doesn't.
-                    if object_name == '.':
-                        break
-                    # first reconstruct the file size.
-                    if object_size_high != 0xffffffff:
-                        object_size = (object_size_high << 32) + object_size_low
-                    else:
-                        object_size = object_size_low
+            objectid_to_name[objectid] = full_object_name
+            objectid_to_type[objectid] = chunk_object_type
+            objects.append((objectid, chunk_object_type, full_object_name,
+                            object_size, alias, equiv_id))
+            is_first_element = False
+            chunk += 1
+        else:
+            unpackedsize = maxchunks * stride
 
-                    last_open = open(outfile_full, 'wb')
-                    last_open_name = outfile_rel
-                    last_open_size = object_size
-                    previous_objectid = objectid
-                elif chunk_object_type == YAFFS_OBJECT_TYPE_SYMLINK:
-                    try:
-                        alias = alias.split(b'\x00', 1)[0].decode()
-                    except:
-                        break
-                    # create the symlink
-                    os.symlink(alias, outfile_full)
-                    unpackedfilesandlabels.append((outfile_rel, ['symbolic link']))
-                elif chunk_object_type == YAFFS_OBJECT_TYPE_DIRECTORY:
-                    # create the directory
-                    os.makedirs(outfile_full, exist_ok=True)
-                    unpackedfilesandlabels.append((outfile_rel, ['directory']))
-                elif chunk_object_type == YAFFS_OBJECT_TYPE_HARDLINK:
-                    if equiv_id not in objectid_to_name:
-                        break
-                    linkname = os.path.join(unpackdir_full, objectid_to_name[equiv_id])
-                    os.link(linkname, outfile_full)
-                elif chunk_object_type == YAFFS_OBJECT_TYPE_SPECIAL:
-                    # no permissions to create special files,
-                    # so don't create, but report instead. TODO
-                    pass
-                else:
-                    break
-                objectid_to_type[objectid] = chunk_object_type
-                is_first_element = False
-                dataunpacked = True
+        # a file without any data at the end has to be empty as well
+        if previous_file is not None:
+            (previous_objectid, previous_size) = previous_file
+            if objectid_to_chunks[previous_objectid] == [] and previous_size != 0:
+                objects.pop()
 
-            # skip to the next chunk/spare
-            checkfile.seek(oldoffset + chunk_size + spare_size)
-            if checkfile.tell() == filesize:
-                unpackedsize = filesize - offset
-                break
-        # close any open files
-        if last_open is not None:
-            last_open.close()
-            if objectid_to_latest_chunk[previous_objectid] == 0:
-                if last_open_size != 0:
-                    os.unlink(last_open.name)
-                else:
-                    unpackedfilesandlabels.append((last_open_name, []))
-            else:
-                unpackedfilesandlabels.append((last_open_name, []))
-        if unpackedfilesandlabels == []:
-            dataunpacked = False
-        if dataunpacked:
+        if objects == []:
+            continue
+
+        # recreate the objects from the index
+        os.makedirs(unpackdir_full, exist_ok=True)
+        for (objectid, object_type, full_object_name, object_size, alias, equiv_id) in objects:
+            outfile_rel = os.path.join(unpackdir, full_object_name)
+            outfile_full = os.path.join(unpackdir_full, full_object_name)
+            if object_type == YAFFS_OBJECT_TYPE_FILE:
+                outfile = open(outfile_full, 'wb')
+                for (chunkoffset, byte_count) in objectid_to_chunks[objectid]:
+                    sendfile_range(outfile.fileno(), checkfile.fileno(), chunkoffset, byte_count)
+                outfile.close()
+                unpackedfilesandlabels.append((outfile_rel, []))
+            elif object_type == YAFFS_OBJECT_TYPE_SYMLINK:
+                # create the symlink
+                os.symlink(alias, outfile_full)
+                unpackedfilesandlabels.append((outfile_rel, ['symbolic link']))
+            elif object_type == YAFFS_OBJECT_TYPE_DIRECTORY:
+                # create the directory
+                os.makedirs(outfile_full, exist_ok=True)
+                unpackedfilesandlabels.append((outfile_rel, ['directory']))
+            elif object_type == YAFFS_OBJECT_TYPE_HARDLINK:
+                linkname = os.path.join(unpackdir_full, objectid_to_name[equiv_id])
+                os.link(linkname, outfile_full)
+            # no permissions to create special files,
+            # so don't create, but report instead. TODO
+
+        if unpackedfilesandlabels != []:
+            dataunpacked = True
             metadata['chunk size'] = chunk_size
             metadata['spare size'] = spare_size
             break
 
+    checkdata.close()
+    checkfile.close()
+
     if not dataunpacked:
         unpackingerror = {'offset': offset,
                           'fatal': False,
@@ -476,6 +476,9 @@ def unpack_jpeg(fileresult, scanenvironment, offset, unpackdir):
     unpackedsize = 0
     unpackdir_full = scanenvironment.unpack_path(unpackdir)
 
+    # only verify the structure and do not decode the image with PIL
+    fastverify = 'fast_verify_images' in scanenvironment.get_scanprofile()
+
     # open the file and skip the SOI magic
     checkfile = open(filename_full, 'rb')
     checkfile.seek(offset+2)
@@ -931,7 +934,7 @@ def unpack_jpeg(fileresult, scanenvironment, offset, unpackdir):
             # has been inserted or changed in the ECS. The only
             # way to verify this is to reimplement it, or to run
             # it through an external tool or library such as pillow.
-            readsize = 100
+            readsize = 65536
             while True:
                 oldpos = checkfile.tell()
                 checkbytes = checkfile.read(readsize)
@@ -1000,20 +1003,21 @@ def unpack_jpeg(fileresult, scanenvironment, offset, unpackdir):
 
     if offset == 0 and unpackedsize == filesize:
         # now load the file into PIL as an extra sanity check
-        try:
-            testimg = PIL.Image.open(checkfile)
-            testimg.load()
-            testimg.close()
-        except OSError:
-            checkfile.close()
-            unpackingerror = {'offset': offset, 'fatal': False,
-                              'reason': 'invalid JPEG data according to PIL'}
-            return {'status': False, 'error': unpackingerror}
-        except PIL.Image.DecompressionBombError:
-            checkfile.close()
-            unpackingerror = {'offset': offset, 'fatal': False,
-                              'reason': 'JPEG too large according to PIL'}
-            return {'status': False, 'error': unpackingerror}
+        if not fastverify:
+            try:
+                testimg = PIL.Image.open(checkfile)
+                testimg.load()
+                testimg.close()
+            except OSError:
+                checkfile.close()
+                unpackingerror = {'offset': offset, 'fatal': False,
+                                  'reason': 'invalid JPEG data according to PIL'}
+                return {'status': False, 'error': unpackingerror}
+            except PIL.Image.DecompressionBombError:
+                checkfile.close()
+                unpackingerror = {'offset': offset, 'fatal': False,
+                                  'reason': 'JPEG too large according to PIL'}
+                return {'status': False, 'error': unpackingerror}
         checkfile.close()
 
         labels.append('graphics')
@@ -1032,21 +1036,21 @@ def unpack_jpeg(fileresult, scanenvironment, offset, unpackdir):
     outfile.close()
     checkfile.close()
 
-    # open as read only
-    outfile = open(outfile_full, 'rb')
-
     # now load the file into PIL as an extra sanity check
-    try:
-        testimg = PIL.Image.open(outfile)
-        testimg.load()
-        testimg.close()
-        outfile.close()
-    except OSError:
-        outfile.close()
-        os.unlink(outfile_full)
-        unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'invalid JPEG data according to PIL'}
-        return {'status': False, 'error': unpackingerror}
+    if not fastverify:
+        # open as read only
+        outfile = open(outfile_full, 'rb')
+        try:
+            testimg = PIL.Image.open(outfile)
+            testimg.load()
+            testimg.close()
+            outfile.close()
+        except OSError:
+            outfile.close()
+            os.unlink(outfile_full)
+            unpackingerror = {'offset': offset, 'fatal': False,
+                              'reason': 'invalid JPEG data according to PIL'}
+            return {'status': False, 'error': unpackingerror}
 
     unpackedfilesandlabels.append((outfile_rel, ['jpeg', 'graphics', 'unpacked']))
     return {'status': True, 'length': unpackedsize, 'labels': labels,
@@ -0,0 +1,82 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+
+# Helpers to run CPU bound work that releases the GIL (for example
+# decompression with zlib, lzma, bz2, lz4 or zstd) in a thread pool
+# of the current scanning process.
+
+import collections
+import concurrent.futures
+import os
+
+_pool = None
+_pool_pid = None
+
+
+def get_thread_pool(threads):
+    '''Return a thread pool with at least threads workers for the
+    current process. The pool is created on first use, so it is never
+    shared with forked processes. A pool with fewer workers is shut
+    down when it is replaced. Work that runs in the pool should not
+    wait for other work in the pool.'''
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid() or \
+            _pool._max_workers < threads:
+        if _pool is not None and _pool_pid == os.getpid():
+            # work that was already submitted still finishes, but
+            # do not wait for it, as the caller may be waiting for
+            # results from the old pool as well.
+            _pool.shutdown(wait=False)
+        _pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def ordered_map(function, iterable, threads, window=None):
+    '''Like map(), but with threads > 1 function is applied to the
+    items of iterable in a thread pool. At most window items (default:
+    twice the number of threads) are processed ahead of the results
+    that are returned, which limits the memory that is used. Results
+    are returned in the order of iterable. If the caller stops early,
+    or function raises an exception, work that has not started yet is
+    cancelled and work that has started is waited for.'''
+    if threads <= 1:
+        yield from map(function, iterable)
+        return
+    if window is None:
+        window = 2 * threads
+    pool = get_thread_pool(threads)
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(pool.submit(function, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # do not leave work behind if the caller stops early, as it
+        # could for example still write to files that the caller
+        # removes after an error.
+        for future in pending:
+            future.cancel()
+        concurrent.futures.wait(pending)
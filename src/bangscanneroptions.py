@@ -55,11 +55,20 @@ class BangScannerOptions:
             'removescandirectory': False,
             'createbytecounter': False,
             'createjson': True,
+            'createstatistics': True,
             'tlshmaximum': sys.maxsize,
             'writereport': True,
             'uselogging': True,
             'bangthreads': multiprocessing.cpu_count(),
+            'hashthreads': 0,
+            'unpackthreads': 0,
+            'scanprofile': '',
+            'metadatacache': None,
+            'metadatacachesize': 100000,
             'checkpath': None,
+            'profile': False,
+            'profileparsers': [],
+            'profileminimumduration': 0,
         }
         self.options = ObjectDict(dict(self.defaults))
 
@@ -92,6 +101,18 @@ class BangScannerOptions:
                                 action="store", dest="temporarydirectory",
                                 help="path to temporary directory",
                                 metavar="FILE")
+        self.parser.add_argument("--profile",
+                                action="store_true", dest="profile",
+                                help="profile the worker processes and write the profile to the scan directory")
+        self.parser.add_argument("--profile-parser",
+                                action="append", dest="profileparsers",
+                                help="only profile the parser with this name (can be used multiple times)",
+                                metavar="NAME")
+        self.parser.add_argument("--profile-minimum-duration",
+                                action="store", dest="profileminimumduration",
+                                type=float,
+                                help="only keep profiles of jobs (or parsers) that took at least this many seconds",
+                                metavar="SECONDS")
         self.args = self.parser.parse_args()
         self._check_configuration_file()
 
@@ -174,6 +195,16 @@ class BangScannerOptions:
                 section='configuration')
         self._set_integer_option_from_config('bangthreads',
                 section='configuration', option='threads')
+        self._set_integer_option_from_config('hashthreads',
+                section='configuration')
+        self._set_integer_option_from_config('unpackthreads',
+                section='configuration')
+        self._set_string_option_from_config('scanprofile',
+                section='configuration')
+        self._set_string_option_from_config('metadatacache',
+                section='configuration')
+        self._set_integer_option_from_config('metadatacachesize',
+                section='configuration')
         self._set_boolean_option_from_config('removescandata',
                 section='configuration')
         self._set_boolean_option_from_config('removescandirectory',
@@ -182,6 +213,8 @@ class BangScannerOptions:
                 section='configuration', option='bytecounter')
         self._set_boolean_option_from_config('createjson',
                 section='configuration', option='json')
+        self._set_boolean_option_from_config('createstatistics',
+                section='configuration', option='statistics')
         self._set_integer_option_from_config('tlshmaximum',
                 section='configuration')
         self._set_boolean_option_from_config('writereport',
@@ -195,12 +228,52 @@ class BangScannerOptions:
             self.options.baseunpackdirectory = self.args.baseunpackdirectory
         if self.args.temporarydirectory:
             self.options.temporarydirectory = self.args.temporarydirectory
+        # selecting parsers or a minimum duration implies profiling
+        if self.args.profileparsers:
+            self.options.profileparsers = self.args.profileparsers
+            self.options.profile = True
+        if self.args.profileminimumduration is not None:
+            self.options.profileminimumduration = self.args.profileminimumduration
+            self.options.profile = True
+        if self.args.profile:
+            self.options.profile = True
 
     def _validate_options(self):
         # bangthreads >= 1
         if self.options.bangthreads < 1:
             self.options.bangthreads = self.defaults['bangthreads']
 
+        # hashthreads and unpackthreads 0 means: use the CPUs that are
+        # not used by the scanning processes, but at least one
+        if self.options.hashthreads < 1:
+            self.options.hashthreads = max(1,
+                multiprocessing.cpu_count() // self.options.bangthreads)
+        if self.options.unpackthreads < 1:
+            self.options.unpackthreads = max(1,
+                multiprocessing.cpu_count() // self.options.bangthreads)
+
+        # the scan profile is a comma separated list of names
+        if isinstance(self.options.scanprofile, str):
+            self.options.scanprofile = frozenset(
+                    x.strip() for x in self.options.scanprofile.split(',')
+                    if x.strip() != '')
+
+        if self.options.metadatacachesize < 1:
+            self._error('Metadata cache size has to be positive')
+
+        # the directory of the metadata cache must exist and be writable
+        if self.options.metadatacache:
+            cachedirectory = os.path.dirname(os.path.abspath(self.options.metadatacache))
+            if not os.path.isdir(cachedirectory):
+                self._error("Metadata cache directory %s does not exist, exiting"
+                        % cachedirectory)
+            if not self.check_if_directory_is_writable(cachedirectory):
+                self._error("Metadata cache directory %s cannot be written to, exiting"
+                        % cachedirectory)
+
+        if self.options.profileminimumduration < 0:
+            self._error('Minimum profile duration cannot be negative')
+
         # baseunpackdirectory must be declared
         if not self.options.baseunpackdirectory:
             self._error('Missing base unpack directory')
@@ -48,6 +48,8 @@ import subprocess
 import json
 import xml.dom
 import hashlib
+import io
+import mmap
 import pathlib
 import sqlite3
 
@@ -59,6 +61,10 @@ import snappy
 import mutf8
 
 from FileResult import *
+from bangdatarange import FileRange, copy_range_to_temporary_file, run_with_range_as_stdin
+from bangblockdecompress import unpack_bzip2_parallel, unpack_xz_parallel
+from bangdecompress import DecompressionError, HashingWriter, decompress_lz4_legacy, decompress_lzw, decompress_zstd_frame, zstd_maximum_in_process_size
+from bangparallel import ordered_map
 
 encodingstotranslate = ['utf-8', 'ascii', 'latin-1', 'euc_jp', 'euc_jis_2004',
                         'jisx0213', 'iso2022_jp', 'iso2022_jp_1',
@@ -518,19 +524,32 @@ def unpack_lzma_wrapper(
             outfile_rel = os.path.join(unpackdir, filename_full.stem) + ".tar"
     outfile_full = scanenvironment.unpack_path(outfile_rel)
 
+    # XZ files created with multiple threads have multiple blocks that
+    # can be decompressed independently of each other, so use the
+    # unpacking threads for these.
+    os.makedirs(unpackdir_full, exist_ok=True)
+    xzlength = None
+    if filetype == 'xz' and not decompressor.eof and scanenvironment.get_unpackthreads() > 1:
+        xzlength = unpack_xz_parallel(filename_full, offset, outfile_full,
+                                      scanenvironment.get_unpackthreads())
+
     # data has been unpacked, so open a file and write the data to it.
     # unpacked, or if all data has been unpacked
-    os.makedirs(unpackdir_full, exist_ok=True)
-    outfile = open(outfile_full, 'wb')
-    outfile.write(unpackeddata)
+    if xzlength is None:
+        outfile = open(outfile_full, 'wb')
+        outfile.write(unpackeddata)
     unpackedsize += bytesread - len(decompressor.unused_data)
 
     # there is still some data left to be unpacked, so
     # continue unpacking, as described in the Python documentation:
     # https://docs.python.org/3/library/bz2.html#incremental-de-compression
     # https://docs.python.org/3/library/lzma.html
-    bytesread = checkfile.readinto(checkbuffer)
-    checkbytes = memoryview(checkbuffer[:bytesread])
+    if xzlength is not None:
+        unpackedsize = xzlength
+        bytesread = 0
+    else:
+        bytesread = checkfile.readinto(checkbuffer)
+        checkbytes = memoryview(checkbuffer[:bytesread])
     while bytesread != 0:
         try:
             unpackeddata = decompressor.decompress(checkbytes)
@@ -551,7 +570,8 @@ def unpack_lzma_wrapper(
             break
         bytesread = checkfile.readinto(checkbuffer)
         checkbytes = memoryview(checkbuffer[:bytesread])
-    outfile.close()
+    if xzlength is None:
+        outfile.close()
     checkfile.close()
 
     outfile_size = os.stat(outfile_full).st_size
@@ -735,7 +755,7 @@ def unpack_tar(fileresult, scanenvironment, offset, unpackdir):
                     elif unpacktarinfo.isfile():
                         outfile = open(unpacked_full, 'wb')
                         tarreader = unpacktar.extractfile(unpacktarinfo)
-                        outfile.write(tarreader.read())
+                        shutil.copyfileobj(tarreader, outfile)
                         outfile.close()
                     elif unpacktarinfo.isdir():
                         os.makedirs(unpacked_full, exist_ok=True)
@@ -1141,6 +1161,89 @@ unpack_dahua.signatures = {'dahua': b'DH\x03\04'}
 unpack_dahua.minimum_size = 30
 
 
+# the amount of compressed data of ZIP members that is unpacked in
+# one go by a thread
+zipbatchsize = 4194304
+
+
+def zip_member_path(filename):
+    '''Return the relative path that a ZIP member is unpacked to,
+    in the same way as ZipFile.extract() does it: drive letters,
+    absolute paths, '.' and '..' are removed.'''
+    arcname = filename.replace('/', os.path.sep)
+    arcname = os.path.splitdrive(arcname)[1]
+    return os.path.sep.join(x for x in arcname.split(os.path.sep)
+                            if x not in ('', os.path.curdir, os.path.pardir))
+
+
+def unpack_zip_batch(filename, offset, size, members):
+    '''Unpack a list of (ZipInfo, output file) from a ZIP file of
+    size bytes at offset in filename, using a separate file object.
+    The data of the members is decompressed while it is written and
+    the CRC32 of each member is checked.'''
+    zipfilerange = io.BufferedReader(FileRange(filename, offset, size))
+    try:
+        for (zipinfo, outfile_full) in members:
+            # find the data of the member in the local file header
+            zipfilerange.seek(zipinfo.header_offset)
+            fileheader = zipfilerange.read(30)
+            if len(fileheader) != 30 or fileheader[:4] != b'PK\x03\x04':
+                raise zipfile.BadZipFile('bad local file header')
+            (filenamelength, extrafieldlength) = struct.unpack('<HH', fileheader[26:30])
+            datastart = zipinfo.header_offset + 30 + filenamelength + extrafieldlength
+
+            try:
+                os.makedirs(os.path.dirname(outfile_full), exist_ok=True)
+                outfile = open(outfile_full, 'wb')
+            except (FileExistsError, IsADirectoryError, NotADirectoryError):
+                # TODO: find out what to do with this. This happens
+                # sometimes with zip files with symbolic links from
+                # one directory to another.
+                continue
+            with outfile:
+                # ZipExtFile also reads stored members, and raises
+                # BadZipFile if the CRC32 of the data is wrong.
+                zipfilerange.seek(datastart)
+                zipreader = zipfile.ZipExtFile(zipfilerange, 'r', zipinfo)
+                shutil.copyfileobj(zipreader, outfile, 1048576)
+    finally:
+        zipfilerange.close()
+
+
+def unpack_zip_members(scanenvironment, filename, offset, size, zipinfolist,
+                       faultyzipfiles, unpackdir_full):
+    '''Unpack the members of a ZIP file of size bytes at offset in
+    filename. The members are unpacked in batches in the unpacking
+    threads, each with its own file object.'''
+    # members with the same name: the last one wins, like extractall()
+    members = {}
+    for z in zipinfolist:
+        outfile_full = os.path.join(unpackdir_full, zip_member_path(z.filename))
+        if z.is_dir() or z in faultyzipfiles:
+            # create the directory
+            os.makedirs(outfile_full, exist_ok=True)
+            continue
+        members.pop(outfile_full, None)
+        members[outfile_full] = z
+
+    batches = []
+    batch = []
+    batchsize = 0
+    for (outfile_full, z) in members.items():
+        batch.append((z, outfile_full))
+        batchsize += z.compress_size
+        if batchsize >= zipbatchsize:
+            batches.append(batch)
+            batch = []
+            batchsize = 0
+    if batch:
+        batches.append(batch)
+
+    for result in ordered_map(lambda batch: unpack_zip_batch(filename, offset, size, batch),
+                              batches, scanenvironment.get_unpackthreads()):
+        pass
+
+
 # https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT
 # Documenting version 6.3.6
 # This method first verifies a file to see where the ZIP data
@@ -1949,35 +2052,20 @@ def unpack_zip(fileresult, scanenvironment, offset, unpackdir):
 
     unpackedsize = checkfile.tell() - offset
     if not encrypted:
-        # if the ZIP file is at the end of the file then the ZIP module
-        # from Python will do a lot of the heavy lifting.
+        # Python's zipfile module starts looking for the central
+        # directory at the end of the file, so only show it the range
+        # with the ZIP file, instead of carving it to a temporary file.
         # Malformed ZIP files that need a workaround exist:
         # http://web.archive.org/web/20190814185417/https://bugzilla.redhat.com/show_bug.cgi?id=907442
-        if checkfile.tell() == filesize:
-            carved = False
-        else:
-            # else carve the file from the larger ZIP first
-            temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-            os.sendfile(temporaryfile[0], checkfile.fileno(), offset, unpackedsize)
-            os.fdopen(temporaryfile[0]).close()
-            carved = True
-        if not carved:
-            # seek to the right offset, even though that's
-            # not even necessary.
-            checkfile.seek(offset)
+        wholefile = offset == 0 and checkfile.tell() == filesize
+        zipfilerange = io.BufferedReader(FileRange(filename_full, offset, unpackedsize))
 
         try:
-            if not carved:
-                unpackzipfile = zipfile.ZipFile(checkfile)
-            else:
-                unpackzipfile = zipfile.ZipFile(temporaryfile[1])
-            zipfiles = unpackzipfile.namelist()
+            unpackzipfile = zipfile.ZipFile(zipfilerange)
             zipinfolist = unpackzipfile.infolist()
-            oldcwd = os.getcwd()
 
             # create the unpacking directory
             os.makedirs(unpackdir_full, exist_ok=True)
-            os.chdir(unpackdir_full)
             knowncompression = True
 
             # check if there have been directories stored
@@ -2014,31 +2102,11 @@ def unpack_zip(fileresult, scanenvironment, offset, unpackdir):
                             labels.append('NuGet')
                             break
             if knowncompression:
-                if faultyzipfiles == []:
-                    try:
-                        unpackzipfile.extractall()
-                    except NotImplementedError:
-                        checkfile.close()
-                        if carved:
-                            os.unlink(temporaryfile[1])
-                        unpackingerror = {'offset': offset, 'fatal': False,
-                                          'reason': 'Unknown compression method'}
-                        return {'status': False, 'error': unpackingerror}
-                    except NotADirectoryError:
-                        # TODO: find out what to do with this. This happens
-                        # sometimes with zip files with symbolic links from
-                        # one directory to another.
-                        pass
-                else:
-                    for z in zipinfolist:
-                        if z in faultyzipfiles:
-                            # create the directory
-                            zdirname_full = scanenvironment.unpack_path(os.path.join(unpackdir, z.filename))
-                            os.makedirs(zdirname_full, exist_ok=True)
-                        else:
-                            unpackzipfile.extract(z)
-            os.chdir(oldcwd)
+                unpack_zip_members(scanenvironment, filename_full, offset,
+                                   unpackedsize, zipinfolist,
+                                   faultyzipfiles, unpackdir_full)
             unpackzipfile.close()
+            zipfilerange.close()
 
             if knowncompression:
                 dirwalk = os.walk(unpackdir_full)
@@ -2054,21 +2122,24 @@ def unpack_zip(fileresult, scanenvironment, offset, unpackdir):
             else:
                 labels.append("unknown compression")
 
-            if offset == 0 and not carved:
+            if wholefile:
                 labels.append('compressed')
                 labels.append('zip')
                 if androidsigning:
                     labels.append('apk')
                     labels.append('android')
-            if carved:
-                os.unlink(temporaryfile[1])
             checkfile.close()
             return {'status': True, 'length': unpackedsize, 'labels': labels,
                     'filesandlabels': unpackedfilesandlabels}
-        except zipfile.BadZipFile:
+        except NotImplementedError:
+            checkfile.close()
+            zipfilerange.close()
+            unpackingerror = {'offset': offset, 'fatal': False,
+                              'reason': 'Unknown compression method'}
+            return {'status': False, 'error': unpackingerror}
+        except (zipfile.BadZipFile, EOFError, zlib.error, lzma.LZMAError, OSError):
             checkfile.close()
-            if carved:
-                os.unlink(temporaryfile[1])
+            zipfilerange.close()
             unpackingerror = {'offset': offset, 'fatal': False,
                               'reason': 'Not a valid ZIP file'}
             return {'status': False, 'error': unpackingerror}
@@ -2148,9 +2219,18 @@ def unpack_bzip2(fileresult, scanenvironment, offset, unpackdir, dryrun=False):
         outfile_rel = os.path.join(unpackdir, "unpacked-from-bz2")
 
     outfile_full = scanenvironment.unpack_path(outfile_rel)
+
+    # bzip2 blocks can be decompressed independently of each other,
+    # so if there is more than one block use the unpacking threads.
+    bz2length = None
+    if not dryrun and not bz2decompressor.eof and scanenvironment.get_unpackthreads() > 1:
+        os.makedirs(unpackdir_full, exist_ok=True)
+        bz2length = unpack_bzip2_parallel(filename_full, offset, outfile_full,
+                                          scanenvironment.get_unpackthreads())
+
     # data has been unpacked, so open a file and write the data to it.
     # unpacked, or if all data has been unpacked
-    if not dryrun:
+    if not dryrun and bz2length is None:
         # create the unpacking directory
         os.makedirs(unpackdir_full, exist_ok=True)
         outfile = open(outfile_full, 'wb')
@@ -2163,7 +2243,11 @@ def unpack_bzip2(fileresult, scanenvironment, offset, unpackdir, dryrun=False):
     # https://docs.python.org/3/library/bz2.html#incremental-de-compression
     # read some more data in chunks of 10 MB
     datareadsize = 10000000
-    bz2data = checkfile.read(datareadsize)
+    if bz2length is not None:
+        unpackedsize = bz2length
+        bz2data = b''
+    else:
+        bz2data = checkfile.read(datareadsize)
     while bz2data != b'':
         try:
             unpackeddata = bz2decompressor.decompress(bz2data)
@@ -2192,7 +2276,8 @@ def unpack_bzip2(fileresult, scanenvironment, offset, unpackdir, dryrun=False):
     checkfile.close()
 
     if not dryrun:
-        outfile.close()
+        if bz2length is None:
+            outfile.close()
 
         if offset == 0 and unpackedsize == filesize:
             labels += ['bzip2', 'compressed']
@@ -3809,24 +3894,23 @@ def unpack_cab(fileresult, scanenvironment, offset, unpackdir):
                           'reason': 'cabextract program not found'}
         return {'status': False, 'error': unpackingerror}
 
+    # cabextract cannot read at an offset or from a pipe, so copy
+    # exactly the cabinet if needed.
+    checkfile.close()
     havetmpfile = False
+    cabfile = filename_full
     if not (offset == 0 and filesize == cabinetsize):
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, cabinetsize)
-        os.fdopen(temporaryfile[0]).close()
+        cabfile = copy_range_to_temporary_file(scanenvironment,
+                filename_full, offset, cabinetsize)
         havetmpfile = True
 
-    checkfile.close()
     unpackdir_full = scanenvironment.unpack_path(unpackdir)
-    if havetmpfile:
-        p = subprocess.Popen(['cabextract', '-d', unpackdir_full, temporaryfile[1]], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    else:
-        p = subprocess.Popen(['cabextract', '-d', unpackdir_full, filename_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p = subprocess.Popen(['cabextract', '-d', unpackdir_full, cabfile], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
     (outputmsg, errormsg) = p.communicate()
     if p.returncode != 0:
         if havetmpfile:
-            os.unlink(temporaryfile[1])
+            os.unlink(cabfile)
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'invalid cab file'}
         return {'status': False, 'error': unpackingerror}
@@ -3854,7 +3938,7 @@ def unpack_cab(fileresult, scanenvironment, offset, unpackdir):
 
     # cleanup
     if havetmpfile:
-        os.unlink(temporaryfile[1])
+        os.unlink(cabfile)
 
     return {'status': True, 'length': unpackedsize, 'labels': labels,
             'filesandlabels': unpackedfilesandlabels}
@@ -4275,14 +4359,15 @@ def unpack_rzip(fileresult, scanenvironment, offset, unpackdir):
         return {'status': True, 'length': unpackedsize, 'labels': labels,
                 'filesandlabels': unpackedfilesandlabels}
 
-    temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-    os.sendfile(temporaryfile[0], checkfile.fileno(), offset, unpackedsize)
-    os.fdopen(temporaryfile[0]).close()
+    # rzip needs a seekable file and cannot read at an offset, so
+    # copy exactly the rzip data.
     checkfile.close()
-    p = subprocess.Popen(['rzip', '-d', temporaryfile[1], '-o', outfile_full], stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
+    temporaryfilename = copy_range_to_temporary_file(scanenvironment,
+            filename_full, offset, unpackedsize)
+    p = subprocess.Popen(['rzip', '-d', temporaryfilename, '-o', outfile_full], stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True)
     (outputmsg, errormsg) = p.communicate()
     if p.returncode != 0:
-        os.unlink(temporaryfile[1])
+        os.unlink(temporaryfilename)
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'invalid RZIP file'}
         return {'status': False, 'error': unpackingerror}
@@ -4401,21 +4486,21 @@ def unpack_7z(fileresult, scanenvironment, offset, unpackdir):
                           'reason': '7z program not found'}
         return {'status': False, 'error': unpackingerror}
 
+    # 7z cannot read these formats at an offset or from a pipe, so
+    # copy exactly the archive if needed.
+    checkfile.close()
     havetmpfile = False
+    archivefile = filename_full
     if not (offset == 0 and filesize == unpackedsize):
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, unpackedsize)
-        os.fdopen(temporaryfile[0]).close()
+        archivefile = copy_range_to_temporary_file(scanenvironment,
+                filename_full, offset, unpackedsize)
         havetmpfile = True
-        checkfile.close()
-        p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', temporaryfile[1]], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    if offset == 0 and filesize == unpackedsize:
-        checkfile.close()
-        p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', filename_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', archivefile], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
     (outputmsg, errormsg) = p.communicate()
     if p.returncode != 0:
+        if havetmpfile:
+            os.unlink(archivefile)
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'invalid 7z file'}
         return {'status': False, 'error': unpackingerror}
@@ -4434,7 +4519,7 @@ def unpack_7z(fileresult, scanenvironment, offset, unpackdir):
 
     # cleanup
     if havetmpfile:
-        os.unlink(temporaryfile[1])
+        os.unlink(archivefile)
     else:
         labels.append('7z')
         labels.append('compressed')
@@ -4561,24 +4646,22 @@ def unpack_chm(fileresult, scanenvironment, offset, unpackdir):
 
     unpackedsize = chmsize
 
+    # 7z cannot read these formats at an offset or from a pipe, so
+    # copy exactly the archive if needed.
+    checkfile.close()
     havetmpfile = False
+    archivefile = filename_full
     if not (offset == 0 and filesize == unpackedsize):
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, unpackedsize)
-        os.fdopen(temporaryfile[0]).close()
+        archivefile = copy_range_to_temporary_file(scanenvironment,
+                filename_full, offset, unpackedsize)
         havetmpfile = True
-        checkfile.close()
-        p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', temporaryfile[1]], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    if offset == 0 and filesize == unpackedsize:
-        checkfile.close()
-        p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', filename_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', archivefile], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
     (outputmsg, errormsg) = p.communicate()
     if p.returncode != 0:
         # cleanup
         if havetmpfile:
-            os.unlink(temporaryfile[1])
+            os.unlink(archivefile)
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'invalid CHM file'}
         return {'status': False, 'error': unpackingerror}
@@ -4597,7 +4680,7 @@ def unpack_chm(fileresult, scanenvironment, offset, unpackdir):
 
     # cleanup
     if havetmpfile:
-        os.unlink(temporaryfile[1])
+        os.unlink(archivefile)
     else:
         labels.append('chm')
         labels.append('compressed')
@@ -4840,21 +4923,21 @@ def unpack_wim(fileresult, scanenvironment, offset, unpackdir):
                           'reason': '7z program not found'}
         return {'status': False, 'error': unpackingerror}
 
+    # 7z cannot read these formats at an offset or from a pipe, so
+    # copy exactly the archive if needed.
+    checkfile.close()
     havetmpfile = False
+    archivefile = filename_full
     if not (offset == 0 and filesize == unpackedsize):
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, unpackedsize)
-        os.fdopen(temporaryfile[0]).close()
+        archivefile = copy_range_to_temporary_file(scanenvironment,
+                filename_full, offset, unpackedsize)
         havetmpfile = True
-        checkfile.close()
-        p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', temporaryfile[1]], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    if offset == 0 and filesize == unpackedsize:
-        checkfile.close()
-        p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', filename_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    p = subprocess.Popen(['7z', '-o%s' % unpackdir_full, '-y', 'x', archivefile], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
     (outputmsg, errormsg) = p.communicate()
     if p.returncode != 0:
+        if havetmpfile:
+            os.unlink(archivefile)
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'invalid WIM file'}
         return {'status': False, 'error': unpackingerror}
@@ -4878,7 +4961,7 @@ def unpack_wim(fileresult, scanenvironment, offset, unpackdir):
 
     # cleanup
     if havetmpfile:
-        os.unlink(temporaryfile[1])
+        os.unlink(archivefile)
 
     return {'status': True, 'length': unpackedsize, 'labels': labels,
             'filesandlabels': unpackedfilesandlabels}
@@ -5426,11 +5509,6 @@ def unpack_zstd(fileresult, scanenvironment, offset, unpackdir):
     unpackedsize = 0
     unpackdir_full = scanenvironment.unpack_path(unpackdir)
 
-    if shutil.which('zstd') is None:
-        unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                          'reason': 'zstd program not found'}
-        return {'status': False, 'error': unpackingerror}
-
     checkfile = open(filename_full, 'rb')
     # skip the magic
     checkfile.seek(offset+4)
@@ -5516,6 +5594,8 @@ def unpack_zstd(fileresult, scanenvironment, offset, unpackdir):
                               'reason': 'not enough data for frame content size'}
             return {'status': False, 'error': unpackingerror}
         uncompressed_size = int.from_bytes(checkbytes, byteorder='little')
+        if fcs_field_size == 2:
+            uncompressed_size += 256
         unpackedsize += fcs_field_size
 
     # then the blocks: each block starts with 3 bytes
@@ -5551,45 +5631,58 @@ def unpack_zstd(fileresult, scanenvironment, offset, unpackdir):
             return {'status': False, 'error': unpackingerror}
 
     unpackedsize = checkfile.tell() - offset
+    checkfile.close()
 
     # create the unpacking directory
     os.makedirs(unpackdir_full, exist_ok=True)
 
     # zstd does not record the name of the file that was
     # compressed, so guess, or just set a name.
-    if offset == 0 and unpackedsize == filesize:
+    if offset == 0 and unpackedsize == filesize and filename_full.suffix.lower() == '.zst':
+        outfile_rel = os.path.join(unpackdir, filename_full.stem)
+    else:
+        outfile_rel = os.path.join(unpackdir, "unpacked-by-zstd")
+    outfile_full = scanenvironment.unpack_path(outfile_rel)
+
+    hashes = {}
+    if fcs_field_size != 0 and uncompressed_size <= zstd_maximum_in_process_size:
+        # decompress the frame in process and compute the hashes
+        # of the unpacked data on the way.
+        checkfile = open(filename_full, 'rb')
+        checkdata = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
         checkfile.close()
-        if filename_full.suffix.lower() == '.zst':
-            outfile_rel = os.path.join(unpackdir, filename_full.stem)
-        else:
-            outfile_rel = os.path.join(unpackdir, "unpacked-by-zstd")
-        outfile_full = scanenvironment.unpack_path(outfile_rel)
-        p = subprocess.Popen(['zstd', '-d', '-o', outfile_full, filename_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (outputmsg, errormsg) = p.communicate()
-        if p.returncode != 0:
+        writer = HashingWriter(outfile_full, scanenvironment.get_hashthreads())
+        try:
+            decompress_zstd_frame(checkdata, offset, unpackedsize,
+                                  uncompressed_size, writer)
+            decompressed = True
+        except DecompressionError:
+            decompressed = False
+        finally:
+            checkdata.close()
+            filehashes = writer.close()
+        if not decompressed:
+            os.unlink(outfile_full)
             unpackingerror = {'offset': offset, 'fatal': False,
                               'reason': 'invalid zstd'}
             return {'status': False, 'error': unpackingerror}
-        if fcs_field_size != 0:
-            if uncompressed_size != os.stat(outfile_full).st_size:
-                unpackingerror = {'offset': offset, 'fatal': False,
-                                  'reason': 'invalid checksum'}
-                return {'status': False, 'error': unpackingerror}
-        labels.append('zstd')
-        labels.append('compressed')
+        hashes[outfile_rel] = filehashes
     else:
-        tmpfilename = os.path.join(unpackdir, "unpacked-by-zstd.zst")
-        tmpfile_full = scanenvironment.unpack_path(tmpfilename)
-        tmpfile = open(tmpfile_full, 'wb')
-        os.sendfile(tmpfile.fileno(), checkfile.fileno(), offset, unpackedsize)
-        tmpfile.close()
-        checkfile.close()
-        outfile_rel = tmpfilename[:-4]
-        outfile_full = scanenvironment.unpack_path(outfile_rel)
-        p = subprocess.Popen(['zstd', '-d', '--rm', '-o', outfile_full, tmpfile_full], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (outputmsg, errormsg) = p.communicate()
-        if p.returncode != 0:
-            os.unlink(tmpfile_full)
+        # The Python zstd bindings can only decompress frames at once
+        # and need the content size, so use the zstd program for frames
+        # without a content size, or with a very large content size.
+        if shutil.which('zstd') is None:
+            unpackingerror = {'offset': offset, 'fatal': False,
+                              'reason': 'zstd program not found'}
+            return {'status': False, 'error': unpackingerror}
+
+        # send exactly the zstd frame to zstd on standard input
+        (returncode, outputmsg, errormsg) = run_with_range_as_stdin(
+                ['zstd', '-d', '-o', outfile_full], filename_full,
+                offset, unpackedsize)
+        if returncode != 0:
+            if os.path.exists(outfile_full):
+                os.unlink(outfile_full)
             unpackingerror = {'offset': offset, 'fatal': False,
                               'reason': 'invalid zstd'}
             return {'status': False, 'error': unpackingerror}
@@ -5599,9 +5692,13 @@ def unpack_zstd(fileresult, scanenvironment, offset, unpackdir):
                                   'reason': 'invalid checksum'}
                 return {'status': False, 'error': unpackingerror}
 
+    if offset == 0 and unpackedsize == filesize:
+        labels.append('zstd')
+        labels.append('compressed')
+
     unpackedfilesandlabels.append((outfile_rel, []))
     return {'status': True, 'length': unpackedsize, 'labels': labels,
-            'filesandlabels': unpackedfilesandlabels}
+            'filesandlabels': unpackedfilesandlabels, 'hashes': hashes}
 
 # /usr/share/magic
 unpack_zstd.signatures = {'zstd_08': b'\x28\xb5\x2f\xfd'}
@@ -5699,95 +5796,43 @@ def unpack_lz4legacy(fileresult, scanenvironment, offset, unpackdir):
     unpackedsize = 0
     unpackdir_full = scanenvironment.unpack_path(unpackdir)
 
-    # open the file, seek to the offset
-    checkfile = open(filename_full, 'rb')
-    checkfile.seek(offset+4)
-    unpackedsize = 4
-
-    # now process to see how much data should be
-    # processed using the LZ4 utilities
-    blockunpacked = False
-    while True:
-        # block compressed size
-        checkbytes = checkfile.read(4)
-        if len(checkbytes) != 4:
-            checkfile.close()
-            unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                              'reason': 'not enough data for block compressed size'}
-            return {'status': False, 'error': unpackingerror}
-        # "if the frame is followed by a valid Frame Magic Number, it is considered completed."
-        if checkbytes == b'\x02\x21\x4c\x18':
-            break
-        blockcompressedsize = int.from_bytes(checkbytes, byteorder='little')
-        if offset + blockcompressedsize + 8 > filesize:
-            if not blockunpacked:
-                checkfile.close()
-                unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                                  'reason': 'compressed data cannot be outside file'}
-                return {'status': False, 'error': unpackingerror}
-            break
-        unpackedsize += 4
-
-        # skip over the compressed data
-        checkfile.seek(blockcompressedsize, os.SEEK_CUR)
-        unpackedsize += blockcompressedsize
-
-        # check if the end of file was reached
-        if unpackedsize == filesize:
-            break
-        blockunpacked = True
-
     # create the unpacking directory
     os.makedirs(unpackdir_full, exist_ok=True)
 
-    if offset == 0 and unpackedsize == filesize:
-        checkfile.close()
-        if filename_full.suffix.lower() == '.lz4':
-            outfile_rel = os.path.join(unpackdir, filename_full.stem)
-        else:
-            outfile_rel = os.path.join(unpackdir, "unpacked-from-lz4-legacy")
-        outfile_full = scanenvironment.unpack_path(outfile_rel)
-        p = subprocess.Popen(['lz4c', '-d', filename_full, outfile_full],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (outputmsg, errormsg) = p.communicate()
-        if p.returncode != 0:
-            unpackingerror = {'offset': offset, 'fatal': False,
-                              'reason': 'not a LZ4 legacy file'}
-            return {'status': False, 'error': unpackingerror}
-        labels.append('compressed')
-        labels.append('lz4')
-        unpackedfilesandlabels.append((outfile_rel, []))
-        return {'status': True, 'length': unpackedsize, 'labels': labels,
-                'filesandlabels': unpackedfilesandlabels}
+    if filename_full.suffix.lower() == '.lz4':
+        outfile_rel = os.path.join(unpackdir, filename_full.stem)
     else:
-        # first write the data to a temporary file
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, unpackedsize)
-        os.fdopen(temporaryfile[0]).close()
-        checkfile.close()
-
-        if filename_full.suffix.lower() == '.lz4':
-            outfile_rel = os.path.join(unpackdir, filename_full.stem)
-        else:
-            outfile_rel = os.path.join(unpackdir, "unpacked-from-lz4-legacy")
-        outfile_full = scanenvironment.unpack_path(outfile_rel)
-        p = subprocess.Popen(['lz4c', '-d', temporaryfile[1], outfile_full],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        (outputmsg, errormsg) = p.communicate()
-        os.unlink(temporaryfile[1])
+        outfile_rel = os.path.join(unpackdir, "unpacked-from-lz4-legacy")
+    outfile_full = scanenvironment.unpack_path(outfile_rel)
 
-        if p.returncode != 0:
-            unpackingerror = {'offset': offset, 'fatal': False,
-                              'reason': 'not a LZ4 legacy file'}
-            return {'status': False, 'error': unpackingerror}
+    # the blocks in the frame are decompressed one by one, which
+    # also determines where the frame ends.
+    checkfile = open(filename_full, 'rb')
+    checkdata = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
+    checkfile.close()
+    writer = HashingWriter(outfile_full, scanenvironment.get_hashthreads())
+    try:
+        unpackedsize = decompress_lz4_legacy(checkdata, offset, writer)
+    except DecompressionError:
+        unpackedsize = None
+    finally:
+        checkdata.close()
+        filehashes = writer.close()
+
+    if unpackedsize is None:
+        os.unlink(outfile_full)
+        unpackingerror = {'offset': offset, 'fatal': False,
+                          'reason': 'not a LZ4 legacy file'}
+        return {'status': False, 'error': unpackingerror}
 
-        unpackedfilesandlabels.append((outfile_rel, []))
-        return {'status': True, 'length': unpackedsize, 'labels': labels,
-                'filesandlabels': unpackedfilesandlabels}
+    if offset == 0 and unpackedsize == filesize:
+        labels.append('compressed')
+        labels.append('lz4')
 
-    unpackingerror = {'offset': offset+unpackedsize, 'fatal': False,
-                      'reason': 'invalid LZ4 legacy data'}
-    return {'status': False, 'error': unpackingerror}
+    unpackedfilesandlabels.append((outfile_rel, []))
+    return {'status': True, 'length': unpackedsize, 'labels': labels,
+            'filesandlabels': unpackedfilesandlabels,
+            'hashes': {outfile_rel: filehashes}}
 
 # https://github.com/lz4/lz4/blob/master/doc/lz4_Frame_format.md#legacy-frame
 unpack_lz4legacy.signatures = {'lz4_legacy': b'\x02\x21\x4c\x18'}
@@ -8197,14 +8242,6 @@ def unpack_pack200(fileresult, scanenvironment, offset, unpackdir):
     # the unpack200 tool only works on whole files. Finding out
     # where the file ends is TODO, but if there is data in front
     # of a valid pack200 file it is not a problem.
-    if offset != 0:
-        # create a temporary file and copy the data into the
-        # temporary file if offset != 0
-        checkfile = open(filename_full, 'rb')
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory)
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, filesize - offset)
-        os.fdopen(temporaryfile[0]).close()
-        checkfile.close()
 
     # write unpacked data to a JAR file
     outfile_rel = os.path.join(unpackdir, "unpacked.jar")
@@ -8213,21 +8250,20 @@ def unpack_pack200(fileresult, scanenvironment, offset, unpackdir):
     # create the unpacking directory
     os.makedirs(unpackdir_full, exist_ok=True)
 
-    # then extract the file
+    # then extract the file. If offset != 0 unpack200 reads
+    # the data from the offset on standard input.
     if offset != 0:
-        p = subprocess.Popen(['unpack200', temporaryfile[1], outfile_full],
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                             cwd=unpackdir_full)
+        (returncode, outputmsg, errormsg) = run_with_range_as_stdin(
+                ['unpack200', '-', outfile_full], filename_full, offset,
+                cwd=unpackdir_full)
     else:
         p = subprocess.Popen(['unpack200', filename_full, outfile_full],
                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                              cwd=unpackdir_full)
-    (outputmsg, errormsg) = p.communicate()
-
-    if offset != 0:
-        os.unlink(temporaryfile[1])
+        (outputmsg, errormsg) = p.communicate()
+        returncode = p.returncode
 
-    if p.returncode != 0:
+    if returncode != 0:
         # try to remove any files that were possibly left behind
         try:
             os.unlink(outfile_full)
@@ -9553,94 +9589,53 @@ def unpack_compress(fileresult, scanenvironment, offset, unpackdir):
     unpackedsize = 0
     unpackdir_full = scanenvironment.unpack_path(unpackdir)
 
-    # open the file, skip the magic
-    checkfile = open(filename_full, 'rb')
-    checkfile.seek(offset+2)
-
-    # the next byte contains the "bits per code" field
-    # which has to be between 9 (inclusive) and 16 (inclusive)
-    checkbytes = checkfile.read(1)
-    if len(checkbytes) != 1:
-        checkfile.close()
-        unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'not enough data for'}
-        return {'status': False, 'error': unpackingerror}
-
-    bitspercode = ord(checkbytes) & 0x1f
-    if bitspercode < 9 or bitspercode > 16:
-        checkfile.close()
-        unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'invalid bits per code'}
-        return {'status': False, 'error': unpackingerror}
-
-    # like deflate compress can work on streams
-    # As a test some data can be uncompressed.
-    # First seek back to the original offset...
-    checkfile.seek(offset)
-
-    # ... read some data...
-    testdata = checkfile.read(1024)
-
-    # ...and run 'uncompress' to see if anything can be compressed at all
-    p = subprocess.Popen(['uncompress'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    (standard_out, standard_error) = p.communicate(testdata)
-    if len(standard_out) == 0:
-        checkfile.close()
+    # compress'd data has no end marker, so the data is
+    # decompressed until the end of the file.
+    if filesize - offset < 4:
         unpackingerror = {'offset': offset, 'fatal': False,
-                          'reason': 'invalid compress\'d data'}
+                          'reason': 'not enough data'}
         return {'status': False, 'error': unpackingerror}
 
     # create the unpacking directory
     os.makedirs(unpackdir_full, exist_ok=True)
 
-    havetmpfile = False
-    if offset != 0:
-        temporaryfile = tempfile.mkstemp(dir=scanenvironment.temporarydirectory, suffix='.Z')
-        os.sendfile(temporaryfile[0], checkfile.fileno(), offset, filesize - offset)
-        os.fdopen(temporaryfile[0]).close()
-        havetmpfile = True
-
-    checkfile.close()
-
     if filename_full.suffix.lower() == '.z':
         outfile_rel = os.path.join(unpackdir, filename_full.stem)
     elif filename_full.suffix.lower() == '.tz':
         outfile_rel = os.path.join(unpackdir, filename_full.stem) + ".tar"
     else:
         outfile_rel = os.path.join(unpackdir, "unpacked-from-compress")
-
     outfile_full = scanenvironment.unpack_path(outfile_rel)
-    outfile = open(outfile_full, 'wb')
-
-    if havetmpfile:
-        p = subprocess.Popen(['uncompress', '-c', temporaryfile[1]], stdin=subprocess.PIPE, stdout=outfile, stderr=subprocess.PIPE)
-    else:
-        p = subprocess.Popen(['uncompress', '-c', filename_full], stdin=subprocess.PIPE, stdout=outfile, stderr=subprocess.PIPE)
 
-    (standard_out, standard_error) = p.communicate()
-    if p.returncode != 0 and standard_error != b'':
-        outfile.close()
+    # decompress in process: invalid data (including an invalid
+    # "bits per code" field) is detected while decompressing, so
+    # the data does not have to be tested first.
+    checkfile = open(filename_full, 'rb')
+    checkdata = mmap.mmap(checkfile.fileno(), 0, access=mmap.ACCESS_READ)
+    checkfile.close()
+    writer = HashingWriter(outfile_full, scanenvironment.get_hashthreads())
+    try:
+        unpackedsize = decompress_lzw(checkdata, offset, writer)
+    except DecompressionError:
+        unpackedsize = None
+    finally:
+        checkdata.close()
+        filehashes = writer.close()
+
+    if unpackedsize is None:
         os.unlink(outfile_full)
-        if havetmpfile:
-            os.unlink(temporaryfile[1])
         unpackingerror = {'offset': offset, 'fatal': False,
                           'reason': 'invalid compress file'}
         return {'status': False, 'error': unpackingerror}
 
-    outfile.close()
-
-    # clean up
-    if havetmpfile:
-        os.unlink(temporaryfile[1])
-
     unpackedfilesandlabels.append((outfile_rel, []))
-    unpackedsize = filesize - offset
 
     if offset == 0:
         labels.append('compress')
 
     return {'status': True, 'length': unpackedsize, 'labels': labels,
-            'filesandlabels': unpackedfilesandlabels}
+            'filesandlabels': unpackedfilesandlabels,
+            'hashes': {outfile_rel: filehashes}}
 
 # /usr/share/magic
 unpack_compress.signatures = {'compress': b'\x1f\x9d'}
@@ -0,0 +1,472 @@
+# Binary Analysis Next Generation (BANG!)
+#
+# This file is part of BANG.
+#
+# BANG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3,
+# as published by the Free Software Foundation.
+#
+# BANG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public
+# License, version 3, along with BANG.  If not, see
+# <http://www.gnu.org/licenses/>
+#
+# Licensed under the terms of the GNU Affero General Public License
+# version 3
+# SPDX-License-Identifier: AGPL-3.0-only
+
+# Native readers for virtual disk images: QEMU qcow2, VMware VMDK
+# (hosted sparse extents) and VirtualBox VDI.
+#
+# Virtual disks are usually thin provisioned: only the parts of the
+# guest disk that were written are stored in the image. The readers
+# parse the allocation tables of an image into a sorted list of
+# extents, (guest offset, size, host offset, compressed size), and
+# expose the guest disk as a lazy, seekable, read only file object:
+# data is only read (and decompressed) when it is needed and the parts
+# of the disk that are not allocated read as zeros.
+#
+# write_sparse() writes the guest disk as a sparse raw disk image in
+# which only the allocated extents are written, so a mostly empty
+# virtual disk of 64 GiB does not need 64 GiB of disk space.
+
+import bisect
+import io
+import os
+import struct
+import zlib
+
+from bangdatarange import sendfile_range
+
+
+class VirtualDiskError(Exception):
+    pass
+
+
+# the largest guest disk and file offset that can be written
+max_disk_size = (1 << 63) - 1
+
+
+class VirtualDisk(io.RawIOBase):
+    '''Base class for the guest disk in a virtual disk image at offset
+    in filename. Subclasses parse the allocation tables of the image
+    and set size (the size of the guest disk), length (the size of the
+    image in the file) and the list of extents, and implement
+    decompress() for images with compressed data.'''
+    def __init__(self, filename, offset):
+        self.fd = os.open(filename, os.O_RDONLY)
+        self.offset = offset
+        self.filesize = os.fstat(self.fd).st_size
+        self.position = 0
+        self.size = 0
+        self.length = 0
+        self.extents = []
+        self.cachedextent = None
+        self.cacheddata = b''
+        try:
+            self.parse()
+            if self.size > max_disk_size:
+                raise VirtualDiskError('virtual disk too large')
+        except VirtualDiskError:
+            os.close(self.fd)
+            raise
+        except (struct.error, OSError, ValueError, OverflowError) as e:
+            os.close(self.fd)
+            raise VirtualDiskError(e.args)
+        self.extentstarts = [extent[0] for extent in self.extents]
+
+    def parse(self):
+        raise NotImplementedError
+
+    def decompress(self, data, size):
+        raise VirtualDiskError('compressed data not supported')
+
+    def pread(self, size, position):
+        '''Read size bytes at position (relative to the start of the
+        image), which should be inside the file.'''
+        if position < 0 or self.offset + position + size > self.filesize:
+            raise VirtualDiskError('data cannot be outside of file')
+        data = os.pread(self.fd, size, self.offset + position)
+        if len(data) != size:
+            raise VirtualDiskError('not enough data')
+        return data
+
+    def add_extent(self, guestoffset, size, hostoffset, compressedsize=None):
+        '''Add an extent of the guest disk. Extents have to be added in
+        the order of the guest disk. Uncompressed extents that are
+        contiguous in both the guest disk and the image are merged.'''
+        if guestoffset < 0 or guestoffset >= self.size or guestoffset + size > self.size:
+            raise VirtualDiskError('data outside of virtual disk')
+        if size <= 0:
+            raise VirtualDiskError('invalid extent size')
+        if compressedsize is None:
+            if self.offset + hostoffset + size > self.filesize:
+                raise VirtualDiskError('data cannot be outside of file')
+            self.length = max(self.length, hostoffset + size)
+            if self.extents != []:
+                (lastguest, lastsize, lasthost, lastcompressed) = self.extents[-1]
+                if lastcompressed is None and lastguest + lastsize == guestoffset and \
+                        lasthost + lastsize == hostoffset:
+                    self.extents[-1] = (lastguest, lastsize + size, lasthost, None)
+                    return
+        else:
+            if self.offset + hostoffset + compressedsize > self.filesize:
+                raise VirtualDiskError('data cannot be outside of file')
+            self.length = max(self.length, hostoffset + compressedsize)
+        self.extents.append((guestoffset, size, hostoffset, compressedsize))
+
+    def read_extent(self, extent):
+        '''Return the (decompressed) data of an extent.'''
+        (guestoffset, size, hostoffset, compressedsize) = extent
+        if compressedsize is None:
+            return self.pread(size, hostoffset)
+        # keep the last decompressed extent, as it is usually read in
+        # smaller parts.
+        if extent != self.cachedextent:
+            try:
+                data = self.decompress(self.pread(compressedsize, hostoffset), size)
+            except zlib.error as e:
+                raise VirtualDiskError(e.args)
+            if len(data) != size:
+                raise VirtualDiskError('wrong size for decompressed data')
+            self.cachedextent = extent
+            self.cacheddata = data
+        return self.cacheddata
+
+    def allocated_size(self):
+        return sum(extent[1] for extent in self.extents)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, position, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            position += self.position
+        elif whence == os.SEEK_END:
+            position += self.size
+        if position < 0:
+            raise ValueError('negative seek position %d' % position)
+        self.position = position
+        return position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, b):
+        size = max(0, min(len(b), self.size - self.position))
+        view = memoryview(b)
+        done = 0
+        while done < size:
+            position = self.position + done
+            index = bisect.bisect_right(self.extentstarts, position) - 1
+            if index >= 0 and position < self.extents[index][0] + self.extents[index][1]:
+                extent = self.extents[index]
+                extentoffset = position - extent[0]
+                chunksize = min(size - done, extent[1] - extentoffset)
+                if extent[3] is None:
+                    view[done:done+chunksize] = self.pread(chunksize, extent[2] + extentoffset)
+                else:
+                    view[done:done+chunksize] = self.read_extent(extent)[extentoffset:extentoffset+chunksize]
+            else:
+                # not allocated: read zeros until the next extent
+                if index + 1 < len(self.extents):
+                    chunksize = min(size - done, self.extents[index+1][0] - position)
+                else:
+                    chunksize = size - done
+                view[done:done+chunksize] = bytes(chunksize)
+            done += chunksize
+        self.position += done
+        return done
+
+    def write_sparse(self, outfile_full):
+        '''Write the guest disk to outfile_full as a raw disk image. Only
+        the allocated extents are written, so parts of the guest disk
+        that are not allocated are holes in the output file.'''
+        outfile = open(outfile_full, 'wb')
+        try:
+            outfile.truncate(self.size)
+            for extent in self.extents:
+                if extent[3] is None:
+                    os.lseek(outfile.fileno(), extent[0], os.SEEK_SET)
+                    if sendfile_range(outfile.fileno(), self.fd, self.offset + extent[2],
+                                      extent[1]) != extent[1]:
+                        raise VirtualDiskError('not enough data')
+                else:
+                    os.pwrite(outfile.fileno(), self.read_extent(extent), extent[0])
+        except (OSError, ValueError, OverflowError) as e:
+            # for example a guest disk that is too large for the file
+            # system that it is unpacked to
+            raise VirtualDiskError(e.args)
+        finally:
+            outfile.close()
+
+    def close(self):
+        if not self.closed:
+            os.close(self.fd)
+        super().close()
+
+
+# QEMU qcow2 (version 2 and 3)
+# https://git.qemu.org/?p=qemu.git;a=blob;f=docs/interop/qcow2.txt;hb=HEAD
+qcow2_offset_mask = 0x00fffffffffffe00
+qcow2_compressed_flag = 1 << 62
+qcow2_zero_flag = 1
+
+# incompatible features that change how the image has to be read:
+# external data file and extended L2 entries
+qcow2_unsupported_features = (1 << 2) | (1 << 4)
+
+
+class Qcow2Disk(VirtualDisk):
+    def parse(self):
+        header = self.pread(72, 0)
+        (magic, version, backingfileoffset, backingfilesize, clusterbits,
+         self.size, cryptmethod, l1size, l1tableoffset, refcounttableoffset,
+         refcounttableclusters, nbsnapshots,
+         snapshotsoffset) = struct.unpack('>4sIQIIQIIQQIIQ', header)
+        if magic != b'QFI\xfb' or version not in [2, 3]:
+            raise VirtualDiskError('not a qcow2 image')
+        if clusterbits < 9 or clusterbits > 21:
+            raise VirtualDiskError('invalid cluster size')
+        if backingfileoffset != 0:
+            raise VirtualDiskError('images with a backing file not supported')
+        if cryptmethod != 0:
+            raise VirtualDiskError('encrypted images not supported')
+        self.clustersize = 1 << clusterbits
+        headerlength = 72
+        refcountorder = 4
+        compressiontype = 0
+        if version == 3:
+            (incompatiblefeatures, compatiblefeatures, autoclearfeatures,
+             refcountorder, headerlength) = struct.unpack('>QQQII', self.pread(32, 72))
+            if incompatiblefeatures & qcow2_unsupported_features != 0:
+                raise VirtualDiskError('unsupported qcow2 features')
+            if headerlength > 104:
+                compressiontype = self.pread(1, 104)[0]
+            if refcountorder > 6:
+                raise VirtualDiskError('invalid refcount order')
+        if compressiontype != 0:
+            raise VirtualDiskError('unsupported compression type')
+        self.length = max(headerlength, self.clustersize)
+
+        # compressed clusters have the number of additional 512 byte
+        # sectors in the upper bits of the host offset
+        compressedbits = 62 - (clusterbits - 8)
+        compressedoffsetmask = (1 << compressedbits) - 1
+
+        # every L2 table is a cluster with 8 byte entries
+        l2entries = self.clustersize // 8
+        if l1size * l2entries * self.clustersize < self.size:
+            raise VirtualDiskError('L1 table too small')
+        lastcompressed = None
+        l1table = struct.unpack('>%dQ' % l1size, self.pread(l1size * 8, l1tableoffset))
+        self.length = max(self.length, l1tableoffset + l1size * 8)
+        for l1index, l1entry in enumerate(l1table):
+            l2tableoffset = l1entry & qcow2_offset_mask
+            if l2tableoffset == 0:
+                continue
+            l2table = struct.unpack('>%dQ' % l2entries, self.pread(self.clustersize, l2tableoffset))
+            self.length = max(self.length, l2tableoffset + self.clustersize)
+            for l2index, l2entry in enumerate(l2table):
+                guestoffset = (l1index * l2entries + l2index) * self.clustersize
+                if l2entry & qcow2_compressed_flag:
+                    hostoffset = l2entry & compressedoffsetmask
+                    sectors = ((l2entry & ~qcow2_compressed_flag) >> compressedbits) + 1
+                    compressedsize = sectors * 512 - (hostoffset & 511)
+                    # the last compressed cluster can end before the
+                    # last sector
+                    compressedsize = min(compressedsize, self.filesize - self.offset - hostoffset)
+                    if compressedsize <= 0:
+                        raise VirtualDiskError('compressed data outside of file')
+                    self.add_extent(guestoffset, min(self.clustersize, self.size - guestoffset),
+                                    hostoffset, compressedsize)
+                    if lastcompressed is None or hostoffset > lastcompressed[2]:
+                        lastcompressed = self.extents[-1]
+                    continue
+                hostoffset = l2entry & qcow2_offset_mask
+                if hostoffset == 0 or l2entry & qcow2_zero_flag:
+                    # not allocated, or explicitly zero
+                    continue
+                self.add_extent(guestoffset, min(self.clustersize, self.size - guestoffset),
+                                hostoffset)
+
+        # the size of compressed data is only recorded in sectors, so
+        # if the image ends with compressed data find the exact end.
+        if lastcompressed is not None and lastcompressed[2] + lastcompressed[3] == self.length:
+            decompressor = zlib.decompressobj(-12)
+            try:
+                decompressor.decompress(self.pread(lastcompressed[3], lastcompressed[2]))
+            except zlib.error as e:
+                raise VirtualDiskError(e.args)
+            if decompressor.eof:
+                self.length -= len(decompressor.unused_data)
+
+        # the refcount blocks record which clusters are in use, which
+        # also includes clusters that are not part of the guest disk,
+        # such as the snapshot tables.
+        refcountbits = 1 << refcountorder
+        refcountentries = self.clustersize * 8 // refcountbits
+        refcounttablesize = refcounttableclusters * self.clustersize
+        refcounttable = struct.unpack('>%dQ' % (refcounttablesize // 8),
+                                      self.pread(refcounttablesize, refcounttableoffset))
+        self.length = max(self.length, refcounttableoffset + refcounttablesize)
+        for refcountindex in range(len(refcounttable) - 1, -1, -1):
+            refcountblockoffset = refcounttable[refcountindex] & ~511
+            if refcountblockoffset == 0:
+                continue
+            self.length = max(self.length, refcountblockoffset + self.clustersize)
+            refcounts = self.pread(self.clustersize, refcountblockoffset).rstrip(b'\x00')
+            if refcounts == b'':
+                continue
+            lastcluster = refcountindex * refcountentries + \
+                    (len(refcounts) * 8 + refcountbits - 1) // refcountbits
+            # the last cluster in use can be partially used (compressed
+            # data), so only use the refcounts if clusters are in use
+            # after the last known structure.
+            if (lastcluster - 1) * self.clustersize >= self.length:
+                self.length = lastcluster * self.clustersize
+            break
+        self.length = min(self.length, self.filesize - self.offset)
+
+    def decompress(self, data, size):
+        # raw deflate without a header, followed by padding
+        return zlib.decompressobj(-12).decompress(data, size)
+
+
+# VMware VMDK hosted sparse extents
+# https://www.vmware.com/support/developer/vddk/vmdk_50_technote.pdf
+vmdk_gd_at_end = 0xffffffffffffffff
+vmdk_flag_compressed = 1 << 16
+vmdk_flag_markers = 1 << 17
+
+
+class VmdkSparseDisk(VirtualDisk):
+    def parse(self):
+        header = self.pread(512, 0)
+        (magic, version, flags, capacity, grainsize, descriptoroffset,
+         descriptorsize, numgtesperthe, rgdoffset, gdoffset, overhead,
+         uncleanshutdown, singleendlinechar, nonendlinechar,
+         doubleendlinechar1, doubleendlinechar2,
+         compressalgorithm) = struct.unpack('<4sIIQQQQIQQQ?ccccH', header[:79])
+        if magic != b'KDMV' or version not in [1, 2, 3]:
+            raise VirtualDiskError('not a VMDK sparse extent')
+        self.length = 512
+        if gdoffset == vmdk_gd_at_end:
+            # stream optimized images have the header with the real
+            # grain directory offset in a footer at the end of the
+            # image, followed by an end of stream marker.
+            if self.filesize - self.offset < 1536:
+                raise VirtualDiskError('not enough data for footer')
+            header = self.pread(512, self.filesize - self.offset - 1024)
+            (magic, version, flags, capacity, grainsize, descriptoroffset,
+             descriptorsize, numgtesperthe, rgdoffset, gdoffset, overhead,
+             uncleanshutdown, singleendlinechar, nonendlinechar,
+             doubleendlinechar1, doubleendlinechar2,
+             compressalgorithm) = struct.unpack('<4sIIQQQQIQQQ?ccccH', header[:79])
+            if magic != b'KDMV' or gdoffset == vmdk_gd_at_end:
+                raise VirtualDiskError('invalid footer')
+            self.length = self.filesize - self.offset
+        if grainsize == 0 or grainsize & (grainsize - 1) != 0 or numgtesperthe == 0:
+            raise VirtualDiskError('invalid grain size')
+        if flags & vmdk_flag_compressed and compressalgorithm != 1:
+            raise VirtualDiskError('unsupported compression algorithm')
+        self.compressed = flags & vmdk_flag_compressed != 0
+        self.size = capacity * 512
+        self.grainsize = grainsize * 512
+        if self.size > max_disk_size:
+            raise VirtualDiskError('virtual disk too large')
+        if descriptoroffset != 0:
+            self.length = max(self.length, (descriptoroffset + descriptorsize) * 512)
+        self.length = max(self.length, overhead * 512)
+
+        # the grain directory has a grain table for every numGTEsPerGT
+        # grains. Both have 4 byte entries with sector numbers.
+        gtcoverage = numgtesperthe * self.grainsize
+        if gtcoverage > max_disk_size:
+            raise VirtualDiskError('invalid grain table coverage')
+        gdentries = (self.size + gtcoverage - 1) // gtcoverage
+        rgdend = self.parse_grain_directory(rgdoffset, gdentries, numgtesperthe, False)
+        gdend = self.parse_grain_directory(gdoffset, gdentries, numgtesperthe, True)
+        self.length = max(self.length, rgdend, gdend)
+        self.length = min(self.length, self.filesize - self.offset)
+
+    def parse_grain_directory(self, gdoffset, gdentries, numgtesperthe, addextents):
+        '''Parse the (redundant) grain directory and the grain tables.
+        Returns the end of the structures, and if addextents is set also
+        adds the allocated grains.'''
+        if gdoffset == 0:
+            return 0
+        end = gdoffset * 512 + gdentries * 4
+        graindirectory = struct.unpack('<%dI' % gdentries, self.pread(gdentries * 4, gdoffset * 512))
+        for gdindex, gtoffset in enumerate(graindirectory):
+            if gtoffset == 0:
+                continue
+            end = max(end, gtoffset * 512 + numgtesperthe * 4)
+            if not addextents:
+                continue
+            graintable = struct.unpack('<%dI' % numgtesperthe,
+                                       self.pread(numgtesperthe * 4, gtoffset * 512))
+            for gtindex, grainoffset in enumerate(graintable):
+                # 0: not allocated, 1: zeroed grain
+                if grainoffset <= 1:
+                    continue
+                guestoffset = (gdindex * numgtesperthe + gtindex) * self.grainsize
+                if guestoffset >= self.size:
+                    break
+                size = min(self.grainsize, self.size - guestoffset)
+                if self.compressed:
+                    # compressed grains start with a marker with the
+                    # sector of the grain and the size of the data
+                    (lba, compressedsize) = struct.unpack('<QI', self.pread(12, grainoffset * 512))
+                    if lba * 512 != guestoffset:
+                        raise VirtualDiskError('wrong sector in grain marker')
+                    self.add_extent(guestoffset, size, grainoffset * 512 + 12, compressedsize)
+                else:
+                    self.add_extent(guestoffset, size, grainoffset * 512)
+        return end
+
+    def decompress(self, data, size):
+        return zlib.decompressobj().decompress(data, size)
+
+
+# VirtualBox VDI
+# https://forums.virtualbox.org/viewtopic.php?t=8046
+vdi_block_free = 0xffffffff
+vdi_block_zero = 0xfffffffe
+
+
+class VdiDisk(VirtualDisk):
+    def parse(self):
+        header = self.pread(0x190 + 0x40, 0)
+        if header[0x40:0x44] != b'\x7f\x10\xda\xbe':
+            raise VirtualDiskError('not a VDI image')
+        (headersize, imagetype) = struct.unpack('<II', header[0x48:0x50])
+        (blocksoffset, dataoffset) = struct.unpack('<II', header[0x154:0x15c])
+        (sectorsize,) = struct.unpack('<I', header[0x168:0x16c])
+        (self.size, blocksize, blockextradata, blocksinhdd,
+         blocksallocated) = struct.unpack('<QIIII', header[0x170:0x188])
+        if headersize != 0x190 or sectorsize != 512:
+            raise VirtualDiskError('unsupported VDI header')
+        # differencing images need their parent
+        if imagetype not in [1, 2]:
+            raise VirtualDiskError('unsupported image type')
+        if blocksize == 0 or blocksinhdd * blocksize < self.size:
+            raise VirtualDiskError('invalid block size')
+        blocks = struct.unpack('<%dI' % blocksinhdd, self.pread(blocksinhdd * 4, blocksoffset))
+        self.length = max(blocksoffset + blocksinhdd * 4,
+                          dataoffset + blocksallocated * (blocksize + blockextradata))
+        for index, block in enumerate(blocks):
+            if block in [vdi_block_free, vdi_block_zero]:
+                continue
+            if block >= blocksallocated:
+                raise VirtualDiskError('invalid block number')
+            guestoffset = index * blocksize
+            self.add_extent(guestoffset, min(blocksize, self.size - guestoffset),
+                            dataoffset + block * (blocksize + blockextradata) + blockextradata)
@@ -1,13 +1,13 @@
 
 import os
 import pathlib
-from UnpackParser import UnpackParser, WrappedUnpackParser
+from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
 from FileResult import FileResult
-from bangunpack import unpack_tar
+from FileContentsComputer import Hasher, adaptive_read_size, hash_algorithms
 import tarfile
 
-class wTarUnpackParser(WrappedUnpackParser):
+class TarUnpackParser(UnpackParser):
     extensions = ['.tar']
     signatures = [
         (0x101, b'ustar\x00'),
@@ -15,60 +15,141 @@ class wTarUnpackParser(WrappedUnpackParser):
     ]
     pretty_name = 'tar'
 
-    def unpack_function(self, fileresult, scan_environment, offset, unpack_dir):
-        return unpack_tar(fileresult, scan_environment, offset, unpack_dir)
+    def parse(self):
+        try:
+            self.unpacktar = tarfile.open(fileobj=self.infile, mode='r:')
+        except tarfile.TarError as e:
+            raise UnpackParserException(e.args)
 
+        # tar is a concatenation of files. It could be that a tar file
+        # has been cut halfway, but then the members before the cut
+        # can still be unpacked. Only the data of the last member can
+        # be missing, as tarfile stops at the first header it cannot
+        # read.
+        self.tarinfos = []
+        truncated = False
+        while True:
+            try:
+                tarinfo = self.unpacktar.next()
+            except tarfile.TarError as e:
+                check_condition(self.tarinfos != [], e.args)
+                truncated = True
+                break
+            if tarinfo is None:
+                break
+            self.tarinfos.append(tarinfo)
+        available = self.fileresult.filesize - self.offset
+        end_of_data = self.unpacktar.offset
+        if truncated or end_of_data > available:
+            end_of_data = self.tarinfos.pop().offset
+        check_condition(self.tarinfos != [], "no complete tar members")
 
-class TarUnpackParser(UnpackParser):
-    #extensions = ['.tar']
-    extensions = []
-    signatures = [
-        (0x101, b'ustar\x00'),
-        (0x101, b'ustar\x20\x20\x00')
-    ]
-    pretty_name = 'tar'
+        # GNU tar pads archives with blocks of NUL bytes (the end of
+        # archive marker, plus up to 20 blocks depending on the settings).
+        # These are not read by Python's tarfile module, so explicitly
+        # check for them.
+        self.infile.seek(end_of_data)
+        while end_of_data < available:
+            checkbytes = self.infile.read(512)
+            if checkbytes != b'\x00' * 512:
+                break
+            end_of_data += 512
+        self.unpacked_size = end_of_data
 
-    def tar_unpack_regular(self, outfile_rel, tarinfo):
-        # TODO: absolute paths
-        #print(outfile_rel)
-        if outfile_rel.is_absolute():
-            raise UnpackParserException("trying to extract to absolute path")
-        else:
-            outfile_full = self.scan_environment.unpack_path(outfile_rel)
-            os.makedirs(outfile_full.parent, exist_ok=True)
-            outfile = open(outfile_full, 'wb')
-            tar_reader = self.unpacktar.extractfile(tarinfo)
-            outfile.write(tar_reader.read())
+    def calculate_unpacked_size(self):
+        pass
+
+    def _unpack_path(self, name):
+        '''Return the path relative to the unpack root for a name in the
+        tar file, or None if the member should not be unpacked. Absolute
+        names are unpacked relative to the unpack directory, names that
+        end up outside of the unpack directory are not unpacked.'''
+        name = os.path.normpath(os.path.relpath(name, '/') if os.path.isabs(name) else name)
+        if name == '.' or name == '..' or name.startswith('../'):
+            return None
+        outfile_rel = self.rel_unpack_dir / name
+
+        # do not follow symbolic links from the tar file out of the
+        # unpack directory
+        unpack_dir_full = os.path.realpath(self.scan_environment.unpack_path(self.rel_unpack_dir))
+        outfile_full = self.scan_environment.unpack_path(outfile_rel)
+        parent_full = os.path.realpath(outfile_full.parent)
+        if os.path.commonpath([unpack_dir_full, parent_full]) != unpack_dir_full:
+            return None
+        return outfile_rel
+
+    def tar_unpack_regular(self, outfile_full, tarinfo):
+        '''Copy the data of a member in chunks, computing the hashes of
+        the data on the way, so the scan does not have to do that again.'''
+        hasher = Hasher(hash_algorithms, self.scan_environment.get_hashthreads())
+        hasher.initialize()
+        read_size = adaptive_read_size(tarinfo.size,
+                                       self.scan_environment.get_readsize(),
+                                       self.scan_environment.get_maxreadsize())
+        buf = bytearray(read_size)
+        bufview = memoryview(buf)
+        tar_reader = self.unpacktar.extractfile(tarinfo)
+        outfile = open(outfile_full, 'wb')
+        try:
+            while True:
+                bytes_read = tar_reader.readinto(buf)
+                if bytes_read == 0:
+                    break
+                outfile.write(bufview[:bytes_read])
+                hasher.compute(bufview[:bytes_read])
+        except (OSError, tarfile.TarError) as e:
+            raise UnpackParserException(e.args)
+        finally:
             outfile.close()
+            tar_reader.close()
+        hasher.finalize()
+        return hasher.get()
 
     def unpack(self):
-        unpacked_files = []
+        unpacked_files = {}
         for tarinfo in self.tarinfos:
-            file_path = pathlib.Path(tarinfo.name)
-            outfile_rel = self.rel_unpack_dir / file_path
-            if tarinfo.isfile(): # normal file
-                self.tar_unpack_regular(outfile_rel, tarinfo)
-                pass
-            elif tarinfo.issym(): # symlink
-                pass
-            elif tarinfo.islnk(): # hard link
-                pass
-            elif tarinfo.isdir(): # directory
-                pass
+            # don't unpack block devices, character devices or FIFO
+            if not (tarinfo.isreg() or tarinfo.isdir() or tarinfo.issym() or tarinfo.islnk()):
+                continue
+            outfile_rel = self._unpack_path(tarinfo.name)
+            if outfile_rel is None:
+                continue
+            outfile_full = self.scan_environment.unpack_path(outfile_rel)
+            os.makedirs(outfile_full.parent, exist_ok=True)
+
+            # members with the same name can be stored in a tar file,
+            # for example when using 'tar --append'. The last one wins.
+            if os.path.lexists(outfile_full) and not (tarinfo.isdir() and outfile_full.is_dir()):
+                if outfile_full.is_dir() and not outfile_full.is_symlink():
+                    continue
+                os.unlink(outfile_full)
 
+            hashes = {}
             out_labels = []
-            fr = FileResult(self.fileresult, self.rel_unpack_dir / file_path, set(out_labels))
-            unpacked_files.append(fr)
-        return unpacked_files
+            if tarinfo.isdir():
+                os.makedirs(outfile_full, exist_ok=True)
+                out_labels = ['directory']
+            elif tarinfo.issym():
+                os.symlink(tarinfo.linkname, outfile_full)
+                out_labels = ['symbolic link']
+            elif tarinfo.islnk():
+                link_rel = self._unpack_path(tarinfo.linkname)
+                if link_rel is not None and self.scan_environment.unpack_path(link_rel).is_file():
+                    os.link(self.scan_environment.unpack_path(link_rel), outfile_full)
+                    out_labels = ['hardlink']
+                else:
+                    # the target was not unpacked, so unpack its data
+                    hashes = self.tar_unpack_regular(outfile_full, tarinfo)
+            else:
+                hashes = self.tar_unpack_regular(outfile_full, tarinfo)
 
-    def parse(self):
-        try:
-            self.unpacktar = tarfile.open(fileobj=self.infile, mode='r')
-        except tarfile.TarError as e:
-            raise UnpackParserException(e.args)
-        try:
-            self.tarinfos = self.unpacktar.getmembers()
-        except tarfile.TarError as e:
-            raise UnpackParserException(e.args)
+            fr = FileResult(self.fileresult, outfile_rel, set(out_labels))
+            for hash_algorithm, hash_value in hashes.items():
+                fr.set_hashresult(hash_algorithm, hash_value)
+            unpacked_files[outfile_rel] = fr
+        return list(unpacked_files.values())
 
+    def set_metadata_and_labels(self):
+        self.unpack_results.set_labels(['tar', 'archive'])
+        self.unpack_results.set_metadata({})
 
@@ -1,5 +1,8 @@
 import sys, os
 import pytest
+import hashlib
+import io
+import tarfile
 from test.util import *
 from UnpackParserException import UnpackParserException
 
@@ -28,10 +31,12 @@ def test_load_absolute_tar_file(scan_environment):
     p.open()
     r = p.parse_and_unpack()
     p.close()
-    extracted_fn = "/tmp/test.sgi"
+    # absolute names are unpacked relative to the unpack directory
+    extracted_fn = data_unpack_dir / 'tmp' / 'test.sgi'
     assert r.get_unpacked_files()[0].filename == extracted_fn
     assert r.get_unpacked_files()[0].labels == set()
-    # TODO: check where file is extracted
+    assert scan_environment.unpack_path(extracted_fn).stat().st_size == 592418
+    assert r.get_unpacked_files()[1].labels == set(['directory'])
 
 
 def test_invalid_file_not_tar(scan_environment):
@@ -46,3 +51,90 @@ def test_invalid_file_not_tar(scan_environment):
     p.close()
 
 
+
+def _create_tar_file(path):
+    data = bytes(range(256)) * 4000
+    with tarfile.open(path, 'w', format=tarfile.GNU_FORMAT) as tar:
+        tarinfo = tarfile.TarInfo('dir')
+        tarinfo.type = tarfile.DIRTYPE
+        tar.addfile(tarinfo)
+        tarinfo = tarfile.TarInfo('dir/data')
+        tarinfo.size = len(data)
+        tar.addfile(tarinfo, io.BytesIO(data))
+        tarinfo = tarfile.TarInfo('link')
+        tarinfo.type = tarfile.SYMTYPE
+        tarinfo.linkname = 'dir/data'
+        tar.addfile(tarinfo)
+        tarinfo = tarfile.TarInfo('hardlink')
+        tarinfo.type = tarfile.LNKTYPE
+        tarinfo.linkname = 'dir/data'
+        tar.addfile(tarinfo)
+        tarinfo = tarfile.TarInfo('../outside')
+        tarinfo.size = 5
+        tar.addfile(tarinfo, io.BytesIO(b'data\n'))
+        tarinfo = tarfile.TarInfo('fifo')
+        tarinfo.type = tarfile.FIFOTYPE
+        tar.addfile(tarinfo)
+    return data
+
+def test_unpack_members(scan_environment):
+    scan_environment.readsize = 4096
+    rel_testfile = pathlib.Path('test.tar')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    data = _create_tar_file(abs_testfile)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = TarUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == abs_testfile.stat().st_size
+    assert r.get_labels() == ['tar', 'archive']
+    unpacked_files = dict((x.filename, x) for x in r.get_unpacked_files())
+    assert sorted(unpacked_files) == [data_unpack_dir / 'dir',
+            data_unpack_dir / 'dir' / 'data', data_unpack_dir / 'hardlink',
+            data_unpack_dir / 'link']
+    assert unpacked_files[data_unpack_dir / 'link'].labels == set(['symbolic link'])
+    assert unpacked_files[data_unpack_dir / 'hardlink'].labels == set(['hardlink'])
+    assert scan_environment.unpack_path(data_unpack_dir / 'dir' / 'data').read_bytes() == data
+    assert scan_environment.unpack_path(data_unpack_dir / 'link').read_bytes() == data
+    assert not scan_environment.unpack_path('outside').exists()
+
+    # the hashes are computed while unpacking
+    hashes = unpacked_files[data_unpack_dir / 'dir' / 'data'].get_hashresult()
+    assert hashes['sha256'] == hashlib.sha256(data).hexdigest()
+    assert hashes['md5'] == hashlib.md5(data).hexdigest()
+
+def test_unpack_with_offset(scan_environment):
+    padding_length = 17
+    orig_testfile = testdir_base / 'testdata' / 'unpackers' / 'tar' / 'test.tar'
+    rel_testfile = pathlib.Path('prepend-test.tar')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    with open(abs_testfile, 'wb') as f:
+        f.write(b'A' * padding_length)
+        f.write(orig_testfile.read_bytes())
+        f.write(b'trailing data')
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = TarUnpackParser(fr, scan_environment, data_unpack_dir, padding_length)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == orig_testfile.stat().st_size
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'test.sgi')
+    assert unpacked_path_abs.stat().st_size == 592418
+
+def test_unpack_truncated_file(scan_environment):
+    rel_testfile = pathlib.Path('truncated.tar')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    data = _create_tar_file(abs_testfile)
+    # cut the file in the data of the first file
+    abs_testfile.write_bytes(abs_testfile.read_bytes()[:10000])
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = TarUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    # only the directory could be unpacked
+    assert r.get_length() == 512
+    assert [x.filename for x in r.get_unpacked_files()] == [pathlib.Path('some_dir') / 'dir']
@@ -0,0 +1,92 @@
+import sys, os
+import io
+import zipfile
+from test.util import *
+
+import bangunpack
+from .UnpackParser import ZipUnpackParser
+
+test_members = [
+    ('stored.txt', b'stored data\n' * 1000, zipfile.ZIP_STORED),
+    ('dir/deflated.bin', bytes(range(256)) * 1000, zipfile.ZIP_DEFLATED),
+    ('dir/subdir/bzip2.bin', b'bzip2 data' * 5000, zipfile.ZIP_BZIP2),
+    ('lzma.bin', b'lzma data' * 5000, zipfile.ZIP_LZMA),
+    ('../outside.txt', b'outside\n', zipfile.ZIP_DEFLATED),
+]
+
+def _create_zip_file(members):
+    zipdata = io.BytesIO()
+    with zipfile.ZipFile(zipdata, 'w') as z:
+        z.writestr('dir/', b'')
+        for (name, data, compress_type) in members:
+            z.writestr(name, data, compress_type=compress_type)
+    return zipdata.getvalue()
+
+def _unpack_zip(scan_environment, data, offset):
+    rel_testfile = pathlib.Path('test.zip')
+    scan_environment.unpack_path(rel_testfile).write_bytes(data)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = ZipUnpackParser(fr, scan_environment, data_unpack_dir, offset)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    return (r, data_unpack_dir)
+
+def _check_unpacked_members(scan_environment, r, data_unpack_dir):
+    unpacked_files = set(x.filename for x in r.get_unpacked_files())
+    for (name, data, compress_type) in test_members:
+        name = name.replace('../', '')
+        assert data_unpack_dir / name in unpacked_files
+        assert scan_environment.unpack_path(data_unpack_dir / name).read_bytes() == data
+    assert data_unpack_dir / 'dir' / 'subdir' in unpacked_files
+
+def test_unpack_zip_file(scan_environment):
+    data = _create_zip_file(test_members)
+    r, data_unpack_dir = _unpack_zip(scan_environment, data, 0)
+    assert r.get_length() == len(data)
+    assert 'zip' in r.get_labels()
+    _check_unpacked_members(scan_environment, r, data_unpack_dir)
+
+def test_unpack_zip_file_with_offset(scan_environment):
+    data = _create_zip_file(test_members)
+    padding_length = 17
+    r, data_unpack_dir = _unpack_zip(scan_environment,
+            b'A' * padding_length + data + b'trailing data', padding_length)
+    assert r.get_length() == len(data)
+    assert 'zip' not in r.get_labels()
+    _check_unpacked_members(scan_environment, r, data_unpack_dir)
+    # no temporary copy of the ZIP data was made
+    assert os.listdir(scan_environment.temporarydirectory) == []
+
+def test_unpack_zip_file_in_parallel(scan_environment, monkeypatch):
+    monkeypatch.setattr(bangunpack, 'zipbatchsize', 1)
+    scan_environment.unpackthreads = 3
+    data = _create_zip_file(test_members)
+    r, data_unpack_dir = _unpack_zip(scan_environment, data, 0)
+    _check_unpacked_members(scan_environment, r, data_unpack_dir)
+
+def test_unpack_zip_file_with_bad_crc(scan_environment):
+    data = _create_zip_file([('deflated.bin', b'data' * 1000, zipfile.ZIP_DEFLATED)])
+    # change the CRC in the central directory
+    crc_offset = data.rindex(b'PK\x01\x02') + 16
+    data = data[:crc_offset] + bytes([data[crc_offset] ^ 0xff]) + data[crc_offset+1:]
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        _unpack_zip(scan_environment, data, 0)
+
+def test_unpack_zip_file_with_bad_crc_of_stored_member(scan_environment):
+    data = _create_zip_file([('stored.bin', b'data' * 1000, zipfile.ZIP_STORED)])
+    crc_offset = data.rindex(b'PK\x01\x02') + 16
+    data = data[:crc_offset] + bytes([data[crc_offset] ^ 0xff]) + data[crc_offset+1:]
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        _unpack_zip(scan_environment, data, 0)
+
+def test_unpack_zip_file_in_parallel_with_bad_crc(scan_environment, monkeypatch):
+    monkeypatch.setattr(bangunpack, 'zipbatchsize', 1)
+    scan_environment.unpackthreads = 3
+    members = test_members + [('stored.bin', b'data' * 1000, zipfile.ZIP_STORED)]
+    data = _create_zip_file(members)
+    crc_offset = data.rindex(b'PK\x01\x02') + 16
+    data = data[:crc_offset] + bytes([data[crc_offset] ^ 0xff]) + data[crc_offset+1:]
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        _unpack_zip(scan_environment, data, 0)
@@ -27,6 +27,7 @@ import zlib
 import tlsh
 import mutf8
 
+from bangparallel import ordered_map
 from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
 from kaitaistruct import ValidationNotEqualError
@@ -106,13 +107,82 @@ DEX_037 = DEX_035_OPCODES | DEX_037_OPCODES
 DEX_038 = DEX_035_OPCODES | DEX_037_OPCODES | DEX_038_OPCODES
 DEX_039 = DEX_035_OPCODES | DEX_037_OPCODES | DEX_038_OPCODES | DEX_039_OPCODES
 
-ALL_DEX_VERSIONS = sorted(['035', '037', '038', '039'])
-
 OPCODES = {'035': DEX_035,
            '037': DEX_037,
            '038': DEX_038,
            '039': DEX_039}
 
+# For decoding the opcodes are turned into tables of 256 bytes, with
+# for every opcode the length of the instruction in bytes, or 0 if the
+# opcode is not valid in that version.
+INSTRUCTION_LENGTHS = {version: bytes(opcodes.get(opcode, 0) * 2 for opcode in range(256))
+                       for version, opcodes in OPCODES.items()}
+
+# Opcodes that need more than skipping the instruction: nop (which
+# is also used for the payloads of fill-array-data, packed-switch and
+# sparse-switch), const-string, const-string/jumbo and invalid opcodes.
+SPECIAL_OPCODES = {version: frozenset([0x00, 0x1a, 0x1b]) |
+                            frozenset(opcode for opcode in range(256) if lengths[opcode] == 0)
+                   for version, lengths in INSTRUCTION_LENGTHS.items()}
+
+# the amount of methods that is used to detect the opcode version
+OPCODE_VERSION_SAMPLE_SIZE = 256
+
+def decode_bytecode(bytecode, opcode_version):
+    '''Decode bytecode using the opcodes of opcode_version and return
+    the string ids used by const-string and const-string/jumbo, and
+    whether or not all of the bytecode could be decoded. Decoding
+    stops at the first invalid instruction.'''
+    instruction_lengths = INSTRUCTION_LENGTHS[opcode_version]
+    special_opcodes = SPECIAL_OPCODES[opcode_version]
+    string_ids = []
+    counter = 0
+    len_bytecode = len(bytecode)
+    while counter < len_bytecode:
+        opcode = bytecode[counter]
+        if opcode not in special_opcodes:
+            counter += instruction_lengths[opcode]
+            continue
+
+        if opcode == 0x00:
+            # The payloads use a pseudo opcode: nop with an identifier.
+            # Payloads of an odd length are padded with a nop byte.
+            payload = bytecode[counter+1] if counter + 8 <= len_bytecode else 0
+            if payload == 1:
+                # packed-switch-payload: size, first key, targets
+                size = int.from_bytes(bytecode[counter+2:counter+4], byteorder='little')
+                counter += 8 + size * 4
+            elif payload == 2:
+                # sparse-switch-payload: size, keys, targets
+                size = int.from_bytes(bytecode[counter+2:counter+4], byteorder='little')
+                counter += 4 + size * 8
+            elif payload == 3:
+                # fill-array-data-payload: element width, size, data
+                element_width = int.from_bytes(bytecode[counter+2:counter+4], byteorder='little')
+                size = int.from_bytes(bytecode[counter+4:counter+8], byteorder='little')
+                counter += 8 + size * element_width
+                counter += counter % 2
+            else:
+                counter += 2
+        elif opcode == 0x1a and counter + 4 <= len_bytecode:
+            # const-string
+            string_ids.append(int.from_bytes(bytecode[counter+2:counter+4], byteorder='little'))
+            counter += 4
+        elif opcode == 0x1b and counter + 6 <= len_bytecode:
+            # const-string/jumbo
+            string_ids.append(int.from_bytes(bytecode[counter+2:counter+6], byteorder='little'))
+            counter += 6
+        else:
+            return string_ids, False
+    return string_ids, counter == len_bytecode
+
+def hash_bytecode(bytecode):
+    '''Compute the SHA256 and TLSH hashes of the bytecode of a method'''
+    tlsh_hash = tlsh.hash(bytecode)
+    if tlsh_hash == 'TNULL':
+        tlsh_hash = None
+    return {'sha256': hashlib.sha256(bytecode).hexdigest(), 'tlsh': tlsh_hash}
+
 class DexUnpackParser(UnpackParser):
     extensions = []
     signatures = [
@@ -124,152 +194,29 @@ class DexUnpackParser(UnpackParser):
     ]
     pretty_name = 'dex'
 
-    def parse_bytecode(self, bytecode, opcode_version=None):
-        # parse enough of the bytecode to be able to extract the strings
-        if opcode_version == None:
-            version_str = self.data.header.version_str
-        else:
-            version_str = opcode_version
-
-        # select the correct opcodes
-        opcodes = OPCODES[version_str]
-
-        len_bytecode = len(bytecode)
-
-        # keep track of which versions of the opcodes have been tried.
-        # It could be that the code has been optimized and a different
-        # set of opcodes needs to be tried.
-        tried_versions = [version_str]
-        all_versions_tried = False
-        retry = False
-
-        while not all_versions_tried:
-            counter = 0
-            string_ids = []
-            if retry:
-                if sorted(tried_versions) == ALL_DEX_VERSIONS:
-                    all_versions_tried = True
-                    break
-                for o in ALL_DEX_VERSIONS:
-                    if o not in tried_versions:
-                        opcodes = OPCODES[o]
-                        tried_versions.append(o)
-                        break
-                retry = False
-            while counter < len_bytecode:
-                # read the first instruction
-                opcode = bytecode[counter]
-
-                # check if there are nop instructions to
-                # keep the bytecode byte aligned
-                if len_bytecode - counter == 1:
-                    if opcode == 0:
-                        counter += 1
-                        continue
-
-                # TODO: length sanity check
-
-                # process the byte code to find strings. The interesting
-                # instructions are:
-                #
-                # - const-string (0x1a)
-                # - const-string/jumbo (0x1b)
-                #
-                # Some instructions contain extra data and they need to be
-                # parsed separately and then be skipped.
-                #
-                # - fill-array-data (0x26)
-                # - packed-switch (0x2b)
-                # - sparse-switch (0x2c)
-                if opcode == 0x1a:
-                    string_id = int.from_bytes(bytecode[counter+2:counter+4], byteorder='little')
-                    string_ids.append(string_id)
-                elif opcode == 0x1b:
-                    string_id = int.from_bytes(bytecode[counter+2:counter+6], byteorder='little')
-                    string_ids.append(string_id)
-                elif opcode == 0x00:
-                    # the payloads for fill-array-data, packed-switch and sparse-switch
-                    # use a pseudo opcode
-                    if bytecode[counter+1] == 1:
-                        # packed-switch-payload
-                        try:
-                            counter += opcodes[opcode] * 2
-                        except:
-                            retry = True
-                            break
-
-                        # number of entries in the table
-                        size = int.from_bytes(bytecode[counter:counter+2], byteorder='little')
-                        counter += 2
-                        first_key = int.from_bytes(bytecode[counter:counter+4], byteorder='little')
-                        counter += 4
-                        # then the data
-                        for k in range(0, size):
-                            key = int.from_bytes(bytecode[counter:counter+4], byteorder='little')
-                            counter += 4
-                        if counter%2 != 0:
-                            opcode = bytecode[counter]
-                            if opcode == 0:
-                                counter += 1
-                        continue
-                    elif bytecode[counter+1] == 2:
-                        # sparse-switch-payload
-                        try:
-                            counter += opcodes[opcode] * 2
-                        except:
-                            retry = True
-                            break
-
-                        size = int.from_bytes(bytecode[counter:counter+2], byteorder='little')
-                        counter += 2
-
-                        # keys
-                        for k in range(0, size):
-                            key = int.from_bytes(bytecode[counter:counter+4], byteorder='little')
-                            counter += 4
-
-                        # targets
-                        for t in range(0, size):
-                            target = int.from_bytes(bytecode[counter:counter+4], byteorder='little')
-                            counter += 4
-                        if counter%2 != 0:
-                            opcode = bytecode[counter]
-                            if opcode == 0:
-                                counter += 1
-                        continue
-                    elif bytecode[counter+1] == 3:
-                        # fill-array-data payload
-                        try:
-                            counter += opcodes[opcode] * 2
-                        except:
-                            retry = True
-
-                        element_width = int.from_bytes(bytecode[counter:counter+2], byteorder='little')
-                        counter += 2
-
-                        size = int.from_bytes(bytecode[counter:counter+4], byteorder='little')
-                        counter += 4
-
-                        # data
-                        counter += size * element_width
-                        if counter%2 != 0:
-                            opcode = bytecode[counter]
-                            if opcode == 0:
-                                counter += 1
-                        continue
-
-                try:
-                    counter += opcodes[opcode] * 2
-                except:
-                    retry = True
-                    break
-            if not retry:
+    def detect_opcode_version(self, bytecodes):
+        '''Detect the opcode version of the file using a sample of the
+        bytecode of the methods. Optimized code can use a different
+        set of opcodes than the version in the header suggests, so
+        pick the version that decodes most of the sample, preferring
+        the version from the header.'''
+        header_version = self.data.header.version_str
+        versions = sorted(INSTRUCTION_LENGTHS)
+        if header_version in INSTRUCTION_LENGTHS:
+            versions.remove(header_version)
+            versions.insert(0, header_version)
+
+        sample = bytecodes[:OPCODE_VERSION_SAMPLE_SIZE]
+        best_version = versions[0]
+        best_decoded = -1
+        for version in versions:
+            decoded = sum(decode_bytecode(b, version)[1] for b in sample)
+            if decoded > best_decoded:
+                best_version = version
+                best_decoded = decoded
+            if decoded == len(sample):
                 break
-
-            # do not try all versions yet, as this needs
-            # more sanity checks.
-            break
-        return string_ids
+        return best_version
 
     def parse(self):
         filesize = self.fileresult.filesize
@@ -315,6 +262,13 @@ class DexUnpackParser(UnpackParser):
         metadata['version'] = self.data.header.version_str
         metadata['classes'] = []
 
+        # Per method metadata is only extracted if asked for
+        # in the scan profile.
+        extract_methods = 'dex_methods' in self.scan_environment.get_scanprofile()
+
+        # methods of all classes, as (class_obj, method type, method id, bytecode)
+        methods = []
+
         for class_definition in self.data.class_defs:
             if class_definition.class_data is None:
                 continue
@@ -325,76 +279,17 @@ class DexUnpackParser(UnpackParser):
                 pass
             if class_definition.sourcefile_name is not None:
                 class_obj['source'] = mutf8.decode_modified_utf8(class_definition.sourcefile_name)
-            class_obj['methods'] = []
-
-            # process direct methods
-            method_id = 0
-            for method in class_definition.class_data.direct_methods:
-                if method.code is None:
-                    continue
-
-                # compute various hashes for the bytecode and store them
-                hashes = {}
-                sha256 = hashlib.sha256(method.code.insns).hexdigest()
-                hashes['sha256'] = sha256
-                tlsh_hash = tlsh.hash(method.code.insns)
-                if tlsh_hash != 'TNULL':
-                    hashes['tlsh'] = tlsh_hash
-                else:
-                    hashes['tlsh'] = None
-
-                # extract the relevant strings from the bytecode and store them
-                strings = []
-                res = self.parse_bytecode(method.code.insns)
-                if res != []:
-                  for r in res:
-                      try:
-                          # this shouldn't happen, but there is a bug
-                          # in mutf8: https://github.com/TkTech/mutf8/issues/1
-                          bytecode_string = mutf8.decode_modified_utf8(self.data.string_ids[r].value.data)
-                          strings.append(bytecode_string)
-                      except UnicodeDecodeError:
-                          pass
-
-                method_id += method.method_idx_diff.value
-                method_name = mutf8.decode_modified_utf8(self.data.method_ids[method_id].method_name)
-                class_obj['methods'].append({'name': method_name,
-                                            'method_type': 'direct', 'bytecode_hashes': hashes,
-                                            'strings': strings})
-            # process virtual methods
-            method_id = 0
-            for method in class_definition.class_data.virtual_methods:
-                if method.code is None:
-                    continue
-
-                # compute various hashes for the bytecode and store them
-                hashes = {}
-                sha256 = hashlib.sha256(method.code.insns).hexdigest()
-                hashes['sha256'] = sha256
-                tlsh_hash = tlsh.hash(method.code.insns)
-                if tlsh_hash != 'TNULL':
-                    hashes['tlsh'] = tlsh_hash
-                else:
-                    hashes['tlsh'] = None
-
-                # extract the relevant strings from the bytecode and store them
-                strings = []
-                res = self.parse_bytecode(method.code.insns)
-                if res != []:
-                  for r in res:
-                      try:
-                          # this shouldn't happen, but there is a bug
-                          # in mutf8: https://github.com/TkTech/mutf8/issues/1
-                          bytecode_string = mutf8.decode_modified_utf8(self.data.string_ids[r].value.data)
-                          strings.append(bytecode_string)
-                      except UnicodeDecodeError:
-                          pass
-
-                method_id += method.method_idx_diff.value
-                method_name = mutf8.decode_modified_utf8(self.data.method_ids[method_id].method_name)
-                class_obj['methods'].append({'name': method_name,
-                                            'method_type': 'virtual', 'bytecode_hashes': hashes,
-                                            'strings': strings})
+
+            if extract_methods:
+                class_obj['methods'] = []
+                for method_type, class_methods in [('direct', class_definition.class_data.direct_methods),
+                                                   ('virtual', class_definition.class_data.virtual_methods)]:
+                    method_id = 0
+                    for method in class_methods:
+                        method_id += method.method_idx_diff.value
+                        if method.code is None:
+                            continue
+                        methods.append((class_obj, method_type, method_id, method.code.insns))
 
             # process fields
             class_obj['fields'] = []
@@ -429,5 +324,33 @@ class DexUnpackParser(UnpackParser):
                                             'field_type': 'instance'})
             metadata['classes'].append(class_obj)
 
+        if methods:
+            self.add_methods(methods)
+
         self.unpack_results.set_metadata(metadata)
         self.unpack_results.set_labels(labels)
+
+    def add_methods(self, methods):
+        '''Add the name, the hashes of the bytecode and the strings used
+        in the bytecode of each method to the metadata of its class'''
+        opcode_version = self.detect_opcode_version([m[3] for m in methods])
+
+        # compute the hashes in parallel
+        hashes = ordered_map(hash_bytecode, (m[3] for m in methods),
+                             self.scan_environment.get_hashthreads())
+
+        for (class_obj, method_type, method_id, bytecode), method_hashes in zip(methods, hashes):
+            # extract the relevant strings from the bytecode
+            strings = []
+            for string_id in decode_bytecode(bytecode, opcode_version)[0]:
+                try:
+                    # this shouldn't happen, but there is a bug
+                    # in mutf8: https://github.com/TkTech/mutf8/issues/1
+                    strings.append(mutf8.decode_modified_utf8(self.data.string_ids[string_id].value.data))
+                except (UnicodeDecodeError, IndexError):
+                    pass
+
+            method_name = mutf8.decode_modified_utf8(self.data.method_ids[method_id].method_name)
+            class_obj['methods'].append({'name': method_name,
+                                         'method_type': method_type, 'bytecode_hashes': method_hashes,
+                                         'strings': strings})
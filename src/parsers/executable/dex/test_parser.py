@@ -0,0 +1,29 @@
+import sys, os
+import struct
+from test.util import *
+
+from .UnpackParser import decode_bytecode
+
+def test_decode_bytecode_strings():
+    # const-string v0, string@5
+    bytecode = bytes([0x1a, 0x00, 0x05, 0x00])
+    # packed-switch-payload with two targets
+    bytecode += struct.pack('<HHi', 0x0100, 2, 0) + bytes(8)
+    # const-string/jumbo v0, string@0x10000
+    bytecode += bytes([0x1b, 0x00]) + struct.pack('<I', 0x10000)
+    # fill-array-data-payload with three bytes, padded to an even length
+    bytecode += struct.pack('<HHI', 0x0300, 1, 3) + b'abc\x00'
+    # sparse-switch-payload with one key and target
+    bytecode += struct.pack('<HH', 0x0200, 1) + bytes(8)
+    # return-void, const-string v1, string@7
+    bytecode += bytes([0x0e, 0x00, 0x1a, 0x01, 0x07, 0x00])
+    assert decode_bytecode(bytecode, '035') == ([5, 0x10000, 7], True)
+
+def test_decode_bytecode_opcode_versions():
+    # 0xfa is invoke-polymorphic in version 038 and later (4 code units)
+    bytecode = bytes([0xfa, 0x00]) * 4
+    assert decode_bytecode(bytecode, '038') == ([], True)
+    assert decode_bytecode(bytecode, '035') == ([], False)
+
+def test_decode_bytecode_truncated():
+    assert decode_bytecode(bytes([0x1a, 0x00, 0x05]), '035') == ([], False)
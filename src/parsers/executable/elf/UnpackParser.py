@@ -23,8 +23,12 @@
 
 import os
 import binascii
+import hashlib
+import re
 
-import telfhash
+import tlsh
+from elftools.elf.elffile import ELFFile
+from telfhash.telfhash import extract_call_destinations
 
 from FileResult import FileResult
 from UnpackParser import UnpackParser, check_condition
@@ -42,6 +46,45 @@ FORTIFY_NAMES = ['cpy_chk', 'printf_chk', 'cat_chk', 'poll_chk',
                  '__realpath_chk', '__explicit_bzero_chk', '__recv_chk',
                  '__getdomainname_chk', '__gethostname_chk']
 
+# names of symbols that are ignored by telfhash
+TELFHASH_EXCLUDE_NAMES = set(['__libc_start_main', 'main', 'abort', 'cachectl',
+                              'cacheflush', 'puts', 'atol', 'malloc_trim'])
+TELFHASH_EXCLUDE_RE = re.compile(r'^[_\.]|64$|^str|^mem')
+
+def is_telfhash_symbol(symbol_name):
+    '''Check whether or not telfhash uses a symbol'''
+    return symbol_name != '' and symbol_name not in TELFHASH_EXCLUDE_NAMES \
+        and TELFHASH_EXCLUDE_RE.search(symbol_name) is None
+
+def compute_telfhash(names):
+    '''Compute the telfhash of the (sorted) names of symbols or of the call
+    destinations in a file without symbols, the same way as the telfhash
+    module does. Returns an empty string if no hash could be computed.'''
+    if names == []:
+        return ''
+    try:
+        telfhash_res = tlsh.forcehash(','.join(names).encode('ascii'))
+    except UnicodeEncodeError:
+        return ''
+    if telfhash_res == 'TNULL':
+        return ''
+    return telfhash_res.lower()
+
+# scan profile items that change the metadata
+METADATA_SCANPROFILE = ['elf_dynamic_symbols', 'elf_strings', 'elf_symbols']
+
+def get_parser_version():
+    '''Return a version of the parser for the metadata cache, derived
+    from the code of the parser, so cached metadata is not used
+    anymore when the parser changes.'''
+    parser_hash = hashlib.sha256()
+    for module_file in [__file__, elf.__file__]:
+        with open(module_file, 'rb') as module:
+            parser_hash.update(module.read())
+    return parser_hash.hexdigest()
+
+PARSER_VERSION = get_parser_version()
+
 class ElfUnpackParser(UnpackParser):
     extensions = []
     signatures = [
@@ -114,7 +157,43 @@ class ElfUnpackParser(UnpackParser):
         self.unpack_results.add_unpacked_file( fr )
 
     def set_metadata_and_labels(self):
-        """sets metadata and labels for the unpackresults"""
+        """sets metadata and labels for the unpackresults, using the
+        metadata cache if there is one"""
+        metadatacache = self.scan_environment.get_metadatacache()
+        if metadatacache is None:
+            self.compute_metadata_and_labels()
+            return
+
+        # The metadata depends on the ELF data and on the scan profile.
+        scanprofile = self.scan_environment.get_scanprofile()
+        cache_key = hashlib.sha256()
+        cache_key.update(','.join([x for x in METADATA_SCANPROFILE if x in scanprofile]).encode())
+        cache_key.update(b'\x00')
+        self.infile.seek(0)
+        bytes_left = self.unpacked_size
+        while bytes_left > 0:
+            buf = self.infile.read(min(bytes_left, 1048576))
+            if buf == b'':
+                break
+            cache_key.update(buf)
+            bytes_left -= len(buf)
+        cache_key = cache_key.hexdigest()
+
+        cached = metadatacache.get(self.pretty_name, PARSER_VERSION, cache_key)
+        if cached is not None:
+            metadata, labels, self.soname, self.module_name = cached
+            self.unpack_results.set_metadata(metadata)
+            self.unpack_results.set_labels(labels)
+            return
+
+        self.compute_metadata_and_labels()
+        metadata = self.unpack_results.get_metadata()
+        labels = self.unpack_results.get_labels()
+        metadatacache.put(self.pretty_name, PARSER_VERSION, cache_key,
+                          (metadata, labels, self.soname, self.module_name))
+
+    def compute_metadata_and_labels(self):
+        """computes the metadata and labels for the unpackresults"""
         labels = [ 'elf' ]
         metadata = {}
         string_cutoff_length = 4
@@ -176,15 +255,36 @@ class ElfUnpackParser(UnpackParser):
         # store dependencies (empty for statically linked binaries)
         needed = []
 
-        # store dynamic symbols (empty for statically linked binaries)
-        dynamic_symbols = []
-
         # store information about notes
         notes = []
 
-        # store symbols (empty for most binaries, except for
-        # non-stripped binaries)
-        symbols = []
+        # Symbols and strings are only stored if asked for in the scan
+        # profile, as they can be very large:
+        #
+        # - elf_dynamic_symbols: symbols from the dynamic symbol table
+        #   (.dynsym)
+        # - elf_symbols: symbols from the dynamic symbol table and the
+        #   symbol table (.symtab, non-stripped binaries only)
+        # - elf_strings: strings from the .rodata sections
+        #
+        # Symbols are stored as columns. The names of the symbols and the
+        # strings are stored as indexes into a table of unique strings.
+        scanprofile = self.scan_environment.get_scanprofile()
+        store_symbols = 'elf_symbols' in scanprofile
+        store_dynamic_symbols = store_symbols or 'elf_dynamic_symbols' in scanprofile
+        store_strings = 'elf_strings' in scanprofile
+
+        string_table = {}
+        symbols = {'name': [], 'type': [], 'binding': [], 'visibility': [],
+                   'section_index': [], 'size': [], 'dynamic': []}
+
+        # names of the symbols of the first symbol table, for telfhash
+        telfhash_names = None
+
+        # the types of the symbol tables that were processed: only the
+        # first (non-empty) symbol table of each type is used, whatever
+        # its name, like telfhash does.
+        symbol_table_types = set()
 
         # store RPATH and RUNPATH. Both could be present in a binary
         rpath = ''
@@ -254,49 +354,50 @@ class ElfUnpackParser(UnpackParser):
                                     metadata['security'].append('full relro')
                                 else:
                                     metadata['security'].append('partial relro')
-            elif header.type == elf.Elf.ShType.symtab:
-                if header.name == '.symtab':
-                    for entry in header.body.entries:
-                        symbol = {}
-                        if entry.name == None:
-                            symbol['name'] = ''
-                        else:
-                            symbol['name'] = entry.name
-                        symbol['type'] = entry.type.name
-                        symbol['binding'] = entry.bind.name
-                        symbol['visibility'] = entry.visibility.name
-                        symbol['section_index'] = entry.sh_idx
-                        symbol['size'] = entry.size
-                        symbols.append(symbol)
-            elif header.type == elf.Elf.ShType.dynsym:
-                if header.name == '.dynsym':
+            elif header.type in [elf.Elf.ShType.symtab, elf.Elf.ShType.dynsym]:
+                is_dynsym = header.type == elf.Elf.ShType.dynsym
+                if header.type not in symbol_table_types and header.len_body > 0:
+                    symbol_table_types.add(header.type)
+                    store = store_dynamic_symbols if is_dynsym else store_symbols
+                    # telfhash uses the first symbol table
+                    use_for_telfhash = telfhash_names is None
+                    if use_for_telfhash:
+                        telfhash_names = []
                     for entry in header.body.entries:
-                        symbol = {}
                         if entry.name == None:
-                            symbol['name'] = ''
+                            symbol_name = ''
                         else:
-                            symbol['name'] = entry.name
-                        symbol['type'] = entry.type.name
-                        symbol['binding'] = entry.bind.name
-                        symbol['visibility'] = entry.visibility.name
-                        symbol['section_index'] = entry.sh_idx
-                        symbol['size'] = entry.size
-                        symbols.append(symbol)
-                        dynamic_symbols.append(symbol)
-
-                        if symbol['name'] == 'oatdata':
-                            labels.append('oat')
-                            labels.append('android')
-
-                        # security related information
-                        if symbol['name'] == '__stack_chk_fail':
-                            metadata['security'].append('stack smashing protector')
-                        if '_chk' in symbol['name']:
-                            if 'fortify' not in metadata['security']:
-                                for fortify_name in FORTIFY_NAMES:
-                                    if symbol['name'].endswith(fortify_name):
-                                        metadata['security'].append('fortify')
-                                        break
+                            symbol_name = entry.name
+
+                        if use_for_telfhash and entry.type == elf.Elf.SymbolType.func and \
+                                entry.bind == elf.Elf.SymbolBinding.global_symbol and \
+                                entry.visibility == elf.Elf.SymbolVisibility.default and \
+                                is_telfhash_symbol(symbol_name):
+                            telfhash_names.append(symbol_name.lower())
+
+                        if is_dynsym:
+                            if symbol_name == 'oatdata':
+                                labels.append('oat')
+                                labels.append('android')
+
+                            # security related information
+                            if symbol_name == '__stack_chk_fail':
+                                metadata['security'].append('stack smashing protector')
+                            if '_chk' in symbol_name:
+                                if 'fortify' not in metadata['security']:
+                                    for fortify_name in FORTIFY_NAMES:
+                                        if symbol_name.endswith(fortify_name):
+                                            metadata['security'].append('fortify')
+                                            break
+
+                        if store:
+                            symbols['name'].append(string_table.setdefault(symbol_name, len(string_table)))
+                            symbols['type'].append(entry.type.name)
+                            symbols['binding'].append(entry.bind.name)
+                            symbols['visibility'].append(entry.visibility.name)
+                            symbols['section_index'].append(entry.sh_idx)
+                            symbols['size'].append(entry.size)
+                            symbols['dynamic'].append(is_dynsym)
 
             elif header.type == elf.Elf.ShType.progbits:
                 # process the various progbits sections here
@@ -320,13 +421,14 @@ class ElfUnpackParser(UnpackParser):
                     link_crc = header.body[-4:]
                     metadata['gnu debuglink'] = link_name
                 elif header.name in rodata_sections:
-                    for s in header.body.split(b'\x00'):
-                        if len(s) < string_cutoff_length:
-                            continue
-                        try:
-                            data_strings.append(s.decode())
-                        except:
-                            pass
+                    if store_strings:
+                        for s in header.body.split(b'\x00'):
+                            if len(s) < string_cutoff_length:
+                                continue
+                            try:
+                                data_strings.append(string_table.setdefault(s.decode(), len(string_table)))
+                            except:
+                                pass
                     # some Qt binaries use the Qt resource system,
                     # containing images, text, etc.
                     # Sometimes these end up in an ELF section.
@@ -457,25 +559,30 @@ class ElfUnpackParser(UnpackParser):
                         # .notes in Linux kernel)
                         labels.append('xen')
 
-        metadata['dynamic_symbols'] = dynamic_symbols
         metadata['needed'] = needed
         metadata['notes'] = notes
         metadata['rpath'] = rpath
         metadata['runpath'] = runpath
         metadata['soname'] = self.soname
-        metadata['strings'] = data_strings
-        metadata['symbols'] = symbols
+        if store_strings:
+            metadata['strings'] = list(dict.fromkeys(data_strings))
+        if store_dynamic_symbols:
+            metadata['symbols'] = symbols
+        if store_strings or store_dynamic_symbols:
+            metadata['string_table'] = list(string_table)
         metadata['telfhash'] = ''
 
         if metadata['type'] in ['executable', 'shared']:
-            try:
-                telfhash_result = telfhash.telfhash(str(self.fileresult.filename))
-                if telfhash_result != []:
-                    telfhash_res = telfhash_result[0]['telfhash']
-                    if telfhash_res != 'TNULL' and telfhash_res != '-':
-                        metadata['telfhash'] = telfhash_res
-            except UnicodeEncodeError:
-                pass
+            if telfhash_names is None:
+                # telfhash uses the call destinations in the code
+                # of files without symbols
+                try:
+                    telfhash_names = extract_call_destinations(ELFFile(self.infile))
+                except Exception:
+                    telfhash_names = []
+            else:
+                telfhash_names.sort()
+            metadata['telfhash'] = compute_telfhash(telfhash_names)
 
         if is_dynamic_elf:
             labels.append('dynamic')
@@ -0,0 +1,120 @@
+import sys, os
+from test.util import *
+
+import telfhash
+from telfhash.telfhash import get_hash
+from .UnpackParser import ElfUnpackParser, compute_telfhash, is_telfhash_symbol
+
+# test.c compiled with: gcc -O1 -rdynamic -o test test.c
+rel_testfile = pathlib.Path('unpackers') / 'elf' / 'test'
+
+def _parse_elf(scan_environment, scanprofile, rel_testfile=rel_testfile,
+               testdir=testdir_base / 'testdata'):
+    scan_environment.scanprofile = scanprofile
+    copy_testfile_to_environment(testdir, rel_testfile, scan_environment)
+    fr = fileresult(testdir, rel_testfile, set())
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = ElfUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    return r
+
+def _symbols(metadata):
+    '''Return the symbols as (name, type, binding, dynamic)'''
+    symbols = metadata['symbols']
+    names = [metadata['string_table'][i] for i in symbols['name']]
+    return list(zip(names, symbols['type'], symbols['binding'], symbols['dynamic']))
+
+def _telfhash_module(filename):
+    result = telfhash.telfhash(str(filename))[0]['telfhash']
+    if result == '-':
+        return ''
+    return result
+
+def test_symbols_and_strings_are_not_stored_by_default(scan_environment):
+    r = _parse_elf(scan_environment, frozenset())
+    metadata = r.get_metadata()
+    assert 'symbols' not in metadata
+    assert 'strings' not in metadata
+    assert 'string_table' not in metadata
+    assert metadata['telfhash'] != ''
+    assert 'dynamic' in r.get_labels()
+
+def test_dynamic_symbols(scan_environment):
+    r = _parse_elf(scan_environment, {'elf_dynamic_symbols'})
+    metadata = r.get_metadata()
+    assert 'strings' not in metadata
+    symbols = metadata['symbols']
+    assert set(len(column) for column in symbols.values()) == {len(symbols['name'])}
+    assert all(symbols['dynamic'])
+    assert ('getenv', 'func', 'global_symbol', True) in _symbols(metadata)
+    assert ('parse_header', 'func', 'global_symbol', True) in _symbols(metadata)
+    assert 'main' in [name for (name, _, _, _) in _symbols(metadata)]
+
+def test_symbols(scan_environment):
+    r = _parse_elf(scan_environment, {'elf_symbols'})
+    metadata = r.get_metadata()
+    symbols = _symbols(metadata)
+    # symbols from both .dynsym and .symtab
+    assert ('parse_header', 'func', 'global_symbol', True) in symbols
+    assert ('parse_header', 'func', 'global_symbol', False) in symbols
+    assert ('counter', 'object', 'global_symbol', False) in symbols
+    assert ('test.c', 'file', 'local', False) in symbols
+    # the names are stored once in the string table
+    assert len(set(metadata['string_table'])) == len(metadata['string_table'])
+
+def test_strings(scan_environment):
+    r = _parse_elf(scan_environment, {'elf_strings'})
+    metadata = r.get_metadata()
+    assert 'symbols' not in metadata
+    strings = [metadata['string_table'][i] for i in metadata['strings']]
+    assert 'BANG_TEST_VARIABLE' in strings
+    assert 'BANG test string: %s\n' in strings
+
+def test_strings_and_symbols_share_string_table(scan_environment):
+    r = _parse_elf(scan_environment, {'elf_symbols', 'elf_strings'})
+    metadata = r.get_metadata()
+    assert len(set(metadata['string_table'])) == len(metadata['string_table'])
+    strings = [metadata['string_table'][i] for i in metadata['strings']]
+    assert 'BANG_TEST_VARIABLE' in strings
+    assert 'getenv' in [name for (name, _, _, _) in _symbols(metadata)]
+
+def test_telfhash_is_the_same_as_telfhash_module(scan_environment):
+    r = _parse_elf(scan_environment, frozenset())
+    assert r.get_metadata()['telfhash'] == \
+            _telfhash_module(testdir_base / 'testdata' / rel_testfile)
+
+def test_symbol_tables_are_found_by_type(scan_environment, tmp_path):
+    # rename .dynsym and .symtab in the section header string table
+    data = (testdir_base / 'testdata' / rel_testfile).read_bytes()
+    assert data.count(b'.dynsym\x00') == 1 and data.count(b'.symtab\x00') == 1
+    data = data.replace(b'.dynsym\x00', b'.dsyms1\x00').replace(b'.symtab\x00', b'.syms01\x00')
+    (tmp_path / 'renamed').write_bytes(data)
+    r = _parse_elf(scan_environment, {'elf_symbols'}, pathlib.Path('renamed'), tmp_path)
+    metadata = r.get_metadata()
+    assert ('parse_header', 'func', 'global_symbol', True) in _symbols(metadata)
+    assert ('parse_header', 'func', 'global_symbol', False) in _symbols(metadata)
+    assert metadata['telfhash'] == _telfhash_module(tmp_path / 'renamed')
+    assert metadata['telfhash'] == _parse_elf(scan_environment, frozenset()).get_metadata()['telfhash']
+
+def test_is_telfhash_symbol():
+    assert is_telfhash_symbol('parse_header')
+    assert not is_telfhash_symbol('')
+    assert not is_telfhash_symbol('main')
+    assert not is_telfhash_symbol('__libc_start_main')
+    assert not is_telfhash_symbol('_init')
+    assert not is_telfhash_symbol('.hidden')
+    assert not is_telfhash_symbol('strlen')
+    assert not is_telfhash_symbol('memcpy')
+    assert not is_telfhash_symbol('lseek64')
+
+def test_compute_telfhash():
+    names = sorted(['parse_header', 'read_block', 'write_block', 'compute_checksum',
+                    'open_archive', 'close_archive', 'list_members', 'extract_member',
+                    'verify_signature', 'load_config', 'save_config', 'print_usage'])
+    assert compute_telfhash(names) == get_hash(names)
+    assert compute_telfhash([]) == ''
+    # too little data for a hash
+    assert compute_telfhash(['a']) == ''
+    assert compute_telfhash(['näme'] * 20) == ''
@@ -0,0 +1,94 @@
+import sys, os
+import subprocess
+from test.util import *
+
+from .UnpackParser import Ext2UnpackParser
+
+def test_load_standard_file(scan_environment):
+    rel_testfile = pathlib.Path('unpackers') / 'ext2' / 'test.ext2'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    filesize = fr.filesize
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = Ext2UnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == filesize
+    assert 'filesystem' in r.get_labels()
+    unpacked_files = [ x.filename for x in r.get_unpacked_files() ]
+    assert data_unpack_dir / 'hello.txt' in unpacked_files
+    assert data_unpack_dir / 'lost+found' in unpacked_files
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'hello.txt')
+    assert unpacked_path_abs.read_bytes() == b'hello\n'
+
+def test_load_file_with_offset(scan_environment):
+    padding_length = 17
+    orig_testfile = testdir_base / 'testdata' / 'unpackers' / 'ext2' / 'test.ext2'
+    rel_testfile = pathlib.Path('prepend-test.ext2')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    with open(abs_testfile, 'wb') as f:
+        f.write(b'A' * padding_length)
+        f.write(orig_testfile.read_bytes())
+        f.write(b'trailing data')
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = Ext2UnpackParser(fr, scan_environment, data_unpack_dir, padding_length)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == orig_testfile.stat().st_size
+    assert r.get_labels() == []
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'hello.txt')
+    assert unpacked_path_abs.read_bytes() == b'hello\n'
+
+def test_truncated_file(scan_environment):
+    orig_testfile = testdir_base / 'testdata' / 'unpackers' / 'ext2' / 'test.ext2'
+    rel_testfile = pathlib.Path('truncated.ext2')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    abs_testfile.write_bytes(orig_testfile.read_bytes()[:500000])
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = Ext2UnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
+
+def test_load_file_with_meta_bg(scan_environment):
+    # with meta_bg the group descriptors are spread over the file system
+    # in groups of 16 (1024 byte blocks, 64 byte descriptors)
+    root = scan_environment.temporarydirectory / 'root'
+    (root / 'dir').mkdir(parents=True)
+    (root / 'hello.txt').write_bytes(b'hello\n')
+    for i in range(20):
+        (root / 'dir' / ('file-%d' % i)).write_bytes(bytes([i]) * (i * 1000))
+    rel_testfile = pathlib.Path('meta_bg.ext4')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    subprocess.run(['mke2fs', '-q', '-F', '-t', 'ext4', '-b', '1024',
+                    '-O', 'meta_bg,^resize_inode,64bit', '-d', str(root),
+                    str(abs_testfile), '200M'], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = Ext2UnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == 200 * 1024 * 1024
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'hello.txt')
+    assert unpacked_path_abs.read_bytes() == b'hello\n'
+    for i in range(20):
+        unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'dir' / ('file-%d' % i))
+        assert unpacked_path_abs.read_bytes() == bytes([i]) * (i * 1000)
+
+def test_file_name_with_nul(scan_environment):
+    orig_testfile = testdir_base / 'testdata' / 'unpackers' / 'ext2' / 'test.ext2'
+    rel_testfile = pathlib.Path('nul.ext2')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    abs_testfile.write_bytes(orig_testfile.read_bytes().replace(b'hello.txt', b'hello\x00txt'))
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = Ext2UnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
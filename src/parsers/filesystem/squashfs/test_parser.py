@@ -0,0 +1,106 @@
+import sys, os
+import struct
+import zlib
+from test.util import *
+import bangfilesystems
+
+from .UnpackParser import SquashfsUnpackParser
+
+# test.sqsh contains this file, see the README in the test data
+expected_sgi = testdir_base / 'testdata' / 'unpackers' / 'sgi' / 'test.sgi'
+
+def test_load_standard_file(scan_environment):
+    rel_testfile = pathlib.Path('unpackers') / 'squashfs' / 'test.sqsh'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    filesize = fr.filesize
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = SquashfsUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == filesize
+    assert 'filesystem' in r.get_labels()
+    unpacked_files = [ x.filename for x in r.get_unpacked_files() ]
+    assert unpacked_files == [ data_unpack_dir / 'test.sgi' ]
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'test.sgi')
+    assert unpacked_path_abs.read_bytes() == expected_sgi.read_bytes()
+
+def test_load_file_with_offset(scan_environment):
+    padding_length = 17
+    orig_testfile = testdir_base / 'testdata' / 'unpackers' / 'squashfs' / 'test.sqsh'
+    rel_testfile = pathlib.Path('prepend-test.sqsh')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    with open(abs_testfile, 'wb') as f:
+        f.write(b'A' * padding_length)
+        f.write(orig_testfile.read_bytes())
+        f.write(b'trailing data')
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = SquashfsUnpackParser(fr, scan_environment, data_unpack_dir, padding_length)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == orig_testfile.stat().st_size
+    assert r.get_labels() == []
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'test.sgi')
+    assert unpacked_path_abs.read_bytes() == expected_sgi.read_bytes()
+
+def test_load_file_with_threads(scan_environment):
+    rel_testfile = pathlib.Path('unpackers') / 'squashfs' / 'test.sqsh'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    scan_environment.unpackthreads = 4
+    p = SquashfsUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'test.sgi')
+    assert unpacked_path_abs.read_bytes() == expected_sgi.read_bytes()
+
+def test_truncated_file(scan_environment):
+    orig_testfile = testdir_base / 'testdata' / 'unpackers' / 'squashfs' / 'test.sqsh'
+    rel_testfile = pathlib.Path('truncated.sqsh')
+    abs_testfile = scan_environment.unpack_path(rel_testfile)
+    abs_testfile.write_bytes(orig_testfile.read_bytes()[:300000])
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = SquashfsUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
+
+def test_file_name_with_nul(scan_environment):
+    data = bytearray((testdir_base / 'testdata' / 'unpackers' / 'squashfs' / 'test.sqsh').read_bytes())
+    # append a copy of the directory table (a single metadata block)
+    # as an uncompressed block in which the name has a NUL byte
+    (bytesused,) = struct.unpack_from('<Q', data, 40)
+    (directorytable,) = struct.unpack_from('<Q', data, 72)
+    (header,) = struct.unpack_from('<H', data, directorytable)
+    directory = zlib.decompress(data[directorytable+2:directorytable+2+header])
+    directory = directory.replace(b'test.sgi', b'test\x00sgi')
+    data = data[:bytesused] + struct.pack('<H', len(directory) | 0x8000) + directory
+    struct.pack_into('<Q', data, 40, len(data))
+    struct.pack_into('<Q', data, 72, bytesused)
+    rel_testfile = pathlib.Path('nul.sqsh')
+    scan_environment.unpack_path(rel_testfile).write_bytes(data)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = SquashfsUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
+
+def test_metadata_cache_is_limited(scan_environment, monkeypatch):
+    monkeypatch.setattr(bangfilesystems.SquashfsReader, 'metadata_cache_size', 1)
+    rel_testfile = pathlib.Path('unpackers') / 'squashfs' / 'test.sqsh'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = SquashfsUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'test.sgi')
+    assert unpacked_path_abs.read_bytes() == expected_sgi.read_bytes()
@@ -26,11 +26,13 @@ import pathlib
 import zlib
 import collections
 import socket
+import struct
 
 import lzo
 import zstd
 
 from FileResult import FileResult
+from bangparallel import ordered_map
 
 from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
@@ -38,6 +40,48 @@ from kaitaistruct import ValidationNotEqualError
 from . import ubifs
 
 
+# UBIFS node types, compression types and inode types, see
+# fs/ubifs/ubifs-media.h in the Linux kernel
+UBIFS_NODE_MAGIC = 0x06101831
+UBIFS_INO_NODE = 0
+UBIFS_DATA_NODE = 1
+UBIFS_DENT_NODE = 2
+UBIFS_IDX_NODE = 9
+
+UBIFS_COMPR_NONE = 0
+UBIFS_COMPR_LZO = 1
+UBIFS_COMPR_ZLIB = 2
+UBIFS_COMPR_ZSTD = 3
+
+UBIFS_ITYPE_REG = 0
+UBIFS_ITYPE_DIR = 1
+UBIFS_ITYPE_LNK = 2
+UBIFS_ITYPE_FIFO = 5
+UBIFS_ITYPE_SOCK = 6
+
+# data nodes contain (at most) one block of data
+UBIFS_BLOCK_SIZE = 4096
+
+# the common header of every node
+common_header = struct.Struct('<IIQIBB2x')
+
+# the parts of the nodes that are needed for unpacking, directly
+# after the common header.
+index_header = struct.Struct('<HH')
+branch_header = struct.Struct('<IIII4x')
+inode_header = struct.Struct('<II8x8xQ24x12x4x4x4xIII')
+data_header = struct.Struct('<II8xIHH')
+dent_header = struct.Struct('<II8xQxBH4x')
+
+ubifs_inode_size = 160
+ubifs_data_size = 48
+ubifs_dent_size = 56
+
+# the amount of data read from a leaf node in the index: enough for
+# the header of a data node, inode nodes and most directory entries
+ubifs_leaf_read_size = 512
+
+
 class UbifsUnpackParser(UnpackParser):
     extensions = []
     signatures = [
@@ -48,149 +92,192 @@ class UbifsUnpackParser(UnpackParser):
     def parse(self):
         try:
             self.data = ubifs.Ubifs.from_io(self.infile)
+            # instances are only parsed when they are accessed
+            self.leb_size = self.data.super.node_header.leb_size
+            self.num_leb = self.data.super.node_header.num_leb
+            self.root_leb = self.data.master_1.node_header.leb_root
+            self.root_offset = self.data.master_1.node_header.ofs_root
         except (Exception, ValidationNotEqualError) as e:
             raise UnpackParserException(e.args)
+        check_condition(self.offset + self.leb_size * self.num_leb <= self.fileresult.filesize,
+                        "not enough data")
+
+    def calculate_unpacked_size(self):
+        self.unpacked_size = self.leb_size * self.num_leb
 
     # no need to carve from the file
     #def carve(self):
     #    pass
 
+    def read_node(self, lnum, offset, size, read_size=None):
+        '''Read a node of size bytes from the file system, or only the
+        first read_size bytes of it. Returns the node type and the node
+        (including the common header).'''
+        check_condition(lnum < self.num_leb and offset + size <= self.leb_size,
+                        "node outside of file system")
+        check_condition(size >= common_header.size, "node too small")
+        if read_size is None or read_size > size:
+            read_size = size
+        node = os.pread(self.infile.fileno(), read_size,
+                        self.offset + lnum * self.leb_size + offset)
+        check_condition(len(node) == read_size, "not enough data for node")
+        (magic, crc, sqnum, node_length, node_type, group_type) = common_header.unpack_from(node)
+        check_condition(magic == UBIFS_NODE_MAGIC, "wrong node magic")
+        check_condition(node_length <= size, "wrong node length")
+        return (node_type, node[:node_length])
+
+    def build_index(self):
+        '''Walk the index tree once and record the directory entries,
+        the inodes and the positions of the data nodes.'''
+        # parent inode -> list of (name, inode, inode type)
+        self.directory_entries = collections.defaultdict(list)
+
+        # inode -> (size, inline data (symbolic link target))
+        self.inodes = {}
+
+        # inode -> list of (block number, lnum, offset, length)
+        self.data_nodes = collections.defaultdict(list)
+
+        seen_nodes = set()
+        index_nodes = [(self.root_leb, self.root_offset, self.leb_size - self.root_offset)]
+        while index_nodes:
+            (lnum, offset, size) = index_nodes.pop()
+            check_condition((lnum, offset) not in seen_nodes, "loop in index")
+            seen_nodes.add((lnum, offset))
+            (node_type, node) = self.read_node(lnum, offset, size)
+            check_condition(node_type == UBIFS_IDX_NODE, "index node expected")
+            (child_count, level) = index_header.unpack_from(node, common_header.size)
+            for child in range(child_count):
+                branch_offset = common_header.size + index_header.size + child * branch_header.size
+                check_condition(branch_offset + branch_header.size <= len(node),
+                                "not enough data for branch")
+                (target_lnum, target_offset, target_length,
+                 key_inode) = branch_header.unpack_from(node, branch_offset)
+                if level > 0:
+                    index_nodes.append((target_lnum, target_offset, target_length))
+                    continue
+                if target_length < ubifs_data_size:
+                    continue
+                # only the header of data nodes is read here
+                (node_type, leaf) = self.read_node(target_lnum, target_offset,
+                                                   target_length, ubifs_leaf_read_size)
+                if node_type != UBIFS_DATA_NODE and len(leaf) < target_length:
+                    (node_type, leaf) = self.read_node(target_lnum, target_offset,
+                                                       target_length)
+                if node_type == UBIFS_DENT_NODE and len(leaf) >= ubifs_dent_size:
+                    (parent, key, target_inode, inode_type,
+                     name_length) = dent_header.unpack_from(leaf, common_header.size)
+                    name = leaf[ubifs_dent_size:ubifs_dent_size+name_length]
+                    self.directory_entries[parent].append((name, target_inode, inode_type))
+                elif node_type == UBIFS_INO_NODE and len(leaf) >= ubifs_inode_size:
+                    (inode, key, inode_size, mode, flags,
+                     data_length) = inode_header.unpack_from(leaf, common_header.size)
+                    self.inodes[inode] = (inode_size, leaf[ubifs_inode_size:ubifs_inode_size+data_length])
+                elif node_type == UBIFS_DATA_NODE:
+                    (inode, key, uncompressed_size, compression,
+                     compressed_size) = data_header.unpack_from(leaf, common_header.size)
+                    self.data_nodes[inode].append((key & 0x1fffffff, target_lnum,
+                                                   target_offset, target_length))
+
+    def write_file(self, task):
+        '''Write the data blocks of a file. Returns an error message,
+        or None if the file was written.'''
+        (inode, outfile_full) = task
+        outfile = open(outfile_full, 'wb')
+        try:
+            for (block, lnum, offset, length) in self.data_nodes[inode]:
+                (node_type, node) = self.read_node(lnum, offset, length)
+                (inode_number, key, uncompressed_size, compression,
+                 compressed_size) = data_header.unpack_from(node, common_header.size)
+                data = node[ubifs_data_size:]
+                if compression == UBIFS_COMPR_NONE:
+                    block_data = data
+                elif compression == UBIFS_COMPR_ZLIB:
+                    block_data = zlib.decompress(data, -zlib.MAX_WBITS)
+                elif compression == UBIFS_COMPR_LZO:
+                    block_data = lzo.decompress(data, False, uncompressed_size)
+                elif compression == UBIFS_COMPR_ZSTD:
+                    block_data = zstd.decompress(data)
+                else:
+                    return "unsupported compression"
+                os.pwrite(outfile.fileno(), block_data, block * UBIFS_BLOCK_SIZE)
+            if inode in self.inodes:
+                outfile.truncate(self.inodes[inode][0])
+        except (zlib.error, lzo.error, zstd.Error, UnpackParserException):
+            return "invalid data node"
+        finally:
+            outfile.close()
+        return None
+
     def unpack(self):
         unpacked_files = []
+        self.build_index()
 
-        # store the highest inode number
-        highest_inum = self.data.master_1.node_header.highest_inum
-
-        # traverse the tree, starting with the root inode
-        node_blocks = collections.deque()
-        node_blocks.append(self.data.index_root)
-
-        # inode to parent, name and type mappings
-        parent_to_inodes = {}
-        inode_to_name = {}
-        inode_to_parent = {}
-        inode_to_type = {}
-
-        while True:
-            # grab a node to process
-            try:
-                process_node = node_blocks.popleft()
-                if type(process_node.node_header) == ubifs.Ubifs.IndexHeader:
-                    for branch in process_node.node_header.branches:
-                        node_blocks.append(branch.branch_target)
-                elif type(process_node.node_header) == ubifs.Ubifs.DirectoryHeader:
-                    # TODO: use the key for some verification of the inode
-                    parent_inode_nr = process_node.node_header.key.inode_number
-                    if parent_inode_nr not in parent_to_inodes:
-                        parent_to_inodes[parent_inode_nr] = []
-                    parent_to_inodes[parent_inode_nr].append(process_node)
-
-                    # target inode number
-                    target_inode = process_node.node_header.inode_number
-                    target_name = process_node.node_header.name
-
-                    # store name, parent and type
-                    inode_to_name[target_inode] = target_name
-                    inode_to_parent[target_inode] = parent_inode_nr
-                    inode_to_type[target_inode] = process_node.node_header.inode_type
-            except IndexError:
-                break
-
-        # reconstruct the directory paths per inode
+        # Walk the directory tree, starting with the root inode. Every
+        # directory is only visited once. Files with more than one name
+        # are hardlinked.
         inode_to_path = {}
-        for i in sorted(inode_to_name):
-            new_name = inode_to_name[i]
-            index = i
-            while True:
-                if index not in inode_to_parent:
-                    inode_to_path[i] = new_name
-                    break
-                index = inode_to_parent[index]
-                if index in inode_to_name:
-                    new_name = os.path.join(inode_to_name[index], new_name)
-
-        # create the directories
-        for inode in inode_to_path:
-            if inode_to_type[inode] == ubifs.Ubifs.InodeTypes.directory:
-                outfile_rel = self.rel_unpack_dir / inode_to_path[inode]
-                outfile_full = self.scan_environment.unpack_path(outfile_rel)
-                outfile_full.mkdir(exist_ok=True)
-            else:
-                # create the directory of the parent
-                outfile_rel = self.rel_unpack_dir / inode_to_path[inode]
+        files_to_write = []
+        hardlinks = []
+        directories = collections.deque([(1, pathlib.Path())])
+        seen_directories = set([1])
+        while directories:
+            (directory_inode, directory_path) = directories.popleft()
+            for (name, inode, inode_type) in sorted(self.directory_entries[directory_inode]):
+                try:
+                    name = name.decode()
+                except UnicodeDecodeError:
+                    continue
+                if name in ['', '.', '..'] or '/' in name or '\x00' in name:
+                    continue
+                outfile_rel = self.rel_unpack_dir / directory_path / name
                 outfile_full = self.scan_environment.unpack_path(outfile_rel)
-                outfile_full.parent.mkdir(exist_ok=True)
-
-        # now that there is a mapping of inodes to names of files
-        # the nodes can be traversed again to find the extra metadata
-        # as well as the data blocks belonging to the nodes.
-        node_blocks = collections.deque()
-        node_blocks.append(self.data.index_root)
-
-        while True:
-            try:
-                process_node = node_blocks.popleft()
-                if type(process_node.node_header) == ubifs.Ubifs.IndexHeader:
-                    for branch in process_node.node_header.branches:
-                        node_blocks.append(branch.branch_target)
-                elif type(process_node.node_header) == ubifs.Ubifs.InodeHeader:
-                    inode = process_node.node_header.key.inode_number
-                    if inode in inode_to_type:
-                        outfile_rel = self.rel_unpack_dir / inode_to_path[inode]
-                        if inode_to_type[inode] == ubifs.Ubifs.InodeTypes.regular:
-                            # write a stub file
-                            outfile_full = self.scan_environment.unpack_path(outfile_rel)
-                            outfile = open(outfile_full, 'wb')
-                            outfile.close()
-                            fr = FileResult(self.fileresult, outfile_rel, set())
-                            unpacked_files.append(fr)
-                        elif inode_to_type[inode] == ubifs.Ubifs.InodeTypes.directory:
-                            # directories have already been processed, so skip
-                            pass
-                        elif inode_to_type[inode] == ubifs.Ubifs.InodeTypes.link:
-                            outfile_full = self.scan_environment.unpack_path(outfile_rel)
-                            try:
-                                 target = process_node.node_header.data.decode()
-                                 outfile_full.symlink_to(target)
-                            except Exception as e:
-                                 continue
-                            fr = FileResult(self.fileresult, outfile_rel, set(['symbolic link']))
-                            unpacked_files.append(fr)
-                        elif inode_to_type[inode] == ubifs.Ubifs.InodeTypes.block_device:
-                            # skip block devices
-                            pass
-                        elif inode_to_type[inode] == ubifs.Ubifs.InodeTypes.character_device:
-                            # skip character devices
-                            pass
-                        elif inode_to_type[inode] == ubifs.Ubifs.InodeTypes.fifo:
-                            # create fifo
-                            outfile_full = self.scan_environment.unpack_path(outfile_rel)
-                            os.mkfifo(outfile_full)
-                            fr = FileResult(self.fileresult, outfile_rel, set(['fifo']))
-                            unpacked_files.append(fr)
-                        elif inode_to_type[inode] == ubifs.Ubifs.InodeTypes.socket:
-                            # create socket
-                            outfile_full = self.scan_environment.unpack_path(outfile_rel)
-                            ubi_socket = socket.socket(socket.AF_UNIX)
-                            ubi_socket.bind(outfile_full)
-                            fr = FileResult(self.fileresult, outfile_rel, set(['socket']))
-                            unpacked_files.append(fr)
-                elif type(process_node.node_header) == ubifs.Ubifs.DataHeader:
-                    inode = process_node.node_header.key.inode_number
-                    outfile_rel = self.rel_unpack_dir / inode_to_path[inode]
-                    outfile_full = self.scan_environment.unpack_path(outfile_rel)
-                    outfile = open(outfile_full, 'ab')
-                    if process_node.node_header.compression == ubifs.Ubifs.Compression.no_compression:
-                        outfile.write(process_node.node_header.data)
-                    elif process_node.node_header.compression == ubifs.Ubifs.Compression.zlib:
-                        outfile.write(zlib.decompress(process_node.node_header.data, -zlib.MAX_WBITS))
-                    elif process_node.node_header.compression == ubifs.Ubifs.Compression.lzo:
-                        outfile.write(lzo.decompress(process_node.node_header.data, False, process_node.node_header.len_uncompressed))
-                    elif process_node.node_header.compression == ubifs.Ubifs.Compression.zstd:
-                        outfile.write(zstd.decompress(process_node.node_header.data))
-                    outfile.close()
-            except IndexError:
-                break
+                if inode_type == UBIFS_ITYPE_DIR:
+                    if inode in seen_directories:
+                        continue
+                    seen_directories.add(inode)
+                    outfile_full.mkdir(parents=True, exist_ok=True)
+                    directories.append((inode, directory_path / name))
+                elif inode_type == UBIFS_ITYPE_REG:
+                    if inode in inode_to_path:
+                        hardlinks.append((inode_to_path[inode], outfile_full))
+                        continue
+                    inode_to_path[inode] = outfile_full
+                    files_to_write.append((inode, outfile_full))
+                    unpacked_files.append(FileResult(self.fileresult, outfile_rel, set()))
+                elif inode_type == UBIFS_ITYPE_LNK:
+                    try:
+                        target = self.inodes[inode][1].decode()
+                    except (KeyError, UnicodeDecodeError):
+                        continue
+                    if '\x00' in target:
+                        continue
+                    outfile_full.symlink_to(target)
+                    fr = FileResult(self.fileresult, outfile_rel, set(['symbolic link']))
+                    unpacked_files.append(fr)
+                elif inode_type == UBIFS_ITYPE_FIFO:
+                    # create fifo
+                    os.mkfifo(outfile_full)
+                    fr = FileResult(self.fileresult, outfile_rel, set(['fifo']))
+                    unpacked_files.append(fr)
+                elif inode_type == UBIFS_ITYPE_SOCK:
+                    # create socket
+                    ubi_socket = socket.socket(socket.AF_UNIX)
+                    ubi_socket.bind(str(outfile_full))
+                    ubi_socket.close()
+                    fr = FileResult(self.fileresult, outfile_rel, set(['socket']))
+                    unpacked_files.append(fr)
+                # block devices and character devices are skipped
+
+        # Write the files, in parallel if possible. The data nodes are
+        # decompressed by the threads, zlib and zstd release the GIL.
+        errors = ordered_map(self.write_file, files_to_write,
+                             self.scan_environment.get_unpackthreads())
+        for error in errors:
+            check_condition(error is None, error)
+
+        for (target, outfile_full) in hardlinks:
+            os.link(target, outfile_full)
 
         return unpacked_files
 
@@ -1,10 +1,12 @@
+import array
 import os
-import struct
+import sys
 from . import vfat
 from . import vfat_directory
 from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
 from FileResult import FileResult
+from bangdatarange import sendfile_range
 from kaitaistruct import ValidationNotEqualError
 
 def get_lfn_part(record):
@@ -21,6 +23,9 @@ def get_short_filename(record):
         fn += b'.' + ext
     return fn.decode().lower()
 
+# table to clear the upper four bits of a byte
+fat32_mask = bytes(i & 0x0f for i in range(256))
+
 class VfatUnpackParser(UnpackParser):
     pretty_name = 'fat'
     # FAT does not have a reliable signature
@@ -44,6 +49,8 @@ class VfatUnpackParser(UnpackParser):
         check_condition(bpb.bytes_per_ls > 0, "invalid bpb value: bytes_per_ls")
         self.fat12 = self.is_fat12()
         self.fat32 = self.data.boot_sector.is_fat32
+        self.cluster_map = self.read_cluster_map()
+        self.cluster_size = bpb.ls_per_clus * bpb.bytes_per_ls
         self.pos_data = self.data.boot_sector.pos_root_dir + self.data.boot_sector.size_root_dir
         check_condition(self.pos_data <= self.fileresult.filesize,
                 "data sector outside file")
@@ -65,21 +72,36 @@ class VfatUnpackParser(UnpackParser):
         cluster_count = 2 + (total_ls - data_start) / bpb.ls_per_clus
         return cluster_count < 4087
 
-    def get_fat12_entry(self, n):
-        """Gets the entry from a FAT12 cluster map."""
-        # http://dfists.ua.es/~gil/FAT12Description.pdf, p. 9
-        if n & 0x01 == 0:
-            return ((self.data.fats[0][1+((3*n)>>1)] & 0x0f) << 8) | \
-                    self.data.fats[0][(3*n)>>1]
-        return ((self.data.fats[0][(3*n)>>1] & 0xf0 ) >> 4 ) | \
-            (self.data.fats[0][1+((3*n)>>1)] << 4)
-
-    def get_fat16_entry(self, n):
-        # return self.data.fats[0][2*n] | (self.data.fats[0][2*n + 1] << 8)
-        return struct.unpack("<H", self.data.fats[0][2*n:2*n+2])[0]
-
-    def get_fat32_entry(self, n):
-        return struct.unpack("<I", self.data.fats[0][4*n:4*n+4])[0] & 0x0fffffff
+    def read_cluster_map(self):
+        """Decodes the first FAT into an array with one entry per cluster,
+        so that cluster chains can be followed without decoding entries
+        one by one."""
+        fat = self.data.fats[0]
+        if self.fat12:
+            # every three bytes hold two 12 bit entries
+            # http://dfists.ua.es/~gil/FAT12Description.pdf, p. 9
+            fat = fat[:len(fat) - len(fat) % 3]
+            low = fat[0::3]
+            middle = fat[1::3]
+            high = fat[2::3]
+            cluster_map = array.array('I', [0]) * (len(fat) // 3 * 2)
+            cluster_map[0::2] = array.array('I',
+                    [a | ((b & 0x0f) << 8) for a, b in zip(low, middle)])
+            cluster_map[1::2] = array.array('I',
+                    [(b >> 4) | (c << 4) for b, c in zip(middle, high)])
+            return cluster_map
+        if self.fat32:
+            # the upper four bits of a FAT32 entry are reserved
+            fat = bytearray(fat[:len(fat) - len(fat) % 4])
+            fat[3::4] = fat[3::4].translate(fat32_mask)
+            cluster_map = array.array('I')
+        else:
+            fat = fat[:len(fat) - len(fat) % 2]
+            cluster_map = array.array('H')
+        cluster_map.frombytes(fat)
+        if sys.byteorder == 'big':
+            cluster_map.byteswap()
+        return cluster_map
 
     def unpack(self):
         try:
@@ -130,30 +152,27 @@ class VfatUnpackParser(UnpackParser):
     def extract_dir(self, start_cluster, rel_outfile):
         abs_outfile = self.scan_environment.unpack_path(rel_outfile)
         os.makedirs(abs_outfile, exist_ok=True)
-        dir_entries = b''
-        cluster_size = self.data.boot_sector.bpb.ls_per_clus * \
-                self.data.boot_sector.bpb.bytes_per_ls
-        for cluster in self.cluster_chain(start_cluster):
-            start = self.pos_data + (cluster-2) * cluster_size
-            check_condition(start+cluster_size <= self.fileresult.filesize,
+        dir_entries = []
+        for start, size in self.cluster_runs(start_cluster):
+            check_condition(start+size <= self.fileresult.filesize,
                     "file data outside file")
             self.infile.seek(start)
-            dir_entries += self.infile.read(cluster_size)
-        return dir_entries
+            dir_entries.append(self.infile.read(size))
+        return b''.join(dir_entries)
 
     def extract_file(self, start_cluster, file_size, rel_outfile):
         abs_outfile = self.scan_environment.unpack_path(rel_outfile)
         os.makedirs(abs_outfile.parent, exist_ok=True)
         outfile = open(abs_outfile, 'wb')
         size_read = 0
-        cluster_size = self.data.boot_sector.bpb.ls_per_clus * \
-                self.data.boot_sector.bpb.bytes_per_ls
-        for cluster in self.cluster_chain(start_cluster):
-            bytes_to_read = min(cluster_size, file_size - size_read)
-            start = self.pos_data + (cluster-2) * cluster_size
+        for start, size in self.cluster_runs(start_cluster):
+            if size_read == file_size:
+                break
+            bytes_to_read = min(size, file_size - size_read)
             check_condition(start+bytes_to_read <= self.fileresult.filesize,
                     "file data outside file")
-            os.sendfile(outfile.fileno(), self.infile.fileno(), start + self.infile.offset, bytes_to_read)
+            sendfile_range(outfile.fileno(), self.infile.fileno(),
+                    start + self.infile.offset, bytes_to_read)
             size_read += bytes_to_read
         outfile.close()
         outlabels = []
@@ -164,19 +183,40 @@ class VfatUnpackParser(UnpackParser):
         if self.fat12:
             return cluster >= 0xff8
         if self.fat32:
-            # return cluster >= 0x0ffffff8   # if cluster already masked
-            return (cluster & 0xffffff8) == 0xffffff8
+            # cluster map entries are already masked
+            return cluster >= 0x0ffffff8
         return cluster >= 0xfff8
 
-    def get_cluster_map_entry(self, cluster):
-        if self.fat12:
-            return self.get_fat12_entry(cluster)
-        if self.fat32:
-            return self.get_fat32_entry(cluster)
-        return self.get_fat16_entry(cluster)
-
     def cluster_chain(self, start_cluster):
         cluster = start_cluster
-        while not self.is_end_cluster(cluster):
+        cluster_map = self.cluster_map
+        # empty files do not have any clusters
+        if cluster == 0:
+            return
+        # a chain cannot be longer than the cluster map, unless it loops
+        for _ in range(len(cluster_map)):
+            if self.is_end_cluster(cluster):
+                return
+            check_condition(2 <= cluster < len(cluster_map),
+                    "invalid cluster in cluster chain")
             yield cluster
-            cluster = self.get_cluster_map_entry(cluster)
+            cluster = cluster_map[cluster]
+        raise UnpackParserException("loop in cluster chain")
+
+    def cluster_runs(self, start_cluster):
+        """Yields the offset and size of every run of consecutive clusters
+        in a cluster chain, so that each run can be copied at once."""
+        run_start = None
+        run_length = 0
+        for cluster in self.cluster_chain(start_cluster):
+            if run_start is not None and cluster == run_start + run_length:
+                run_length += 1
+                continue
+            if run_start is not None:
+                yield (self.pos_data + (run_start-2) * self.cluster_size,
+                        run_length * self.cluster_size)
+            run_start = cluster
+            run_length = 1
+        if run_start is not None:
+            yield (self.pos_data + (run_start-2) * self.cluster_size,
+                    run_length * self.cluster_size)
@@ -1,5 +1,6 @@
 import sys, os
 import hashlib
+import struct
 from test.util import *
 
 from .UnpackParser import VfatUnpackParser
@@ -103,3 +104,57 @@ def test_fat12_subdirectories_unpacked_correctly(scan_environment):
 # test FAT12, FAT16, FAT32
 # test LFN (long filenames)
 
+def _create_fat16(cluster_chains):
+    '''Create a FAT16 file system with 512 byte clusters and a file in the
+    root directory for each name in cluster_chains.'''
+    bytes_per_ls = 512
+    ls_per_fat = 20
+    total_ls = 4200
+    boot_sector = b'\xeb\x3c\x90' + b'MSWIN4.1' + struct.pack('<HBHBHHBHHHII',
+            bytes_per_ls, 1, 1, 1, 16, total_ls, 0xf8, ls_per_fat, 32, 2, 0, 0)
+    boot_sector += struct.pack('<BBBI11s8s', 0x80, 0, 0x29, 0, b'NO NAME    ', b'FAT16   ')
+    boot_sector = boot_sector.ljust(510, b'\x00') + b'\x55\xaa'
+    fat = [0xfff8, 0xffff] + [0] * (ls_per_fat * bytes_per_ls // 2 - 2)
+    data = bytearray(bytes_per_ls * (total_ls - 1 - ls_per_fat - 1))
+    root_dir = b''
+    contents = {}
+    for name, chain in cluster_chains.items():
+        content = b''
+        for i, cluster in enumerate(chain):
+            fat[cluster] = chain[i+1] if i + 1 < len(chain) else 0xffff
+            cluster_data = (b'%s-%d ' % (name.encode(), i)) * 100
+            cluster_data = cluster_data[:bytes_per_ls]
+            data[(cluster-2)*bytes_per_ls:(cluster-1)*bytes_per_ls] = cluster_data
+            content += cluster_data
+        # the file ends halfway in its last cluster
+        content = content[:len(content) - bytes_per_ls // 2]
+        contents[name] = content
+        start_cluster = chain[0] if chain else 0
+        root_dir += struct.pack('<8s3sB14xHI', name.upper().encode().ljust(8),
+                b'   ', 0x20, start_cluster, len(content))
+    root_dir = root_dir.ljust(bytes_per_ls, b'\x00')
+    image = boot_sector + struct.pack('<%dH' % len(fat), *fat) + root_dir + data
+    return image, contents
+
+# test if files of which the clusters are not consecutive are unpacked correctly
+def test_fat16_fragmented_files_unpacked_correctly(scan_environment):
+    image, contents = _create_fat16({
+        'frag': [2, 3, 7, 4, 5, 6, 10, 11],
+        'single': [8],
+        'empty': [],
+    })
+    rel_testfile = pathlib.Path('test.fat')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = VfatUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == len(image)
+    assert len(r.get_unpacked_files()) == 3
+    assert list(p.cluster_runs(2)) == [(p.pos_data, 1024), (p.pos_data + 5*512, 512),
+            (p.pos_data + 2*512, 1536), (p.pos_data + 8*512, 1024)]
+    for name, content in contents.items():
+        unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / name)
+        assert unpacked_path_abs.read_bytes() == content
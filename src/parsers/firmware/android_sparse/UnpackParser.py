@@ -30,16 +30,22 @@ Tool to create images with for testing:
 * https://android.googlesource.com/platform/system/core/+/master/libsparse - img2simg.c
 
 Note: this is different to the Android sparse data image format.
+
+The format is described in android_sparse.ksy. Only the headers of the
+chunks are read when parsing: the data of raw chunks is copied straight
+from the input file with sendfile() when unpacking. "Don't care" chunks
+and fill chunks with zeros are not written but become holes in the
+output file, which is a sparse file with the size of the original data.
 '''
 
 import os
 import pathlib
+import struct
 from FileResult import FileResult
 
 from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
-from kaitaistruct import ValidationNotEqualError, ValidationExprError
-from . import android_sparse
+from bangdatarange import sendfile_range
 
 class AndroidSparseUnpackParser(UnpackParser):
     extensions = []
@@ -48,27 +54,74 @@ class AndroidSparseUnpackParser(UnpackParser):
     ]
     pretty_name = 'androidsparse'
 
+    # chunk types, see sparse_format.h
+    CHUNK_TYPE_RAW = 0xcac1
+    CHUNK_TYPE_FILL = 0xcac2
+    CHUNK_TYPE_DONT_CARE = 0xcac3
+    CHUNK_TYPE_CRC32 = 0xcac4
+
+    # maximum size of a single write of fill data
+    fill_write_size = 1048576
+
+    # maximum size of the unpacked data. Fill chunks with a non-zero
+    # value are written out in full, so a tiny image could otherwise
+    # create a huge file.
+    max_unpacked_size = 64 * 1024 * 1024 * 1024
+
     def parse(self):
         self.file_size = self.fileresult.filesize
-        try:
-            self.data = android_sparse.AndroidSparse.from_io(self.infile)
-            self.unpacked_size = self.data.header.len_header
-            for chunk in self.data.chunks:
-                check_condition(chunk.header.chunk_type in android_sparse.AndroidSparse.ChunkTypes,
-                                "invalid chunk type")
-                if chunk.header.chunk_type == android_sparse.AndroidSparse.ChunkTypes.raw:
-                    check_condition(chunk.header.num_body_blocks * self.data.header.block_size == len(chunk.body),
-                                    "not enough data in body")
-                elif chunk.header.chunk_type == android_sparse.AndroidSparse.ChunkTypes.fill:
-                    check_condition(len(chunk.body) == 4, "wrong body length")
-                elif chunk.header.chunk_type == android_sparse.AndroidSparse.ChunkTypes.dont_care:
-                    check_condition(len(chunk.body) == 0, "wrong body length")
-                self.unpacked_size += chunk.header.len_chunk
-        except (Exception, ValidationNotEqualError, ValidationExprError) as e:
-            raise UnpackParserException(e.args)
-        check_condition(self.file_size >= self.unpacked_size, "not enough data")
-        check_condition(self.data.header.version.major == 1, "unsupported major version")
-        check_condition(self.data.header.block_size % 4 == 0, "unsupported block size")
+        check_condition(self.file_size - self.offset >= 28, "not enough data for header")
+        (magic, major_version, minor_version, len_header, self.len_chunk_header,
+         self.block_size, self.num_blocks, num_chunks,
+         checksum) = struct.unpack('<IHHHHIIII', self.infile.read(28))
+        check_condition(magic == 0xed26ff3a, "invalid magic")
+        check_condition(major_version == 1, "unsupported major version")
+        check_condition(len_header >= 28, "invalid header size")
+        check_condition(self.len_chunk_header >= 12, "invalid chunk header size")
+        check_condition(self.block_size != 0 and self.block_size % 4 == 0,
+                        "unsupported block size")
+        check_condition(self.num_blocks * self.block_size <= self.max_unpacked_size,
+                        "unpacked data too large")
+
+        # record the type, the size in blocks, the offset of the body
+        # and (for fill chunks) the fill value of each chunk
+        self.chunks = []
+        chunk_offset = len_header
+        total_blocks = 0
+        for i in range(num_chunks):
+            self.infile.seek(chunk_offset)
+            chunk_header = self.infile.read(12)
+            check_condition(len(chunk_header) == 12, "not enough data for chunk header")
+            (chunk_type, reserved, num_body_blocks,
+             len_chunk) = struct.unpack('<HHII', chunk_header)
+            check_condition(len_chunk >= self.len_chunk_header, "invalid chunk size")
+            len_body = len_chunk - self.len_chunk_header
+            if chunk_type == self.CHUNK_TYPE_RAW:
+                check_condition(num_body_blocks * self.block_size == len_body,
+                                "not enough data in body")
+            elif chunk_type == self.CHUNK_TYPE_FILL:
+                check_condition(len_body == 4, "wrong body length")
+            elif chunk_type == self.CHUNK_TYPE_DONT_CARE:
+                check_condition(len_body == 0, "wrong body length")
+            elif chunk_type == self.CHUNK_TYPE_CRC32:
+                check_condition(len_body == 4, "wrong body length")
+            else:
+                raise UnpackParserException("invalid chunk type")
+            check_condition(self.offset + chunk_offset + len_chunk <= self.file_size,
+                            "not enough data")
+            if chunk_type != self.CHUNK_TYPE_CRC32:
+                total_blocks += num_body_blocks
+                check_condition(total_blocks <= self.num_blocks, "too many blocks in chunks")
+            fill_value = None
+            if chunk_type == self.CHUNK_TYPE_FILL:
+                self.infile.seek(chunk_offset + self.len_chunk_header)
+                fill_value = self.infile.read(4)
+            self.chunks.append((chunk_type, num_body_blocks,
+                                chunk_offset + self.len_chunk_header, fill_value))
+            chunk_offset += len_chunk
+        # like libsparse, the chunks have to add up to the size in the header
+        check_condition(total_blocks == self.num_blocks, "wrong number of blocks in chunks")
+        self.unpacked_size = chunk_offset
 
     def unpack(self):
         # there is only one file that needs to be unpacked/created
@@ -82,19 +135,37 @@ class AndroidSparseUnpackParser(UnpackParser):
         outfile_full = self.scan_environment.unpack_path(outfile_rel)
         os.makedirs(outfile_full.parent, exist_ok=True)
         outfile = open(outfile_full, 'wb')
-        for chunk in self.data.chunks:
-            if chunk.header.chunk_type == android_sparse.AndroidSparse.ChunkTypes.raw:
-                outfile.write(chunk.body)
-            elif chunk.header.chunk_type == android_sparse.AndroidSparse.ChunkTypes.fill:
-                # Fill data, always length 4
-                for c in range(0, chunk.header.num_body_blocks):
-                    # It has already been checked that blk_sz
-                    # is divisible by 4.
-                   outfile.write(chunk.body*(self.data.header.block_size//4))
-            elif chunk.header.chunk_type == android_sparse.AndroidSparse.ChunkTypes.dont_care:
-                for c in range(0, chunk.header.num_body_blocks):
-                   outfile.write(b'\x00' * self.data.header.block_size)
-        outfile.close()
+        try:
+            outfd = outfile.fileno()
+            out_offset = 0
+            for (chunk_type, num_body_blocks, body_offset, fill_value) in self.chunks:
+                chunk_size = num_body_blocks * self.block_size
+                if chunk_type == self.CHUNK_TYPE_RAW:
+                    os.lseek(outfd, out_offset, os.SEEK_SET)
+                    sendfile_range(outfd, self.infile.fileno(),
+                                   self.infile.offset + body_offset, chunk_size)
+                elif chunk_type == self.CHUNK_TYPE_FILL and fill_value != b'\x00' * 4:
+                    # Fill data is written in large writes. It has already
+                    # been checked that the block size is divisible by 4.
+                    os.lseek(outfd, out_offset, os.SEEK_SET)
+                    blocks_per_write = max(1, self.fill_write_size // self.block_size)
+                    fill_data = fill_value * (self.block_size // 4) * min(num_body_blocks, blocks_per_write)
+                    bytes_to_write = chunk_size
+                    while bytes_to_write > 0:
+                        bytes_to_write -= os.write(outfd, fill_data[:bytes_to_write])
+                elif chunk_type == self.CHUNK_TYPE_CRC32:
+                    # CRC32 chunks only contain a checksum of the data so
+                    # far and do not produce any output blocks.
+                    continue
+                # "don't care" chunks and fill chunks with zeros are
+                # skipped, which leaves holes in the output file.
+                out_offset += chunk_size
+            # set the size of the output for images that end with a hole
+            os.ftruncate(outfd, out_offset)
+        except OSError as e:
+            raise UnpackParserException(e.args)
+        finally:
+            outfile.close()
         fr = FileResult(self.fileresult, self.rel_unpack_dir / file_path, set())
         unpacked_files.append(fr)
         return unpacked_files
@@ -0,0 +1,115 @@
+import sys, os
+import struct
+from test.util import *
+
+from .UnpackParser import AndroidSparseUnpackParser
+
+block_size = 4096
+
+def _chunk(chunk_type, num_blocks, body):
+    return struct.pack('<HHII', chunk_type, 0, num_blocks, 12 + len(body)) + body
+
+def _create_sparse_image(chunks):
+    num_blocks = sum(c[1] for c in chunks if c[0] != 0xcac4)
+    header = struct.pack('<IHHHHIIII', 0xed26ff3a, 1, 0, 28, 12,
+                         block_size, num_blocks, len(chunks), 0)
+    return header + b''.join(_chunk(*c) for c in chunks)
+
+raw_data = bytes(range(256)) * 32
+test_chunks = [
+    (0xcac1, 2, raw_data),
+    (0xcac2, 3, b'\x01\x02\x03\x04'),
+    (0xcac3, 1000, b''),
+    (0xcac2, 2, b'\x00\x00\x00\x00'),
+    (0xcac1, 1, raw_data[:block_size]),
+    # the number of blocks of CRC32 chunks is ignored, like libsparse does
+    (0xcac4, 5, b'\x00\x00\x00\x00'),
+    (0xcac3, 10, b''),
+]
+expected_data = raw_data + b'\x01\x02\x03\x04' * (3 * block_size // 4) + \
+    b'\x00' * (1002 * block_size) + raw_data[:block_size] + \
+    b'\x00' * (10 * block_size)
+
+def test_unpack_sparse_image(scan_environment):
+    rel_testfile = pathlib.Path('test.img')
+    image = _create_sparse_image(test_chunks)
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = AndroidSparseUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == len(image)
+    assert r.get_labels() == ['android', 'androidsparse']
+    unpacked_files = [ x.filename for x in r.get_unpacked_files() ]
+    assert unpacked_files == [ data_unpack_dir / 'sparse.out' ]
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'sparse.out')
+    assert unpacked_path_abs.read_bytes() == expected_data
+
+def test_unpack_sparse_image_with_offset(scan_environment):
+    padding_length = 17
+    rel_testfile = pathlib.Path('prepend-test.img')
+    image = _create_sparse_image(test_chunks)
+    scan_environment.unpack_path(rel_testfile).write_bytes(
+        b'A' * padding_length + image + b'trailing data')
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = AndroidSparseUnpackParser(fr, scan_environment, data_unpack_dir, padding_length)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == len(image)
+    unpacked_path_abs = scan_environment.unpack_path(data_unpack_dir / 'sparse.out')
+    assert unpacked_path_abs.read_bytes() == expected_data
+
+def test_truncated_sparse_image(scan_environment):
+    rel_testfile = pathlib.Path('truncated.img')
+    image = _create_sparse_image(test_chunks)
+    scan_environment.unpack_path(rel_testfile).write_bytes(image[:5000])
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = AndroidSparseUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
+
+def test_invalid_chunk_type(scan_environment):
+    rel_testfile = pathlib.Path('invalid.img')
+    image = _create_sparse_image([(0xcac5, 0, b'')])
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = AndroidSparseUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
+
+def test_wrong_number_of_blocks(scan_environment):
+    rel_testfile = pathlib.Path('wrong-blocks.img')
+    image = bytearray(_create_sparse_image(test_chunks))
+    # the number of blocks in the header
+    image[16:20] = struct.pack('<I', 1000)
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = AndroidSparseUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r"too many blocks in chunks") as cm:
+        r = p.parse_and_unpack()
+    p.close()
+
+@pytest.mark.parametrize('chunk', [
+    (0xcac3, 0xffffffff, b''),
+    (0xcac2, 0xffffffff, b'\x01\x02\x03\x04'),
+])
+def test_unpacked_data_too_large(scan_environment, chunk):
+    rel_testfile = pathlib.Path('too-large.img')
+    image = _create_sparse_image([chunk])
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    p = AndroidSparseUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r"unpacked data too large") as cm:
+        r = p.parse_and_unpack()
+    p.close()
+    assert not scan_environment.unpack_path(pathlib.Path('some_dir')).exists()
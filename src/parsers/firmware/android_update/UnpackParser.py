@@ -22,25 +22,138 @@
 
 '''
 The Android A/B update format is either a full image or an update image.
-The focus here is first on the full image. The specification cannot be
+The focus here is on the full image. The specification cannot be
 fully captured in Kaitai Struct as it part of the data structure is done
 using Google Protobuf.
 
 This parser uses both Kaitai Struct and a parser generated from the Protobuf
 sources. Kaitai Struct is used for the first big sweep and several syntactical
 checks. The Protobuf generated parsers is then used to extract the data.
+
+A full update contains an image for every partition that is written with
+a list of operations that replace blocks in the partition with (possibly
+compressed) data from the payload, or with zeros. The operations write
+to different blocks, so they are independent of each other and are
+applied in parallel in a pool of threads (decompression and writing
+release the GIL). Blocks that are zeroed are not written, but are holes
+in the (sparse) partition image.
+
+Delta updates need the old version of the partitions and are not supported.
 '''
 
+import bz2
+import lzma
 import os
 import pathlib
+import zstd
 from FileResult import FileResult
 
 from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
+from bangdatarange import sendfile_range
+from bangparallel import ordered_map
 from kaitaistruct import ValidationNotEqualError
+from google.protobuf.message import DecodeError
 from . import android_update
-from . import google_protobuf
-from . import vlq_base128_le
+from . import update_metadata_pb2
+
+InstallOperation = update_metadata_pb2.InstallOperation
+
+# operations that are used in full updates
+full_update_operations = set([InstallOperation.REPLACE,
+                              InstallOperation.REPLACE_BZ,
+                              InstallOperation.REPLACE_XZ,
+                              InstallOperation.ZSTD,
+                              InstallOperation.ZERO,
+                              InstallOperation.DISCARD])
+
+
+def zstd_content_size(data):
+    '''Return the content size recorded in the header of the zstd frame
+    in data, or None if it is not recorded.'''
+    if len(data) < 6 or data[:4] != b'\x28\xb5\x2f\xfd':
+        return None
+    descriptor = data[4]
+    single_segment = descriptor & 0x20 != 0
+    position = 5 + (0 if single_segment else 1) + [0, 1, 2, 4][descriptor & 3]
+    fcs_field_size = [1 if single_segment else 0, 2, 4, 8][descriptor >> 6]
+    if fcs_field_size == 0 or position + fcs_field_size > len(data):
+        return None
+    content_size = int.from_bytes(data[position:position+fcs_field_size], 'little')
+    if fcs_field_size == 2:
+        content_size += 256
+    return content_size
+
+
+def decompress_operation(operation_type, data, maxsize):
+    '''Decompress the data of an operation, which should not be larger
+    than maxsize. Returns None if the data is larger.'''
+    if operation_type in [InstallOperation.REPLACE_BZ, InstallOperation.REPLACE_XZ]:
+        if operation_type == InstallOperation.REPLACE_BZ:
+            decompressor = bz2.BZ2Decompressor()
+        else:
+            decompressor = lzma.LZMADecompressor()
+        data = decompressor.decompress(data, maxsize + 1)
+        if len(data) <= maxsize and not decompressor.eof:
+            raise EOFError('compressed data ended before the end of the stream')
+    elif operation_type == InstallOperation.ZSTD:
+        # the zstd bindings decompress a frame at once, using the
+        # content size from the frame header
+        content_size = zstd_content_size(data)
+        if content_size is None:
+            raise ValueError('no content size in zstd frame')
+        if content_size > maxsize:
+            return None
+        data = zstd.decompress(data)
+    if len(data) > maxsize:
+        return None
+    return data
+
+
+def apply_operations(payload_name, data_offset, block_size, partition_name,
+                     operations):
+    '''Apply operations of a full update to a partition image. Each
+    operation is a tuple (type, offset of the data relative to
+    data_offset, length of the data, destination extents). Errors are
+    returned as a string, or None if there were no errors.'''
+    payload = open(payload_name, 'rb')
+    partition = open(partition_name, 'r+b')
+    try:
+        for (operation_type, offset, length, extents) in operations:
+            if operation_type == InstallOperation.REPLACE:
+                # copy the data straight from the payload
+                position = data_offset + offset
+                for (start_block, num_blocks) in extents:
+                    size = min(num_blocks * block_size, length)
+                    os.lseek(partition.fileno(), start_block * block_size, os.SEEK_SET)
+                    if sendfile_range(partition.fileno(), payload.fileno(),
+                                      position, size) != size:
+                        return 'not enough data'
+                    position += size
+                    length -= size
+                continue
+
+            data = os.pread(payload.fileno(), length, data_offset + offset)
+            if len(data) != length:
+                return 'not enough data'
+            try:
+                data = decompress_operation(operation_type, data,
+                                            sum(n for (s, n) in extents) * block_size)
+            except (OSError, ValueError, EOFError, lzma.LZMAError, zstd.Error):
+                return 'invalid compressed data'
+            if data is None:
+                return 'too much data for extents'
+            data = memoryview(data)
+            for (start_block, num_blocks) in extents:
+                size = num_blocks * block_size
+                os.pwrite(partition.fileno(), data[:size], start_block * block_size)
+                data = data[size:]
+    except OSError as e:
+        return 'could not write partition image: %s' % e
+    finally:
+        payload.close()
+        partition.close()
+    return None
 
 
 class AndroidUpdateUnpackParser(UnpackParser):
@@ -50,31 +163,120 @@ class AndroidUpdateUnpackParser(UnpackParser):
     ]
     pretty_name = 'android_update'
 
+    # the amount of data of operations that is applied in one go
+    data_per_task = 16 * 1024 * 1024
+
+    # the maximum size of a partition image
+    max_partition_size = 64 * 1024 * 1024 * 1024
+
     def parse(self):
-        check_condition(1 != 1, "disabled")
         try:
             self.data = android_update.AndroidUpdate.from_io(self.infile)
         except (Exception, ValidationNotEqualError) as e:
             raise UnpackParserException(e.args)
-        check_condition(self.data.img_header.len_image + self.offset <= self.fileresult.filesize, "not enough data")
+        check_condition(self.data.major_version == 2, "unsupported major version")
+        try:
+            self.manifest = update_metadata_pb2.DeltaArchiveManifest.FromString(self.data.manifest)
+        except DecodeError as e:
+            raise UnpackParserException(e.args)
+        check_condition(self.manifest.block_size != 0, "invalid block size")
 
+        # the data of the operations follows the manifest and the
+        # manifest signature, and the signatures of the payload are
+        # at the end of the data.
+        data_size = self.manifest.signatures_offset + self.manifest.signatures_size
+        partition_names = set()
+        self.partition_sizes = []
+        for partition in self.manifest.partitions:
+            name = partition.partition_name
+            check_condition(name not in partition_names, "duplicate partition name")
+            check_condition(name != '' and '/' not in name and not name.startswith('.'),
+                            "invalid partition name")
+            partition_names.add(name)
+            partition_size = 0
+            for operation in partition.operations:
+                check_condition(operation.type in full_update_operations,
+                                "delta updates not supported")
+                data_size = max(data_size, operation.data_offset + operation.data_length)
+                for extent in operation.dst_extents:
+                    partition_size = max(partition_size,
+                        (extent.start_block + extent.num_blocks) * self.manifest.block_size)
+            if partition.HasField('new_partition_info'):
+                check_condition(partition_size <= partition.new_partition_info.size,
+                                "operation outside of partition")
+                partition_size = partition.new_partition_info.size
+            check_condition(partition_size <= self.max_partition_size,
+                            "partition too large")
+            self.partition_sizes.append(partition_size)
+        self.unpacked_size = self.data.ofs_data + data_size
+        check_condition(self.offset + self.unpacked_size <= self.fileresult.filesize,
+                        "not enough data")
+
+    def calculate_unpacked_size(self):
+        pass
 
     # no need to carve from the file
     def carve(self):
         pass
 
-    #def unpack(self):
-        #unpacked_files = []
-        #return unpacked_files
+    def unpack(self):
+        unpacked_files = []
+        payload_name = self.scan_environment.get_unpack_path_for_fileresult(self.fileresult)
+        block_size = self.manifest.block_size
+
+        # create the (sparse) partition images and split the operations
+        # that write data into tasks
+        tasks = []
+        for (partition, partition_size) in zip(self.manifest.partitions, self.partition_sizes):
+            file_path = pathlib.Path(partition.partition_name + '.img')
+            outfile_rel = self.rel_unpack_dir / file_path
+            outfile_full = self.scan_environment.unpack_path(outfile_rel)
+            os.makedirs(outfile_full.parent, exist_ok=True)
+
+            operations = []
+            task_data = 0
+            for operation in partition.operations:
+                extents = [(extent.start_block, extent.num_blocks)
+                           for extent in operation.dst_extents]
+                # zeroed and discarded blocks are left as holes
+                if operation.type in [InstallOperation.ZERO, InstallOperation.DISCARD]:
+                    continue
+                operations.append((operation.type, operation.data_offset,
+                                   operation.data_length, extents))
+                task_data += operation.data_length
+                if task_data >= self.data_per_task:
+                    tasks.append((outfile_full, operations))
+                    operations = []
+                    task_data = 0
+            if operations:
+                tasks.append((outfile_full, operations))
+
+            outfile = open(outfile_full, 'wb')
+            try:
+                outfile.truncate(partition_size)
+            except OSError as e:
+                raise UnpackParserException(e.args)
+            finally:
+                outfile.close()
+            unpacked_files.append(FileResult(self.fileresult, outfile_rel, set()))
 
-    # make sure that self.unpacked_size is not overwritten
-    #def calculate_unpacked_size(self):
-        #pass
+        # apply the tasks, in parallel if possible
+        data_offset = self.offset + self.data.ofs_data
+        errors = ordered_map(lambda task: apply_operations(payload_name, data_offset,
+                                                           block_size, task[0], task[1]),
+                             tasks, self.scan_environment.get_unpackthreads())
+        for error in errors:
+            check_condition(error is None, error)
+        return unpacked_files
 
     def set_metadata_and_labels(self):
         """sets metadata and labels for the unpackresults"""
-        labels = ['allwinner']
+        labels = ['android', 'android update']
         metadata = {}
+        metadata['minor_version'] = self.manifest.minor_version
+        metadata['block_size'] = self.manifest.block_size
+        metadata['partitions'] = [partition.partition_name
+                                  for partition in self.manifest.partitions]
 
         self.unpack_results.set_labels(labels)
         self.unpack_results.set_metadata(metadata)
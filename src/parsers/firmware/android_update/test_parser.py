@@ -0,0 +1,143 @@
+import sys, os
+import bz2
+import lzma
+import struct
+import zstd
+from test.util import *
+
+from .UnpackParser import AndroidUpdateUnpackParser
+from . import update_metadata_pb2
+
+InstallOperation = update_metadata_pb2.InstallOperation
+
+block_size = 4096
+
+def _create_payload(partitions):
+    '''Create a full update payload. partitions is a list of
+    (name, size, operations), where operations is a list of
+    (type, data, [(start_block, num_blocks)]).'''
+    manifest = update_metadata_pb2.DeltaArchiveManifest()
+    manifest.block_size = block_size
+    manifest.minor_version = 0
+    data = b''
+    for (name, size, operations) in partitions:
+        partition = manifest.partitions.add()
+        partition.partition_name = name
+        partition.new_partition_info.size = size
+        for (operation_type, operation_data, extents) in operations:
+            operation = partition.operations.add()
+            operation.type = operation_type
+            if operation_data:
+                operation.data_offset = len(data)
+                operation.data_length = len(operation_data)
+                data += operation_data
+            for (start_block, num_blocks) in extents:
+                extent = operation.dst_extents.add()
+                extent.start_block = start_block
+                extent.num_blocks = num_blocks
+    manifest.signatures_offset = len(data)
+    manifest.signatures_size = 0
+    manifest = manifest.SerializeToString()
+    return b'CrAU' + struct.pack('>QQI', 2, len(manifest), 0) + manifest + data
+
+block_a = bytes(range(256)) * (block_size // 256)
+block_b = b'B' * block_size
+test_partitions = [
+    ('system', 8 * block_size, [
+        (InstallOperation.REPLACE, block_a * 2, [(0, 1), (3, 1)]),
+        (InstallOperation.REPLACE_BZ, bz2.compress(block_b), [(1, 1)]),
+        (InstallOperation.ZERO, b'', [(2, 1), (6, 2)]),
+        (InstallOperation.REPLACE_XZ, lzma.compress(block_a + block_b), [(4, 2)]),
+    ]),
+    ('vendor', 4 * block_size, [
+        (InstallOperation.ZSTD, zstd.compress(block_b * 3), [(0, 2), (3, 1)]),
+    ]),
+]
+expected_partitions = {
+    'system.img': block_a + block_b + bytes(block_size) + block_a + block_a
+                  + block_b + bytes(2 * block_size),
+    'vendor.img': block_b * 2 + bytes(block_size) + block_b,
+}
+
+def _unpack_payload(scan_environment, payload, offset):
+    rel_testfile = pathlib.Path('payload.bin')
+    scan_environment.unpack_path(rel_testfile).write_bytes(payload)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = AndroidUpdateUnpackParser(fr, scan_environment, data_unpack_dir, offset)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    return (r, data_unpack_dir)
+
+def test_unpack_full_update(scan_environment):
+    payload = _create_payload(test_partitions)
+    r, data_unpack_dir = _unpack_payload(scan_environment, payload, 0)
+    assert r.get_length() == len(payload)
+    assert 'android update' in r.get_labels()
+    assert r.get_metadata()['partitions'] == ['system', 'vendor']
+    unpacked_files = [ x.filename for x in r.get_unpacked_files() ]
+    assert unpacked_files == [data_unpack_dir / 'system.img',
+                              data_unpack_dir / 'vendor.img']
+    for name, data in expected_partitions.items():
+        assert scan_environment.unpack_path(data_unpack_dir / name).read_bytes() == data
+
+def test_unpack_full_update_with_offset(scan_environment):
+    payload = _create_payload(test_partitions)
+    padding_length = 17
+    r, data_unpack_dir = _unpack_payload(scan_environment,
+            b'A' * padding_length + payload + b'trailing data', padding_length)
+    assert r.get_length() == len(payload)
+    for name, data in expected_partitions.items():
+        assert scan_environment.unpack_path(data_unpack_dir / name).read_bytes() == data
+
+def test_unpack_full_update_in_parallel(scan_environment):
+    scan_environment.unpackthreads = 2
+    payload = _create_payload(test_partitions)
+    r, data_unpack_dir = _unpack_payload(scan_environment, payload, 0)
+    for name, data in expected_partitions.items():
+        assert scan_environment.unpack_path(data_unpack_dir / name).read_bytes() == data
+
+def test_delta_update_not_supported(scan_environment):
+    payload = _create_payload([('system', block_size, [
+        (InstallOperation.SOURCE_COPY, b'', [(0, 1)])])])
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        _unpack_payload(scan_environment, payload, 0)
+
+def test_truncated_file(scan_environment):
+    payload = _create_payload(test_partitions)
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        _unpack_payload(scan_environment, payload[:-100], 0)
+
+def test_operation_outside_of_partition(scan_environment):
+    payload = _create_payload([('system', block_size, [
+        (InstallOperation.REPLACE, block_a * 2, [(0, 2)])])])
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        _unpack_payload(scan_environment, payload, 0)
+
+def test_partition_too_large(scan_environment):
+    payload = _create_payload([('system', 1 << 62, [
+        (InstallOperation.REPLACE, block_a, [(0, 1)])])])
+    with pytest.raises(UnpackParserException, match = r"partition too large") as cm:
+        _unpack_payload(scan_environment, payload, 0)
+
+@pytest.mark.parametrize('operation_type, compressed', [
+    (InstallOperation.REPLACE_BZ, bz2.compress(block_b * 2)),
+    (InstallOperation.REPLACE_XZ, lzma.compress(block_b * 2)),
+    (InstallOperation.ZSTD, zstd.compress(block_b * 2)),
+])
+def test_too_much_data_for_extents(scan_environment, operation_type, compressed):
+    payload = _create_payload([('system', 2 * block_size, [
+        (operation_type, compressed, [(0, 1)])])])
+    with pytest.raises(UnpackParserException, match = r"too much data for extents") as cm:
+        _unpack_payload(scan_environment, payload, 0)
+
+@pytest.mark.parametrize('operation_type, compressed', [
+    (InstallOperation.REPLACE_BZ, bz2.compress(block_a)[:-10]),
+    (InstallOperation.REPLACE_XZ, lzma.compress(block_a)[:-10]),
+])
+def test_truncated_compressed_data(scan_environment, operation_type, compressed):
+    payload = _create_payload([('system', block_size, [
+        (operation_type, compressed, [(0, 1)])])])
+    with pytest.raises(UnpackParserException, match = r"invalid compressed data") as cm:
+        _unpack_payload(scan_environment, payload, 0)
@@ -21,11 +21,16 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import os
+import struct
 from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
 from kaitaistruct import ValidationFailedError
 from . import bmp
 
+# magic, file length, reserved, reserved, offset of the bitmap,
+# length of the bitmap header
+BMP_HEADER = struct.Struct('<2sIHHII')
+
 
 class BmpUnpackParser(UnpackParser):
     extensions = []
@@ -36,13 +41,36 @@ class BmpUnpackParser(UnpackParser):
     # https://en.wikipedia.org/wiki/BMP_file_format
 
     def parse(self):
+        if 'fast_verify_images' in self.scan_environment.get_scanprofile():
+            self.parse_structure()
+            return
         try:
             self.data = bmp.Bmp.from_io(self.infile)
         except (Exception, ValidationFailedError) as e:
             raise UnpackParserException(e.args)
+        self.len_file = self.data.file_hdr.len_file
+
+    def parse_structure(self):
+        '''Only verify the file header and the length of the bitmap
+        header, without parsing the bitmap header, color table and
+        bitmap.'''
+        data = self.infile.data
+        check_condition(self.offset + BMP_HEADER.size <= len(data),
+                        "not enough data for header")
+        (magic, self.len_file, _, _, ofs_bitmap, len_header) = \
+                BMP_HEADER.unpack_from(data, self.offset)
+        check_condition(magic == b'BM', "invalid magic")
+        check_condition(self.len_file <= len(data) - self.offset,
+                        "not enough data")
+        check_condition(ofs_bitmap <= self.len_file,
+                        "invalid bitmap offset")
+        check_condition(len_header in [12, 64, 16, 40, 52, 56, 108, 124],
+                        "invalid bitmap header length")
+        check_condition(14 + len_header <= ofs_bitmap,
+                        "bitmap header outside of bitmap info")
 
     def calculate_unpacked_size(self):
-        self.unpacked_size = self.data.file_hdr.len_file
+        self.unpacked_size = self.len_file
 
     def set_metadata_and_labels(self):
         """sets metadata and labels for the unpackresults"""
@@ -0,0 +1,51 @@
+import sys, os
+from test.util import *
+
+from UnpackParserException import UnpackParserException
+from .UnpackParser import BmpUnpackParser
+
+def test_fast_verify_standard_bmp_file(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    rel_testfile = pathlib.Path('unpackers') / 'bmp' / 'test.bmp'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    filesize = fr.filesize
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = BmpUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == filesize
+    assert r.get_unpacked_files() == []
+    assert set(r.get_labels()) == set(['bmp', 'graphics'])
+
+def test_fast_verify_extracted_bmp_file_is_correct(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    rel_testfile = pathlib.Path('unpackers') / 'bmp' / 'test-prepend-random-data.bmp'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = BmpUnpackParser(fr, scan_environment, data_unpack_dir, 128)
+    p.open()
+    r = p.parse_and_unpack()
+    p.carve()
+    p.close()
+    assert r.get_length() == 572666
+    unpacked_file = r.get_unpacked_files()[0].filename
+    unpacked_labels = r.get_unpacked_files()[0].labels
+    assert pathlib.Path(unpacked_file) == pathlib.Path(data_unpack_dir) / 'unpacked.bmp'
+    assertUnpackedPathExists(scan_environment, unpacked_file)
+    assert (scan_environment.unpackdirectory / unpacked_file).stat().st_size == r.get_length()
+    assert set(unpacked_labels) == set(r.get_labels() + ['unpacked'])
+
+def test_fast_verify_truncated_bmp_file(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    rel_testfile = pathlib.Path('unpackers') / 'bmp' / 'test-cut-data-from-end.bmp'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = BmpUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
@@ -21,12 +21,20 @@
 # SPDX-License-Identifier: AGPL-3.0-only
 
 import os
+import struct
 import defusedxml.minidom
 from . import gif
 from UnpackParser import UnpackParser, check_condition
 from UnpackParserException import UnpackParserException
 from kaitaistruct import ValidationNotEqualError
 
+# screen width, screen height, flags, background color index,
+# pixel aspect ratio
+LOGICAL_SCREEN_DESCRIPTOR = struct.Struct('<HHBBB')
+
+# left, top, width, height, flags
+IMAGE_DESCRIPTOR = struct.Struct('<HHHHB')
+
 class GifUnpackParser(UnpackParser):
     extensions = ['.gif']
     signatures = [
@@ -36,6 +44,10 @@ class GifUnpackParser(UnpackParser):
     pretty_name = 'gif'
 
     def parse(self):
+        if 'fast_verify_images' in self.scan_environment.get_scanprofile():
+            self.data = None
+            self.parse_structure()
+            return
         try:
             self.data = gif.Gif.from_io(self.infile)
         # TODO: decide what exceptions to catch
@@ -44,16 +56,104 @@ class GifUnpackParser(UnpackParser):
         except BaseException as e:
             raise UnpackParserException(e.args)
 
+    def parse_structure(self):
+        '''Only verify the structure of the file: walk the blocks and
+        check the descriptors and lengths, without reading the contents
+        of the data sub-blocks.'''
+        data = self.infile.data
+        check_condition(self.offset + 6 + LOGICAL_SCREEN_DESCRIPTOR.size <= len(data),
+                        "not enough data for header")
+        check_condition(data[self.offset:self.offset+3] == b'GIF',
+                        "invalid magic")
+        (self.screen_width, self.screen_height, flags, _, _) = \
+                LOGICAL_SCREEN_DESCRIPTOR.unpack_from(data, self.offset + 6)
+        check_condition(self.screen_width > 0, "invalid screen width")
+        check_condition(self.screen_height > 0, "invalid screen height")
+        curoffset = self.offset + 6 + LOGICAL_SCREEN_DESCRIPTOR.size
+
+        # global color table
+        if flags & 0x80 != 0:
+            curoffset += 3 * (2 << (flags & 7))
+            check_condition(curoffset <= len(data),
+                            "not enough data for global color table")
+
+        # then the blocks, until the trailer or the end of the file
+        while curoffset < len(data):
+            block_type = data[curoffset]
+            curoffset += 1
+            if block_type == 0x3b:
+                break
+            if block_type == 0x2c:
+                check_condition(curoffset + IMAGE_DESCRIPTOR.size <= len(data),
+                                "not enough data for image descriptor")
+                (_, _, width, height, flags) = IMAGE_DESCRIPTOR.unpack_from(data, curoffset)
+                check_condition(width > 0, "invalid image width")
+                check_condition(height > 0, "invalid image height")
+                curoffset += IMAGE_DESCRIPTOR.size
+
+                # local color table
+                if flags & 0x80 != 0:
+                    curoffset += 3 * (2 << (flags & 7))
+                    check_condition(curoffset <= len(data),
+                                    "not enough data for local color table")
+
+                # skip the LZW minimum code size
+                curoffset = self.skip_subblocks(curoffset + 1)
+            elif block_type == 0x21:
+                check_condition(curoffset < len(data),
+                                "not enough data for extension label")
+                label = data[curoffset]
+                curoffset += 1
+                if label == 0xf9:
+                    # graphic control extension
+                    check_condition(curoffset + 6 <= len(data),
+                                    "not enough data for graphic control extension")
+                    check_condition(data[curoffset] == 4,
+                                    "invalid graphic control extension block size")
+                    check_condition(data[curoffset+5] == 0,
+                                    "invalid graphic control extension terminator")
+                    curoffset += 6
+                    continue
+                if label == 0xff:
+                    # application extension
+                    check_condition(curoffset < len(data) and data[curoffset] == 11,
+                                    "invalid application extension block size")
+                    curoffset += 12
+                curoffset = self.skip_subblocks(curoffset)
+            else:
+                raise UnpackParserException("invalid block type")
+        self.infile.seek(curoffset - self.offset)
+
+    def skip_subblocks(self, curoffset):
+        '''Skip data sub-blocks starting at curoffset and return
+        the offset after the block terminator.'''
+        data = self.infile.data
+        while True:
+            check_condition(curoffset < len(data),
+                            "not enough data for sub-block")
+            len_bytes = data[curoffset]
+            curoffset += 1 + len_bytes
+            if len_bytes == 0:
+                return curoffset
+
     def unpack(self):
         """extract any files from the input file"""
         return []
 
     def set_metadata_and_labels(self):
         """sets metadata and labels for the unpackresults"""
+        labels = ['gif', 'graphics']
+        if self.data is None:
+            # the blocks are only parsed when the images are fully verified
+            metadata = {'width': self.screen_width,
+                        'height': self.screen_height}
+            self.unpack_results.set_metadata(metadata)
+            self.unpack_results.set_labels(labels)
+            return
+
         extensions = [ x.body for x in self.data.blocks
                 if x.block_type == self.data.BlockType.extension ]
 
-        labels = ['gif', 'graphics']
         metadata = { 'width': self.data.logical_screen_descriptor.screen_width,
                      'height': self.data.logical_screen_descriptor.screen_height}
 
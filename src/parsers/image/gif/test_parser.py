@@ -1,4 +1,6 @@
 import sys, os
+import io
+import PIL.Image
 from test.util import *
 
 from UnpackParserException import UnpackParserException
@@ -50,3 +52,58 @@ def test_load_png_file(scan_environment):
     p.close()
 
 
+
+def _create_gif():
+    '''Create a GIF image of 300x200 pixels with a gradient.'''
+    image = PIL.Image.new('RGB', (300, 200))
+    image.putdata([(x % 256, y, (x + y) % 256) for y in range(200) for x in range(300)])
+    giffile = io.BytesIO()
+    image.save(giffile, 'GIF')
+    return giffile.getvalue()
+
+def _write_testfile(scan_environment, data):
+    rel_testfile = pathlib.Path('test.gif')
+    scan_environment.unpack_path(rel_testfile).write_bytes(data)
+    return fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+
+def test_fast_verify_gif_file(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    gif_data = _create_gif()
+    fr = _write_testfile(scan_environment, gif_data)
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = GifUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == len(gif_data)
+    assert r.get_unpacked_files() == []
+    assert r.get_metadata()['width'] == 300
+    assert r.get_metadata()['height'] == 200
+    assert set(r.get_labels()) == set(['gif', 'graphics'])
+
+def test_fast_verify_extracted_gif_file_is_correct(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    gif_data = _create_gif()
+    fr = _write_testfile(scan_environment, b'A' * 128 + gif_data + b'trailing data')
+    data_unpack_dir = pathlib.Path('some_dir')
+    p = GifUnpackParser(fr, scan_environment, data_unpack_dir, 128)
+    p.open()
+    r = p.parse_and_unpack()
+    p.carve()
+    p.close()
+    assert r.get_length() == len(gif_data)
+    unpacked_file = r.get_unpacked_files()[0].filename
+    assert pathlib.Path(unpacked_file) == data_unpack_dir / 'unpacked.gif'
+    assertUnpackedPathExists(scan_environment, unpacked_file)
+    assert (scan_environment.unpackdirectory / unpacked_file).read_bytes() == gif_data
+    assert r.get_metadata()['width'] == 300
+
+def test_fast_verify_truncated_gif_file(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    gif_data = _create_gif()
+    fr = _write_testfile(scan_environment, gif_data[:len(gif_data)//2])
+    p = GifUnpackParser(fr, scan_environment, pathlib.Path('some_dir'), 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
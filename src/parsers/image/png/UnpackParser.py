@@ -31,8 +31,10 @@ Section 5 describes the structure of a PNG file
 
 import os
 import binascii
+import collections
 import datetime
 import json
+import struct
 import uuid
 from xml.parsers.expat import ExpatError
 
@@ -55,6 +57,16 @@ KNOWN_CHUNKS = set(['IHDR', 'IDAT', 'IEND', 'PLTE', 'bKGD', 'cHRM',
                     'ptIc', 'snAp', 'viSt', 'pcLs', 'raNd', 'dSIG',
                     'eXIf', 'eXif', 'skMf', 'skRf'])
 
+# chunk length and type
+CHUNK_HEADER = struct.Struct('>I4s')
+
+# the fields of the IHDR chunk: width, height, bit depth,
+# color type, compression method, filter method, interlace method
+IHDR = struct.Struct('>IIBBBBB')
+IhdrFields = collections.namedtuple('IhdrFields',
+        ['width', 'height', 'bit_depth', 'color_type',
+         'compression_method', 'filter_method', 'interlace_method'])
+
 
 class PngUnpackParser(UnpackParser):
     extensions = ['.png']
@@ -65,20 +77,16 @@ class PngUnpackParser(UnpackParser):
 
     def parse(self):
         self.chunknames = set()
+        if 'fast_verify_images' in self.scan_environment.get_scanprofile():
+            self.data = None
+            self.parse_structure()
+            return
         try:
             self.data = png.Png.from_io(self.infile)
         except (Exception, ValidationNotEqualError, ValidationExprError, ValidationLessThanError) as e:
             raise UnpackParserException(e.args)
-        check_condition(self.data.ihdr.bit_depth in [1, 2, 4, 8, 16],
-                "invalid bit depth")
-        check_condition(self.data.ihdr.width > 0,
-                "invalid width")
-        check_condition(self.data.ihdr.height > 0,
-                "invalid height")
-        check_condition(self.data.ihdr.filter_method == 0,
-                "invalid filter method")
-        check_condition(self.data.ihdr.interlace_method in [0, 1],
-                "invalid interlace method")
+        self.ihdr = self.data.ihdr
+        self.check_ihdr()
 
         for i in self.data.chunks:
             # compute CRC32
@@ -98,6 +106,65 @@ class PngUnpackParser(UnpackParser):
         check_condition('IEND' in self.chunknames,
                         "IEND section missing")
 
+    def check_ihdr(self):
+        check_condition(self.ihdr.bit_depth in [1, 2, 4, 8, 16],
+                "invalid bit depth")
+        check_condition(self.ihdr.width > 0,
+                "invalid width")
+        check_condition(self.ihdr.height > 0,
+                "invalid height")
+        check_condition(self.ihdr.filter_method == 0,
+                "invalid filter method")
+        check_condition(self.ihdr.interlace_method in [0, 1],
+                "invalid interlace method")
+
+    def parse_structure(self):
+        '''Only verify the structure of the file: walk the chunks, check
+        their lengths and the IHDR chunk, and compute the CRCs of all
+        chunks in a single pass over the data, without parsing the
+        contents of the other chunks.'''
+        data = self.infile.data
+        check_condition(data[self.offset:self.offset+8] == b'\x89PNG\x0d\x0a\x1a\x0a',
+                        "invalid magic")
+
+        # walk the chunks and record the offset and length of each chunk
+        chunks = []
+        chunkoffset = self.offset + 8
+        while True:
+            check_condition(chunkoffset + 12 <= len(data),
+                            "not enough data for chunk")
+            chunklength, chunktype = CHUNK_HEADER.unpack_from(data, chunkoffset)
+            check_condition(chunkoffset + 12 + chunklength <= len(data),
+                            "chunk outside of file")
+            try:
+                chunktype = chunktype.decode()
+            except UnicodeDecodeError:
+                raise UnpackParserException("invalid chunk type")
+            if chunks == []:
+                check_condition(chunktype == 'IHDR' and chunklength == IHDR.size,
+                                "IHDR chunk missing")
+                self.ihdr = IhdrFields._make(IHDR.unpack_from(data, chunkoffset + 8))
+            else:
+                self.chunknames.add(chunktype)
+            chunks.append((chunkoffset, chunklength))
+            chunkoffset += 12 + chunklength
+            if chunktype == 'IEND':
+                break
+        self.check_ihdr()
+
+        check_condition('IDAT' in self.chunknames,
+                        "IDAT section missing")
+
+        # then compute the CRCs of the chunk types and bodies,
+        # without copying the data
+        with memoryview(data) as view:
+            for chunkstart, chunklength in chunks:
+                crcoffset = chunkstart + 8 + chunklength
+                computed_crc = binascii.crc32(view[chunkstart+4:crcoffset])
+                check_condition(computed_crc == int.from_bytes(view[crcoffset:crcoffset+4], byteorder='big'),
+                                "invalid CRC")
+        self.infile.seek(chunkoffset - self.offset)
+
     def unpack(self):
         """extract any files from the input file"""
         return []
@@ -112,8 +179,14 @@ class PngUnpackParser(UnpackParser):
         metatags = []
         png_type_labels = []
 
+        # the chunk bodies are only parsed when the images are fully verified
+        if self.data is None:
+            chunks = []
+        else:
+            chunks = self.data.chunks
+
         # TODO: eXif, tXMP
-        for i in self.data.chunks:
+        for i in chunks:
             if i.type == 'eXIf':
                 # eXIf is a recent extension to PNG. ImageMagick supports it but
                 # there does not seem to be widespread adoption yet.
@@ -303,9 +376,9 @@ class PngUnpackParser(UnpackParser):
                 png_type_labels.append('adobe fireworks')
                 break
 
-        metadata['width'] = self.data.ihdr.width
-        metadata['height'] = self.data.ihdr.height
-        metadata['depth'] = self.data.ihdr.bit_depth
+        metadata['width'] = self.ihdr.width
+        metadata['height'] = self.ihdr.height
+        metadata['depth'] = self.ihdr.bit_depth
         metadata['text'] = pngtexts
         metadata['exif'] = exiftags
         metadata['xmp'] = xmptags
@@ -0,0 +1,49 @@
+import sys, os
+from test.util import *
+
+from UnpackParserException import UnpackParserException
+from .UnpackParser import PngUnpackParser
+
+def test_fast_verify_animated_png_file(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    rel_testfile = pathlib.Path('unpackers') / 'png' / 'Animated_PNG_example_bouncing_beach_ball.png'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    filesize = fr.filesize
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = PngUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    r = p.parse_and_unpack()
+    p.close()
+    assert r.get_length() == filesize
+    assert r.get_unpacked_files() == []
+    assert 'apng' in r.get_labels()
+    assert r.get_metadata()['width'] == 100
+    assert r.get_metadata()['text'] == []
+
+def test_fast_verify_prepended_png_file(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    rel_testfile = pathlib.Path('unpackers') / 'png' / 'Animated_PNG_example_bouncing_beach_ball-prepend-random-data.png'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = PngUnpackParser(fr, scan_environment, data_unpack_dir, 128)
+    p.open()
+    r = p.parse_and_unpack()
+    p.carve()
+    p.close()
+    assert r.get_length() == 63435
+    unpacked_file = r.get_unpacked_files()[0].filename
+    assert (scan_environment.unpackdirectory / unpacked_file).stat().st_size == r.get_length()
+
+def test_fast_verify_png_file_with_invalid_crc(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    rel_testfile = pathlib.Path('unpackers') / 'png' / 'Animated_PNG_example_bouncing_beach_ball-data-replaced-in-middle.png'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    data_unpack_dir = rel_testfile.parent / 'some_dir'
+    p = PngUnpackParser(fr, scan_environment, data_unpack_dir, 0)
+    p.open()
+    with pytest.raises(UnpackParserException, match = r".*CRC.*") as cm:
+        r = p.parse_and_unpack()
+    p.close()
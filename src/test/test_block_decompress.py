@@ -0,0 +1,80 @@
+import bz2
+import lzma
+import subprocess
+from .util import *
+from bangblockdecompress import *
+import bangunpack
+
+def _create_data():
+    return b''.join(bytes([i % 251]) * (i % 50 + 1) + bytes(range(256)) * (i % 7)
+                    for i in range(5000))
+
+def _create_multi_block_xz(data):
+    # Python's lzma module always creates a single block
+    p = subprocess.run(['xz', '-c', '-T2', '--block-size=100000'], input=data,
+                       stdout=subprocess.PIPE, check=True)
+    return p.stdout
+
+def test_find_bit_pattern():
+    # the pattern at bit 3 and at bit 64
+    value = (0x314159265359 << (200 - 3 - 48)) | (0x314159265359 << (200 - 64 - 48))
+    data = value.to_bytes(25, byteorder='big')
+    assert find_bit_pattern(data, 0x314159265359, 48, 0, len(data)) == [3, 64]
+
+def test_find_and_decompress_bzip2_blocks():
+    data = _create_data()
+    compressed = b'padding' + bz2.compress(data, 1) + b'trailing data'
+    (blocks, endofstream) = find_bzip2_blocks(compressed, 7)
+    assert len(blocks) > 1
+    assert endofstream == len(compressed) - len(b'trailing data')
+    unpacked = b''.join(decompress_bzip2_block(compressed, b'1', start, end)
+                        for (start, end) in blocks)
+    assert unpacked == data
+
+def test_find_and_decompress_xz_blocks():
+    data = _create_data()
+    compressed = b'padding' + _create_multi_block_xz(data) + b'trailing data'
+    (streamheader, blocks, endofstream) = find_xz_blocks(compressed, 7)
+    assert len(blocks) > 1
+    assert endofstream == len(compressed) - len(b'trailing data')
+    unpacked = b''.join(decompress_xz_block(compressed, streamheader, block)
+                        for block in blocks)
+    assert unpacked == data
+
+def test_find_xz_blocks_single_threaded():
+    # the compressed size is not recorded in the block header
+    compressed = lzma.compress(_create_data())
+    assert find_xz_blocks(compressed, 0) is None
+
+def _unpack_in_parallel(scan_environment, unpack_function, compressed, name):
+    scan_environment.unpackthreads = 2
+    rel_testfile = pathlib.Path(name)
+    scan_environment.unpack_path(rel_testfile).write_bytes(compressed)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    return unpack_function(fr, scan_environment, 0, pathlib.Path('some_dir'))
+
+def test_unpack_bzip2_in_parallel(scan_environment):
+    data = _create_data()
+    compressed = bz2.compress(data, 1)
+    r = _unpack_in_parallel(scan_environment, bangunpack.unpack_bzip2,
+                            compressed + b'\x00' * 10, 'test.bz2')
+    assert r['status']
+    assert r['length'] == len(compressed)
+    assert scan_environment.unpack_path(r['filesandlabels'][0][0]).read_bytes() == data
+
+def test_unpack_xz_in_parallel(scan_environment):
+    data = _create_data()
+    compressed = _create_multi_block_xz(data)
+    r = _unpack_in_parallel(scan_environment, bangunpack.unpack_xz,
+                            compressed, 'test.xz')
+    assert r['status']
+    assert r['length'] == len(compressed)
+    assert r['labels'] == ['xz', 'compressed']
+    assert scan_environment.unpack_path(r['filesandlabels'][0][0]).read_bytes() == data
+
+def test_unpack_corrupt_bzip2_in_parallel(scan_environment):
+    compressed = bytearray(bz2.compress(_create_data(), 1))
+    compressed[len(compressed) // 2] ^= 0xff
+    r = _unpack_in_parallel(scan_environment, bangunpack.unpack_bzip2,
+                            bytes(compressed), 'test.bz2')
+    assert not r['status']
@@ -0,0 +1,87 @@
+import io
+from .util import *
+from bangdatarange import *
+
+def _create_file(path):
+    data = bytes(range(256)) * 1000
+    path.write_bytes(data)
+    return data
+
+def test_copy_range_to_temporary_file(scan_environment, tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path)
+    temporaryfilename = copy_range_to_temporary_file(scan_environment,
+            path, 1000, 5000)
+    with open(temporaryfilename, 'rb') as f:
+        assert f.read() == data[1000:6000]
+    os.unlink(temporaryfilename)
+    assert scan_environment.statistics.get()['counters']['temporary_bytes_written'] == 5000
+
+def test_copy_range_past_end_of_file(scan_environment, tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path)
+    temporaryfilename = copy_range_to_temporary_file(scan_environment,
+            path, len(data) - 10, 100)
+    with open(temporaryfilename, 'rb') as f:
+        assert f.read() == data[-10:]
+    os.unlink(temporaryfilename)
+    assert scan_environment.statistics.get()['counters']['temporary_bytes_written'] == 10
+
+def test_run_with_range_as_stdin(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path)
+    (returncode, outputmsg, errormsg) = run_with_range_as_stdin(['cat'],
+            path, 1000, 100000)
+    assert returncode == 0
+    assert outputmsg == data[1000:101000]
+
+def test_run_with_range_as_stdin_until_end(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path)
+    (returncode, outputmsg, errormsg) = run_with_range_as_stdin(['cat'],
+            path, 1000)
+    assert returncode == 0
+    assert outputmsg == data[1000:]
+
+def test_run_with_range_as_stdin_program_exits_early(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path)
+    (returncode, outputmsg, errormsg) = run_with_range_as_stdin(['true'],
+            path, 0, len(data))
+    assert returncode == 0
+
+def test_tool_help_contains_missing_program():
+    assert not tool_help_contains(('bang-nonexisting-program', '-help'), '-o')
+
+def test_data_ranges(tmp_path):
+    path = tmp_path / 'sparse'
+    with open(path, 'wb') as f:
+        f.write(b'A' * 4096)
+        f.seek(1024 * 1024)
+        f.write(b'B' * 4096)
+        f.truncate(4 * 1024 * 1024)
+    with open(path, 'rb') as f:
+        ranges = data_ranges(f.fileno(), 0, 4 * 1024 * 1024)
+        assert f.tell() == 0
+    # file systems that do not report holes return the whole range
+    if len(ranges) != 1:
+        assert ranges == [(0, 4096), (1024 * 1024, 4096)]
+    assert sum(size for (offset, size) in ranges) <= 4 * 1024 * 1024
+
+def test_data_ranges_partial(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path)
+    with open(path, 'rb') as f:
+        assert data_ranges(f.fileno(), 1000, 5000) == [(1000, 5000)]
+
+def test_file_range(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path)
+    f = FileRange(path, 1000, 5000)
+    assert f.read(10) == data[1000:1010]
+    f.seek(-10, os.SEEK_END)
+    assert f.read() == data[5990:6000]
+    assert f.read() == b''
+    f.seek(100)
+    assert f.tell() == 100
+    assert io.BufferedReader(f).read() == data[1100:6000]
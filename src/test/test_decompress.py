@@ -0,0 +1,134 @@
+import hashlib
+import subprocess
+import lz4.frame
+from .util import *
+from bangdecompress import *
+import bangunpack
+
+class BytesWriter:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+def _unpack(scan_environment, unpack_function, data, name, offset=0):
+    rel_testfile = pathlib.Path(name)
+    scan_environment.unpack_path(rel_testfile).write_bytes(data)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    return unpack_function(fr, scan_environment, offset, pathlib.Path('some_dir'))
+
+def _check_unpacked_file(scan_environment, r, data):
+    outfile_rel = r['filesandlabels'][0][0]
+    assert scan_environment.unpack_path(outfile_rel).read_bytes() == data
+    assert r['hashes'][outfile_rel]['sha256'] == hashlib.sha256(data).hexdigest()
+
+def _pg6130():
+    with open(testdir_base / 'testdata' / 'unpackers' / 'lz4' / 'pg6130.txt.lz4', 'rb') as f:
+        return lz4.frame.decompress(f.read())
+
+def test_decompress_lzw():
+    compressed = (testdir_base / 'testdata' / 'unpackers' / 'compress' / 'pg6130.txt.Z').read_bytes()
+    writer = BytesWriter()
+    assert decompress_lzw(b'padding' + compressed, 7, writer, flushsize=1000) == len(compressed)
+    assert writer.data == _pg6130()[:200000]
+
+def _compress_lzw(data, maxbits):
+    '''Compress data with LZW without block mode, and write the codes
+    in groups like ncompress does.'''
+    table = dict((bytes([i]), i) for i in range(256))
+    codes = []
+    string = b''
+    for i in range(len(data)):
+        if string + data[i:i+1] in table:
+            string += data[i:i+1]
+            continue
+        codes.append(table[string])
+        if len(table) < 1 << maxbits:
+            table[string + data[i:i+1]] = len(table)
+        string = data[i:i+1]
+    if string:
+        codes.append(table[string])
+
+    compressed = bytearray(b'\x1f\x9d' + bytes([maxbits]))
+    bits = 9
+    # the last entry in the table of the decompressor, which does not
+    # add an entry for the first code
+    end = 254
+    position = 0
+    while position < len(codes):
+        if end >= (1 << bits) - 1 and bits < maxbits:
+            bits += 1
+        group = []
+        while position < len(codes) and len(group) < 8:
+            # the rest of the group is skipped if the code size changes
+            if group and end >= (1 << bits) - 1 and bits < maxbits:
+                break
+            group.append(codes[position])
+            position += 1
+            end = min(end + 1, (1 << maxbits) - 1)
+        groupsize = bits if position < len(codes) else (len(group) * bits + 7) // 8
+        groupdata = sum(code << (i * bits) for (i, code) in enumerate(group))
+        compressed += groupdata.to_bytes(groupsize, byteorder='little')
+    return bytes(compressed)
+
+def test_decompress_lzw_long_table_entries():
+    # the table entries are longer than the suffixes in the table
+    data = b'a' * 100000 + bytes(range(256)) * 100 + b'b' * 10000
+    for maxbits in [12, 16]:
+        compressed = _compress_lzw(data, maxbits)
+        writer = BytesWriter()
+        assert decompress_lzw(compressed, 0, writer) == len(compressed)
+        assert writer.data == data
+
+def test_decompress_lzw_invalid_code():
+    # the second code refers to a table entry that does not exist
+    compressed = b'\x1f\x9d\x90' + (0x41 | (0x1ff << 9)).to_bytes(3, byteorder='little')
+    with pytest.raises(DecompressionError):
+        decompress_lzw(compressed, 0, BytesWriter())
+
+def test_unpack_compress(scan_environment):
+    compressed = (testdir_base / 'testdata' / 'unpackers' / 'compress' / 'pg6130.txt.Z').read_bytes()
+    r = _unpack(scan_environment, bangunpack.unpack_compress, compressed, 'pg6130.txt.Z')
+    assert r['status']
+    assert r['length'] == len(compressed)
+    assert r['labels'] == ['compress']
+    assert r['filesandlabels'][0][0] == 'some_dir/pg6130.txt'
+    _check_unpacked_file(scan_environment, r, _pg6130()[:200000])
+
+def test_unpack_lz4_legacy(scan_environment):
+    data = _pg6130() * 12
+    p = subprocess.run(['lz4c', '-l', '-c'], input=data, stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE, check=True)
+    compressed = p.stdout
+    r = _unpack(scan_environment, bangunpack.unpack_lz4legacy,
+                b'padding' + compressed + b'trailing data', 'test', offset=7)
+    assert r['status']
+    assert r['length'] == len(compressed)
+    assert r['labels'] == []
+    _check_unpacked_file(scan_environment, r, data)
+
+def test_unpack_zstd_in_process(scan_environment, tmp_path):
+    data = _pg6130()
+    # zstd only records the content size when compressing a file
+    (tmp_path / 'data').write_bytes(data)
+    p = subprocess.run(['zstd', '-c', '-q', tmp_path / 'data'],
+                       stdout=subprocess.PIPE, check=True)
+    compressed = p.stdout
+    r = _unpack(scan_environment, bangunpack.unpack_zstd,
+                compressed + b'trailing data', 'test.zst')
+    assert r['status']
+    assert r['length'] == len(compressed)
+    _check_unpacked_file(scan_environment, r, data)
+
+def test_unpack_zstd_without_content_size(scan_environment):
+    data = _pg6130()
+    p = subprocess.run(['zstd', '-c', '-q', '--no-content-size'], input=data,
+                       stdout=subprocess.PIPE, check=True)
+    compressed = p.stdout
+    r = _unpack(scan_environment, bangunpack.unpack_zstd, compressed, 'test.zst')
+    assert r['status']
+    assert r['length'] == len(compressed)
+    assert r['labels'] == ['zstd', 'compressed']
+    assert r['hashes'] == {}
+    assert scan_environment.unpack_path(r['filesandlabels'][0][0]).read_bytes() == data
@@ -0,0 +1,55 @@
+import hashlib
+import random
+
+from .util import *
+from FileContentsComputer import *
+import bangparallel
+
+def _create_file(path, size):
+    data = random.Random(0).randbytes(size)
+    path.write_bytes(data)
+    return data
+
+def _hash_file(path, read_size, max_read_size=None, threads=1):
+    fc = FileContentsComputer(read_size, max_read_size=max_read_size)
+    hasher = Hasher(hash_algorithms, threads)
+    fc.subscribe(hasher)
+    fc.read(path)
+    return hasher.get()
+
+def _expected_hashes(data):
+    return dict([(a, hashlib.new(a, data).hexdigest())
+        for a in hash_algorithms])
+
+def test_adaptive_read_size():
+    assert adaptive_read_size(100, 10240, None) == 10240
+    assert adaptive_read_size(100, 10240, 1048576) == 10240
+    assert adaptive_read_size(16*65536, 10240, 1048576) == 65536
+    assert adaptive_read_size(1 << 30, 10240, 1048576) == 1048576
+
+def test_hasher_large_reads(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path, 3*1048576 + 17)
+    assert _hash_file(path, 10240, 1048576) == _expected_hashes(data)
+
+def test_hasher_parallel(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path, 3*1048576 + 17)
+    assert _hash_file(path, 10240, 1048576, threads=3) == _expected_hashes(data)
+
+def test_hasher_parallel_small_reads(tmp_path):
+    path = tmp_path / 'data'
+    data = _create_file(path, 100000)
+    assert _hash_file(path, 10240, threads=3) == _expected_hashes(data)
+
+def test_hasher_empty_file(tmp_path):
+    path = tmp_path / 'data'
+    path.write_bytes(b'')
+    assert _hash_file(path, 10240, 1048576, threads=3) == emptyhashresults
+
+def test_hasher_thread_pool_is_replaced_and_shut_down():
+    small_pool = bangparallel.get_thread_pool(1)
+    large_pool = bangparallel.get_thread_pool(small_pool._max_workers + 1)
+    assert large_pool is not small_pool
+    assert small_pool._shutdown
+    assert bangparallel.get_thread_pool(1) is large_pool
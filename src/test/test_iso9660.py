@@ -0,0 +1,343 @@
+import math
+import struct
+import zlib
+from .util import *
+import bangfilesystems
+
+def _both(fmt, value):
+    '''Pack a value in both little endian and big endian order.'''
+    return struct.pack('<' + fmt, value) + struct.pack('>' + fmt, value)
+
+def _directory_record(extent, size, flags, name, system_use=b''):
+    padding = b'\x00' * (1 - len(name) % 2)
+    record = struct.pack('<BB', 0, 0) + _both('I', extent) + _both('I', size)
+    record += bytes(7) + struct.pack('<BBB', flags, 0, 0) + _both('H', 1)
+    record += struct.pack('<B', len(name)) + name + padding + system_use
+    record += b'\x00' * (len(record) % 2)
+    return bytes([len(record)]) + record[1:]
+
+def _path_table(directories, name_encoding):
+    path_table = b''
+    for (extent, parent, name) in directories:
+        name = name.encode(name_encoding) if name else b'\x00'
+        path_table += struct.pack('<BBIH', len(name), 0, extent, parent) + name
+        path_table += b'\x00' * (len(name) % 2)
+    return path_table
+
+def _rock_ridge(name=None, symlink=None, zisofs=None):
+    system_use = b''
+    if name is not None:
+        name = name.encode()
+        system_use += b'NM' + bytes([5 + len(name), 1, 0]) + name
+    if symlink is not None:
+        components = b''
+        for component in symlink.split('/'):
+            if component == '':
+                components += b'\x08\x00'
+            else:
+                components += b'\x00' + bytes([len(component)]) + component.encode()
+        system_use += b'SL' + bytes([5 + len(components), 1, 0]) + components
+    if zisofs is not None:
+        system_use += b'ZF\x10\x01pz\x04\x0f' + _both('I', zisofs)
+    return system_use
+
+def _zisofs(data):
+    '''Compress data with zisofs, with 32 KiB blocks. Blocks of NUL
+    bytes are not stored.'''
+    block_size = 32768
+    blocks = math.ceil(len(data) / block_size)
+    header = b'\x37\xe4\x53\x96\xc9\xdb\xd6\x07' + struct.pack('<IBBH', len(data), 4, 15, 0)
+    position = len(header) + (blocks + 1) * 4
+    pointers = [position]
+    compressed = b''
+    for i in range(blocks):
+        block = data[i*block_size:(i+1)*block_size]
+        if block.count(0) != len(block):
+            compressed += zlib.compress(block)
+        pointers.append(position + len(compressed))
+    return header + struct.pack('<%dI' % len(pointers), *pointers) + compressed
+
+def _create_iso(entries, rockridge=True, joliet=False, boot=False, hybrid=False):
+    '''Create an ISO9660 image. entries is a list of (path, contents)
+    where contents is None for directories, a str for symbolic links
+    (Rock Ridge only) and bytes for files, which can be a tuple of bytes
+    for files with several extents. Files named *.z are compressed
+    with zisofs.'''
+    # sectors 0-15 are the system area, followed by the volume
+    # descriptors, the path tables and the directories.
+    descriptors = 2 + boot + joliet
+    sector = 16 + descriptors
+    boot_catalog = None
+    if boot:
+        boot_catalog = sector
+        sector += 1
+    directories = sorted([path for (path, contents) in entries if contents is None],
+                         key=lambda path: (path.count('/'), path))
+    directories = [''] + directories
+    trees = [('iso', 'ascii')]
+    if joliet:
+        trees.append(('joliet', 'utf-16-be'))
+    path_table_sectors = {}
+    directory_sectors = {}
+    for (tree, encoding) in trees:
+        path_table_sectors[tree] = sector
+        sector += 1
+        for directory in directories:
+            directory_sectors[(tree, directory)] = sector
+            sector += 1
+
+    # the file data
+    file_extents = {}
+    data = {}
+    for (path, contents) in entries:
+        if isinstance(contents, str) or contents is None:
+            continue
+        if isinstance(contents, bytes):
+            contents = (contents, )
+        if path.endswith('.z'):
+            contents = (_zisofs(b''.join(contents)), )
+        file_extents[path] = []
+        for extent in contents:
+            file_extents[path].append((sector, len(extent)))
+            data[sector] = extent
+            sector += math.ceil(len(extent) / 2048)
+    if boot:
+        # a boot image that is not in the directory tree
+        boot_image_sector = sector
+        data[sector] = b'boot' * 1024
+        sector += 2
+    volume_space_size = sector
+
+    image = bytearray(volume_space_size * 2048)
+    for (position, extent) in data.items():
+        image[position*2048:position*2048+len(extent)] = extent
+
+    for (tree, encoding) in trees:
+        # the path table, ordered by level (ECMA 119, 6.9.1)
+        path_table_directories = []
+        for directory in directories:
+            parent = directories.index(directory.rpartition('/')[0]) + 1
+            path_table_directories.append((directory_sectors[(tree, directory)], parent,
+                                           directory.rpartition('/')[2]))
+        path_table = _path_table(path_table_directories, encoding)
+        image[path_table_sectors[tree]*2048:path_table_sectors[tree]*2048+len(path_table)] = path_table
+
+        for directory in directories:
+            parent = directory.rpartition('/')[0]
+            system_use = b''
+            if directory == '' and tree == 'iso' and rockridge:
+                system_use = b'SP\x07\x01\xbe\xef\x00'
+            records = _directory_record(directory_sectors[(tree, directory)], 2048, 2, b'\x00', system_use)
+            records += _directory_record(directory_sectors[(tree, parent)], 2048, 2, b'\x01')
+            for (counter, (path, contents)) in enumerate(entries):
+                if path.rpartition('/')[0] != directory:
+                    continue
+                name = path.rpartition('/')[2]
+                if tree == 'joliet':
+                    isoname = name.encode(encoding)
+                    system_use = b''
+                else:
+                    isoname = b'F%d' % counter
+                    system_use = b''
+                    if rockridge:
+                        symlink = contents if isinstance(contents, str) else None
+                        zisofs = None
+                        if path.endswith('.z'):
+                            zisofs = len(contents)
+                        system_use = _rock_ridge(name, symlink, zisofs)
+                    else:
+                        isoname = name.upper().encode()
+                if contents is None:
+                    records += _directory_record(directory_sectors[(tree, path)], 2048, 2,
+                                                 isoname, system_use)
+                    continue
+                if tree == 'iso' or not rockridge:
+                    isoname += ';1'.encode(encoding)
+                extents = file_extents.get(path, [(0, 0)])
+                for (i, (extent, size)) in enumerate(extents):
+                    flags = 0x80 if i < len(extents) - 1 else 0
+                    records += _directory_record(extent, size, flags, isoname, system_use)
+            position = directory_sectors[(tree, directory)] * 2048
+            image[position:position+len(records)] = records
+
+    # the volume descriptors
+    def volume_descriptor(descriptortype, tree, escape=b''):
+        descriptor = bytearray(2048)
+        descriptor[0:7] = bytes([descriptortype]) + b'CD001\x01'
+        descriptor[80:88] = _both('I', volume_space_size)
+        descriptor[88:88+len(escape)] = escape
+        descriptor[128:132] = _both('H', 2048)
+        descriptor[132:140] = _both('I', len(_path_table(path_table_directories, 'ascii')))
+        if tree == 'joliet':
+            descriptor[132:140] = _both('I', len(_path_table(path_table_directories, 'utf-16-be')))
+        descriptor[140:144] = struct.pack('<I', path_table_sectors[tree])
+        descriptor[156:190] = _directory_record(directory_sectors[(tree, '')], 2048, 2, b'\x00')
+        return descriptor
+
+    position = 16 * 2048
+    image[position:position+2048] = volume_descriptor(1, 'iso')
+    position += 2048
+    if boot:
+        descriptor = bytearray(2048)
+        descriptor[0:7] = b'\x00CD001\x01'
+        descriptor[7:39] = b'EL TORITO SPECIFICATION'.ljust(32, b'\x00')
+        descriptor[0x47:0x4b] = struct.pack('<I', boot_catalog)
+        image[position:position+2048] = descriptor
+        position += 2048
+
+        # the validation entry, the default entry, which boots a file
+        # in the directory tree, and a section with one more image.
+        validation = bytearray(b'\x01' + bytes(27) + b'\x00\x00\x55\xaa')
+        checksum = -sum(struct.unpack('<16H', validation)) & 0xffff
+        validation[28:30] = struct.pack('<H', checksum)
+        catalog = bytes(validation)
+        catalog += struct.pack('<BBHBBHI20x', 0x88, 0, 0, 0, 0, 4,
+                               file_extents['isolinux.bin'][0][0])
+        catalog += struct.pack('<BBH28x', 0x91, 0xef, 1)
+        catalog += struct.pack('<BBHBBHI20x', 0x88, 0, 0, 0, 0, 8, boot_image_sector)
+        image[boot_catalog*2048:boot_catalog*2048+len(catalog)] = catalog
+    if joliet:
+        image[position:position+2048] = volume_descriptor(2, 'joliet', b'%/E')
+        position += 2048
+    image[position:position+7] = b'\xffCD001\x01'
+
+    if hybrid:
+        # a partition table for the image padded to 1 MiB, with a GPT
+        # header of which the backup is in the last sector.
+        disksize = 1024 * 1024
+        image[446:462] = struct.pack('<B3xB3xII', 0x80, 0x17, 0, disksize // 512)
+        image[510:512] = b'\x55\xaa'
+        image[512:520] = b'EFI PART'
+        image[544:552] = struct.pack('<Q', disksize // 512 - 1)
+        image += b'\x00' * (disksize - len(image))
+    return bytes(image)
+
+def _unpack(scan_environment, image, offset=0):
+    rel_testfile = pathlib.Path('test.iso')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_iso9660(fr, scan_environment, offset, unpackdir)
+    return (r, unpackdir, scan_environment.unpack_path(unpackdir))
+
+entries = [
+    ('a.txt', b'hello'),
+    ('dir', None),
+    ('dir/sub', None),
+    ('dir/sub/Long File Name.txt', b'x' * 5000),
+    ('dir/empty', b''),
+    ('large', (b'a' * 4096, b'b' * 100)),
+]
+
+def test_unpack_iso9660_rock_ridge(scan_environment):
+    image = _create_iso(entries + [('dir/link', '../a.txt'), ('abs', '/etc/passwd'),
+                                   ('c.z', b'c' * 32768 + bytes(32768) + b'd' * 10)])
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, image)
+    assert r['status'] is True
+    assert r['length'] == len(image)
+    assert r['labels'] == ['iso9660', 'filesystem']
+    assert r['metadata']['rockridge'] is True
+    assert sorted(r['filesandlabels']) == [
+        (os.path.join(unpackdir, 'a.txt'), []),
+        (os.path.join(unpackdir, 'abs'), ['symbolic link']),
+        (os.path.join(unpackdir, 'c.z'), []),
+        (os.path.join(unpackdir, 'dir', 'empty'), []),
+        (os.path.join(unpackdir, 'dir', 'link'), ['symbolic link']),
+        (os.path.join(unpackdir, 'dir', 'sub', 'Long File Name.txt'), []),
+        (os.path.join(unpackdir, 'large'), [])]
+    assert (unpackdir_full / 'a.txt').read_bytes() == b'hello'
+    assert (unpackdir_full / 'dir' / 'sub' / 'Long File Name.txt').read_bytes() == b'x' * 5000
+    assert (unpackdir_full / 'dir' / 'empty').read_bytes() == b''
+    assert (unpackdir_full / 'large').read_bytes() == b'a' * 4096 + b'b' * 100
+    assert (unpackdir_full / 'c.z').read_bytes() == b'c' * 32768 + bytes(32768) + b'd' * 10
+    assert os.readlink(unpackdir_full / 'dir' / 'link') == '../a.txt'
+    assert os.readlink(unpackdir_full / 'abs') == '/etc/passwd'
+
+def test_unpack_iso9660_joliet(scan_environment):
+    image = _create_iso(entries, rockridge=False, joliet=True)
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, image)
+    assert r['status'] is True
+    assert r['metadata']['rockridge'] is False
+    assert r['metadata']['joliet'] is True
+    assert (unpackdir_full / 'dir' / 'sub' / 'Long File Name.txt').read_bytes() == b'x' * 5000
+    assert (unpackdir_full / 'large').read_bytes() == b'a' * 4096 + b'b' * 100
+
+def test_unpack_iso9660_plain(scan_environment):
+    image = _create_iso([('a.txt', b'hello'), ('dir', None), ('dir/readme', b'text')],
+                        rockridge=False)
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, image)
+    assert r['status'] is True
+    # the version number and the trailing dot are removed
+    assert sorted(r['filesandlabels']) == [
+        (os.path.join(unpackdir, 'A.TXT'), []),
+        (os.path.join(unpackdir, 'DIR', 'README'), [])]
+    assert (unpackdir_full / 'DIR' / 'README').read_bytes() == b'text'
+
+def test_unpack_iso9660_el_torito_and_hybrid(scan_environment):
+    image = _create_iso([('isolinux.bin', b'i' * 5000)], boot=True, hybrid=True)
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, image + b'trailing data')
+    assert r['status'] is True
+    # the padding of the hybrid image belongs to the image
+    assert r['length'] == len(image)
+    assert r['metadata']['bootable'] is True
+    assert r['metadata']['hybrid'] == 'gpt'
+    assert sorted(r['filesandlabels']) == [
+        (os.path.join(unpackdir, '[BOOT]', '1-Boot-NoEmul.img'), []),
+        (os.path.join(unpackdir, '[BOOT]', '2-Boot-NoEmul.img'), []),
+        (os.path.join(unpackdir, 'isolinux.bin'), [])]
+    # the boot image in the directory tree has the size of the file
+    assert (unpackdir_full / '[BOOT]' / '1-Boot-NoEmul.img').read_bytes() == b'i' * 5000
+    assert (unpackdir_full / '[BOOT]' / '2-Boot-NoEmul.img').read_bytes() == b'boot' * 1024
+
+def test_unpack_iso9660_invalid_path_table(scan_environment):
+    image = bytearray(_create_iso([('dir', None), ('dir/a', b'a')]))
+    # let the parent of the subdirectory point to a directory that
+    # is not in the path table.
+    path_table = 18 * 2048
+    image[path_table+10+6:path_table+10+8] = struct.pack('<H', 3)
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, bytes(image))
+    assert r['status'] is False
+
+@pytest.mark.parametrize('testfile, offset, length, labels', [
+    ('test.iso', 0, 952320, ['iso9660', 'filesystem']),
+    ('test-add-random-data.iso', 0, 952320, []),
+    ('test-prepend-random-data.iso', 128, 952320, []),
+])
+def test_unpack_iso9660_testdata(scan_environment, testfile, offset, length, labels):
+    rel_testfile = pathlib.Path('unpackers') / 'iso9660' / testfile
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_iso9660(fr, scan_environment, offset, unpackdir)
+    assert r['status'] is True
+    assert r['length'] == length
+    assert r['labels'] == labels
+    assert r['filesandlabels'] == [(os.path.join(unpackdir, 'test.sgi'), [])]
+    assert scan_environment.unpack_path(unpackdir / 'test.sgi').stat().st_size == 592418
+
+@pytest.mark.parametrize('testfile', ['test-cut-data-from-end.iso', 'test-cut-data-from-middle.iso'])
+def test_unpack_iso9660_testdata_truncated(scan_environment, testfile):
+    rel_testfile = pathlib.Path('unpackers') / 'iso9660' / testfile
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    r = bangfilesystems.unpack_iso9660(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert r['status'] is False
+
+@pytest.mark.parametrize('rockridge, joliet', [(True, False), (False, True)])
+def test_unpack_iso9660_name_with_nul(scan_environment, rockridge, joliet):
+    image = _create_iso([('a\x00b', b'hello')], rockridge=rockridge, joliet=joliet)
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, image)
+    assert r['status'] is False
+
+def test_unpack_iso9660_symlink_with_nul(scan_environment):
+    image = _create_iso([('a.txt', b'hello'), ('link', 'a\x00b')])
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, image)
+    assert r['status'] is True
+    assert r['filesandlabels'] == [(os.path.join(unpackdir, 'a.txt'), [])]
+
+def test_unpack_iso9660_short_continuation_entry(scan_environment):
+    image = _create_iso([('a.txt', b'hello')])
+    # turn the NM entry into a CE entry that is too short
+    image = image.replace(b'NM\x0a\x01\x00a.txt', b'CE\x0a\x01\x00a.txt', 1)
+    (r, unpackdir, unpackdir_full) = _unpack(scan_environment, image)
+    assert r['status'] is False
@@ -0,0 +1,166 @@
+import binascii
+import lzma
+import stat
+import struct
+import zlib
+from .util import *
+import bangfilesystems
+from bangfilesystems import Jffs2Reader, decompress_rtime
+
+def _compress_rtime(data):
+    '''rtime compression as done by the Linux kernel.'''
+    positions = [0] * 256
+    compressed = bytearray()
+    pos = 0
+    while pos < len(data):
+        value = data[pos]
+        compressed.append(value)
+        pos += 1
+        backpos = positions[value]
+        positions[value] = pos
+        runlength = 0
+        while backpos < pos and pos < len(data) and \
+                data[pos] == data[backpos] and runlength < 255:
+            backpos += 1
+            pos += 1
+            runlength += 1
+        compressed.append(runlength)
+    return bytes(compressed)
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'abcdef',
+    b'a' * 1000,
+    b'abcabcabcabcabcabcabcabx' * 50,
+    bytes(range(256)) * 20,
+])
+def test_decompress_rtime(data):
+    assert decompress_rtime(_compress_rtime(data), len(data)) == data
+
+def _crc(data):
+    return (binascii.crc32(data, -1) ^ -1) & 0xffffffff
+
+def _node(nodetype, body):
+    header = struct.pack('<HHI', 0x1985, nodetype, 12 + len(body))
+    node = header + struct.pack('<I', _crc(header)) + body
+    return node + b'\x00' * ((-len(node)) % 4)
+
+def _dirent(parentinode, version, inode, name):
+    name = name.encode()
+    body = struct.pack('<IIIIBBH', parentinode, version, inode, 0, len(name), 0, 0)
+    header = struct.pack('<HHI', 0x1985, Jffs2Reader.DIRENT, 40 + len(name))
+    header += struct.pack('<I', _crc(header))
+    body += struct.pack('<II', _crc(header + body), _crc(name)) + name
+    return _node(Jffs2Reader.DIRENT, body)
+
+def _inode(inode, version, mode, size, writeoffset, data, compressor, compressed):
+    body = struct.pack('<IIIHHIIIIIIIBBHI', inode, version, mode, 0, 0, size,
+                       0, 0, 0, writeoffset, len(compressed), len(data),
+                       compressor, 0, 0, _crc(compressed))
+    header = struct.pack('<HHI', 0x1985, Jffs2Reader.INODE, 68 + len(compressed))
+    header += struct.pack('<I', _crc(header))
+    # the node CRC does not cover the data CRC
+    body += struct.pack('<I', _crc(header + body[:-4])) + compressed
+    return _node(Jffs2Reader.INODE, body)
+
+lzma_filters = [{'id': lzma.FILTER_LZMA1, 'dict_size': 0x2000,
+                 'lc': 0, 'lp': 0, 'pb': 0}]
+
+def _create_jffs2():
+    '''Create a JFFS2 image with a file that is partly overwritten by a
+    newer version, a deleted file, a directory with a hardlink and an
+    LZMA compressed file, and a symbolic link.'''
+    regular = stat.S_IFREG | 0o644
+    olddata = b'old data ' * 100
+    newdata = b'new data ' * 20
+    lzmadata = b'lzma compressed ' * 50
+    image = _dirent(1, 1, 2, 'a.txt')
+    image += _inode(2, 1, regular, len(olddata), 0, olddata,
+                    Jffs2Reader.COMPR_ZLIB, zlib.compress(olddata))
+    image += _dirent(1, 2, 3, 'b.txt')
+    image += _inode(3, 1, regular, 5, 0, b'hello', Jffs2Reader.COMPR_NONE, b'hello')
+    image += _dirent(1, 3, 4, 'dir')
+    image += _inode(4, 1, stat.S_IFDIR | 0o755, 0, 0, b'', 0, b'')
+    image += _dirent(4, 4, 5, 'c.txt')
+    image += _inode(5, 1, regular, len(lzmadata), 0, lzmadata, Jffs2Reader.COMPR_LZMA,
+                    lzma.compress(lzmadata, format=lzma.FORMAT_RAW, filters=lzma_filters))
+    image += _dirent(4, 5, 2, 'hardlink')
+    image += _dirent(1, 6, 6, 'symlink')
+    image += _inode(6, 1, stat.S_IFLNK | 0o777, 5, 0, b'a.txt', Jffs2Reader.COMPR_NONE, b'a.txt')
+    # overwrite the start of a.txt and shrink it, then delete b.txt
+    image += _inode(2, 2, regular, 500, 0, newdata,
+                    Jffs2Reader.COMPR_RTIME, _compress_rtime(newdata))
+    image += _dirent(1, 7, 0, 'b.txt')
+    return (image, newdata + olddata[len(newdata):500], lzmadata)
+
+def test_unpack_jffs2(scan_environment):
+    (image, adata, cdata) = _create_jffs2()
+    rel_testfile = pathlib.Path('test.jffs2')
+    # erased flash, followed by data that is not JFFS2
+    scan_environment.unpack_path(rel_testfile).write_bytes(
+        b'garbage!' + image + b'\xff' * 4096 + b'trailing data')
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_jffs2(fr, scan_environment, 8, unpackdir)
+    assert r['status'] is True
+    assert r['length'] == len(image) + 4096
+    assert r['labels'] == []
+    assert sorted(r['filesandlabels']) == [
+        (str(unpackdir / 'a.txt'), []),
+        (str(unpackdir / 'dir' / 'c.txt'), []),
+        (str(unpackdir / 'symlink'), ['symbolic link'])]
+    unpackdir_full = scan_environment.unpack_path(unpackdir)
+    assert (unpackdir_full / 'a.txt').read_bytes() == adata
+    assert (unpackdir_full / 'dir' / 'c.txt').read_bytes() == cdata
+    assert (unpackdir_full / 'dir' / 'hardlink').stat().st_ino == \
+            (unpackdir_full / 'a.txt').stat().st_ino
+    assert os.readlink(unpackdir_full / 'symlink') == 'a.txt'
+    assert not (unpackdir_full / 'b.txt').exists()
+
+def test_unpack_jffs2_bad_data_crc(scan_environment):
+    (image, adata, cdata) = _create_jffs2()
+    rel_testfile = pathlib.Path('test.jffs2')
+    # damage the data of the last version of a.txt, which is followed
+    # by a directory entry of 48 bytes
+    image = bytearray(image)
+    image[-52] ^= 0xff
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_jffs2(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert r['status'] is True
+    assert r['length'] == len(image) - 48 - 68 - 20
+    assert r['labels'] == []
+    unpackdir_full = scan_environment.unpack_path(pathlib.Path('some_dir'))
+    assert (unpackdir_full / 'a.txt').read_bytes() == b'old data ' * 100
+    assert (unpackdir_full / 'b.txt').read_bytes() == b'hello'
+
+@pytest.mark.parametrize('testfile', ['test-little.jffs2', 'test-big.jffs2'])
+def test_unpack_jffs2_testdata(scan_environment, testfile):
+    rel_testfile = pathlib.Path('unpackers') / 'jffs2' / testfile
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_jffs2(fr, scan_environment, 0, unpackdir)
+    assert r['status'] is True
+    assert r['length'] == 594192
+    assert r['labels'] == ['jffs2', 'filesystem']
+    assert r['filesandlabels'] == [(str(unpackdir / 'test.sgi'), [])]
+
+def test_unpack_jffs2_names_with_nul(scan_environment):
+    (image, adata, cdata) = _create_jffs2()
+    # a file with a NUL byte in the name and a symbolic link with a NUL
+    # byte in the target are not unpacked
+    image += _dirent(1, 8, 7, 'nul\x00name')
+    image += _inode(7, 1, stat.S_IFREG | 0o644, 5, 0, b'hello', Jffs2Reader.COMPR_NONE, b'hello')
+    image += _dirent(1, 9, 8, 'nullink')
+    image += _inode(8, 1, stat.S_IFLNK | 0o777, 5, 0, b'a\x00txt', Jffs2Reader.COMPR_NONE, b'a\x00txt')
+    rel_testfile = pathlib.Path('test.jffs2')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_jffs2(fr, scan_environment, 0, unpackdir)
+    assert r['status'] is True
+    assert sorted(r['filesandlabels']) == [
+        (str(unpackdir / 'a.txt'), []),
+        (str(unpackdir / 'dir' / 'c.txt'), []),
+        (str(unpackdir / 'symlink'), ['symbolic link'])]
@@ -0,0 +1,44 @@
+import io
+from .util import *
+import PIL.Image
+import bangmedia
+
+def _create_jpeg():
+    '''Create a small JPEG image with a gradient.'''
+    image = PIL.Image.new('RGB', (64, 48))
+    image.putdata([(x * 4, y * 5, x + y) for y in range(48) for x in range(64)])
+    jpegfile = io.BytesIO()
+    image.save(jpegfile, 'JPEG')
+    return jpegfile.getvalue()
+
+def _unpack_jpeg(scan_environment, data, offset):
+    rel_testfile = pathlib.Path('test.jpg')
+    scan_environment.unpack_path(rel_testfile).write_bytes(data)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    return bangmedia.unpack_jpeg(fr, scan_environment, offset, unpackdir)
+
+def test_fast_verify_jpeg(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    jpeg = _create_jpeg()
+    r = _unpack_jpeg(scan_environment, jpeg, 0)
+    assert r['status'] is True
+    assert r['length'] == len(jpeg)
+    assert r['labels'] == ['graphics', 'jpeg']
+    assert r['filesandlabels'] == []
+
+def test_fast_verify_jpeg_with_prepended_data(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    jpeg = _create_jpeg()
+    r = _unpack_jpeg(scan_environment, b'\x00' * 128 + jpeg + b'trailing data', 128)
+    assert r['status'] is True
+    assert r['length'] == len(jpeg)
+    unpacked_file = pathlib.Path('some_dir') / 'unpacked.jpg'
+    assert r['filesandlabels'] == [(str(unpacked_file), ['jpeg', 'graphics', 'unpacked'])]
+    assert scan_environment.unpack_path(unpacked_file).read_bytes() == jpeg
+
+def test_fast_verify_truncated_jpeg(scan_environment):
+    scan_environment.scanprofile = {'fast_verify_images'}
+    jpeg = _create_jpeg()
+    r = _unpack_jpeg(scan_environment, jpeg[:len(jpeg)//2], 0)
+    assert r['status'] is False
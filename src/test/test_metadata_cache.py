@@ -0,0 +1,113 @@
+import multiprocessing
+import pickle
+import sqlite3
+
+from MetadataCache import *
+
+def test_put_and_get(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    assert cache.get('elf', '1', 'abc') is None
+    cache.put('elf', '1', 'abc', ({'soname': 'libc.so.6'}, ['elf']))
+    assert cache.get('elf', '1', 'abc') == ({'soname': 'libc.so.6'}, ['elf'])
+    assert cache.get('dex', '1', 'abc') is None
+
+def test_other_versions_are_invalidated(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.put('elf', '1', 'abc', 'old')
+    cache.put('dex', '1', 'abc', 'dex')
+    assert cache.get('elf', '2', 'abc') is None
+    cache.put('elf', '2', 'def', 'new')
+    assert cache.get('elf', '1', 'abc') is None
+    assert cache.get('elf', '2', 'def') == 'new'
+    assert cache.get('dex', '1', 'abc') == 'dex'
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3', maxentries=2)
+    cache.put('elf', '1', 'a', 'a')
+    cache.put('elf', '1', 'b', 'b')
+    cache.get('elf', '1', 'a')
+    cache.put('elf', '1', 'c', 'c')
+    assert cache.get('elf', '1', 'a') == 'a'
+    assert cache.get('elf', '1', 'b') is None
+    assert cache.get('elf', '1', 'c') == 'c'
+
+def _lastused(cachefile, key):
+    connection = sqlite3.connect(cachefile)
+    lastused = connection.execute('SELECT lastused FROM metadata WHERE key = ?',
+                                  (key,)).fetchone()[0]
+    connection.close()
+    return lastused
+
+def test_get_does_not_write(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3', maxentries=100)
+    cache.put('elf', '1', 'a', 'a')
+    lastused = _lastused(tmp_path / 'cache.sqlite3', 'a')
+    assert cache.get('elf', '1', 'a') == 'a'
+    assert _lastused(tmp_path / 'cache.sqlite3', 'a') == lastused
+    # when the entries were used is written when evicting
+    cache.evict()
+    assert _lastused(tmp_path / 'cache.sqlite3', 'a') > lastused
+
+def test_entries_are_evicted_periodically(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3', maxentries=2, evictinterval=3)
+    for key in ['a', 'b', 'c']:
+        cache.put('elf', '1', key, key)
+    assert cache.get('elf', '1', 'a') is None
+    # there can be more entries until the next check
+    cache.put('elf', '1', 'd', 'd')
+    cache.put('elf', '1', 'e', 'e')
+    assert cache.get('elf', '1', 'b') == 'b'
+    cache.put('elf', '1', 'f', 'f')
+    # b was used after c, d and e were stored
+    for key in ['c', 'd', 'e']:
+        assert cache.get('elf', '1', key) is None
+    assert cache.get('elf', '1', 'b') == 'b'
+    assert cache.get('elf', '1', 'f') == 'f'
+
+def test_missing_directory_disables_cache(tmp_path):
+    cache = MetadataCache(tmp_path / 'nonexistent' / 'cache.sqlite3')
+    assert cache.get('elf', '1', 'a') is None
+    cache.put('elf', '1', 'a', 'a')
+    assert cache.get('elf', '1', 'a') is None
+
+def test_corrupted_cache_file_disables_cache(tmp_path):
+    (tmp_path / 'cache.sqlite3').write_bytes(b'not a database' * 1000)
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.put('elf', '1', 'a', 'a')
+    assert cache.get('elf', '1', 'a') is None
+
+def test_locked_database_is_not_written(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3', timeout=0)
+    cache.put('elf', '1', 'a', 'a')
+    connection = sqlite3.connect(tmp_path / 'cache.sqlite3', isolation_level=None)
+    connection.execute('BEGIN EXCLUSIVE')
+    cache.put('elf', '1', 'b', 'b')
+    connection.execute('ROLLBACK')
+    connection.close()
+    # the cache is used again when the database is no longer locked
+    assert cache.get('elf', '1', 'b') is None
+    cache.put('elf', '1', 'b', 'b')
+    assert cache.get('elf', '1', 'b') == 'b'
+
+def test_corrupted_value_is_a_cache_miss(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.put('elf', '1', 'a', 'a')
+    connection = sqlite3.connect(tmp_path / 'cache.sqlite3')
+    connection.execute("UPDATE metadata SET value = x'80'")
+    connection.commit()
+    connection.close()
+    assert cache.get('elf', '1', 'a') is None
+
+def _put_in_process(cache):
+    cache.put('elf', '1', 'child', 'from child')
+
+def test_cache_is_shared_between_processes(tmp_path):
+    cache = MetadataCache(tmp_path / 'cache.sqlite3')
+    cache.put('elf', '1', 'parent', 'from parent')
+    process = multiprocessing.Process(target=_put_in_process, args=(cache,))
+    process.start()
+    process.join()
+    assert cache.get('elf', '1', 'child') == 'from child'
+    # a copy of the cache, as used in a new scan
+    cache = pickle.loads(pickle.dumps(cache))
+    assert cache.get('elf', '1', 'parent') == 'from parent'
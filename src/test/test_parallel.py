@@ -0,0 +1,30 @@
+import threading
+import time
+
+import pytest
+
+from bangparallel import ordered_map
+
+def test_ordered_map_returns_results_in_order():
+    assert list(ordered_map(lambda x: x * 2, range(20), 4)) == [x * 2 for x in range(20)]
+
+def test_ordered_map_waits_for_started_work_on_error():
+    started = []
+    finished = []
+    # the first four items all start before the error is raised
+    barrier = threading.Barrier(4, timeout=10)
+    def work(x):
+        started.append(x)
+        if x < 4:
+            barrier.wait()
+        if x == 0:
+            raise ValueError('error')
+        time.sleep(0.1)
+        finished.append(x)
+    with pytest.raises(ValueError):
+        for result in ordered_map(work, range(8), 4, window=8):
+            pass
+    # the work that was running when the error was raised has finished,
+    # the work that had not started yet has been cancelled
+    assert sorted(finished) == sorted(x for x in started if x != 0)
+    assert set(finished) >= set([1, 2, 3])
@@ -0,0 +1,59 @@
+import io
+import os
+import pathlib
+
+from ScanProfiler import *
+
+def _worker_profile(profiledirectory):
+    return profiledirectory / ("worker-%d.prof" % os.getpid())
+
+def test_job_is_profiled(tmp_path):
+    profiler = ScanProfiler(tmp_path)
+    token = profiler.start_job()
+    sum(range(1000))
+    profiler.stop(token)
+    profiler.dump()
+    assert _worker_profile(tmp_path).exists()
+
+def test_only_selected_parsers_are_profiled(tmp_path):
+    profiler = ScanProfiler(tmp_path, parsers=['gif'])
+    assert profiler.start_job() is None
+    assert profiler.start_parser('png') is None
+    token = profiler.start_parser('gif')
+    assert token is not None
+    profiler.stop(token)
+    profiler.dump()
+    assert _worker_profile(tmp_path).exists()
+
+def test_short_jobs_are_not_profiled(tmp_path):
+    profiler = ScanProfiler(tmp_path, minimumduration=3600)
+    token = profiler.start_job()
+    profiler.stop(token)
+    profiler.dump()
+    assert not _worker_profile(tmp_path).exists()
+
+def test_profiles_are_merged(tmp_path):
+    profiler = ScanProfiler(tmp_path)
+    for i in range(2):
+        token = profiler.start_job()
+        sorted(range(1000))
+        profiler.stop(token)
+    profiler.dump()
+    reportfile = io.StringIO()
+    assert merge_profiles(tmp_path, tmp_path / 'profile.prof', reportfile)
+    assert (tmp_path / 'profile.prof').exists()
+    assert 'function calls' in reportfile.getvalue()
+
+def test_no_profiles_are_merged(tmp_path):
+    reportfile = io.StringIO()
+    assert not merge_profiles(tmp_path, tmp_path / 'profile.prof', reportfile)
+    assert not (tmp_path / 'profile.prof').exists()
+
+def test_profile_is_written_on_dump(tmp_path):
+    profiler = ScanProfiler(tmp_path)
+    token = profiler.start_job()
+    sum(range(1000))
+    profiler.stop(token)
+    assert not _worker_profile(tmp_path).exists()
+    profiler.dump()
+    assert _worker_profile(tmp_path).exists()
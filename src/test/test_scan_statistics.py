@@ -0,0 +1,117 @@
+import io
+import json
+
+from .util import *
+
+from FileResult import *
+from ScanJob import *
+from ScanStatistics import *
+
+def create_tmp_fileresult(path_abs, content):
+    with open(path_abs, 'wb') as f:
+        f.write(content)
+    fileresult = FileResult(None, path_abs, set())
+    fileresult.set_filesize(path_abs.stat().st_size)
+    return fileresult
+
+def test_parser_attempts_are_counted():
+    statistics = ScanStatistics()
+    start = statistics.start_parser()
+    statistics.end_parser('a', start, True)
+    start = statistics.start_parser()
+    statistics.end_parser('a', start, False)
+    start = statistics.start_parser()
+    statistics.end_parser('b', start, False)
+    s = statistics.get()
+    assert s['parsers']['a']['attempts'] == 2
+    assert s['parsers']['a']['successes'] == 1
+    assert s['parsers']['a']['failures'] == 1
+    assert s['parsers']['b']['attempts'] == 1
+    assert s['parsers']['b']['successes'] == 0
+    assert s['parsers']['a']['wall'] >= 0
+
+def test_merge_statistics():
+    s1 = ScanStatistics()
+    s1.add('bytes_scanned', 100)
+    s1.add_candidates('0:4141', 3)
+    s1.end_parser('a', s1.start_parser(), True)
+    s2 = ScanStatistics()
+    s2.add('bytes_scanned', 50)
+    s2.add('directories_created')
+    s2.add_candidates('0:4141', 2)
+    s2.end_parser('a', s2.start_parser(), False)
+    merged = merge_statistics([s1.get(), s2.get()])
+    assert merged['workers'] == 2
+    assert merged['counters']['bytes_scanned'] == 150
+    assert merged['counters']['directories_created'] == 1
+    assert merged['counters']['directories_removed'] == 0
+    assert merged['candidates'] == {'0:4141': 5}
+    assert merged['parsers']['a']['attempts'] == 2
+    assert merged['parsers']['a']['failures'] == 1
+
+def test_merged_statistics_can_be_written():
+    s = ScanStatistics()
+    s.end_parser('a', s.start_parser(), True)
+    merged = merge_statistics([s.get()])
+    jsonfile = io.StringIO()
+    write_statistics_json(merged, jsonfile)
+    assert json.loads(jsonfile.getvalue())['parsers']['a']['successes'] == 1
+    csvfile = io.StringIO()
+    write_statistics_csv(merged, csvfile)
+    lines = csvfile.getvalue().splitlines()
+    assert lines[0] == 'parser,attempts,successes,failures,wall,cpu'
+    assert lines[1].startswith('a,1,1,0,')
+
+def _check_for_signatures(scan_environment, unpackparser):
+    fn = pathlib.Path("test.sig1")
+    fileresult = create_tmp_fileresult(scan_environment.temporarydirectory / fn, b"A"*70)
+    scan_environment.set_unpackparsers([unpackparser])
+    scanjob = ScanJob(fileresult)
+    scanjob.set_scanenvironment(scan_environment)
+    scanjob.initialize()
+    unpack_manager = UnpackManager(scan_environment.unpackdirectory,
+            scan_environment.statistics)
+    scanjob.prepare_for_unpacking()
+    scanjob.check_for_signatures(unpack_manager)
+    return scan_environment.statistics.get()
+
+def test_signature_unpack_success_is_recorded(scan_environment):
+    s = _check_for_signatures(scan_environment, UnpackParserExtractSig1)
+    assert s['parsers']['sig1_extract']['attempts'] == 1
+    assert s['parsers']['sig1_extract']['successes'] == 1
+    assert s['candidates'][signature_name((2, b'AA'))] > 0
+    assert s['counters']['bytes_scanned'] == 70
+    assert s['counters']['bytes_unpacked'] == 70
+    assert s['counters']['directories_created'] == 1
+
+def test_signature_unpack_fail_is_recorded(scan_environment):
+    s = _check_for_signatures(scan_environment, UnpackParserExtractSig1Fail)
+    assert s['parsers']['sig1_extract_fail']['successes'] == 0
+    assert s['parsers']['sig1_extract_fail']['failures'] == \
+            s['parsers']['sig1_extract_fail']['attempts']
+    assert 'bytes_unpacked' not in s['counters']
+    assert s['counters']['directories_removed'] == \
+            s['counters']['directories_created']
+
+def test_statistics_are_stored_per_process(scan_environment):
+    scan_environment.statisticsdict = {}
+    scan_environment.statistics.add('files')
+    scan_environment.store_statistics()
+    assert scan_environment.statisticsdict[os.getpid()]['counters'] == {'files': 1}
+
+def test_statistics_are_stored_when_worker_exits(scan_environment):
+    scan_environment.statisticsdict = {}
+    path_abs = scan_environment.unpackdirectory / 'test.bin'
+    scan_environment.scanfilequeue.put(ScanJob(create_tmp_fileresult(path_abs, b'\x00' * 20)))
+    scan_environment.scanfilequeue.put(None)
+    processfile(scan_environment)
+    assert scan_environment.statisticsdict[os.getpid()]['counters']['files'] == 1
+
+def test_statistics_are_stored_when_scan_job_fails(scan_environment):
+    scan_environment.statisticsdict = {}
+    path_abs = scan_environment.unpackdirectory / 'test.bin'
+    scan_environment.scanfilequeue.put(ScanJob(create_tmp_fileresult(path_abs, b'\x00' * 20)))
+    # the empty mock queue raises an exception for the next job
+    with pytest.raises(ScanJobError):
+        processfile(scan_environment)
+    assert scan_environment.statisticsdict[os.getpid()]['counters']['files'] == 1
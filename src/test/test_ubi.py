@@ -0,0 +1,108 @@
+import struct
+from .util import *
+import bangfilesystems
+
+blocksize = 16384
+vid_hdr_offset = 64
+data_offset = 128
+leb_size = blocksize - data_offset
+
+def _peb(volume_id=None, lnum=0, sqnum=0, data=b'', volume_type=1, image_sequence=1,
+         data_pad=0):
+    '''Create a PEB with an erase counter header and, unless the PEB
+    is free, a volume identifier header.'''
+    ec_header = struct.pack('>4sB3xQIII32xI', b'UBI#', 1, 0, vid_hdr_offset,
+                            data_offset, image_sequence, 0)
+    if volume_id is None:
+        return ec_header + b'\xff' * (blocksize - len(ec_header))
+    data_size = len(data) if volume_type == 2 else 0
+    used_ebs = 2 if volume_type == 2 else 0
+    vid_header = struct.pack('>4sBBBBII4xIIII4xQ12x', b'UBI!', 1, volume_type,
+                             0, 0, volume_id, lnum, data_size, used_ebs, data_pad, 0,
+                             sqnum)
+    vid_header += struct.pack('>I', bangfilesystems.ubi_crc(vid_header))
+    peb = ec_header + vid_header
+    return peb + data + b'\xff' * (blocksize - len(peb) - len(data))
+
+def _vtbl_record(name, volume_type):
+    name = name.encode()
+    return struct.pack('>IIIBBH128sB23xI', 10, 1, 0, volume_type, 0,
+                       len(name), name, 0, 0)
+
+def _create_ubi():
+    '''Create a UBI image with a dynamic volume 'rootfs' of which LEB 1
+    is not mapped and LEB 0 has an older copy, and a static volume
+    'kernel' of two LEBs.'''
+    vtbl = _vtbl_record('rootfs', 1) + _vtbl_record('kernel', 2)
+    vtbl += bytes(172) * (leb_size // 172 - 2)
+    pebs = [
+        _peb(0x7fffefff, 0, 1, vtbl),
+        _peb(0x7fffefff, 1, 2, vtbl),
+        _peb(0, 2, 3, b'c' * leb_size),
+        _peb(0, 0, 10, b'a' * leb_size),
+        _peb(),
+        _peb(1, 0, 4, b'k' * leb_size, 2),
+        _peb(1, 1, 5, b'kernel end', 2),
+        _peb(0, 0, 6, b'old' * 100),
+    ]
+    return b''.join(pebs)
+
+def test_unpack_ubi(scan_environment):
+    image = _create_ubi()
+    rel_testfile = pathlib.Path('test.ubi')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image + b'trailing data')
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_ubi(fr, scan_environment, 0, unpackdir)
+    assert r['status'] is True
+    assert r['length'] == len(image)
+    assert r['labels'] == []
+    assert r['filesandlabels'] == [
+        (os.path.join(unpackdir, 'image-1', 'rootfs'), []),
+        (os.path.join(unpackdir, 'image-1', 'kernel'), [])]
+    unpackdir_full = scan_environment.unpack_path(unpackdir)
+    # the unmapped LEB reads as erased flash
+    assert (unpackdir_full / 'image-1' / 'rootfs').read_bytes() == \
+            b'a' * leb_size + b'\xff' * leb_size + b'c' * leb_size
+    assert (unpackdir_full / 'image-1' / 'kernel').read_bytes() == \
+            b'k' * leb_size + b'kernel end'
+
+def test_unpack_ubi_full_file(scan_environment):
+    image = _create_ubi()
+    rel_testfile = pathlib.Path('test.ubi')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_ubi(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert r['status'] is True
+    assert r['labels'] == ['ubi']
+
+def test_unpack_ubi_without_volume_table(scan_environment):
+    image = b''.join([_peb(0, 0, 1, b'a' * leb_size), _peb(0, 1, 2, b'b' * leb_size)])
+    rel_testfile = pathlib.Path('test.ubi')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_ubi(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert r['status'] is False
+
+def test_unpack_ubi_with_corrupted_vid_header(scan_environment):
+    # the newest copy of LEB 0 of 'rootfs' has a wrong CRC and is not used
+    image = bytearray(_create_ubi())
+    image[3 * blocksize + vid_hdr_offset + 63] ^= 0xff
+    rel_testfile = pathlib.Path('test.ubi')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_ubi(fr, scan_environment, 0, unpackdir)
+    assert r['status'] is True
+    assert r['length'] == len(image)
+    rootfs = (scan_environment.unpack_path(unpackdir) / 'image-1' / 'rootfs').read_bytes()
+    assert rootfs[:leb_size] == b'old' * 100 + b'\xff' * (leb_size - 300)
+
+def test_unpack_ubi_with_invalid_data_pad(scan_environment):
+    image = b''.join([_peb(0x7fffefff, 0, 1, data_pad=blocksize),
+                      _peb(0, 0, 2, b'a' * leb_size)])
+    rel_testfile = pathlib.Path('test.ubi')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_ubi(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert r['status'] is False
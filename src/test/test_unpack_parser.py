@@ -2,7 +2,8 @@ import pytest
 
 from .util import *
 from UnpackParserException import UnpackParserException
-from UnpackParser import UnpackParser
+from UnpackParser import UnpackParser, OffsetInputFile
+from kaitaistruct import KaitaiStream
 from bangsignatures import get_unpackers
 from parsers.database.sqlite.UnpackParser import SqliteUnpackParser
 from parsers.image.gif.UnpackParser import GifUnpackParser
@@ -73,3 +74,26 @@ def test_all_unpack_parsers_raise_exception_on_empty_file(scan_environment, unpa
         pytest.fail("%s accepts empty file" % unpackparser.__name__)
     up.close()
 
+def test_offset_input_file_starts_at_offset(tmp_path):
+    testfile = tmp_path / 'test'
+    testfile.write_bytes(b'garbage\x01\x00\x00\x00abcdef')
+    infile = OffsetInputFile(open(testfile, 'rb'), 7)
+    ks = KaitaiStream(infile)
+    assert ks.size() == 10
+    assert ks.read_u4le() == 1
+    assert ks.pos() == 4
+    assert ks.read_bytes(6) == b'abcdef'
+    assert ks.is_eof()
+    ks.seek(2)
+    assert ks.read_bytes_full() == b'\x00\x00abcdef'
+    # the file descriptor is the one of the whole file
+    assert os.pread(infile.fileno(), 7, 0) == b'garbage'
+    infile.close()
+
+def test_offset_input_file_empty_file(tmp_path):
+    testfile = tmp_path / 'test'
+    testfile.write_bytes(b'')
+    infile = OffsetInputFile(open(testfile, 'rb'), 0)
+    assert infile.read(10) == b''
+    assert infile.seek(0, os.SEEK_END) == 0
+    infile.close()
@@ -0,0 +1,213 @@
+import errno
+import struct
+import zlib
+from .util import *
+from bangvirtualdisk import *
+import bangvirtualdisk
+import bangfilesystems
+
+clustersize = 65536
+
+def _cluster(i):
+    return bytes([i]) * clustersize
+
+def _create_qcow2(disksize):
+    '''Create a qcow2 (version 3) image with 64 KiB clusters: header,
+    L1 table, refcount table, refcount block and L2 table in clusters
+    0 to 4. Guest clusters 1 and 2 are in host clusters 5 and 6, guest
+    cluster 10 is compressed and guest cluster 11 is a zero cluster.'''
+    header = struct.pack('>4sIQIIQIIQQIIQ', b'QFI\xfb', 3, 0, 0, 16,
+                         disksize, 0, 1, clustersize, 2 * clustersize, 1, 0, 0)
+    header += struct.pack('>QQQII', 0, 0, 0, 4, 104)
+    l1table = struct.pack('>Q', 4 * clustersize | (1 << 63))
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -12)
+    compressed = compressor.compress(_cluster(10)) + compressor.flush()
+    compressedsectors = (len(compressed) + 511) // 512
+    l2entries = [0] * (clustersize // 8)
+    l2entries[1] = 5 * clustersize | (1 << 63)
+    l2entries[2] = 6 * clustersize | (1 << 63)
+    l2entries[10] = (1 << 62) | ((compressedsectors - 1) << 54) | (7 * clustersize)
+    l2entries[11] = 1
+    l2table = struct.pack('>%dQ' % len(l2entries), *l2entries)
+    refcounttable = struct.pack('>Q', 3 * clustersize)
+    refcountblock = struct.pack('>8H', *([1] * 8))
+    image = b''
+    for data in [header, l1table, refcounttable, refcountblock, l2table,
+                 _cluster(1), _cluster(2), compressed]:
+        image += data + b'\x00' * ((-len(data)) % clustersize)
+    return image[:7 * clustersize + len(compressed)]
+
+def _check_disk(disk, disksize):
+    assert disk.size == disksize
+    disk.seek(0)
+    assert disk.read(clustersize) == bytes(clustersize)
+    # a read that crosses extents
+    disk.seek(clustersize - 10)
+    assert disk.read(20) == bytes(10) + b'\x01' * 10
+    disk.seek(2 * clustersize - 10)
+    assert disk.read(20) == b'\x01' * 10 + b'\x02' * 10
+    disk.seek(10 * clustersize + 100)
+    assert disk.read(10) == b'\x0a' * 10
+    disk.seek(-10, os.SEEK_END)
+    assert disk.read() == bytes(10)
+
+def test_qcow2_disk(tmp_path):
+    disksize = 1024 * 1024
+    image = _create_qcow2(disksize)
+    (tmp_path / 'test.qcow2').write_bytes(b'padding' + image + b'trailing data')
+    disk = Qcow2Disk(tmp_path / 'test.qcow2', 7)
+    # clusters 1 and 2 are merged into one extent
+    assert [(e[0], e[1]) for e in disk.extents] == [(clustersize, 2 * clustersize),
+                                                   (10 * clustersize, clustersize)]
+    assert disk.length == len(image)
+    _check_disk(disk, disksize)
+    disk.close()
+
+def test_qcow2_with_backing_file(tmp_path):
+    image = bytearray(_create_qcow2(1024 * 1024))
+    image[8:16] = struct.pack('>Q', 512)
+    (tmp_path / 'test.qcow2').write_bytes(image)
+    with pytest.raises(VirtualDiskError):
+        Qcow2Disk(tmp_path / 'test.qcow2', 0)
+
+def _create_vmdk(disksize, compressed):
+    '''Create a VMDK sparse extent with 64 KiB grains, with grains 1, 2
+    and 10 allocated.'''
+    grainsectors = clustersize // 512
+    flags = 3 | ((1 << 16) | (1 << 17) if compressed else 0)
+    # header, grain directory in sector 1, grain table in sector 2
+    header = struct.pack('<4sIIQQQQIQQQ?ccccH', b'KDMV', 3 if compressed else 1,
+                         flags, disksize // 512, grainsectors, 0, 0, 512, 0, 1,
+                         grainsectors, False, b'\n', b' ', b'\r', b'\n',
+                         1 if compressed else 0)
+    header += b'\x00' * (512 - len(header))
+    graindirectory = struct.pack('<I', 2) + b'\x00' * 508
+    grains = {}
+    data = b''
+    position = clustersize
+    for i in [1, 2, 10]:
+        if compressed:
+            grain = zlib.compress(_cluster(i))
+            grain = struct.pack('<QI', i * grainsectors, len(grain)) + grain
+            grain += b'\x00' * ((-len(grain)) % 512)
+        else:
+            grain = _cluster(i)
+        grains[i] = position // 512
+        data += grain
+        position += len(grain)
+    graintable = struct.pack('<512I', *[grains.get(i, 0) for i in range(512)])
+    metadata = header + graindirectory + graintable
+    return metadata + b'\x00' * (clustersize - len(metadata)) + data
+
+def test_vmdk_disk(tmp_path):
+    disksize = 1024 * 1024
+    image = _create_vmdk(disksize, False)
+    (tmp_path / 'test.vmdk').write_bytes(image + b'trailing data')
+    disk = VmdkSparseDisk(tmp_path / 'test.vmdk', 0)
+    assert disk.length == len(image)
+    _check_disk(disk, disksize)
+    disk.close()
+
+def test_vmdk_disk_compressed(tmp_path):
+    disksize = 1024 * 1024
+    image = _create_vmdk(disksize, True)
+    (tmp_path / 'test.vmdk').write_bytes(image)
+    disk = VmdkSparseDisk(tmp_path / 'test.vmdk', 0)
+    _check_disk(disk, disksize)
+    disk.close()
+
+def _create_vdi(disksize):
+    '''Create a dynamic VDI image with 1 MiB blocks, with blocks 1 and
+    3 allocated.'''
+    blocksize = 1024 * 1024
+    header = b'<<< Oracle VM VirtualBox Disk Image >>>\n'.ljust(0x40, b'\x00')
+    header += struct.pack('<IHHIII', 0xbeda107f, 1, 1, 0x190, 1, 0)
+    header = header.ljust(0x154, b'\x00')
+    header += struct.pack('<IIIIII', 0x200, 0x1000, 0, 0, 0, 512)
+    header += struct.pack('<IQIIII', 0, disksize, blocksize, 0,
+                          disksize // blocksize, 2)
+    header = header.ljust(0x200, b'\x00')
+    blocks = [0xffffffff] * (disksize // blocksize)
+    blocks[1] = 0
+    blocks[3] = 1
+    header += struct.pack('<%dI' % len(blocks), *blocks)
+    header = header.ljust(0x1000, b'\x00')
+    return header + b'\x01' * blocksize + b'\x03' * blocksize
+
+def test_unpack_vdi(scan_environment):
+    disksize = 4 * 1024 * 1024
+    image = _create_vdi(disksize)
+    rel_testfile = pathlib.Path('test.vdi')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_vdi(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert r['status']
+    assert r['length'] == len(image)
+    assert r['labels'] == ['virtualbox', 'vdi', 'filesystem']
+    outfile_full = scan_environment.unpack_path(r['filesandlabels'][0][0])
+    assert outfile_full.stat().st_size == disksize
+    with open(outfile_full, 'rb') as f:
+        assert f.read(1024 * 1024) == bytes(1024 * 1024)
+        assert f.read(1024 * 1024) == b'\x01' * 1024 * 1024
+        assert f.read(1024 * 1024) == bytes(1024 * 1024)
+        assert f.read(1024 * 1024) == b'\x03' * 1024 * 1024
+
+def test_unpack_qcow2_at_offset(scan_environment):
+    disksize = 64 * 1024 * 1024
+    image = _create_qcow2(disksize)
+    rel_testfile = pathlib.Path('test')
+    scan_environment.unpack_path(rel_testfile).write_bytes(b'padding' + image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_qcow2(fr, scan_environment, 7, pathlib.Path('some_dir'))
+    assert r['status']
+    assert r['length'] == len(image)
+    assert r['labels'] == []
+    outfile_full = scan_environment.unpack_path(r['filesandlabels'][0][0])
+    assert outfile_full.stat().st_size == disksize
+    # only the allocated clusters are written
+    assert outfile_full.stat().st_blocks * 512 < disksize // 4
+    disk = Qcow2Disk(scan_environment.unpack_path(rel_testfile), 7)
+    assert outfile_full.read_bytes() == disk.read()
+    disk.close()
+
+def test_qcow2_cluster_outside_of_disk(tmp_path):
+    # guest cluster 10 is outside of a disk of 5 clusters
+    image = _create_qcow2(5 * clustersize)
+    (tmp_path / 'test.qcow2').write_bytes(image)
+    with pytest.raises(VirtualDiskError):
+        Qcow2Disk(tmp_path / 'test.qcow2', 0)
+
+def test_unpack_qcow2_write_error(scan_environment, monkeypatch):
+    def sendfile_error(outfd, infd, offset, size):
+        raise OSError(errno.EFBIG, 'File too large')
+    monkeypatch.setattr(bangvirtualdisk, 'sendfile_range', sendfile_error)
+    image = _create_qcow2(1024 * 1024)
+    rel_testfile = pathlib.Path('test.qcow2')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_qcow2(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert not r['status']
+    assert os.listdir(scan_environment.unpack_path('some_dir')) == []
+
+def test_qcow2_compressed_cluster_outside_of_file(tmp_path):
+    image = bytearray(_create_qcow2(1024 * 1024))
+    # move guest cluster 10 after the end of the image
+    l2entry = 4 * clustersize + 10 * 8
+    (entry,) = struct.unpack('>Q', image[l2entry:l2entry + 8])
+    image[l2entry:l2entry + 8] = struct.pack('>Q', entry + 2 * clustersize)
+    (tmp_path / 'test.qcow2').write_bytes(image)
+    with pytest.raises(VirtualDiskError, match='compressed data outside of file'):
+        Qcow2Disk(tmp_path / 'test.qcow2', 0)
+
+def test_unpack_vmdk_too_large(scan_environment):
+    image = bytearray(_create_vmdk(1024 * 1024, False))
+    # capacity, grain size and number of grain table entries
+    image[12:28] = struct.pack('<QQ', 1 << 62, 1 << 40)
+    image[44:48] = struct.pack('<I', 1 << 31)
+    # no grain tables
+    image[512:516] = bytes(4)
+    rel_testfile = pathlib.Path('test.vmdk')
+    scan_environment.unpack_path(rel_testfile).write_bytes(image[:1024])
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_vmdk(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert not r['status']
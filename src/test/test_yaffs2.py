@@ -0,0 +1,49 @@
+from .util import *
+import bangfilesystems
+
+testfiles = sorted((testdir_base / 'testdata' / 'unpackers' / 'yaffs2').iterdir())
+
+@pytest.mark.parametrize('testfile', [f.name for f in testfiles])
+def test_unpack_yaffs2(scan_environment, testfile):
+    rel_testfile = pathlib.Path('unpackers') / 'yaffs2' / testfile
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_yaffs2(fr, scan_environment, 0, unpackdir)
+    assert r['status'] is True
+    assert r['length'] == fr.filesize
+    assert r['labels'] == ['yaffs', 'filesystem']
+
+    # the chunk and spare size are in the name of the test file
+    (chunk_size, spare_size) = testfile.split('-')[1:3]
+    assert r['metadata'] == {'chunk size': int(chunk_size), 'spare size': int(spare_size)}
+    if 'empty-file' in testfile:
+        assert r['filesandlabels'] == [(os.path.join(unpackdir, 'test'), [])]
+    else:
+        assert (os.path.join(unpackdir, 'test'), ['directory']) in r['filesandlabels']
+    if 'dir-with-file' in testfile:
+        assert len(r['filesandlabels']) == 2
+        unpacked = scan_environment.unpack_path(unpackdir / 'test' / 'test.ico')
+        assert unpacked.stat().st_size == 2686
+
+def test_unpack_yaffs2_links(scan_environment):
+    rel_testfile = pathlib.Path('unpackers') / 'yaffs2' / 'yaffs2-2048-64-be-links.img'
+    copy_testfile_to_environment(testdir_base / 'testdata', rel_testfile, scan_environment)
+    fr = fileresult(testdir_base / 'testdata', rel_testfile, set())
+    unpackdir = pathlib.Path('some_dir')
+    r = bangfilesystems.unpack_yaffs2(fr, scan_environment, 0, unpackdir)
+    assert r['status'] is True
+    assert (os.path.join(unpackdir, 'test', 'symlink'), ['symbolic link']) in r['filesandlabels']
+    unpackdir_full = scan_environment.unpack_path(unpackdir)
+    assert os.readlink(unpackdir_full / 'test' / 'symlink') == 'test.ico'
+    assert (unpackdir_full / 'test' / 'hardlink').stat().st_size == 2686
+
+def test_unpack_yaffs2_with_data_appended(scan_environment):
+    testdata = (testdir_base / 'testdata' / 'unpackers' / 'yaffs2' / 'yaffs2-1024-32-le-dir-with-file.img').read_bytes()
+    rel_testfile = pathlib.Path('test.img')
+    scan_environment.unpack_path(rel_testfile).write_bytes(testdata + b'\x00' * 2000)
+    fr = fileresult(scan_environment.unpackdirectory, rel_testfile, set())
+    r = bangfilesystems.unpack_yaffs2(fr, scan_environment, 0, pathlib.Path('some_dir'))
+    assert r['status'] is True
+    assert r['length'] == len(testdata)
+    assert r['labels'] == []
@@ -0,0 +1,293 @@
+#include <stdio.h>
+#include <stdlib.h>
+
+/* the functions are exported to have enough dynamic symbols for telfhash */
+int counter;
+
+int parse_header(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int read_block(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int write_block(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int compute_checksum(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int open_archive(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int close_archive(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int list_members(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int extract_member(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int verify_signature(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int load_config(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int save_config(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int print_usage(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int handle_error(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int allocate_buffer(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int free_buffer(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int decode_name(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int encode_name(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int scan_directory(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int walk_tree(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int hash_file(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int compare_files(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int copy_file(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int rename_file(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int remove_file(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int create_directory(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int set_permissions(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int get_timestamp(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int format_size(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int parse_options(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int run_command(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int wait_child(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int send_message(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int receive_message(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int connect_server(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int disconnect_server(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int lock_resource(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int unlock_resource(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int log_message(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int flush_output(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int init_state(int x)
+{
+    counter += x;
+    return counter;
+}
+
+int main(int argc, char **argv)
+{
+    const char *value = getenv("BANG_TEST_VARIABLE");
+    if (value != NULL)
+        printf("BANG test string: %s\n", value);
+    parse_header(argc);
+    read_block(argc);
+    write_block(argc);
+    compute_checksum(argc);
+    open_archive(argc);
+    close_archive(argc);
+    list_members(argc);
+    extract_member(argc);
+    verify_signature(argc);
+    load_config(argc);
+    save_config(argc);
+    print_usage(argc);
+    handle_error(argc);
+    allocate_buffer(argc);
+    free_buffer(argc);
+    decode_name(argc);
+    encode_name(argc);
+    scan_directory(argc);
+    walk_tree(argc);
+    hash_file(argc);
+    compare_files(argc);
+    copy_file(argc);
+    rename_file(argc);
+    remove_file(argc);
+    create_directory(argc);
+    set_permissions(argc);
+    get_timestamp(argc);
+    format_size(argc);
+    parse_options(argc);
+    run_command(argc);
+    wait_child(argc);
+    send_message(argc);
+    receive_message(argc);
+    connect_server(argc);
+    disconnect_server(argc);
+    lock_resource(argc);
+    unlock_resource(argc);
+    log_message(argc);
+    flush_output(argc);
+    init_state(argc);
+    return 0;
+}